@@ -3,18 +3,27 @@ import hashlib
 import logging
 import os
 import threading
-from typing import Any, Dict, Optional, Type
+from typing import Any, Dict, Iterable, Optional, Type
 
+from api import http_pool
 from api.base_api import BaseApi
 from api.chat_completion import ChatCompletion
+from api.circuit_breaker import CircuitBreaker, CircuitBreakerSettings
 from api.deepseek import DeepSeek
 from api.doubao import Doubao
 from api.fallback_api import FallbackApi, FallbackEntry
+from api.hedging import Hedger, HedgingSettings
+from api.http_pool import HttpPoolSettings
+from api.key_balancing import KeyBalancer, KeyBalancing
 from api.kimi import Kimi
 from api.minimax import MiniMax
 from api.modelscope import ModelScope
+from api.param_schema import parse_params
 from api.provider_fallback_api import ProviderFallbackApi, ProviderFallbackEntry
+from api.rate_limiting import RateLimit, RateLimiter
+from api.retry_policy import RetryPolicy
 from api.retrying_api import FailureHandler, FeishuNotifier, RetryingApi
+from api.routing import RoutingSettings, TargetStats
 from api.zhipu import Zhipu
 
 logger = logging.getLogger(__name__)
@@ -22,6 +31,12 @@ logger = logging.getLogger(__name__)
 # Project-root relative path; hot reload watches this fixed filename only.
 CREDENTIALS_FILENAME = "credentials.config"
 _SENSITIVE_CONFIG_KEYS = frozenset({"api_key"})
+# Per-provider RetryPolicy, KeyBalancing and RateLimit objects live beside the
+# provider configs in the credentials map, so provider constructors never see the
+# RETRY_*, KEY_BALANCING, API_KEY_WEIGHTS and RATE_LIMIT_* keys.
+_RETRY_POLICIES_KEY = "retry_policies"
+_KEY_BALANCING_KEY = "key_balancing"
+_RATE_LIMITS_KEY = "rate_limits"
 
 
 class ManualModelSelectionError(ValueError):
@@ -29,12 +44,19 @@ class ManualModelSelectionError(ValueError):
 
 
 class ApiFactory:
-    """Factory for configured AI provider clients."""
+    """Factory for configured AI provider clients.
+
+    Optional settings sections owned by other layers (the session manager's
+    [session_pool], [session_store] and so on) are registered by their owner,
+    either through the constructor or register_settings_classes.
+    """
 
     FEISHU_WEBHOOK_URL = "https://open.feishu.cn/open-apis/bot/v2/hook/b06a606f-9cc9-4033-bed8-8ff2e65ecec9"
     CHAT_COMPLETION_PREFIX = "chat_completion:"
+    # Per-target runtime state shared across clients, pruned on reload
+    _RUNTIME_STATE_CACHES = ("circuit_breakers", "target_stats", "hedgers", "key_balancers", "rate_limiters")
 
-    def __init__(self):
+    def __init__(self, settings_classes: Iterable[Type[Any]] = ()):
         self._clients: Dict[str, BaseApi] = {}
         self._default_client: BaseApi | None = None
         self._designated_providers: list[str] = ["doubao"]
@@ -46,10 +68,27 @@ class ApiFactory:
         self._config: configparser.ConfigParser | None = None
         self._failure_handlers: list[FailureHandler] = [FeishuNotifier(self.FEISHU_WEBHOOK_URL).notify_failure]
         self._provider_classes: Dict[str, Type[BaseApi]] = {}
+        self._settings_classes: Dict[str, Type[Any]] = {}
+        self._settings: Dict[str, Any] = {}
         self._credentials_path = CREDENTIALS_FILENAME
         self._reload_lock = threading.RLock()
         self._last_config_hash: str | None = None
+        self._manual_clients: Dict[tuple[str, str, str | None], BaseApi] = {}
+        self._manual_clients_lock = threading.Lock()
+        self._circuit_breakers: Dict[tuple[str, str, str | None], CircuitBreaker] = {}
+        self._circuit_breakers_lock = threading.Lock()
+        self._target_stats: Dict[tuple[str, str, str | None], TargetStats] = {}
+        self._target_stats_lock = threading.Lock()
+        self._hedgers: Dict[str, Hedger] = {}
+        self._hedgers_lock = threading.Lock()
+        self._key_balancers: Dict[tuple[str, tuple[str | None, ...], KeyBalancing], KeyBalancer] = {}
+        self._key_balancers_lock = threading.Lock()
+        self._rate_limiters: Dict[tuple[str, str | None, str | None, RateLimit], RateLimiter] = {}
+        self._rate_limiters_lock = threading.Lock()
+        # Keys of the caches above touched while a reload builds its clients.
+        self._reload_used_keys: Dict[str, set[Any]] | None = None
         self._register_provider_classes()
+        self._register_settings_classes(settings_classes)
         self._load_config()
         self._register_designated_provider()
         self._last_config_hash = self._hash_file(self._credentials_path)
@@ -62,6 +101,37 @@ class ApiFactory:
         self._provider_classes["modelscope"] = ModelScope
         self._provider_classes["kimi"] = Kimi
 
+    def _register_settings_classes(self, settings_classes: Iterable[Type[Any]] = ()):
+        self._settings_classes[HttpPoolSettings.SECTION_NAME] = HttpPoolSettings
+        self._settings_classes[CircuitBreakerSettings.SECTION_NAME] = CircuitBreakerSettings
+        self._settings_classes[RoutingSettings.SECTION_NAME] = RoutingSettings
+        self._settings_classes[HedgingSettings.SECTION_NAME] = HedgingSettings
+        for settings_class in settings_classes:
+            self._settings_classes[settings_class.SECTION_NAME] = settings_class
+
+    def register_settings_classes(self, settings_classes: Iterable[Type[Any]]) -> None:
+        """
+        Register optional config sections owned by another layer.
+
+        Sections not registered yet are parsed from the loaded config right away
+        and are re-read on every hot reload like the factory's own sections.
+
+        Raises:
+            ValueError: A newly registered section fails validation.
+        """
+        with self._reload_lock:
+            for settings_class in settings_classes:
+                section_name = settings_class.SECTION_NAME
+                if section_name in self._settings_classes:
+                    continue
+                if self._config is not None:
+                    self._settings[section_name] = self._load_settings_section(
+                        self._config,
+                        section_name,
+                        settings_class,
+                    )
+                self._settings_classes[section_name] = settings_class
+
     def _create_minimal_config(self, credential_file: str):
         lines = []
 
@@ -72,8 +142,22 @@ class ApiFactory:
         lines.append("# 供应商回退链示例: PROVIDER = doubao,zhipu,kimi")
         lines.append("# 按从左到右的顺序尝试供应商，不要留下空项。")
         lines.append("PROVIDER = doubao")
+        lines.append("# 每个服务商配置段都可以加入以下可选的重试参数（示例为默认值）:")
+        for param in RetryPolicy.get_params():
+            lines.append(f"# {param.to_config_key()} = {param.default}  ; {param.description}")
+        lines.append("# API_KEY 配置多个值的服务商可以加入以下可选的均衡参数:")
+        for param in KeyBalancing.get_params():
+            example = param.default if param.default is not None else "3,1"
+            lines.append(f"# {param.to_config_key()} = {example}  ; {param.description}")
+        lines.append("# 每个服务商配置段都可以加入以下可选的限流参数（示例为默认值）:")
+        for param in RateLimit.get_params():
+            lines.append(f"# {param.to_config_key()} = {param.default}  ; {param.description}")
         lines.append("")
 
+        for section_name, settings_class in self._settings_classes.items():
+            lines.extend(self._build_settings_config_lines(section_name, settings_class))
+            lines.append("")
+
         for provider_name, provider_class in self._provider_classes.items():
             lines.extend(self._build_provider_config_lines(provider_name, provider_class))
             lines.append("")
@@ -92,13 +176,14 @@ class ApiFactory:
             raise UserWarning(f"已在当前目录生成 {credential_file} 文件，请填入凭据信息!")
 
         try:
-            config, credentials, providers = self._parse_credentials_file(
+            config, credentials, providers, settings = self._parse_credentials_file(
                 credential_file,
                 allow_create_missing=True,
             )
             self._config = config
             self._credentials = credentials
             self._set_designated_providers(providers)
+            self._apply_settings(settings)
         except UserWarning:
             raise
         except ValueError:
@@ -111,7 +196,7 @@ class ApiFactory:
         credential_file: str,
         *,
         allow_create_missing: bool,
-    ) -> tuple[configparser.ConfigParser, Dict[str, Any], list[str]]:
+    ) -> tuple[configparser.ConfigParser, Dict[str, Any], list[str], Dict[str, Any]]:
         """Parse and validate credentials without mutating live client objects."""
         if not os.path.exists(credential_file):
             raise ValueError(f"配置文件不存在: {credential_file}")
@@ -126,21 +211,35 @@ class ApiFactory:
             raw_provider = config.get("designated_provider", "PROVIDER", fallback="doubao")
 
         providers = self._parse_designated_providers(raw_provider)
+        retry_policies: Dict[str, RetryPolicy] = {}
+        key_balancing: Dict[str, KeyBalancing] = {}
+        rate_limits: Dict[str, RateLimit] = {}
         credentials: Dict[str, Any] = {
             "designated_provider": ",".join(providers),
             "designated_providers": list(providers),
+            _RETRY_POLICIES_KEY: retry_policies,
+            _KEY_BALANCING_KEY: key_balancing,
+            _RATE_LIMITS_KEY: rate_limits,
         }
 
         for provider_name in providers:
-            provider_config = self._load_provider_config(
+            provider_config, retry_policy, balancing, rate_limit = self._load_provider_config(
                 config,
                 provider_name,
                 credential_file,
                 allow_create_missing=allow_create_missing,
             )
             credentials[provider_name] = provider_config
+            retry_policies[provider_name] = retry_policy
+            key_balancing[provider_name] = balancing
+            rate_limits[provider_name] = rate_limit
 
-        return config, credentials, providers
+        settings = {
+            section_name: self._load_settings_section(config, section_name, settings_class)
+            for section_name, settings_class in self._settings_classes.items()
+        }
+
+        return config, credentials, providers, settings
 
     def reload_credentials(self) -> bool:
         """
@@ -178,11 +277,12 @@ class ApiFactory:
                     return False
 
                 previous_summary = self._safe_runtime_summary()
-                config, credentials, providers = self._parse_credentials_file(
+                config, credentials, providers, settings = self._parse_credentials_file(
                     credential_file,
                     allow_create_missing=False,
                 )
 
+                self._reload_used_keys = {}
                 new_clients: Dict[str, BaseApi] = {}
                 for provider_name in providers:
                     new_clients[provider_name] = self._build_configured_provider_client(
@@ -201,13 +301,19 @@ class ApiFactory:
                             self._get_provider_class(provider_name),
                             failure_handlers=[],
                             credentials=credentials,
+                            waits_for_capacity=False,
                         )
-                        entries.append(
-                            ProviderFallbackEntry(provider_name=provider_name, client=client)
-                        )
+                        entries.append(ProviderFallbackEntry(
+                            provider_name=provider_name,
+                            client=client,
+                            breaker=self._circuit_breaker("provider-chain", provider_name),
+                            stats=self._routing_stats("provider-chain", provider_name),
+                        ))
                     new_default_client = ProviderFallbackApi(
                         entries,
                         failure_handlers=self._failure_handlers,
+                        routing_settings=lambda: self.get_settings(RoutingSettings.SECTION_NAME),
+                        hedger=self._hedger("provider-chain"),
                     )
 
                 self._config = config
@@ -216,6 +322,11 @@ class ApiFactory:
                 self._clients = new_clients
                 self._default_client = new_default_client
                 self._last_config_hash = new_hash
+                # Replace rather than clear: builds still in flight keep
+                # writing into the old dict and never leak into the new one.
+                self._manual_clients = {}
+                self._apply_settings(settings)
+                self._prune_runtime_state(self._reload_used_keys)
 
                 # Runtime state is already committed. Logging must never undo
                 # success or bubble into the watcher thread.
@@ -247,6 +358,27 @@ class ApiFactory:
                     failure_summary,
                 )
                 return False
+            finally:
+                self._reload_used_keys = None
+
+    def _mark_runtime_key(self, cache_name: str, key: Any) -> None:
+        used = self._reload_used_keys
+        if used is not None:
+            used.setdefault(cache_name, set()).add(key)
+
+    def _prune_runtime_state(self, used: Dict[str, set[Any]]) -> None:
+        """Drop breakers, stats, hedgers, balancers and limiters the reloaded config no longer uses.
+
+        Entries for targets that are still configured were touched while building the
+        new clients and keep their state. Manual clients of providers outside the new
+        chain are rebuilt with fresh state, like the manual client cache itself.
+        """
+        for cache_name in self._RUNTIME_STATE_CACHES:
+            cache = getattr(self, f"_{cache_name}")
+            keep = used.get(cache_name, set())
+            with getattr(self, f"_{cache_name}_lock"):
+                for key in [key for key in cache if key not in keep]:
+                    del cache[key]
 
     @staticmethod
     def _hash_file(path: str) -> str | None:
@@ -372,7 +504,7 @@ class ApiFactory:
         credential_file: str,
         *,
         allow_create_missing: bool = True,
-    ) -> Dict[str, Any]:
+    ) -> tuple[Dict[str, Any], RetryPolicy, KeyBalancing, RateLimit]:
         section_name = self._get_provider_section_name(provider_name)
         provider_class = self._get_provider_class(provider_name)
 
@@ -386,6 +518,9 @@ class ApiFactory:
             if config_key.startswith("#"):
                 continue
             provider_config[config_key.lower()] = raw_value
+        retry_policy = self._extract_retry_policy(provider_config, section_name)
+        balancing = self._extract_key_balancing(provider_config, section_name)
+        rate_limit = self._extract_rate_limit(provider_config, section_name)
 
         for param in provider_class.get_params():
             if param.name in provider_config:
@@ -401,7 +536,82 @@ class ApiFactory:
             error_msg = f"服务商 [{section_name}] 配置错误:\n" + "\n".join(f"  - {e}" for e in errors)
             raise ValueError(error_msg)
 
-        return provider_config
+        return provider_config, retry_policy, balancing, rate_limit
+
+    @staticmethod
+    def _extract_retry_policy(provider_config: Dict[str, Any], section_name: str) -> RetryPolicy:
+        """Pop the RETRY_* keys of a provider section into its RetryPolicy."""
+        try:
+            return RetryPolicy.from_config(provider_config)
+        except ValueError as exception:
+            errors = str(exception).splitlines()
+            raise ValueError(
+                f"服务商 [{section_name}] 配置错误:\n" + "\n".join(f"  - {e}" for e in errors)
+            ) from exception
+
+    @staticmethod
+    def _extract_key_balancing(provider_config: Dict[str, Any], section_name: str) -> KeyBalancing:
+        """Pop KEY_BALANCING and API_KEY_WEIGHTS of a provider section into its KeyBalancing."""
+        try:
+            return KeyBalancing.from_config(provider_config)
+        except ValueError as exception:
+            errors = str(exception).splitlines()
+            raise ValueError(
+                f"服务商 [{section_name}] 配置错误:\n" + "\n".join(f"  - {e}" for e in errors)
+            ) from exception
+
+    @staticmethod
+    def _extract_rate_limit(provider_config: Dict[str, Any], section_name: str) -> RateLimit:
+        """Pop the RATE_LIMIT_* keys of a provider section into its RateLimit."""
+        try:
+            return RateLimit.from_config(provider_config)
+        except ValueError as exception:
+            errors = str(exception).splitlines()
+            raise ValueError(
+                f"服务商 [{section_name}] 配置错误:\n" + "\n".join(f"  - {e}" for e in errors)
+            ) from exception
+
+    def _load_settings_section(
+        self,
+        config: configparser.ConfigParser,
+        section_name: str,
+        settings_class: Type[Any],
+    ) -> Any:
+        """Parse an optional non-provider section; missing sections use defaults."""
+        raw_config: Dict[str, Any] = {}
+        if config.has_section(section_name):
+            for config_key, raw_value in config.items(section_name):
+                if config_key.startswith("#"):
+                    continue
+                raw_config[config_key.lower()] = raw_value
+
+        try:
+            settings_config = parse_params(settings_class.get_params(), raw_config)
+        except ValueError as exception:
+            raise ValueError(f"配置段 [{section_name}] 配置错误: {exception}") from exception
+
+        is_valid, errors = settings_class.validate_config(settings_config)
+        if not is_valid:
+            error_msg = f"配置段 [{section_name}] 配置错误:\n" + "\n".join(f"  - {e}" for e in errors)
+            raise ValueError(error_msg)
+
+        return settings_class(**settings_config)
+
+    def _apply_settings(self, settings: Dict[str, Any]) -> None:
+        self._settings = dict(settings)
+        http_pool_settings = settings.get(HttpPoolSettings.SECTION_NAME)
+        if http_pool_settings is not None:
+            http_pool.configure(http_pool_settings)
+
+    def get_settings(self, section_name: str) -> Any:
+        """Return the parsed settings object of an optional config section."""
+        settings = self._settings.get(section_name)
+        if settings is None:
+            settings_class = self._settings_classes.get(section_name)
+            if settings_class is None:
+                raise ValueError(f"未知配置段: {section_name}")
+            settings = settings_class()
+        return settings
 
     def _ensure_provider_config(self, provider_name: str, credential_file: str):
         if os.path.exists(credential_file):
@@ -446,6 +656,18 @@ class ApiFactory:
 
         return lines
 
+    def _build_settings_config_lines(
+        self,
+        section_name: str,
+        settings_class: Type[Any],
+    ) -> list[str]:
+        lines = [f"[{section_name}]"]
+        for param in settings_class.get_params():
+            lines.append(f"# {param.description}")
+            default_value = "" if param.default is None else str(param.default)
+            lines.append(f"{param.to_config_key()} = {default_value}")
+        return lines
+
     def _build_param_config_comments(self, config_key: str, description: str) -> list[str]:
         comments = [description]
         if config_key == "API_KEY":
@@ -496,9 +718,64 @@ class ApiFactory:
                 provider_name,
                 self._get_provider_class(provider_name),
                 failure_handlers=[],
+                waits_for_capacity=False,
             )
-            entries.append(ProviderFallbackEntry(provider_name=provider_name, client=client))
-        return ProviderFallbackApi(entries, failure_handlers=self._failure_handlers)
+            entries.append(ProviderFallbackEntry(
+                provider_name=provider_name,
+                client=client,
+                breaker=self._circuit_breaker("provider-chain", provider_name),
+                stats=self._routing_stats("provider-chain", provider_name),
+            ))
+        return ProviderFallbackApi(
+            entries,
+            failure_handlers=self._failure_handlers,
+            routing_settings=lambda: self.get_settings(RoutingSettings.SECTION_NAME),
+            hedger=self._hedger("provider-chain"),
+        )
+
+    def _circuit_breaker(self, provider_name: str, target: str, api_key: str | None = None) -> CircuitBreaker:
+        """Breakers are shared by every client that calls the same target, including
+        clients rebuilt by a reload; a changed API key gets a fresh breaker."""
+        key = (provider_name, target, api_key)
+        with self._circuit_breakers_lock:
+            self._mark_runtime_key("circuit_breakers", key)
+            breaker = self._circuit_breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    provider_name,
+                    target,
+                    lambda: self.get_settings(CircuitBreakerSettings.SECTION_NAME),
+                    failure_handlers=self._failure_handlers,
+                )
+                self._circuit_breakers[key] = breaker
+            return breaker
+
+    def _routing_stats(self, provider_name: str, target: str, api_key: str | None = None) -> TargetStats:
+        """Latency statistics are shared and keyed the same way as circuit breakers."""
+        key = (provider_name, target, api_key)
+        with self._target_stats_lock:
+            self._mark_runtime_key("target_stats", key)
+            stats = self._target_stats.get(key)
+            if stats is None:
+                stats = TargetStats(target, lambda: self.get_settings(RoutingSettings.SECTION_NAME))
+                self._target_stats[key] = stats
+            return stats
+
+    def _hedger(self, provider_name: str) -> Hedger:
+        """One hedge budget per chain, shared by clients of the same provider and kept across reloads."""
+        with self._hedgers_lock:
+            self._mark_runtime_key("hedgers", provider_name)
+            hedger = self._hedgers.get(provider_name)
+            if hedger is None:
+                hedger = Hedger(provider_name, lambda: self.get_settings(HedgingSettings.SECTION_NAME))
+                self._hedgers[provider_name] = hedger
+            return hedger
+
+    def hedging_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hedged requests fired, won and lost per fallback chain."""
+        with self._hedgers_lock:
+            hedgers = list(self._hedgers.values())
+        return {hedger.provider_name: hedger.stats() for hedger in hedgers}
 
     def _build_configured_provider_client(
         self,
@@ -507,6 +784,7 @@ class ApiFactory:
         extra_kwargs: Dict[str, Any] | None = None,
         failure_handlers: list[FailureHandler] | None = None,
         credentials: Dict[str, Any] | None = None,
+        waits_for_capacity: bool = True,
     ) -> BaseApi:
         credential_file = self._credentials_path
         credentials_map = self._credentials if credentials is None else credentials
@@ -519,6 +797,9 @@ class ApiFactory:
             credentials_map = self._credentials
 
         creds = credentials_map.get(name.lower(), {})
+        retry_policy = credentials_map.get(_RETRY_POLICIES_KEY, {}).get(name.lower())
+        key_balancing = credentials_map.get(_KEY_BALANCING_KEY, {}).get(name.lower())
+        rate_limit = credentials_map.get(_RATE_LIMITS_KEY, {}).get(name.lower())
         client_kwargs = creds.copy()
         if extra_kwargs:
             client_kwargs.update(extra_kwargs)
@@ -528,7 +809,16 @@ class ApiFactory:
             error_msg = f"服务商 '{name}' 参数错误:\n" + "\n".join(f"  - {e}" for e in errors)
             raise ValueError(error_msg)
 
-        return self._build_provider_client(name, client_class, client_kwargs, failure_handlers=failure_handlers)
+        return self._build_provider_client(
+            name,
+            client_class,
+            client_kwargs,
+            failure_handlers=failure_handlers,
+            retry_policy=retry_policy,
+            key_balancing=key_balancing,
+            rate_limit=rate_limit,
+            waits_for_capacity=waits_for_capacity,
+        )
 
     def _build_provider_client(
         self,
@@ -536,6 +826,10 @@ class ApiFactory:
         client_class: Type[BaseApi],
         client_kwargs: Dict[str, Any],
         failure_handlers: list[FailureHandler] | None = None,
+        retry_policy: RetryPolicy | None = None,
+        key_balancing: KeyBalancing | None = None,
+        rate_limit: RateLimit | None = None,
+        waits_for_capacity: bool = True,
     ) -> BaseApi:
         handlers = self._failure_handlers if failure_handlers is None else failure_handlers
         api_keys: list[str | None] = []
@@ -554,14 +848,16 @@ class ApiFactory:
         else:
             targets.append(None)
 
-        if len(api_keys) == 1 and len(targets) == 1:
+        # 启用限流时单个 API Key/模型也经过回退链，以便在额度不足时等待或快速失败
+        rate_limited = rate_limit is not None and rate_limit.enabled
+        if len(api_keys) == 1 and len(targets) == 1 and not rate_limited:
             provider_kwargs = client_kwargs.copy()
             if has_api_key:
                 provider_kwargs["api_key"] = api_keys[0]
             if active_target_param_name is not None:
                 provider_kwargs[active_target_param_name] = targets[0]
             client = client_class(**provider_kwargs)  # type: ignore
-            return self._wrap_provider_client(name, client, handlers)
+            return self._wrap_provider_client(name, client, handlers, retry_policy)
 
         entries: list[FallbackEntry] = []
         api_key_varies = len(api_keys) > 1
@@ -575,13 +871,64 @@ class ApiFactory:
                 label = self._build_fallback_label(api_key_index, api_key_varies, target)
                 secrets = (api_key,) if has_api_key and api_key is not None else ()
                 client = client_class(**provider_kwargs)  # type: ignore
+                # 回退链扣除首次请求的额度，重试层为每次重试扣除，额度与实际发出的请求数一致
+                limiter = self._rate_limiter(name, api_key, target, rate_limit)
                 entries.append(FallbackEntry(
                     target=label,
-                    client=self._wrap_provider_client(label, client, []),
+                    client=self._wrap_provider_client(label, client, [], retry_policy, limiter),
                     secrets=secrets,
+                    model=target,
+                    breaker=self._circuit_breaker(name, label, api_key),
+                    stats=self._routing_stats(name, label, api_key),
+                    limiter=limiter,
                 ))
 
-        return FallbackApi(name, entries, failure_handlers=handlers)
+        return FallbackApi(
+            name,
+            entries,
+            failure_handlers=handlers,
+            routing_settings=lambda: self.get_settings(RoutingSettings.SECTION_NAME),
+            hedger=self._hedger(name),
+            balancer=self._key_balancer(name, api_keys, key_balancing),
+            waits_for_capacity=waits_for_capacity,
+        )
+
+    def _key_balancer(
+        self,
+        provider_name: str,
+        api_keys: list[str | None],
+        key_balancing: KeyBalancing | None,
+    ) -> KeyBalancer | None:
+        """Balancers are shared per provider and key list so in-flight counts cover every client."""
+        if key_balancing is None or not key_balancing.balanced or len(api_keys) < 2:
+            return None
+        key = (provider_name, tuple(api_keys), key_balancing)
+        with self._key_balancers_lock:
+            self._mark_runtime_key("key_balancers", key)
+            balancer = self._key_balancers.get(key)
+            if balancer is None:
+                balancer = KeyBalancer(key_balancing, len(api_keys))
+                self._key_balancers[key] = balancer
+            return balancer
+
+    def _rate_limiter(
+        self,
+        provider_name: str,
+        api_key: str | None,
+        model: str | None,
+        rate_limit: RateLimit | None,
+    ) -> RateLimiter | None:
+        """One limiter per provider, API key and model, shared by every client that calls them."""
+        if rate_limit is None or not rate_limit.enabled:
+            return None
+        key = (provider_name, api_key, model, rate_limit)
+        with self._rate_limiters_lock:
+            self._mark_runtime_key("rate_limiters", key)
+            limiter = self._rate_limiters.get(key)
+            if limiter is None:
+                limiter = RateLimiter(rate_limit)
+                self._rate_limiters[key] = limiter
+            return limiter
 
     def _build_fallback_label(self, api_key_index: int, api_key_varies: bool, target: str | None) -> str:
         if target is None:
@@ -610,11 +957,13 @@ class ApiFactory:
         name: str,
         client: BaseApi,
         failure_handlers: list[FailureHandler] | None = None,
+        retry_policy: RetryPolicy | None = None,
+        limiter: RateLimiter | None = None,
     ) -> BaseApi:
         if isinstance(client, (RetryingApi, FallbackApi, ProviderFallbackApi)):
             return client
         handlers = self._failure_handlers if failure_handlers is None else failure_handlers
-        return RetryingApi(name, client, failure_handlers=handlers)
+        return RetryingApi(name, client, failure_handlers=handlers, policy=retry_policy, limiter=limiter)
 
     def register_provider(self, name: str, client: BaseApi):
         if not isinstance(client, BaseApi):
@@ -629,10 +978,10 @@ class ApiFactory:
         provider: Optional[str] = None,
         model: Optional[str] = None,
     ) -> BaseApi:
-        with self._reload_lock:
-            if model is not None:
-                return self._build_manual_client(provider, model)
+        if model is not None:
+            return self._get_manual_client(provider, model)
 
+        with self._reload_lock:
             if provider is None:
                 if self._default_client is None:
                     raise ValueError("默认服务商客户端尚未初始化")
@@ -647,11 +996,34 @@ class ApiFactory:
 
             return self._clients[provider]
 
-    def _build_manual_client(
+    def _get_manual_client(
         self,
         provider: Optional[str],
         model: str,
     ) -> BaseApi:
+        """Return the shared client for one configured provider/model pair.
+
+        Clients are cached per (provider, model, config hash) and built outside
+        the reload lock, so a slow construction never blocks other requests.
+        """
+        provider_name, model_name = self._normalize_manual_selection(provider, model)
+        with self._reload_lock:
+            config = self._config
+            config_hash = self._last_config_hash
+            manual_clients = self._manual_clients
+
+        cache_key = (provider_name, model_name, config_hash)
+        client = manual_clients.get(cache_key)
+        if client is not None:
+            return client
+
+        client = self._build_manual_client(provider_name, model_name, config)
+        with self._manual_clients_lock:
+            # Concurrent misses may both build; every caller gets the first one.
+            return manual_clients.setdefault(cache_key, client)
+
+    @staticmethod
+    def _normalize_manual_selection(provider: Optional[str], model: str) -> tuple[str, str]:
         if provider is None:
             raise ManualModelSelectionError("指定 model 时必须同时指定 provider")
         if not isinstance(provider, str):
@@ -667,8 +1039,14 @@ class ApiFactory:
             raise ManualModelSelectionError("参数 'model' 不能为空")
         if "," in model_name:
             raise ManualModelSelectionError("参数 'model' 只能指定一个模型")
+        return provider_name, model_name
 
-        config = self._config
+    def _build_manual_client(
+        self,
+        provider_name: str,
+        model_name: str,
+        config: configparser.ConfigParser | None,
+    ) -> BaseApi:
         if config is None:
             raise ManualModelSelectionError("服务商配置尚未加载")
 
@@ -715,6 +1093,12 @@ class ApiFactory:
             if config_key.startswith("#"):
                 continue
             provider_config[config_key.lower()] = raw_value
+        try:
+            retry_policy = self._extract_retry_policy(provider_config, section_name)
+            key_balancing = self._extract_key_balancing(provider_config, section_name)
+            rate_limit = self._extract_rate_limit(provider_config, section_name)
+        except ValueError as exception:
+            raise ManualModelSelectionError(str(exception)) from exception
 
         for param in provider_class.get_params():
             if param.name in provider_config:
@@ -737,6 +1121,9 @@ class ApiFactory:
             provider_name,
             provider_class,
             provider_config,
+            retry_policy=retry_policy,
+            key_balancing=key_balancing,
+            rate_limit=rate_limit,
         )
 
     def set_designated_provider(self, provider: str):
@@ -1,8 +1,9 @@
+import asyncio
 from abc import ABC, abstractmethod
-from collections.abc import Iterator
+from collections.abc import AsyncIterator, Iterator
 from typing import Any, Dict, List, Optional
 
-from api.param_schema import ProviderParam
+from api.param_schema import ProviderParam, validate_params
 
 
 class BaseApi(ABC):
@@ -44,26 +45,7 @@ class BaseApi(ABC):
         Returns:
             (是否有效, 错误信息列表)
         """
-        errors = []
-        params = cls.get_params()
-        
-        # 检查必填参数
-        for param in params:
-            if param.required and param.name not in config:
-                errors.append(f"缺少必填参数: {param.name}")
-            elif param.name in config:
-                is_valid, error_msg = param.validate(config[param.name])
-                if not is_valid:
-                    errors.append(error_msg)
-        
-        # 检查未知参数
-        config_keys = set(config.keys())
-        param_names = {p.name for p in params}
-        unknown_keys = config_keys - param_names
-        if unknown_keys:
-            errors.append(f"未知参数: {', '.join(unknown_keys)}")
-        
-        return len(errors) == 0, errors
+        return validate_params(cls.get_params(), config)
     
     @abstractmethod
     def reason(self, messages: List[Dict[str, str]]) -> str:
@@ -73,3 +55,26 @@ class BaseApi(ABC):
     def reason_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
         """流式推理；旧 provider 默认退化为单个完整响应。"""
         yield self.reason(messages)
+
+    async def reason_async(self, messages: List[Dict[str, str]]) -> str:
+        """异步推理；未原生实现的 provider 默认在线程池中执行 reason。"""
+        return await asyncio.to_thread(self.reason, messages)
+
+    async def reason_stream_async(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """异步流式推理；未原生实现的 provider 默认在线程池中逐块读取 reason_stream。"""
+        stream = self.reason_stream(messages)
+        finished = object()
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, stream, finished)
+                if chunk is finished:
+                    return
+                yield chunk
+        finally:
+            close = getattr(stream, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except ValueError:
+                    # 取消时工作线程可能仍在执行 next()，生成器稍后会自行结束。
+                    pass
@@ -0,0 +1,250 @@
+"""回退链中每个目标（API Key/模型组合或服务商）的熔断器。
+
+目标在最近的请求中失败率过高时熔断器打开，冷却期内的请求直接跳过该目标，
+不再为已知不可用的目标付出完整的重试等待。冷却结束后进入半开状态，放行少量试探请求：
+试探成功则关闭熔断器，失败则重新打开。
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+
+from api.param_schema import ParamType, ProviderParam, validate_params
+from api.provider_errors import is_target_failure
+from api.retrying_api import CircuitBreakerEvent, FailureHandler
+
+
+class CircuitOpenError(RuntimeError):
+    """回退链中所有目标的熔断器都处于打开状态，请求未发送"""
+
+    def __init__(self, provider_name: str, targets: list[str]) -> None:
+        super().__init__(f"{provider_name} 的所有目标均已熔断: {', '.join(targets)}")
+        self.provider_name: str = provider_name
+        self.targets: list[str] = targets
+
+
+@dataclass(frozen=True)
+class CircuitBreakerSettings:
+    """[circuit_breaker] 配置段，默认关闭，与未配置该段时的行为一致"""
+
+    SECTION_NAME = "circuit_breaker"
+    DEFAULT_FAILURE_RATE_THRESHOLD = 0.5
+    DEFAULT_MINIMUM_REQUESTS = 5
+    DEFAULT_WINDOW_SIZE = 20
+    DEFAULT_COOL_DOWN_SECONDS = 30.0
+    DEFAULT_HALF_OPEN_MAX_CALLS = 1
+
+    enabled: bool = False
+    failure_rate_threshold: float = DEFAULT_FAILURE_RATE_THRESHOLD
+    minimum_requests: int = DEFAULT_MINIMUM_REQUESTS
+    window_size: int = DEFAULT_WINDOW_SIZE
+    cool_down_seconds: float = DEFAULT_COOL_DOWN_SECONDS
+    half_open_max_calls: int = DEFAULT_HALF_OPEN_MAX_CALLS
+
+    @classmethod
+    def get_params(cls) -> List[ProviderParam]:
+        return [
+            ProviderParam(
+                name="enabled",
+                param_type=ParamType.BOOLEAN,
+                required=False,
+                default=False,
+                description="是否为回退链中的每个目标启用熔断器",
+            ),
+            ProviderParam(
+                name="failure_rate_threshold",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_FAILURE_RATE_THRESHOLD,
+                description="最近请求中失败的比例达到该值时打开熔断器，取值 (0, 1]",
+            ),
+            ProviderParam(
+                name="minimum_requests",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_MINIMUM_REQUESTS,
+                description="统计窗口内至少有这么多次请求才计算失败率",
+            ),
+            ProviderParam(
+                name="window_size",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_WINDOW_SIZE,
+                description="计算失败率时参考最近多少次请求",
+            ),
+            ProviderParam(
+                name="cool_down_seconds",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_COOL_DOWN_SECONDS,
+                description="熔断器打开后跳过该目标的秒数，之后放行试探请求",
+            ),
+            ProviderParam(
+                name="half_open_max_calls",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_HALF_OPEN_MAX_CALLS,
+                description="半开状态下同时放行的试探请求数",
+            ),
+        ]
+
+    @classmethod
+    def validate_config(cls, config: Dict[str, Any]) -> tuple[bool, List[str]]:
+        is_valid, errors = validate_params(cls.get_params(), config)
+        threshold = config.get("failure_rate_threshold")
+        if isinstance(threshold, (int, float)) and not 0 < threshold <= 1:
+            errors.append("failure_rate_threshold must be greater than 0 and at most 1")
+        minimum_requests = config.get("minimum_requests")
+        if isinstance(minimum_requests, int) and minimum_requests <= 0:
+            errors.append("minimum_requests must be greater than 0")
+        window_size = config.get("window_size")
+        if isinstance(window_size, int) and isinstance(minimum_requests, int) and window_size < minimum_requests:
+            errors.append("window_size must not be less than minimum_requests")
+        cool_down_seconds = config.get("cool_down_seconds")
+        if isinstance(cool_down_seconds, (int, float)) and cool_down_seconds <= 0:
+            errors.append("cool_down_seconds must be greater than 0")
+        half_open_max_calls = config.get("half_open_max_calls")
+        if isinstance(half_open_max_calls, int) and half_open_max_calls <= 0:
+            errors.append("half_open_max_calls must be greater than 0")
+        return is_valid and not errors, errors
+
+
+class CircuitBreaker:
+    """单个目标的熔断器，线程安全。
+
+    状态变化以 CircuitBreakerEvent 的形式暂存，由调用方在锁外通过 notify() 发给失败处理器，
+    异步调用方用 notify_async() 在线程中发送，避免阻塞事件循环。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        provider_name: str,
+        target: str,
+        settings_provider: Callable[[], CircuitBreakerSettings],
+        failure_handlers: list[FailureHandler] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.provider_name: str = provider_name
+        self.target: str = target
+        self.failure_handlers: list[FailureHandler] = failure_handlers or []
+        self._settings_provider = settings_provider
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._outcomes: deque[bool] = deque()
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._pending_events: list[CircuitBreakerEvent] = []
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow_request(self) -> bool:
+        """是否向该目标发送请求；半开状态下放行的请求必须以 record_* 或 release 结束"""
+        settings = self._settings_provider()
+        if not settings.enabled:
+            return True
+        with self._lock:
+            if self._state == self.OPEN:
+                if self._clock() - self._opened_at < settings.cool_down_seconds:
+                    return False
+                self._transition(self.HALF_OPEN, settings)
+            if self._state == self.HALF_OPEN:
+                if self._half_open_in_flight >= settings.half_open_max_calls:
+                    return False
+                self._half_open_in_flight += 1
+            return True
+
+    def record_success(self) -> None:
+        settings = self._settings_provider()
+        if not settings.enabled:
+            return
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._half_open_in_flight -= 1
+                self._transition(self.CLOSED, settings)
+            elif self._state == self.CLOSED:
+                self._add_outcome(True, settings)
+
+    def record_failure(self, exception: Exception) -> None:
+        # 参数错误、超出上下文长度等是请求本身的问题，不代表目标不可用
+        if not is_target_failure(exception):
+            self.release()
+            return
+        settings = self._settings_provider()
+        if not settings.enabled:
+            return
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._half_open_in_flight -= 1
+                self._transition(self.OPEN, settings)
+            elif self._state == self.CLOSED:
+                self._add_outcome(False, settings)
+                if self._should_open(settings):
+                    self._transition(self.OPEN, settings)
+
+    def release(self) -> None:
+        """放行的请求没有结果（如客户端断开），归还半开状态的试探名额"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._half_open_in_flight > 0:
+                self._half_open_in_flight -= 1
+
+    def notify(self) -> None:
+        if not self._pending_events:
+            return
+        for event in self._pop_events():
+            for handler in self.failure_handlers:
+                try:
+                    handler(event)
+                except Exception as exception:
+                    print(f"失败处理器执行失败: {type(exception).__name__}")
+
+    async def notify_async(self) -> None:
+        if self._pending_events:
+            await asyncio.to_thread(self.notify)
+
+    def _pop_events(self) -> list[CircuitBreakerEvent]:
+        with self._lock:
+            events, self._pending_events = self._pending_events, []
+        return events
+
+    def _add_outcome(self, succeeded: bool, settings: CircuitBreakerSettings) -> None:
+        self._outcomes.append(succeeded)
+        while len(self._outcomes) > settings.window_size:
+            self._outcomes.popleft()
+
+    def _should_open(self, settings: CircuitBreakerSettings) -> bool:
+        if len(self._outcomes) < settings.minimum_requests:
+            return False
+        return self._failure_rate() >= settings.failure_rate_threshold
+
+    def _failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def _transition(self, state: str, settings: CircuitBreakerSettings) -> None:
+        event = CircuitBreakerEvent(
+            provider_name=self.provider_name,
+            will_retry=False,
+            target=self.target,
+            from_state=self._state,
+            to_state=state,
+            failure_rate=self._failure_rate(),
+            cool_down_seconds=settings.cool_down_seconds,
+        )
+        self._state = state
+        if state == self.OPEN:
+            self._opened_at = self._clock()
+        elif state == self.CLOSED:
+            self._outcomes.clear()
+        self._half_open_in_flight = 0
+        self._pending_events.append(event)
@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import logging
 import threading
+from collections.abc import Callable
 from pathlib import Path
 from typing import TYPE_CHECKING
 
@@ -35,12 +36,15 @@ def start_credentials_watcher(
     credentials_path: str | Path = CREDENTIALS_FILENAME,
     debounce_ms: int = DEFAULT_DEBOUNCE_MS,
     stop_event: threading.Event | None = None,
+    on_reloaded: Callable[[], None] | None = None,
 ) -> threading.Thread:
     """
     Start a daemon thread that watches credentials.config and reloads factory.
 
     Only the fixed filename is considered. Existing Session clients are not
     mutated by reload; new sessions and GET /models use the reloaded config.
+    ``on_reloaded`` runs after each reload that replaced the runtime config,
+    e.g. to tell forked worker processes to reload as well.
     """
     resolved = _resolve_credentials_path(credentials_path)
     watch_dir = resolved.parent
@@ -84,7 +88,9 @@ def start_credentials_watcher(
                 )
                 # Isolate each reload so a single failure never kills watching.
                 try:
-                    factory.reload_credentials()
+                    reloaded = factory.reload_credentials()
+                    if reloaded and on_reloaded is not None:
+                        on_reloaded()
                 except Exception:
                     logger.exception(
                         "credentials reload raised unexpectedly; watcher continues: path=%s",
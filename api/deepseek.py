@@ -1,12 +1,15 @@
-from collections.abc import Iterator
-from typing import Dict, List
+from collections.abc import AsyncIterator, Iterator
+from typing import Any, Dict, List, Tuple
 
+import httpx
 import requests
 
+from api import http_pool
 from api.base_api import BaseApi
 from api.error_request_logger import log_llm_error_request, log_llm_success_request
 from api.param_schema import ParamType, ProviderParam
-from api.streaming import stream_chat_completion
+from api.provider_errors import provider_http_error
+from api.streaming import stream_chat_completion, stream_chat_completion_async
 
 
 class DeepSeek(BaseApi):
@@ -57,20 +60,10 @@ class DeepSeek(BaseApi):
         Raises:
             Exception: 当 API 调用失败时抛出异常
         """
-        url = f"{self.base_url}/chat/completions"
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": self.model,
-            "messages": messages
-        }
-        
+        url, headers, data = self._build_request(messages)
+
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = http_pool.post(url, headers=headers, json=data)
         except requests.exceptions.RequestException as exception:
             log_llm_error_request("deepseek", url, data, exception=exception)
             raise
@@ -86,9 +79,52 @@ class DeepSeek(BaseApi):
             return response_content
         else:
             log_llm_error_request("deepseek", url, data, response=response)
-            raise Exception(f"DeepSeek API 调用失败: {response.status_code}, {response.text}")
+            raise provider_http_error("DeepSeek API 调用失败", response)
 
     def reason_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        url, headers, data = self._build_request(messages)
+        yield from stream_chat_completion(
+            provider="deepseek",
+            url=url,
+            headers=headers,
+            request_body=data,
+            error_prefix="DeepSeek API 调用失败",
+        )
+
+    async def reason_async(self, messages: List[Dict[str, str]]) -> str:
+        url, headers, data = self._build_request(messages)
+
+        try:
+            response = await http_pool.async_post(url, headers=headers, json=data)
+        except httpx.HTTPError as exception:
+            log_llm_error_request("deepseek", url, data, exception=exception)
+            raise
+
+        if response.status_code == 200:
+            try:
+                result = response.json()
+                response_content = result['choices'][0]['message']['content']
+            except Exception as exception:
+                log_llm_error_request("deepseek", url, data, response=response, exception=exception)
+                raise
+            log_llm_success_request("deepseek", url, data, response=response)
+            return response_content
+        else:
+            log_llm_error_request("deepseek", url, data, response=response)
+            raise provider_http_error("DeepSeek API 调用失败", response)
+
+    async def reason_stream_async(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        url, headers, data = self._build_request(messages)
+        async for chunk in stream_chat_completion_async(
+            provider="deepseek",
+            url=url,
+            headers=headers,
+            request_body=data,
+            error_prefix="DeepSeek API 调用失败",
+        ):
+            yield chunk
+
+    def _build_request(self, messages: List[Dict[str, str]]) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
         url = f"{self.base_url}/chat/completions"
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -98,10 +134,4 @@ class DeepSeek(BaseApi):
             "model": self.model,
             "messages": messages,
         }
-        yield from stream_chat_completion(
-            provider="deepseek",
-            url=url,
-            headers=headers,
-            request_body=data,
-            error_prefix="DeepSeek API 调用失败",
-        )
+        return url, headers, data
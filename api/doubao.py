@@ -1,7 +1,9 @@
-from collections.abc import Iterator
-from typing import Dict, List
+import asyncio
+import weakref
+from collections.abc import AsyncIterator, Iterator
+from typing import Any, Dict, List
 
-from volcenginesdkarkruntime import Ark
+from volcenginesdkarkruntime import Ark, AsyncArk
 
 from api.base_api import BaseApi
 from api.error_request_logger import log_llm_error_request, log_llm_success_request
@@ -30,7 +32,12 @@ class Doubao(BaseApi):
     
     def __init__(self, api_key: str, access_point: str) -> None:
         self.access_point = access_point
+        self.api_key = api_key
         self.client = Ark(api_key=api_key)
+        # AsyncArk 的连接绑定在创建它的事件循环上，按需为每个循环各建一个
+        self._async_clients: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, AsyncArk
+        ] = weakref.WeakKeyDictionary()
 
     def reason(self, messages: List[Dict[str, str]]) -> str:
         request_body = {
@@ -64,15 +71,9 @@ class Doubao(BaseApi):
         try:
             completion = self.client.chat.completions.create(**request_body)
             for chunk in completion:
-                choices = getattr(chunk, "choices", None)
-                if not choices:
-                    continue
-                choice = choices[0]
-                if getattr(choice, "finish_reason", None) is not None:
-                    completed = True
-                delta = getattr(choice, "delta", None)
-                content = getattr(delta, "content", None)
-                if isinstance(content, str) and content:
+                content, finished = self._parse_stream_chunk(chunk)
+                completed = completed or finished
+                if content:
                     chunks.append(content)
                     yield content
             if not completed:
@@ -98,3 +99,86 @@ class Doubao(BaseApi):
                 request_body,
                 response_body="".join(chunks),
             )
+
+    async def reason_async(self, messages: List[Dict[str, str]]) -> str:
+        request_body = {
+            "model": self.access_point,
+            "messages": messages,
+        }
+        try:
+            completion = await self._async_client().chat.completions.create(**request_body)
+            response_content = completion.choices[0].message.content
+        except Exception as exception:
+            log_llm_error_request("doubao", "ark://chat/completions", request_body, exception=exception)
+            raise
+        log_llm_success_request(
+            "doubao",
+            "ark://chat/completions",
+            request_body,
+            response_body=response_content,
+        )
+        return response_content
+
+    async def reason_stream_async(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        request_body = {
+            "model": self.access_point,
+            "messages": messages,
+            "stream": True,
+        }
+        completion = None
+        chunks: list[str] = []
+        completed = False
+
+        try:
+            completion = await self._async_client().chat.completions.create(**request_body)
+            async for chunk in completion:
+                content, finished = self._parse_stream_chunk(chunk)
+                completed = completed or finished
+                if content:
+                    chunks.append(content)
+                    yield content
+            if not completed:
+                raise IncompleteStreamError("上游流式响应在完成标记前结束")
+        except Exception as exception:
+            log_llm_error_request(
+                "doubao",
+                "ark://chat/completions",
+                request_body,
+                response_body="".join(chunks),
+                exception=exception,
+            )
+            raise
+        finally:
+            close = getattr(completion, "close", None)
+            if callable(close):
+                await close()
+
+        if completed:
+            log_llm_success_request(
+                "doubao",
+                "ark://chat/completions",
+                request_body,
+                response_body="".join(chunks),
+            )
+
+    def _async_client(self) -> AsyncArk:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AsyncArk(api_key=self.api_key)
+            self._async_clients[loop] = client
+        return client
+
+    @staticmethod
+    def _parse_stream_chunk(chunk: Any) -> tuple[str | None, bool]:
+        """返回 (可见内容, 是否带完成标记)"""
+        choices = getattr(chunk, "choices", None)
+        if not choices:
+            return None, False
+        choice = choices[0]
+        finished = getattr(choice, "finish_reason", None) is not None
+        delta = getattr(choice, "delta", None)
+        content = getattr(delta, "content", None)
+        if isinstance(content, str) and content:
+            return content, finished
+        return None, finished
@@ -4,6 +4,7 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any
 
+import httpx
 import requests
 
 
@@ -16,7 +17,7 @@ def log_llm_error_request(
     provider: str,
     url: str,
     request_body: Any,
-    response: requests.Response | None = None,
+    response: requests.Response | httpx.Response | None = None,
     response_body: Any = None,
     exception: Exception | None = None,
 ) -> None:
@@ -42,7 +43,7 @@ def log_llm_success_request(
     provider: str,
     url: str,
     request_body: Any,
-    response: requests.Response | None = None,
+    response: requests.Response | httpx.Response | None = None,
     response_body: Any = None,
 ) -> None:
     record = _build_record(provider, url, request_body, response=response, response_body=response_body)
@@ -64,7 +65,7 @@ def _build_record(
     provider: str,
     url: str,
     request_body: Any,
-    response: requests.Response | None = None,
+    response: requests.Response | httpx.Response | None = None,
     response_body: Any = None,
     exception: Exception | None = None,
 ) -> dict[str, Any]:
@@ -95,7 +96,7 @@ def _read_recent_success_records() -> list[dict[str, Any]]:
 
 
 def _response_status_code(
-    response: requests.Response | None,
+    response: requests.Response | httpx.Response | None,
     exception: Exception | None,
 ) -> int | None:
     if response is not None:
@@ -113,7 +114,7 @@ def _response_status_code(
 
 
 def _response_body(
-    response: requests.Response | None,
+    response: requests.Response | httpx.Response | None,
     exception: Exception | None,
     response_body: Any = None,
 ) -> Any:
@@ -1,9 +1,26 @@
-from collections.abc import Iterator, Sequence
+import asyncio
+import time
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+from contextlib import aclosing
 from dataclasses import dataclass
-from typing import override
+from typing import cast, override
 
 from api.base_api import BaseApi
-from api.retrying_api import FailureHandler, FallbackEvent
+from api.circuit_breaker import CircuitBreaker, CircuitOpenError
+from api.hedging import Attempt, HedgedRace, Hedger, HedgingSettings, as_stream
+from api.key_balancing import KeyBalancer
+from api.provider_errors import ErrorCategory
+from api.rate_limiting import (
+    RateLimitedError,
+    RateLimiter,
+    wait_and_retry,
+    wait_and_retry_async,
+    wait_and_retry_stream,
+    wait_and_retry_stream_async,
+)
+from api.retrying_api import AsyncSleeper, FailureHandler, FallbackEvent, Sleeper
+from api.routing import Observation, RoutingSettings, TargetStats, rank_entries, rank_groups
+from api.token_estimation import estimate_prompt_tokens, estimate_tokens
 
 
 @dataclass(frozen=True)
@@ -13,70 +30,321 @@ class FallbackEntry:
     target: str
     client: BaseApi
     secrets: tuple[str, ...] = ()
+    model: str | None = None
+    breaker: CircuitBreaker | None = None
+    stats: TargetStats | None = None
+    limiter: RateLimiter | None = None
 
 
 class FallbackApi(BaseApi):
-    """Try multiple clients in order and report only after the whole chain fails."""
+    """Try multiple clients in order and report only after the whole chain fails.
+
+    With latency routing enabled the entries are tried fastest first. Entries whose
+    circuit breaker is open are skipped without a request. When every entry is
+    skipped the chain fails fast with CircuitOpenError. With hedging enabled the
+    async methods also start the next entry when the current one is slow to answer.
+    A key balancer picks which API key's entries come first for each request; the
+    other keys stay behind it as failover. Entries whose rate limiter is out of
+    quota are skipped as well; when every entry is out of quota the chain fails with
+    RateLimitedError without sending a request. A chain that waits_for_capacity then
+    waits once for the quota to recover if that is within the limiter's max wait and
+    tries again; chains nested in a ProviderFallbackApi leave the wait to it.
+    """
 
     def __init__(
         self,
         provider_name: str,
         entries: Sequence[FallbackEntry],
         failure_handlers: list[FailureHandler] | None = None,
+        routing_settings: Callable[[], RoutingSettings] | None = None,
+        hedger: Hedger | None = None,
+        balancer: KeyBalancer | None = None,
+        sleeper: Sleeper = time.sleep,
+        async_sleeper: AsyncSleeper = asyncio.sleep,
+        waits_for_capacity: bool = True,
     ) -> None:
         if not entries:
             raise ValueError("fallback chain cannot be empty")
         self.provider_name: str = provider_name
         self.entries: list[FallbackEntry] = list(entries)
         self.failure_handlers: list[FailureHandler] = failure_handlers or []
+        self.routing_settings: Callable[[], RoutingSettings] | None = routing_settings
+        self.hedger: Hedger | None = hedger
+        self.balancer: KeyBalancer | None = balancer
+        self.sleeper: Sleeper = sleeper
+        self.async_sleeper: AsyncSleeper = async_sleeper
+        self.waits_for_capacity: bool = waits_for_capacity
+        # 条目按 API Key 分组的序号，与 API_KEY 中的顺序一致
+        self._key_indexes: dict[tuple[str, ...], int] = {}
+        for entry in self.entries:
+            self._key_indexes.setdefault(entry.secrets, len(self._key_indexes))
 
     @override
     def reason(self, messages: list[dict[str, str]]) -> str:
-        exceptions: list[Exception] = []
-        for entry in self.entries:
-            try:
-                return entry.client.reason(messages)
-            except Exception as exception:
-                exceptions.append(exception)
+        tokens = self._prompt_tokens(messages)
+        return wait_and_retry(lambda: self._reason(messages, tokens), self._waits_for, self.sleeper)
 
-        event = FallbackEvent(
-            provider_name=self.provider_name,
-            will_retry=False,
-            targets=[entry.target for entry in self.entries],
-            exceptions=exceptions,
-            secret_values=tuple(secret for entry in self.entries for secret in entry.secrets),
+    @override
+    def reason_stream(self, messages: list[dict[str, str]]) -> Iterator[str]:
+        tokens = self._prompt_tokens(messages)
+        return wait_and_retry_stream(lambda: self._reason_stream(messages, tokens), self._waits_for, self.sleeper)
+
+    @override
+    async def reason_async(self, messages: list[dict[str, str]]) -> str:
+        tokens = self._prompt_tokens(messages)
+        return await wait_and_retry_async(lambda: self._reason_async(messages, tokens), self._waits_for, self.async_sleeper)
+
+    @override
+    def reason_stream_async(self, messages: list[dict[str, str]]) -> AsyncIterator[str]:
+        tokens = self._prompt_tokens(messages)
+        return wait_and_retry_stream_async(
+            lambda: self._reason_stream_async(messages, tokens),
+            self._waits_for,
+            self.async_sleeper,
         )
+
+    def _reason(self, messages: list[dict[str, str]], tokens: int) -> str:
+        exceptions: list[Exception] = []
+        attempted_entries: list[FallbackEntry] = []
+        ruled_out: set[tuple[str, object]] = set()
+        try:
+            for entry in self._route(streaming=False):
+                if self._is_ruled_out(entry, ruled_out) or not self._admit(entry, tokens):
+                    continue
+                attempted_entries.append(entry)
+                observation = Observation(entry.stats)
+                try:
+                    result = entry.client.reason(messages)
+                except Exception as exception:
+                    exceptions.append(exception)
+                    self._record_failure(entry, exception, observation)
+                    self._rule_out(entry, exception, ruled_out)
+                except BaseException:
+                    self._release(entry)
+                    raise
+                else:
+                    self._record_success(entry, observation, estimate_tokens(result))
+                    return result
+        finally:
+            self._notify_breakers()
+
+        if not exceptions:
+            raise self._unavailable_error(tokens)
+        event = self._build_fallback_event(attempted_entries, exceptions)
         self._handle_failure(event)
         self._attach_fallback_event(exceptions[-1], event)
         raise exceptions[-1]
 
-    @override
-    def reason_stream(self, messages: list[dict[str, str]]) -> Iterator[str]:
+    def _reason_stream(self, messages: list[dict[str, str]], tokens: int) -> Iterator[str]:
         exceptions: list[Exception] = []
         attempted_entries: list[FallbackEntry] = []
+        ruled_out: set[tuple[str, object]] = set()
 
-        for entry in self.entries:
-            attempted_entries.append(entry)
-            yielded_content = False
-            stream = None
+        try:
+            for entry in self._route(streaming=True):
+                if self._is_ruled_out(entry, ruled_out) or not self._admit(entry, tokens):
+                    continue
+                attempted_entries.append(entry)
+                yielded_content = False
+                completion_tokens = 0
+                recorded = False
+                stream = None
+                observation = Observation(entry.stats)
+                try:
+                    stream = entry.client.reason_stream(messages)
+                    for chunk in stream:
+                        if not chunk:
+                            continue
+                        if not yielded_content:
+                            yielded_content = True
+                            observation.first_token()
+                        completion_tokens += estimate_tokens(chunk)
+                        yield chunk
+                    recorded = True
+                    self._record_success(entry, observation, completion_tokens)
+                    return
+                except Exception as exception:
+                    exceptions.append(exception)
+                    recorded = True
+                    self._record_failure(entry, exception, observation)
+                    if yielded_content:
+                        break
+                    self._rule_out(entry, exception, ruled_out)
+                finally:
+                    if not recorded:
+                        self._release(entry)
+                    close = getattr(stream, "close", None)
+                    if callable(close):
+                        close()
+        finally:
+            self._notify_breakers()
+
+        if not exceptions:
+            raise self._unavailable_error(tokens)
+        event = self._build_fallback_event(attempted_entries, exceptions)
+        self._handle_failure(event)
+        self._attach_fallback_event(exceptions[-1], event)
+        raise exceptions[-1]
+
+    async def _reason_async(self, messages: list[dict[str, str]], tokens: int) -> str:
+        hedging = self._begin_hedging()
+        if hedging is not None:
+            return "".join([
+                chunk async for chunk in self._hedged_stream_async(messages, tokens, hedging, streaming=False)
+            ])
+
+        exceptions: list[Exception] = []
+        attempted_entries: list[FallbackEntry] = []
+        ruled_out: set[tuple[str, object]] = set()
+        try:
+            for entry in self._route(streaming=False):
+                if self._is_ruled_out(entry, ruled_out) or not self._admit(entry, tokens):
+                    continue
+                attempted_entries.append(entry)
+                observation = Observation(entry.stats)
+                try:
+                    result = await entry.client.reason_async(messages)
+                except Exception as exception:
+                    exceptions.append(exception)
+                    self._record_failure(entry, exception, observation)
+                    self._rule_out(entry, exception, ruled_out)
+                except BaseException:
+                    # 任务被取消时请求没有结果，归还半开状态的试探名额
+                    self._release(entry)
+                    raise
+                else:
+                    self._record_success(entry, observation, estimate_tokens(result))
+                    return result
+        finally:
+            await self._notify_breakers_async()
+
+        if not exceptions:
+            raise self._unavailable_error(tokens)
+        event = self._build_fallback_event(attempted_entries, exceptions)
+        await self._handle_failure_async(event)
+        self._attach_fallback_event(exceptions[-1], event)
+        raise exceptions[-1]
+
+    async def _reason_stream_async(self, messages: list[dict[str, str]], tokens: int) -> AsyncIterator[str]:
+        hedging = self._begin_hedging()
+        if hedging is not None:
+            hedged = self._hedged_stream_async(messages, tokens, hedging, streaming=True)
             try:
-                stream = entry.client.reason_stream(messages)
-                for chunk in stream:
-                    if not chunk:
-                        continue
-                    yielded_content = True
+                async for chunk in hedged:
                     yield chunk
-                return
-            except Exception as exception:
-                exceptions.append(exception)
-                if yielded_content:
-                    break
             finally:
-                close = getattr(stream, "close", None)
-                if callable(close):
-                    close()
+                await hedged.aclose()
+            return
 
-        event = FallbackEvent(
+        exceptions: list[Exception] = []
+        attempted_entries: list[FallbackEntry] = []
+        ruled_out: set[tuple[str, object]] = set()
+
+        try:
+            for entry in self._route(streaming=True):
+                if self._is_ruled_out(entry, ruled_out) or not self._admit(entry, tokens):
+                    continue
+                attempted_entries.append(entry)
+                yielded_content = False
+                completion_tokens = 0
+                recorded = False
+                stream = None
+                observation = Observation(entry.stats)
+                try:
+                    stream = entry.client.reason_stream_async(messages)
+                    async for chunk in stream:
+                        if not chunk:
+                            continue
+                        if not yielded_content:
+                            yielded_content = True
+                            observation.first_token()
+                        completion_tokens += estimate_tokens(chunk)
+                        yield chunk
+                    recorded = True
+                    self._record_success(entry, observation, completion_tokens)
+                    return
+                except Exception as exception:
+                    exceptions.append(exception)
+                    recorded = True
+                    self._record_failure(entry, exception, observation)
+                    if yielded_content:
+                        break
+                    self._rule_out(entry, exception, ruled_out)
+                finally:
+                    if not recorded:
+                        self._release(entry)
+                    aclose = getattr(stream, "aclose", None)
+                    if callable(aclose):
+                        await aclose()
+        finally:
+            await self._notify_breakers_async()
+
+        if not exceptions:
+            raise self._unavailable_error(tokens)
+        event = self._build_fallback_event(attempted_entries, exceptions)
+        await self._handle_failure_async(event)
+        self._attach_fallback_event(exceptions[-1], event)
+        raise exceptions[-1]
+
+    async def _hedged_stream_async(
+        self,
+        messages: list[dict[str, str]],
+        tokens: int,
+        hedging: HedgingSettings,
+        streaming: bool,
+    ) -> AsyncIterator[str]:
+        """Race the current entry against the next one once the hedge delay passes; the first to answer wins."""
+        ruled_out: set[tuple[str, object]] = set()
+        race: HedgedRace[FallbackEntry] = HedgedRace(cast(Hedger, self.hedger), hedging, streaming)
+
+        def start_attempt(entry: FallbackEntry) -> AsyncIterator[str] | None:
+            if self._is_ruled_out(entry, ruled_out) or not self._admit(entry, tokens):
+                return None
+            return self._open_stream(entry, messages, streaming)
+
+        def record_failure(attempt: Attempt[FallbackEntry], exception: Exception) -> None:
+            self._record_failure(attempt.entry, exception, attempt.observation)
+            self._rule_out(attempt.entry, exception, ruled_out)
+
+        try:
+            async with aclosing(race.run_stream(
+                self._route(streaming),
+                start_attempt,
+                lambda attempt: self._record_success(attempt.entry, attempt.observation, attempt.completion_tokens),
+                record_failure,
+                self._release,
+            )) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+        finally:
+            await self._notify_breakers_async()
+        if race.succeeded:
+            return
+
+        if not race.exceptions:
+            raise self._unavailable_error(tokens)
+        event = self._build_fallback_event(race.attempted, race.exceptions)
+        await self._handle_failure_async(event)
+        self._attach_fallback_event(race.exceptions[-1], event)
+        raise race.exceptions[-1]
+
+    def _begin_hedging(self) -> HedgingSettings | None:
+        if self.hedger is None or len(self.entries) < 2:
+            return None
+        return self.hedger.begin_request()
+
+    @staticmethod
+    def _open_stream(entry: FallbackEntry, messages: list[dict[str, str]], streaming: bool) -> AsyncIterator[str]:
+        if streaming:
+            return entry.client.reason_stream_async(messages)
+        return as_stream(lambda: entry.client.reason_async(messages))
+
+    def _build_fallback_event(
+        self,
+        attempted_entries: list[FallbackEntry],
+        exceptions: list[Exception],
+    ) -> FallbackEvent:
+        return FallbackEvent(
             provider_name=self.provider_name,
             will_retry=False,
             targets=[entry.target for entry in attempted_entries],
@@ -87,9 +355,96 @@ class FallbackApi(BaseApi):
                 for secret in entry.secrets
             ),
         )
-        self._handle_failure(event)
-        self._attach_fallback_event(exceptions[-1], event)
-        raise exceptions[-1]
+
+    @staticmethod
+    def _rule_out(entry: FallbackEntry, exception: Exception, ruled_out: set[tuple[str, object]]) -> None:
+        """An auth error rules out the entry's API key; a context-length error rules out its model."""
+        category = getattr(exception, "category", None)
+        if category is ErrorCategory.AUTH and entry.secrets:
+            ruled_out.add(("secrets", entry.secrets))
+        elif category is ErrorCategory.CONTEXT_LENGTH and entry.model is not None:
+            ruled_out.add(("model", entry.model))
+
+    @staticmethod
+    def _is_ruled_out(entry: FallbackEntry, ruled_out: set[tuple[str, object]]) -> bool:
+        return ("secrets", entry.secrets) in ruled_out or ("model", entry.model) in ruled_out
+
+    def _route(self, streaming: bool) -> Sequence[FallbackEntry]:
+        if self.balancer is None:
+            return rank_entries(self.entries, self.routing_settings, streaming)
+        # 延迟排序只决定模型的先后，同一模型内保持均衡器选出的 Key 顺序，流量不会都集中到最快的 Key 上
+        balanced = self._balanced_entries(self.balancer)
+        return rank_groups(balanced, lambda entry: entry.model, self.routing_settings, streaming)
+
+    def _balanced_entries(self, balancer: KeyBalancer) -> Sequence[FallbackEntry]:
+        positions = {key_index: position for position, key_index in enumerate(balancer.order())}
+        return sorted(self.entries, key=lambda entry: positions[self._key_indexes[entry.secrets]])
+
+    def _admit(self, entry: FallbackEntry, tokens: int) -> bool:
+        if entry.breaker is not None and not entry.breaker.allow_request():
+            return False
+        if entry.limiter is not None and not entry.limiter.try_acquire(tokens):
+            # 额度不足时请求不会发出，归还半开状态的试探名额
+            if entry.breaker is not None:
+                entry.breaker.release()
+            return False
+        if self.balancer is not None:
+            self.balancer.acquire(self._key_indexes[entry.secrets])
+        return True
+
+    def _record_success(self, entry: FallbackEntry, observation: Observation, completion_tokens: int = 0) -> None:
+        observation.succeeded()
+        if entry.breaker is not None:
+            entry.breaker.record_success()
+        if entry.limiter is not None:
+            entry.limiter.charge(completion_tokens)
+        self._finish(entry)
+
+    def _record_failure(self, entry: FallbackEntry, exception: Exception, observation: Observation) -> None:
+        observation.failed(exception)
+        if entry.breaker is not None:
+            entry.breaker.record_failure(exception)
+        self._finish(entry)
+
+    def _release(self, entry: FallbackEntry) -> None:
+        if entry.breaker is not None:
+            entry.breaker.release()
+        self._finish(entry)
+
+    def _finish(self, entry: FallbackEntry) -> None:
+        if self.balancer is not None:
+            self.balancer.release(self._key_indexes[entry.secrets])
+
+    def _prompt_tokens(self, messages: list[dict[str, str]]) -> int:
+        if any(entry.limiter is not None and entry.limiter.counts_tokens for entry in self.entries):
+            return estimate_prompt_tokens(messages)
+        return 0
+
+    def _waits_for(self, error: RateLimitedError) -> bool:
+        """Wait only for this chain's own not-sent error, never for an entry's."""
+        return self.waits_for_capacity and error.provider_name == self.provider_name and error.waitable
+
+    def _unavailable_error(self, tokens: int) -> Exception:
+        """The error for a request that every entry skipped without sending it."""
+        targets = [entry.target for entry in self.entries]
+        waits = [
+            (wait, entry.limiter.limit.max_wait)
+            for entry in self.entries
+            if entry.limiter is not None and (wait := entry.limiter.wait_time(tokens)) > 0
+        ]
+        if waits:
+            return RateLimitedError.from_waits(self.provider_name, targets, waits)
+        return CircuitOpenError(self.provider_name, targets)
+
+    def _notify_breakers(self) -> None:
+        for entry in self.entries:
+            if entry.breaker is not None:
+                entry.breaker.notify()
+
+    async def _notify_breakers_async(self) -> None:
+        for entry in self.entries:
+            if entry.breaker is not None:
+                await entry.breaker.notify_async()
 
     def _handle_failure(self, event: FallbackEvent) -> None:
         for handler in self.failure_handlers:
@@ -98,6 +453,10 @@ class FallbackApi(BaseApi):
             except Exception as exception:
                 print(f"failure handler failed: {type(exception).__name__}")
 
+    async def _handle_failure_async(self, event: FallbackEvent) -> None:
+        if self.failure_handlers:
+            await asyncio.to_thread(self._handle_failure, event)
+
     def _attach_fallback_event(self, exception: Exception, event: FallbackEvent) -> None:
         try:
             setattr(exception, "fallback_event", event)
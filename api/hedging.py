@@ -0,0 +1,381 @@
+"""回退链的对冲请求。
+
+[hedging] 启用后，异步接口上的回退链在首个目标迟迟没有输出时（非流式请求为完整响应，
+流式请求为首个非空片段），并行请求下一个目标，先输出者胜出，另一个请求被取消并释放连接。
+每条链的对冲次数受预算限制：每个请求为预算存入 MAX_HEDGE_RATE 个额度，每次对冲消耗 1 个，
+因此长期来看额外发出的上游请求不超过请求数的 MAX_HEDGE_RATE 倍。
+
+HedgedRace.run_stream 实现竞速本身，回退链只提供准入、发起请求和记录结果的回调，
+API Key/模型回退链和服务商回退链共用同一套竞速逻辑。
+"""
+
+import asyncio
+import threading
+from collections.abc import AsyncIterator, Awaitable, Iterable
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Generic, List, Protocol, TypeVar
+
+from api.param_schema import ParamType, ProviderParam, validate_params
+from api.routing import Observation, TargetStats
+from api.token_estimation import estimate_tokens
+
+# 预算最多累积的对冲次数，避免长时间空闲后集中对冲
+_MAX_BALANCE = 10.0
+_P95 = 0.95
+
+
+@dataclass(frozen=True)
+class HedgingSettings:
+    """[hedging] 配置段，默认关闭，与未配置该段时的行为一致"""
+
+    SECTION_NAME = "hedging"
+    DEFAULT_DELAY_MS = 1000.0
+    DEFAULT_MIN_P95_SAMPLES = 20
+    DEFAULT_MAX_HEDGE_RATE = 0.1
+
+    enabled: bool = False
+    delay_ms: float = DEFAULT_DELAY_MS
+    use_p95: bool = False
+    min_p95_samples: int = DEFAULT_MIN_P95_SAMPLES
+    max_hedge_rate: float = DEFAULT_MAX_HEDGE_RATE
+
+    @classmethod
+    def get_params(cls) -> List[ProviderParam]:
+        return [
+            ProviderParam(
+                name="enabled",
+                param_type=ParamType.BOOLEAN,
+                required=False,
+                default=False,
+                description="是否在异步接口上为回退链发出对冲请求",
+            ),
+            ProviderParam(
+                name="delay_ms",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_DELAY_MS,
+                description="首个目标超过这么多毫秒仍没有输出时，并行请求下一个目标",
+            ),
+            ProviderParam(
+                name="use_p95",
+                param_type=ParamType.BOOLEAN,
+                required=False,
+                default=False,
+                description="样本足够时改用首个目标最近请求的 p95 延迟（流式请求为 TTFT）作为对冲延迟",
+            ),
+            ProviderParam(
+                name="min_p95_samples",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_MIN_P95_SAMPLES,
+                description="目标至少有这么多次成功请求后才使用 p95 延迟",
+            ),
+            ProviderParam(
+                name="max_hedge_rate",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_MAX_HEDGE_RATE,
+                description="对冲请求数占请求数的最大比例，取值 (0, 1]",
+            ),
+        ]
+
+    @classmethod
+    def validate_config(cls, config: Dict[str, Any]) -> tuple[bool, List[str]]:
+        is_valid, errors = validate_params(cls.get_params(), config)
+        delay_ms = config.get("delay_ms")
+        if isinstance(delay_ms, (int, float)) and delay_ms <= 0:
+            errors.append("delay_ms must be greater than 0")
+        min_p95_samples = config.get("min_p95_samples")
+        if isinstance(min_p95_samples, int) and min_p95_samples <= 0:
+            errors.append("min_p95_samples must be greater than 0")
+        max_hedge_rate = config.get("max_hedge_rate")
+        if isinstance(max_hedge_rate, (int, float)) and not 0 < max_hedge_rate <= 1:
+            errors.append("max_hedge_rate must be greater than 0 and at most 1")
+        return is_valid and not errors, errors
+
+
+class Hedger:
+    """一条回退链的对冲预算和胜负统计，线程安全"""
+
+    def __init__(self, provider_name: str, settings_provider: Callable[[], HedgingSettings]) -> None:
+        self.provider_name: str = provider_name
+        self._settings_provider = settings_provider
+        self._lock = threading.Lock()
+        self._balance = 0.0
+        self._requests = 0
+        self._hedged = 0
+        self._won = 0
+        self._lost = 0
+        self._budget_exhausted = 0
+
+    def begin_request(self) -> HedgingSettings | None:
+        """请求开始时调用；启用对冲时存入预算并返回当前配置，否则返回 None"""
+        settings = self._settings_provider()
+        if not settings.enabled:
+            return None
+        with self._lock:
+            self._requests += 1
+            self._balance = min(self._balance + settings.max_hedge_rate, _MAX_BALANCE)
+        return settings
+
+    def delay(self, settings: HedgingSettings, stats: TargetStats | None, streaming: bool) -> float:
+        """首个目标的对冲延迟（秒）"""
+        if settings.use_p95 and stats is not None:
+            p95 = stats.percentile(_P95, streaming, min_samples=settings.min_p95_samples)
+            if p95 is not None:
+                return p95
+        return settings.delay_ms / 1000
+
+    def try_hedge(self) -> bool:
+        with self._lock:
+            if self._balance < 1.0:
+                self._budget_exhausted += 1
+                return False
+            self._balance -= 1.0
+            self._hedged += 1
+            return True
+
+    def refund(self) -> None:
+        """预算已扣除但没有可对冲的目标"""
+        with self._lock:
+            self._balance = min(self._balance + 1.0, _MAX_BALANCE)
+            self._hedged -= 1
+
+    def record_winner(self, hedge_won: bool) -> None:
+        with self._lock:
+            if hedge_won:
+                self._won += 1
+            else:
+                self._lost += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "hedged": self._hedged,
+                "won": self._won,
+                "lost": self._lost,
+                "budget_exhausted": self._budget_exhausted,
+            }
+
+
+class _HedgedEntry(Protocol):
+    @property
+    def stats(self) -> TargetStats | None: ...
+
+
+EntryT = TypeVar("EntryT", bound=_HedgedEntry)
+_END = object()
+
+
+class _Failed:
+    def __init__(self, exception: Exception) -> None:
+        self.exception = exception
+
+
+class Attempt(Generic[EntryT]):
+    """竞速中的一个目标，在独立任务中读取输出。
+
+    首个非空片段到达、输出结束或失败时 ready 完成；失败时 error 为异常。
+    队列长度为 1，未被选中的请求读到首个片段后就不再继续读取上游。
+    记录该请求的结果（成功、失败或释放熔断器名额）后把 settled 置为 True。
+    completion_tokens 是已读出片段的估算 token 数，供限流扣除输出额度。
+    """
+
+    def __init__(
+        self,
+        entry: EntryT,
+        observation: Observation,
+        stream: AsyncIterator[str],
+        hedge: bool,
+        track_first_token: bool,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        self.entry: EntryT = entry
+        self.observation: Observation = observation
+        self.hedge: bool = hedge
+        self.error: Exception | None = None
+        self.reported: bool = False
+        self.settled: bool = False
+        self.completion_tokens: int = 0
+        self.started: float = loop.time()
+        self.ready: asyncio.Future[None] = loop.create_future()
+        self._track_first_token = track_first_token
+        self._queue: asyncio.Queue[Any] = asyncio.Queue(maxsize=1)
+        self.task: asyncio.Task[None] = asyncio.create_task(self._pump(stream))
+
+    async def chunks(self) -> AsyncIterator[str]:
+        while True:
+            item = await self._queue.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failed):
+                raise item.exception
+            self.completion_tokens += estimate_tokens(item)
+            yield item
+
+    async def _pump(self, stream: AsyncIterator[str]) -> None:
+        try:
+            async for chunk in stream:
+                if not chunk:
+                    continue
+                if not self.ready.done():
+                    if self._track_first_token:
+                        self.observation.first_token()
+                    self.ready.set_result(None)
+                await self._queue.put(chunk)
+        except Exception as exception:
+            if self.ready.done():
+                await self._queue.put(_Failed(exception))
+            else:
+                self.error = exception
+                self.ready.set_result(None)
+            return
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if callable(aclose):
+                await aclose()
+        if not self.ready.done():
+            self.ready.set_result(None)
+        await self._queue.put(_END)
+
+
+class HedgedRace(Generic[EntryT]):
+    """一次请求中并行进行的目标，最多一个首发请求和一个对冲请求。
+
+    run_stream 依次尝试候选目标：首个目标超过对冲延迟仍没有输出时，预算允许就并行发出下一个目标，
+    先输出者胜出，其余请求被取消。结束后 attempted 为需要计入失败通知的目标（不含被取消的请求），
+    exceptions 为各目标的失败，succeeded 表示是否有目标完整输出。
+    """
+
+    def __init__(self, hedger: Hedger, settings: HedgingSettings, streaming: bool) -> None:
+        self._hedger = hedger
+        self._settings = settings
+        self._streaming = streaming
+        self._attempts: list[Attempt[EntryT]] = []
+        self.hedged: bool = False
+        self.attempted: list[EntryT] = []
+        self.exceptions: list[Exception] = []
+        self.succeeded: bool = False
+
+    @property
+    def running(self) -> list[Attempt[EntryT]]:
+        """尚未有结果的请求，按发出顺序"""
+        return [attempt for attempt in self._attempts if not attempt.reported]
+
+    async def run_stream(
+        self,
+        candidates: Iterable[EntryT],
+        start_attempt: Callable[[EntryT], AsyncIterator[str] | None],
+        record_success: Callable[[Attempt[EntryT]], None],
+        record_failure: Callable[[Attempt[EntryT], Exception], None],
+        release: Callable[[EntryT], None],
+        on_fallback: Callable[[Attempt[EntryT], Exception], Awaitable[None]] | None = None,
+    ) -> AsyncIterator[str]:
+        """竞速并输出胜出目标的片段。
+
+        start_attempt 对目标做准入检查并发起请求，不允许发出时返回 None；
+        record_success / record_failure 记录有结果的请求，release 归还被取消请求占用的名额，
+        on_fallback 在目标输出前失败、竞速转向下一个目标时调用。
+        """
+        candidates = iter(candidates)
+        may_hedge = True
+        try:
+            while self.running or self._start_next(candidates, start_attempt, hedge=False):
+                timeout = None
+                if may_hedge and len(self.running) == 1:
+                    stats = self.running[0].entry.stats
+                    timeout = self._hedge_timeout(self._hedger.delay(self._settings, stats, self._streaming))
+                attempt = await self._wait(timeout)
+                if attempt is None:
+                    may_hedge = False
+                    if self._hedger.try_hedge() and not self._start_next(candidates, start_attempt, hedge=True):
+                        self._hedger.refund()
+                    continue
+
+                if attempt.error is not None:
+                    self._fail(attempt, attempt.error, record_failure)
+                    if on_fallback is not None:
+                        await on_fallback(attempt, attempt.error)
+                    continue
+
+                for loser in await self._cancel(keep=attempt):
+                    release(loser.entry)
+                    self.attempted = [entry for entry in self.attempted if entry is not loser.entry]
+                if self.hedged:
+                    self._hedger.record_winner(attempt.hedge)
+                try:
+                    async for chunk in attempt.chunks():
+                        yield chunk
+                except Exception as exception:
+                    self._fail(attempt, exception, record_failure)
+                    return
+                attempt.settled = True
+                self.succeeded = True
+                record_success(attempt)
+                return
+        finally:
+            for attempt in await self._cancel():
+                release(attempt.entry)
+
+    def _start_next(
+        self,
+        candidates: Iterable[EntryT],
+        start_attempt: Callable[[EntryT], AsyncIterator[str] | None],
+        hedge: bool,
+    ) -> bool:
+        for entry in candidates:
+            observation = Observation(entry.stats)
+            stream = start_attempt(entry)
+            if stream is None:
+                continue
+            self.attempted.append(entry)
+            self._attempts.append(Attempt(entry, observation, stream, hedge, self._streaming))
+            if hedge:
+                self.hedged = True
+            return True
+        return False
+
+    def _fail(
+        self,
+        attempt: Attempt[EntryT],
+        exception: Exception,
+        record_failure: Callable[[Attempt[EntryT], Exception], None],
+    ) -> None:
+        attempt.settled = True
+        self.exceptions.append(exception)
+        record_failure(attempt, exception)
+
+    def _hedge_timeout(self, delay: float) -> float:
+        """距离对冲还要等待的秒数，从唯一在进行的请求发出时算起"""
+        elapsed = asyncio.get_running_loop().time() - self.running[0].started
+        return max(delay - elapsed, 0.0)
+
+    async def _wait(self, timeout: float | None) -> Attempt[EntryT] | None:
+        """等待下一个有结果的请求；超时返回 None。同时完成时先发出的优先"""
+        running = self.running
+        await asyncio.wait([attempt.ready for attempt in running], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for attempt in running:
+            if attempt.ready.done():
+                attempt.reported = True
+                return attempt
+        return None
+
+    async def _cancel(self, keep: Attempt[EntryT] | None = None) -> list[Attempt[EntryT]]:
+        """取消除 keep 以外所有结果未记录的请求，等待它们关闭上游连接并把它们标记为 settled"""
+        cancelled = [
+            attempt
+            for attempt in self._attempts
+            if attempt is not keep and not attempt.settled
+        ]
+        for attempt in cancelled:
+            attempt.settled = True
+            attempt.task.cancel()
+        if cancelled:
+            await asyncio.gather(*(attempt.task for attempt in cancelled), return_exceptions=True)
+        return cancelled
+
+
+async def as_stream(call: Callable[[], Awaitable[str]]) -> AsyncIterator[str]:
+    """把非流式请求包装成只有一个片段的流，以便与流式请求共用竞速逻辑"""
+    yield await call()
@@ -0,0 +1,362 @@
+"""Shared keep-alive HTTP sessions for provider clients.
+
+Every provider request goes through one ``requests.Session`` per base URL
+(scheme + host), so consecutive chat turns reuse warm TCP/TLS connections
+instead of paying a fresh handshake each time. Async callers get the same
+per-base-URL reuse through one ``httpx.AsyncClient`` per event loop.
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+from collections.abc import AsyncIterator
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, List
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from api.param_schema import ParamType, ProviderParam, validate_params
+
+
+@dataclass(frozen=True)
+class HttpPoolSettings:
+    """[http_pool] 配置段"""
+
+    SECTION_NAME = "http_pool"
+    DEFAULT_POOL_SIZE = 32
+    DEFAULT_IDLE_TIMEOUT = 90.0
+
+    pool_size: int = DEFAULT_POOL_SIZE
+    idle_timeout: float = DEFAULT_IDLE_TIMEOUT
+
+    @classmethod
+    def get_params(cls) -> List[ProviderParam]:
+        return [
+            ProviderParam(
+                name="pool_size",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_POOL_SIZE,
+                description="每个上游地址最多保持的 keep-alive 连接数",
+            ),
+            ProviderParam(
+                name="idle_timeout",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_IDLE_TIMEOUT,
+                description="上游地址连续空闲多少秒后关闭其连接池",
+            ),
+        ]
+
+    @classmethod
+    def validate_config(cls, config: Dict[str, Any]) -> tuple[bool, List[str]]:
+        is_valid, errors = validate_params(cls.get_params(), config)
+        pool_size = config.get("pool_size")
+        if isinstance(pool_size, int) and pool_size <= 0:
+            errors.append("pool_size must be greater than 0")
+        idle_timeout = config.get("idle_timeout")
+        if isinstance(idle_timeout, (int, float)) and idle_timeout <= 0:
+            errors.append("idle_timeout must be greater than 0")
+        return is_valid and not errors, errors
+
+
+@dataclass
+class _PooledSession:
+    session: requests.Session
+    last_used: float
+
+
+class HttpSessionPool:
+    """Per-base-URL keep-alive sessions with idle expiry and hit/miss counters."""
+
+    def __init__(self, settings: HttpPoolSettings | None = None) -> None:
+        self._settings: HttpPoolSettings = settings or HttpPoolSettings()
+        self._sessions: Dict[str, _PooledSession] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+
+    @property
+    def settings(self) -> HttpPoolSettings:
+        return self._settings
+
+    def configure(self, settings: HttpPoolSettings) -> None:
+        """Apply new pool settings; existing sessions are rebuilt on next use."""
+        with self._lock:
+            if settings == self._settings:
+                return
+            self._settings = settings
+            stale = list(self._sessions.values())
+            self._sessions = {}
+        for entry in stale:
+            # In-flight responses keep their connection until released; the
+            # closed pool then discards it instead of returning it.
+            entry.session.close()
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.session_for(url).post(url, **kwargs)
+
+    def session_for(self, url: str) -> requests.Session:
+        key = self._base_url_key(url)
+        now = time.monotonic()
+        expired: list[_PooledSession] = []
+        with self._lock:
+            idle_timeout = self._settings.idle_timeout
+            for other_key, other in list(self._sessions.items()):
+                if now - other.last_used > idle_timeout:
+                    expired.append(self._sessions.pop(other_key))
+            self._expired += len(expired)
+
+            entry = self._sessions.get(key)
+            if entry is None:
+                self._misses += 1
+                entry = _PooledSession(session=self._build_session(), last_used=now)
+                self._sessions[key] = entry
+            else:
+                self._hits += 1
+                entry.last_used = now
+            session = entry.session
+
+        for stale in expired:
+            stale.session.close()
+        return session
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = dict(self._sessions)
+            result: Dict[str, Any] = {
+                "pool_size": self._settings.pool_size,
+                "idle_timeout": self._settings.idle_timeout,
+                "hits": self._hits,
+                "misses": self._misses,
+                "expired": self._expired,
+            }
+
+        hosts: Dict[str, Dict[str, int]] = {}
+        for key, entry in sessions.items():
+            opened, sent = self._connection_counts(entry.session)
+            hosts[key] = {
+                "connections_opened": opened,
+                "requests_sent": sent,
+                "connections_reused": max(sent - opened, 0),
+            }
+        result["hosts"] = hosts
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+        for entry in sessions:
+            entry.session.close()
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+        pool_size = self._settings.pool_size
+        for prefix in ("https://", "http://"):
+            session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        return session
+
+    @staticmethod
+    def _base_url_key(url: str) -> str:
+        return _base_url_key(url)
+
+    @staticmethod
+    def _connection_counts(session: requests.Session) -> tuple[int, int]:
+        opened = 0
+        sent = 0
+        for adapter in session.adapters.values():
+            pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+            if pools is None:
+                continue
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is None:
+                    continue
+                opened += getattr(pool, "num_connections", 0)
+                sent += getattr(pool, "num_requests", 0)
+        return opened, sent
+
+
+@dataclass
+class _PooledAsyncClient:
+    client: httpx.AsyncClient
+    loop: asyncio.AbstractEventLoop
+    in_flight: int = 0
+    retired: bool = False
+
+
+class AsyncHttpClientPool:
+    """Per-event-loop, per-base-URL ``httpx.AsyncClient`` instances.
+
+    httpx connections belong to the loop that opened them, so clients are
+    keyed by the running loop and dropped together with it. Clients replaced
+    by ``configure`` are closed on their own loop once their in-flight
+    requests finish.
+    """
+
+    def __init__(self, settings: HttpPoolSettings | None = None) -> None:
+        self._settings: HttpPoolSettings = settings or HttpPoolSettings()
+        self._clients: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop,
+            Dict[str, _PooledAsyncClient],
+        ] = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def configure(self, settings: HttpPoolSettings) -> None:
+        """Apply new settings; clients already handed out finish their requests before closing."""
+        with self._lock:
+            if settings == self._settings:
+                return
+            self._settings = settings
+            stale = self._retire_all()
+        for pooled in stale:
+            self._schedule_close(pooled)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        pooled = self._checkout(url)
+        try:
+            return await pooled.client.post(url, **kwargs)
+        finally:
+            await self._checkin(pooled)
+
+    def stream(self, url: str, **kwargs: Any) -> AbstractAsyncContextManager[httpx.Response]:
+        return self._stream(url, **kwargs)
+
+    async def aclose(self) -> None:
+        """Close the running loop's clients, e.g. at server shutdown."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._clients.pop(loop, {})
+            stale = []
+            for pooled in clients.values():
+                pooled.retired = True
+                if pooled.in_flight == 0:
+                    stale.append(pooled)
+        for pooled in stale:
+            await pooled.client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "clients": sum(len(clients) for clients in self._clients.values()),
+            }
+
+    @asynccontextmanager
+    async def _stream(self, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        pooled = self._checkout(url)
+        try:
+            async with pooled.client.stream("POST", url, **kwargs) as response:
+                yield response
+        finally:
+            await self._checkin(pooled)
+
+    def _checkout(self, url: str) -> _PooledAsyncClient:
+        loop = asyncio.get_running_loop()
+        key = _base_url_key(url)
+        with self._lock:
+            clients = self._clients.get(loop)
+            if clients is None:
+                clients = {}
+                self._clients[loop] = clients
+            pooled = clients.get(key)
+            if pooled is None:
+                self._misses += 1
+                pooled = _PooledAsyncClient(client=self._build_client(), loop=loop)
+                clients[key] = pooled
+            else:
+                self._hits += 1
+            pooled.in_flight += 1
+            return pooled
+
+    async def _checkin(self, pooled: _PooledAsyncClient) -> None:
+        with self._lock:
+            pooled.in_flight -= 1
+            close = pooled.retired and pooled.in_flight == 0
+        if close:
+            await pooled.client.aclose()
+
+    def _retire_all(self) -> list[_PooledAsyncClient]:
+        """Drop every client; returns the idle ones, busy ones close on their last checkin."""
+        stale: list[_PooledAsyncClient] = []
+        for clients in self._clients.values():
+            for pooled in clients.values():
+                pooled.retired = True
+                if pooled.in_flight == 0:
+                    stale.append(pooled)
+        self._clients = weakref.WeakKeyDictionary()
+        return stale
+
+    @staticmethod
+    def _schedule_close(pooled: _PooledAsyncClient) -> None:
+        # aclose must run on the loop that owns the client's connections; a
+        # closed loop has already dropped them.
+        if pooled.loop.is_closed():
+            return
+        closing = pooled.client.aclose()
+        try:
+            asyncio.run_coroutine_threadsafe(closing, pooled.loop)
+        except RuntimeError:
+            closing.close()
+
+    def _build_client(self) -> httpx.AsyncClient:
+        # Match the blocking path: no overall timeout, because reasoning
+        # models may legitimately take minutes to finish.
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(None),
+            limits=httpx.Limits(
+                max_connections=None,
+                max_keepalive_connections=self._settings.pool_size,
+                keepalive_expiry=self._settings.idle_timeout,
+            ),
+        )
+
+
+def _base_url_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+
+_default_pool = HttpSessionPool()
+_default_async_pool = AsyncHttpClientPool()
+
+
+def post(url: str, **kwargs: Any) -> requests.Response:
+    """POST through the shared per-base-URL keep-alive pool."""
+    return _default_pool.post(url, **kwargs)
+
+
+async def async_post(url: str, **kwargs: Any) -> httpx.Response:
+    """POST through the current event loop's per-base-URL keep-alive client."""
+    return await _default_async_pool.post(url, **kwargs)
+
+
+def async_stream(url: str, **kwargs: Any) -> AbstractAsyncContextManager[httpx.Response]:
+    """Open a streaming POST; the connection is released when the context exits."""
+    return _default_async_pool.stream(url, **kwargs)
+
+
+def configure(settings: HttpPoolSettings) -> None:
+    _default_pool.configure(settings)
+    _default_async_pool.configure(settings)
+
+
+async def aclose_async_clients() -> None:
+    """Close the running loop's async clients; call from the ASGI shutdown hook."""
+    await _default_async_pool.aclose()
+
+
+def get_stats() -> Dict[str, Any]:
+    stats = _default_pool.stats()
+    stats["async"] = _default_async_pool.stats()
+    return stats
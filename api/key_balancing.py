@@ -0,0 +1,149 @@
+"""同一服务商多个 API Key 之间的负载均衡。
+
+API_KEY 配置多个值时默认按顺序故障转移，第一个 Key 承担全部流量。服务商配置段的
+KEY_BALANCING 可以改为 round_robin、weighted 或 least_in_flight：每个请求先按策略选出
+一个 Key，其余 Key 从它之后依次排列，选中的 Key 失败时仍会切换到其余 Key。
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from api.param_schema import ParamType, ProviderParam, parse_params, unquote, validate_params
+
+
+@dataclass(frozen=True)
+class KeyBalancing:
+    """单个服务商的 API Key 均衡策略，默认 failover 与旧行为一致。
+
+    - failover：总是先用第一个 Key，失败后依次切换
+    - round_robin：各 Key 轮流作为首选
+    - weighted：按 API_KEY_WEIGHTS 的比例平滑轮询
+    - least_in_flight：首选当前进行中请求最少的 Key，相同时轮流
+    """
+
+    FAILOVER = "failover"
+    ROUND_ROBIN = "round_robin"
+    WEIGHTED = "weighted"
+    LEAST_IN_FLIGHT = "least_in_flight"
+    STRATEGIES = (FAILOVER, ROUND_ROBIN, WEIGHTED, LEAST_IN_FLIGHT)
+
+    strategy: str = FAILOVER
+    weights: tuple[int, ...] = ()
+
+    @classmethod
+    def get_params(cls) -> List[ProviderParam]:
+        """服务商配置段中可用的均衡参数"""
+        return [
+            ProviderParam(
+                name="key_balancing",
+                param_type=ParamType.STRING,
+                required=False,
+                default=cls.FAILOVER,
+                description="多个 API Key 的均衡策略：failover、round_robin、weighted、least_in_flight",
+            ),
+            ProviderParam(
+                name="api_key_weights",
+                param_type=ParamType.STRING,
+                required=False,
+                description="weighted 策略下各 API Key 的权重，逗号分隔的正整数，与 API_KEY 一一对应",
+            ),
+        ]
+
+    @classmethod
+    def validate_config(cls, config: Dict[str, Any]) -> tuple[bool, List[str]]:
+        is_valid, errors = validate_params(cls.get_params(), config)
+        strategy = config.get("key_balancing")
+        if isinstance(strategy, str) and unquote(strategy).lower() not in cls.STRATEGIES:
+            errors.append(f"key_balancing must be one of: {', '.join(cls.STRATEGIES)}")
+        weights = config.get("api_key_weights")
+        if isinstance(weights, str):
+            if _parse_weights(weights) is None:
+                errors.append("api_key_weights must be a comma-separated list of positive integers")
+        return is_valid and not errors, errors
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "KeyBalancing":
+        """从服务商配置中取出并移除均衡参数，校验失败时抛出 ValueError"""
+        names = {param.name for param in cls.get_params()}
+        raw_config = {name: config.pop(name) for name in list(config) if name in names}
+        balancing_config = parse_params(cls.get_params(), raw_config)
+        is_valid, errors = cls.validate_config(balancing_config)
+        if not is_valid:
+            raise ValueError("\n".join(errors))
+        weights = tuple(_parse_weights(balancing_config.get("api_key_weights") or "") or ())
+        if weights and "api_key" in config and len(weights) != len(str(config["api_key"]).split(",")):
+            raise ValueError("api_key_weights must list one weight per api_key")
+        return cls(strategy=unquote(balancing_config["key_balancing"]).lower(), weights=weights)
+
+    @property
+    def balanced(self) -> bool:
+        return self.strategy != self.FAILOVER
+
+
+class KeyBalancer:
+    """为每个请求排列 API Key 的尝试顺序，线程安全。
+
+    Key 用其在 API_KEY 中的位置（从 0 开始）表示。least_in_flight 依赖调用方在请求开始和
+    结束时调用 acquire/release。
+    """
+
+    def __init__(self, balancing: KeyBalancing, key_count: int) -> None:
+        self.balancing: KeyBalancing = balancing
+        self.key_count: int = key_count
+        self._weights: list[int] = list(balancing.weights) or [1] * key_count
+        self._lock = threading.Lock()
+        self._cursor = 0
+        self._current_weights = [0] * key_count
+        self._in_flight = [0] * key_count
+
+    def order(self) -> list[int]:
+        """本次请求的 Key 顺序：首选的 Key 在前，其余从它之后依次排列"""
+        with self._lock:
+            first = self._pick()
+        return [(first + offset) % self.key_count for offset in range(self.key_count)]
+
+    def acquire(self, key_index: int) -> None:
+        with self._lock:
+            self._in_flight[key_index] += 1
+
+    def release(self, key_index: int) -> None:
+        with self._lock:
+            if self._in_flight[key_index] > 0:
+                self._in_flight[key_index] -= 1
+
+    def in_flight(self) -> list[int]:
+        with self._lock:
+            return list(self._in_flight)
+
+    def _pick(self) -> int:
+        strategy = self.balancing.strategy
+        if strategy == KeyBalancing.WEIGHTED:
+            # 平滑加权轮询：权重 3,1 的两个 Key 依次得到 0,0,1,0 而不是 0,0,0,1
+            total = sum(self._weights)
+            for index, weight in enumerate(self._weights):
+                self._current_weights[index] += weight
+            chosen = max(range(self.key_count), key=lambda index: self._current_weights[index])
+            self._current_weights[chosen] -= total
+            return chosen
+
+        start = self._cursor
+        self._cursor = (self._cursor + 1) % self.key_count
+        if strategy == KeyBalancing.LEAST_IN_FLIGHT:
+            return min(
+                range(self.key_count),
+                key=lambda index: (self._in_flight[index], (index - start) % self.key_count),
+            )
+        if strategy == KeyBalancing.ROUND_ROBIN:
+            return start
+        return 0
+
+
+def _parse_weights(value: str) -> list[int] | None:
+    try:
+        weights = [int(unquote(part)) for part in unquote(value).split(",")]
+    except ValueError:
+        return None
+    if not weights or any(weight <= 0 for weight in weights):
+        return None
+    return weights
@@ -1,12 +1,15 @@
-from collections.abc import Iterator
-from typing import Any, Dict, List
+from collections.abc import AsyncIterator, Iterator
+from typing import Any, Dict, List, Tuple
 
+import httpx
 import requests
 
+from api import http_pool
 from api.base_api import BaseApi
 from api.error_request_logger import log_llm_error_request, log_llm_success_request
 from api.param_schema import ParamType, ProviderParam
-from api.streaming import stream_chat_completion
+from api.provider_errors import provider_http_error
+from api.streaming import stream_chat_completion, stream_chat_completion_async
 
 
 class Kimi(BaseApi):
@@ -88,6 +91,19 @@ class Kimi(BaseApi):
             return
         yield from self._reason_anthropic_stream(messages)
 
+    async def reason_async(self, messages: List[Dict[str, str]]) -> str:
+        if self.protocol == "openai":
+            return await self._reason_openai_async(messages)
+        return await self._reason_anthropic_async(messages)
+
+    async def reason_stream_async(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        if self.protocol == "openai":
+            stream = self._reason_openai_stream_async(messages)
+        else:
+            stream = self._reason_anthropic_stream_async(messages)
+        async for chunk in stream:
+            yield chunk
+
     def _resolve_base_url(self, base_url: str) -> str:
         if base_url:
             return base_url.rstrip("/")
@@ -96,23 +112,31 @@ class Kimi(BaseApi):
         return self.ANTHROPIC_BASE_URL
 
     def _reason_openai(self, messages: List[Dict[str, str]]) -> str:
-        url = f"{self.base_url}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "User-Agent": self.USER_AGENT,
-        }
-        data = {
-            "model": self.model,
-            "messages": messages,
-            "max_tokens": self.max_tokens,
-        }
+        url, headers, data = self._build_openai_request(messages)
 
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = http_pool.post(url, headers=headers, json=data)
         except requests.exceptions.RequestException as exception:
             log_llm_error_request("kimi", url, data, exception=exception)
             raise
+        return self._handle_openai_response(url, data, response)
+
+    async def _reason_openai_async(self, messages: List[Dict[str, str]]) -> str:
+        url, headers, data = self._build_openai_request(messages)
+
+        try:
+            response = await http_pool.async_post(url, headers=headers, json=data)
+        except httpx.HTTPError as exception:
+            log_llm_error_request("kimi", url, data, exception=exception)
+            raise
+        return self._handle_openai_response(url, data, response)
+
+    def _handle_openai_response(
+        self,
+        url: str,
+        data: Dict[str, Any],
+        response: requests.Response | httpx.Response,
+    ) -> str:
         if response.status_code == 200:
             try:
                 result = response.json()
@@ -128,20 +152,10 @@ class Kimi(BaseApi):
             log_llm_success_request("kimi", url, data, response=response)
             return content
         log_llm_error_request("kimi", url, data, response=response)
-        raise Exception(f"Kimi API call failed: {response.status_code}, {response.text}")
+        raise provider_http_error("Kimi API call failed", response)
 
     def _reason_openai_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
-        url = f"{self.base_url}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "User-Agent": self.USER_AGENT,
-        }
-        data = {
-            "model": self.model,
-            "messages": messages,
-            "max_tokens": self.max_tokens,
-        }
+        url, headers, data = self._build_openai_request(messages)
         yield from stream_chat_completion(
             provider="kimi",
             url=url,
@@ -151,21 +165,44 @@ class Kimi(BaseApi):
             protocol="openai",
         )
 
+    async def _reason_openai_stream_async(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        url, headers, data = self._build_openai_request(messages)
+        async for chunk in stream_chat_completion_async(
+            provider="kimi",
+            url=url,
+            headers=headers,
+            request_body=data,
+            error_prefix="Kimi API call failed",
+            protocol="openai",
+        ):
+            yield chunk
+
     def _reason_anthropic(self, messages: List[Dict[str, str]]) -> str:
-        url = self._anthropic_messages_url()
-        headers = {
-            "x-api-key": self.api_key,
-            "anthropic-version": self.anthropic_version,
-            "Content-Type": "application/json",
-            "User-Agent": self.USER_AGENT,
-        }
-        data = self._build_anthropic_payload(messages)
+        url, headers, data = self._build_anthropic_request(messages)
 
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = http_pool.post(url, headers=headers, json=data)
         except requests.exceptions.RequestException as exception:
             log_llm_error_request("kimi", url, data, exception=exception)
             raise
+        return self._handle_anthropic_response(url, data, response)
+
+    async def _reason_anthropic_async(self, messages: List[Dict[str, str]]) -> str:
+        url, headers, data = self._build_anthropic_request(messages)
+
+        try:
+            response = await http_pool.async_post(url, headers=headers, json=data)
+        except httpx.HTTPError as exception:
+            log_llm_error_request("kimi", url, data, exception=exception)
+            raise
+        return self._handle_anthropic_response(url, data, response)
+
+    def _handle_anthropic_response(
+        self,
+        url: str,
+        data: Dict[str, Any],
+        response: requests.Response | httpx.Response,
+    ) -> str:
         if response.status_code == 200:
             try:
                 result = response.json()
@@ -176,25 +213,59 @@ class Kimi(BaseApi):
             log_llm_success_request("kimi", url, data, response=response)
             return response_content
         log_llm_error_request("kimi", url, data, response=response)
-        raise Exception(f"Kimi API call failed: {response.status_code}, {response.text}")
+        raise provider_http_error("Kimi API call failed", response)
 
     def _reason_anthropic_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
-        url = self._anthropic_messages_url()
-        headers = {
-            "x-api-key": self.api_key,
-            "anthropic-version": self.anthropic_version,
-            "Content-Type": "application/json",
-            "User-Agent": self.USER_AGENT,
-        }
+        url, headers, data = self._build_anthropic_request(messages)
         yield from stream_chat_completion(
             provider="kimi",
             url=url,
             headers=headers,
-            request_body=self._build_anthropic_payload(messages),
+            request_body=data,
             error_prefix="Kimi API call failed",
             protocol="anthropic",
         )
 
+    async def _reason_anthropic_stream_async(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        url, headers, data = self._build_anthropic_request(messages)
+        async for chunk in stream_chat_completion_async(
+            provider="kimi",
+            url=url,
+            headers=headers,
+            request_body=data,
+            error_prefix="Kimi API call failed",
+            protocol="anthropic",
+        ):
+            yield chunk
+
+    def _build_openai_request(
+        self, messages: List[Dict[str, str]]
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        url = f"{self.base_url}/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "User-Agent": self.USER_AGENT,
+        }
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": self.max_tokens,
+        }
+        return url, headers, data
+
+    def _build_anthropic_request(
+        self, messages: List[Dict[str, str]]
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        url = self._anthropic_messages_url()
+        headers = {
+            "x-api-key": self.api_key,
+            "anthropic-version": self.anthropic_version,
+            "Content-Type": "application/json",
+            "User-Agent": self.USER_AGENT,
+        }
+        return url, headers, self._build_anthropic_payload(messages)
+
     def _anthropic_messages_url(self) -> str:
         if self.base_url.endswith("/v1"):
             return f"{self.base_url}/messages"
@@ -1,13 +1,16 @@
 import re
-from collections.abc import Iterator
-from typing import Dict, List, Tuple
+from collections.abc import AsyncIterator, Iterator
+from typing import Any, Dict, List, Tuple
 
+import httpx
 import requests
 
+from api import http_pool
 from api.base_api import BaseApi
 from api.error_request_logger import log_llm_error_request, log_llm_success_request
 from api.param_schema import ParamType, ProviderParam
-from api.streaming import stream_chat_completion
+from api.provider_errors import provider_http_error
+from api.streaming import stream_chat_completion, stream_chat_completion_async
 
 
 class MiniMax(BaseApi):
@@ -69,6 +72,29 @@ class MiniMax(BaseApi):
         Returns:
             API 响应结果
         """
+        url, headers, data = self._build_request(messages, reasoning_split)
+
+        try:
+            response = http_pool.post(url, headers=headers, json=data)
+        except requests.exceptions.RequestException as exception:
+            log_llm_error_request("minimax", url, data, exception=exception)
+            raise
+        return self._handle_response(url, data, response)
+
+    async def _call_api_async(self, messages: List[Dict[str, str]], reasoning_split: bool = True) -> Dict:
+        """_call_api 的异步版本，走当前事件循环的连接池"""
+        url, headers, data = self._build_request(messages, reasoning_split)
+
+        try:
+            response = await http_pool.async_post(url, headers=headers, json=data)
+        except httpx.HTTPError as exception:
+            log_llm_error_request("minimax", url, data, exception=exception)
+            raise
+        return self._handle_response(url, data, response)
+
+    def _build_request(
+        self, messages: List[Dict[str, str]], reasoning_split: bool = True
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
         url = f"{self.base_url}/chat/completions"
 
         headers = {
@@ -81,13 +107,14 @@ class MiniMax(BaseApi):
             "messages": messages,
             "reasoning_split": reasoning_split
         }
+        return url, headers, data
 
-        try:
-            response = requests.post(url, headers=headers, json=data)
-        except requests.exceptions.RequestException as exception:
-            log_llm_error_request("minimax", url, data, exception=exception)
-            raise
-
+    @staticmethod
+    def _handle_response(
+        url: str,
+        data: Dict[str, Any],
+        response: requests.Response | httpx.Response,
+    ) -> Dict:
         if response.status_code == 200:
             try:
                 result = response.json()
@@ -98,7 +125,7 @@ class MiniMax(BaseApi):
             return result
         else:
             log_llm_error_request("minimax", url, data, response=response)
-            raise Exception(f"MiniMax API 调用失败: {response.status_code}, {response.text}")
+            raise provider_http_error("MiniMax API 调用失败", response)
 
     @staticmethod
     def _strip_think_tags(content: str) -> str:
@@ -125,16 +152,7 @@ class MiniMax(BaseApi):
         return self._strip_think_tags(content)
 
     def reason_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
-        url = f"{self.base_url}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        data = {
-            "model": self.model,
-            "messages": messages,
-            "reasoning_split": True,
-        }
+        url, headers, data = self._build_request(messages, reasoning_split=True)
         yield from stream_chat_completion(
             provider="minimax",
             url=url,
@@ -144,6 +162,25 @@ class MiniMax(BaseApi):
             cumulative_content=True,
         )
 
+    async def reason_async(self, messages: List[Dict[str, str]]) -> str:
+        """reason 的异步版本，同样会记录原始内容供历史记录使用"""
+        result = await self._call_api_async(messages, reasoning_split=True)
+        content = result['choices'][0]['message']['content']
+        self._last_raw_content = content
+        return self._strip_think_tags(content)
+
+    async def reason_stream_async(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        url, headers, data = self._build_request(messages, reasoning_split=True)
+        async for chunk in stream_chat_completion_async(
+            provider="minimax",
+            url=url,
+            headers=headers,
+            request_body=data,
+            error_prefix="MiniMax API 调用失败",
+            cumulative_content=True,
+        ):
+            yield chunk
+
     def reason_with_raw_response(self, messages: List[Dict[str, str]]) -> Tuple[str, str]:
         """
         调用 MiniMax API，返回原始内容和清理后的内容
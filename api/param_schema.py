@@ -5,7 +5,7 @@
 
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 
 class ParamType(Enum):
@@ -80,3 +80,58 @@ class ProviderParam:
                 return False, f"参数 '{self.name}' 必须是数字"
         
         return True, None
+
+
+def unquote(value: str) -> str:
+    """去掉配置值两端的空白和引号，配置文件中 KEY = "value" 与 KEY = value 等价"""
+    return value.strip().strip('"').strip("'")
+
+
+def parse_params(params: Iterable[ProviderParam], raw_config: Dict[str, Any]) -> Dict[str, Any]:
+    """按参数定义解析配置段，并为缺省项填充默认值
+
+    Args:
+        params: 参数定义列表
+        raw_config: 原始配置字典（键为小写参数名，值为字符串）
+
+    Returns:
+        解析后的配置字典，未知键原样保留以便后续校验报错
+    """
+    parsed = dict(raw_config)
+    for param in params:
+        if param.name in parsed:
+            parsed[param.name] = param.parse_value(parsed[param.name])
+        elif param.default is not None:
+            parsed[param.name] = param.default
+    return parsed
+
+
+def validate_params(params: List[ProviderParam], config: Dict[str, Any]) -> Tuple[bool, List[str]]:
+    """验证配置是否符合参数定义
+
+    Args:
+        params: 参数定义列表
+        config: 配置字典（键为参数名，值为参数值）
+
+    Returns:
+        (是否有效, 错误信息列表)
+    """
+    errors = []
+
+    # 检查必填参数
+    for param in params:
+        if param.required and param.name not in config:
+            errors.append(f"缺少必填参数: {param.name}")
+        elif param.name in config:
+            is_valid, error_msg = param.validate(config[param.name])
+            if not is_valid:
+                errors.append(error_msg)
+
+    # 检查未知参数
+    config_keys = set(config.keys())
+    param_names = {p.name for p in params}
+    unknown_keys = config_keys - param_names
+    if unknown_keys:
+        errors.append(f"未知参数: {', '.join(unknown_keys)}")
+
+    return len(errors) == 0, errors
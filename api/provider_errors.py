@@ -0,0 +1,198 @@
+"""服务商 HTTP 失败响应的结构化异常。
+
+服务商收到非 200 响应时抛出 ProviderHTTPError 的子类，异常上带有状态码、响应头、
+上游要求的等待时间和错误类别。重试与回退据此直接判断，不再从异常文本中查找状态码。
+流式响应中途的错误事件同样按事件中的状态码或错误类型构造对应的子类。
+"""
+
+import json
+from enum import Enum
+from typing import Any, Mapping
+
+import httpx
+import requests
+
+from api.retry_policy import parse_retry_after
+
+RETRYABLE_STATUS_CODES: frozenset[int] = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+# 上游超出上下文长度时的常见错误描述（OpenAI 兼容接口、Anthropic 兼容接口及国内服务商）
+_CONTEXT_LENGTH_MARKERS: tuple[str, ...] = (
+    "context_length_exceeded",
+    "maximum context length",
+    "context length",
+    "context window",
+    "prompt is too long",
+    "too many tokens",
+    "上下文长度",
+    "超过最大长度",
+)
+# 流式错误事件中常见的错误类型（OpenAI 兼容接口的 type/code、Anthropic 的 error.type）对应的状态码
+_STREAM_ERROR_STATUS_CODES: dict[str, int] = {
+    "rate_limit_error": 429,
+    "rate_limit_exceeded": 429,
+    "too_many_requests": 429,
+    "overloaded_error": 529,
+    "server_error": 500,
+    "api_error": 500,
+    "internal_error": 500,
+    "service_unavailable": 503,
+    "authentication_error": 401,
+    "invalid_api_key": 401,
+    "permission_error": 403,
+    "request_too_large": 413,
+    "context_length_exceeded": 400,
+    "invalid_request_error": 400,
+}
+# 流式错误事件既没有状态码也没有可识别的类型时，沿用建立流时的 200
+_STREAM_ERROR_DEFAULT_STATUS = 200
+
+
+class ErrorCategory(Enum):
+    """上游失败的类别"""
+    RATE_LIMIT = "rate_limit"
+    OVERLOADED = "overloaded"
+    CONTEXT_LENGTH = "context_length"
+    AUTH = "auth"
+    OTHER = "other"
+
+
+class ProviderHTTPError(Exception):
+    """服务商返回非 200 响应。异常文本保持 "前缀: 状态码, 响应体" 的格式"""
+
+    category: ErrorCategory = ErrorCategory.OTHER
+
+    def __init__(
+        self,
+        message: str,
+        status_code: int,
+        headers: Mapping[str, str] | None = None,
+        body: str = "",
+    ) -> None:
+        super().__init__(message)
+        self.status_code: int = status_code
+        self.headers: dict[str, str] = {str(name).lower(): value for name, value in (headers or {}).items()}
+        self.body: str = body
+        self.retry_after: float | None = parse_retry_after(self.headers, rate_limited=status_code == 429)
+        self.retryable: bool = self._is_retryable()
+
+    def _is_retryable(self) -> bool:
+        return self.status_code in RETRYABLE_STATUS_CODES
+
+
+class RateLimitError(ProviderHTTPError):
+    """429：请求或 token 速率超限，等待后重试"""
+
+    category = ErrorCategory.RATE_LIMIT
+
+    def _is_retryable(self) -> bool:
+        return True
+
+
+class OverloadedError(ProviderHTTPError):
+    """5xx：上游暂时不可用或过载，等待后重试"""
+
+    category = ErrorCategory.OVERLOADED
+
+    def _is_retryable(self) -> bool:
+        return True
+
+
+class ContextLengthError(ProviderHTTPError):
+    """请求超出模型的上下文长度；同一模型重试不会成功"""
+
+    category = ErrorCategory.CONTEXT_LENGTH
+
+    def _is_retryable(self) -> bool:
+        return False
+
+
+class AuthenticationError(ProviderHTTPError):
+    """401/403：API Key 无效或无权访问；同一 API Key 重试不会成功"""
+
+    category = ErrorCategory.AUTH
+
+    def _is_retryable(self) -> bool:
+        return False
+
+
+def is_target_failure(exception: Exception) -> bool:
+    """失败是否说明目标本身不健康，决定是否计入熔断器和延迟路由的失败率。
+
+    网络错误、超时、5xx、限流和鉴权失败计入；其余 4xx（参数错误、超出上下文长度等）
+    是调用方请求本身的问题，换一个请求目标照样可用，不计入。
+    """
+    status_code = _status_code(exception)
+    if status_code is None or not 400 <= status_code < 500:
+        return True
+    return status_code in RETRYABLE_STATUS_CODES or status_code in (401, 403)
+
+
+def _status_code(exception: Exception) -> int | None:
+    if isinstance(exception, requests.exceptions.RequestException):
+        response = exception.response
+        return response.status_code if response is not None else None
+    if isinstance(exception, httpx.HTTPStatusError):
+        return exception.response.status_code
+    # ProviderHTTPError 和 SDK 异常（如豆包 SDK 的 ArkAPIStatusError）都带有 status_code 属性
+    status_code = getattr(exception, "status_code", None)
+    if isinstance(status_code, int) and not isinstance(status_code, bool):
+        return status_code
+    return None
+
+
+def provider_http_error(
+    error_prefix: str,
+    response: requests.Response | httpx.Response | Any,
+) -> ProviderHTTPError:
+    """按失败响应的状态码和响应体构造对应类别的异常，调用方负责 raise"""
+    status_code = response.status_code
+    body = response.text
+    error_class = _classify(status_code, body)
+    return error_class(
+        f"{error_prefix}: {status_code}, {body}",
+        status_code=status_code,
+        headers=response.headers,
+        body=body,
+    )
+
+
+def provider_stream_error(error: Any) -> ProviderHTTPError:
+    """按流式响应中途的错误事件构造对应类别的异常，调用方负责 raise"""
+    status_code = _stream_error_status(error)
+    body = error if isinstance(error, str) else json.dumps(error, ensure_ascii=False)
+    error_class = _classify(status_code, body)
+    return error_class(
+        f"上游流式响应错误: {status_code}, {body}",
+        status_code=status_code,
+        body=body,
+    )
+
+
+def _stream_error_status(error: Any) -> int:
+    if not isinstance(error, dict):
+        return _STREAM_ERROR_DEFAULT_STATUS
+    for key in ("status_code", "status", "code"):
+        value = error.get(key)
+        if isinstance(value, str) and value.isdigit():
+            value = int(value)
+        if isinstance(value, int) and not isinstance(value, bool) and 400 <= value <= 599:
+            return value
+    for key in ("type", "code"):
+        value = error.get(key)
+        if isinstance(value, str) and value.lower() in _STREAM_ERROR_STATUS_CODES:
+            return _STREAM_ERROR_STATUS_CODES[value.lower()]
+    return _STREAM_ERROR_DEFAULT_STATUS
+
+
+def _classify(status_code: int, body: str) -> type[ProviderHTTPError]:
+    if status_code == 429:
+        return RateLimitError
+    if status_code in (401, 403):
+        return AuthenticationError
+    if status_code in (400, 413, 422):
+        lowered = body.lower()
+        if status_code == 413 or any(marker in lowered for marker in _CONTEXT_LENGTH_MARKERS):
+            return ContextLengthError
+    if status_code in (500, 502, 503, 504, 529):
+        return OverloadedError
+    return ProviderHTTPError
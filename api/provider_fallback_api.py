@@ -1,106 +1,413 @@
-from collections.abc import Iterator, Sequence
+import asyncio
+import time
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+from contextlib import aclosing
 from dataclasses import dataclass
-from typing import override
+from typing import cast, override
 
 from api.base_api import BaseApi
+from api.circuit_breaker import CircuitBreaker, CircuitOpenError
+from api.hedging import Attempt, HedgedRace, Hedger, HedgingSettings, as_stream
+from api.rate_limiting import (
+    RateLimitedError,
+    wait_and_retry,
+    wait_and_retry_async,
+    wait_and_retry_stream,
+    wait_and_retry_stream_async,
+)
 from api.retrying_api import (
+    AsyncSleeper,
     FailureHandler,
     FallbackEvent,
     ProviderFallbackEvent,
     ProviderSwitchEvent,
+    Sleeper,
 )
+from api.routing import Observation, RoutingSettings, TargetStats, rank_entries
+
+# 供应商内所有目标都已熔断或达到速率限制时请求没有发出
+_NOT_SENT_ERRORS = (CircuitOpenError, RateLimitedError)
 
 
 @dataclass(frozen=True)
 class ProviderFallbackEntry:
     provider_name: str
     client: BaseApi
+    breaker: CircuitBreaker | None = None
+    stats: TargetStats | None = None
 
 
 class ProviderFallbackApi(BaseApi):
-    """Try configured providers in priority order."""
+    """Try configured providers in priority order, skipping providers whose circuit breaker is open.
+
+    With latency routing enabled the providers are tried fastest first. With hedging
+    enabled the async methods also start the next provider when the current one is
+    slow to answer. When every provider is skipped because it is out of rate-limit
+    quota, the chain waits once for the quickest one to recover, if that is within
+    its max wait, and tries again.
+    """
 
     def __init__(
         self,
         entries: Sequence[ProviderFallbackEntry],
         failure_handlers: list[FailureHandler] | None = None,
+        routing_settings: Callable[[], RoutingSettings] | None = None,
+        hedger: Hedger | None = None,
+        sleeper: Sleeper = time.sleep,
+        async_sleeper: AsyncSleeper = asyncio.sleep,
     ) -> None:
         if not entries:
             raise ValueError("provider fallback chain cannot be empty")
         self.provider_name: str = "provider-chain"
         self.entries: list[ProviderFallbackEntry] = list(entries)
         self.failure_handlers: list[FailureHandler] = failure_handlers or []
+        self.routing_settings: Callable[[], RoutingSettings] | None = routing_settings
+        self.hedger: Hedger | None = hedger
+        self.sleeper: Sleeper = sleeper
+        self.async_sleeper: AsyncSleeper = async_sleeper
 
     @override
     def reason(self, messages: list[dict[str, str]]) -> str:
-        exceptions: list[Exception] = []
-        for index, entry in enumerate(self.entries):
-            try:
-                return entry.client.reason(messages)
-            except Exception as exception:
-                exceptions.append(exception)
-                next_entry = self._next_entry(index)
-                if next_entry is not None:
-                    self._handle_failure(
-                        self._build_switch_event(entry, next_entry, exception)
-                    )
-
-        event = ProviderFallbackEvent(
-            provider_name=self.provider_name,
-            will_retry=False,
-            providers=[entry.provider_name for entry in self.entries],
-            exceptions=exceptions,
-            secret_values=self._collect_secret_values(exceptions),
-        )
-        self._handle_failure(event)
-        raise exceptions[-1]
+        return wait_and_retry(lambda: self._reason(messages), self._waits_for, self.sleeper)
 
     @override
     def reason_stream(self, messages: list[dict[str, str]]) -> Iterator[str]:
+        return wait_and_retry_stream(lambda: self._reason_stream(messages), self._waits_for, self.sleeper)
+
+    @override
+    async def reason_async(self, messages: list[dict[str, str]]) -> str:
+        return await wait_and_retry_async(lambda: self._reason_async(messages), self._waits_for, self.async_sleeper)
+
+    @override
+    def reason_stream_async(self, messages: list[dict[str, str]]) -> AsyncIterator[str]:
+        return wait_and_retry_stream_async(
+            lambda: self._reason_stream_async(messages),
+            self._waits_for,
+            self.async_sleeper,
+        )
+
+    def _reason(self, messages: list[dict[str, str]]) -> str:
         exceptions: list[Exception] = []
         attempted_entries: list[ProviderFallbackEntry] = []
+        try:
+            entries = self._route(streaming=False)
+            for index, entry in enumerate(entries):
+                if not self._admit(entry):
+                    continue
+                attempted_entries.append(entry)
+                observation = Observation(entry.stats)
+                try:
+                    result = entry.client.reason(messages)
+                except Exception as exception:
+                    exceptions.append(exception)
+                    self._record_failure(entry, exception, observation)
+                    switch_event = self._build_switch_event_if_needed(entries, index, entry, exception)
+                    if switch_event is not None:
+                        self._handle_failure(switch_event)
+                except BaseException:
+                    self._release(entry)
+                    raise
+                else:
+                    self._record_success(entry, observation)
+                    return result
+        finally:
+            self._notify_breakers()
+
+        self._raise_if_all_open(exceptions)
+        self._handle_failure(self._build_fallback_event(attempted_entries, exceptions))
+        raise exceptions[-1]
+
+    def _reason_stream(self, messages: list[dict[str, str]]) -> Iterator[str]:
+        exceptions: list[Exception] = []
+        attempted_entries: list[ProviderFallbackEntry] = []
+
+        try:
+            entries = self._route(streaming=True)
+            for index, entry in enumerate(entries):
+                if not self._admit(entry):
+                    continue
+                attempted_entries.append(entry)
+                yielded_content = False
+                recorded = False
+                stream = None
+                observation = Observation(entry.stats)
+                try:
+                    stream = entry.client.reason_stream(messages)
+                    for chunk in stream:
+                        if not chunk:
+                            continue
+                        if not yielded_content:
+                            yielded_content = True
+                            observation.first_token()
+                        yield chunk
+                    recorded = True
+                    self._record_success(entry, observation)
+                    return
+                except Exception as exception:
+                    exceptions.append(exception)
+                    recorded = True
+                    self._record_failure(entry, exception, observation)
+                    if yielded_content:
+                        break
+                    switch_event = self._build_switch_event_if_needed(entries, index, entry, exception)
+                    if switch_event is not None:
+                        self._handle_failure(switch_event)
+                finally:
+                    if not recorded:
+                        self._release(entry)
+                    close = getattr(stream, "close", None)
+                    if callable(close):
+                        close()
+        finally:
+            self._notify_breakers()
+
+        self._raise_if_all_open(exceptions)
+        self._handle_failure(self._build_fallback_event(attempted_entries, exceptions))
+        raise exceptions[-1]
 
-        for index, entry in enumerate(self.entries):
-            attempted_entries.append(entry)
-            yielded_content = False
-            stream = None
+    async def _reason_async(self, messages: list[dict[str, str]]) -> str:
+        hedging = self._begin_hedging()
+        if hedging is not None:
+            return "".join([chunk async for chunk in self._hedged_stream_async(messages, hedging, streaming=False)])
+
+        exceptions: list[Exception] = []
+        attempted_entries: list[ProviderFallbackEntry] = []
+        try:
+            entries = self._route(streaming=False)
+            for index, entry in enumerate(entries):
+                if not self._admit(entry):
+                    continue
+                attempted_entries.append(entry)
+                observation = Observation(entry.stats)
+                try:
+                    result = await entry.client.reason_async(messages)
+                except Exception as exception:
+                    exceptions.append(exception)
+                    self._record_failure(entry, exception, observation)
+                    switch_event = self._build_switch_event_if_needed(entries, index, entry, exception)
+                    if switch_event is not None:
+                        await self._handle_failure_async(switch_event)
+                except BaseException:
+                    self._release(entry)
+                    raise
+                else:
+                    self._record_success(entry, observation)
+                    return result
+        finally:
+            await self._notify_breakers_async()
+
+        self._raise_if_all_open(exceptions)
+        await self._handle_failure_async(self._build_fallback_event(attempted_entries, exceptions))
+        raise exceptions[-1]
+
+    async def _reason_stream_async(self, messages: list[dict[str, str]]) -> AsyncIterator[str]:
+        hedging = self._begin_hedging()
+        if hedging is not None:
+            hedged = self._hedged_stream_async(messages, hedging, streaming=True)
             try:
-                stream = entry.client.reason_stream(messages)
-                for chunk in stream:
-                    if not chunk:
-                        continue
-                    yielded_content = True
+                async for chunk in hedged:
                     yield chunk
-                return
-            except Exception as exception:
-                exceptions.append(exception)
-                if yielded_content:
-                    break
-                next_entry = self._next_entry(index)
-                if next_entry is not None:
-                    self._handle_failure(
-                        self._build_switch_event(entry, next_entry, exception)
-                    )
             finally:
-                close = getattr(stream, "close", None)
-                if callable(close):
-                    close()
+                await hedged.aclose()
+            return
+
+        exceptions: list[Exception] = []
+        attempted_entries: list[ProviderFallbackEntry] = []
+
+        try:
+            entries = self._route(streaming=True)
+            for index, entry in enumerate(entries):
+                if not self._admit(entry):
+                    continue
+                attempted_entries.append(entry)
+                yielded_content = False
+                recorded = False
+                stream = None
+                observation = Observation(entry.stats)
+                try:
+                    stream = entry.client.reason_stream_async(messages)
+                    async for chunk in stream:
+                        if not chunk:
+                            continue
+                        if not yielded_content:
+                            yielded_content = True
+                            observation.first_token()
+                        yield chunk
+                    recorded = True
+                    self._record_success(entry, observation)
+                    return
+                except Exception as exception:
+                    exceptions.append(exception)
+                    recorded = True
+                    self._record_failure(entry, exception, observation)
+                    if yielded_content:
+                        break
+                    switch_event = self._build_switch_event_if_needed(entries, index, entry, exception)
+                    if switch_event is not None:
+                        await self._handle_failure_async(switch_event)
+                finally:
+                    if not recorded:
+                        self._release(entry)
+                    aclose = getattr(stream, "aclose", None)
+                    if callable(aclose):
+                        await aclose()
+        finally:
+            await self._notify_breakers_async()
+
+        self._raise_if_all_open(exceptions)
+        await self._handle_failure_async(self._build_fallback_event(attempted_entries, exceptions))
+        raise exceptions[-1]
+
+    async def _hedged_stream_async(
+        self,
+        messages: list[dict[str, str]],
+        hedging: HedgingSettings,
+        streaming: bool,
+    ) -> AsyncIterator[str]:
+        """Race the current provider against the next one once the hedge delay passes; the first to answer wins."""
+        entries = self._route(streaming)
+        race: HedgedRace[ProviderFallbackEntry] = HedgedRace(cast(Hedger, self.hedger), hedging, streaming)
+
+        def start_attempt(entry: ProviderFallbackEntry) -> AsyncIterator[str] | None:
+            if not self._admit(entry):
+                return None
+            return self._open_stream(entry, messages, streaming)
+
+        async def on_fallback(attempt: Attempt[ProviderFallbackEntry], exception: Exception) -> None:
+            index = next(index for index, candidate in enumerate(entries) if candidate is attempt.entry)
+            switch_event = self._build_switch_event_if_needed(entries, index, attempt.entry, exception)
+            if switch_event is not None:
+                await self._handle_failure_async(switch_event)
+
+        try:
+            async with aclosing(race.run_stream(
+                entries,
+                start_attempt,
+                lambda attempt: self._record_success(attempt.entry, attempt.observation),
+                lambda attempt, exception: self._record_failure(attempt.entry, exception, attempt.observation),
+                self._release,
+                on_fallback,
+            )) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+        finally:
+            await self._notify_breakers_async()
+        if race.succeeded:
+            return
+
+        self._raise_if_all_open(race.exceptions)
+        await self._handle_failure_async(self._build_fallback_event(race.attempted, race.exceptions))
+        raise race.exceptions[-1]
+
+    def _begin_hedging(self) -> HedgingSettings | None:
+        if self.hedger is None or len(self.entries) < 2:
+            return None
+        return self.hedger.begin_request()
+
+    @staticmethod
+    def _open_stream(
+        entry: ProviderFallbackEntry,
+        messages: list[dict[str, str]],
+        streaming: bool,
+    ) -> AsyncIterator[str]:
+        if streaming:
+            return entry.client.reason_stream_async(messages)
+        return as_stream(lambda: entry.client.reason_async(messages))
+
+    def _build_switch_event_if_needed(
+        self,
+        entries: Sequence[ProviderFallbackEntry],
+        index: int,
+        entry: ProviderFallbackEntry,
+        exception: Exception,
+    ) -> ProviderSwitchEvent | None:
+        # 供应商内的请求没有发出时熔断事件已经通知过或只是额度暂时不足，不发送切换通知
+        if isinstance(exception, _NOT_SENT_ERRORS):
+            return None
+        next_entry = self._next_entry(entries, index)
+        if next_entry is None:
+            return None
+        return self._build_switch_event(entry, next_entry, exception)
 
-        event = ProviderFallbackEvent(
+    def _build_fallback_event(
+        self,
+        attempted_entries: list[ProviderFallbackEntry],
+        exceptions: list[Exception],
+    ) -> ProviderFallbackEvent:
+        return ProviderFallbackEvent(
             provider_name=self.provider_name,
             will_retry=False,
             providers=[entry.provider_name for entry in attempted_entries],
             exceptions=exceptions,
             secret_values=self._collect_secret_values(exceptions),
         )
-        self._handle_failure(event)
-        raise exceptions[-1]
 
-    def _next_entry(self, current_index: int) -> ProviderFallbackEntry | None:
+    def _raise_if_all_open(self, exceptions: list[Exception]) -> None:
+        """没有任何请求真正发出时快速失败，不发送最终失败通知"""
+        if not all(isinstance(exception, _NOT_SENT_ERRORS) for exception in exceptions):
+            return
+        providers = [entry.provider_name for entry in self.entries]
+        waits = [
+            (exception.retry_after, exception.max_wait)
+            for exception in exceptions
+            if isinstance(exception, RateLimitedError)
+        ]
+        if waits:
+            raise RateLimitedError.from_waits(self.provider_name, providers, waits)
+        raise CircuitOpenError(self.provider_name, providers)
+
+    def _waits_for(self, error: RateLimitedError) -> bool:
+        """Wait only when no provider sent the request, not for a provider's own error."""
+        return error.provider_name == self.provider_name and error.waitable
+
+    def _route(self, streaming: bool) -> Sequence[ProviderFallbackEntry]:
+        return rank_entries(self.entries, self.routing_settings, streaming)
+
+    @staticmethod
+    def _admit(entry: ProviderFallbackEntry) -> bool:
+        return entry.breaker is None or entry.breaker.allow_request()
+
+    @staticmethod
+    def _record_success(entry: ProviderFallbackEntry, observation: Observation) -> None:
+        observation.succeeded()
+        if entry.breaker is not None:
+            entry.breaker.record_success()
+
+    @staticmethod
+    def _record_failure(entry: ProviderFallbackEntry, exception: Exception, observation: Observation) -> None:
+        # 供应商内所有目标都已熔断或达到速率限制时请求没有发出，不计入该供应商的统计
+        if isinstance(exception, _NOT_SENT_ERRORS):
+            if entry.breaker is not None:
+                entry.breaker.release()
+            return
+        observation.failed(exception)
+        if entry.breaker is not None:
+            entry.breaker.record_failure(exception)
+
+    @staticmethod
+    def _release(entry: ProviderFallbackEntry) -> None:
+        if entry.breaker is not None:
+            entry.breaker.release()
+
+    def _notify_breakers(self) -> None:
+        for entry in self.entries:
+            if entry.breaker is not None:
+                entry.breaker.notify()
+
+    async def _notify_breakers_async(self) -> None:
+        for entry in self.entries:
+            if entry.breaker is not None:
+                await entry.breaker.notify_async()
+
+    @staticmethod
+    def _next_entry(
+        entries: Sequence[ProviderFallbackEntry],
+        current_index: int,
+    ) -> ProviderFallbackEntry | None:
         next_index = current_index + 1
-        if next_index >= len(self.entries):
+        if next_index >= len(entries):
             return None
-        return self.entries[next_index]
+        return entries[next_index]
 
     def _build_switch_event(
         self,
@@ -142,3 +449,7 @@ class ProviderFallbackApi(BaseApi):
                 handler(event)
             except Exception as exception:
                 print(f"failure handler failed: {type(exception).__name__}")
+
+    async def _handle_failure_async(self, event: ProviderSwitchEvent | ProviderFallbackEvent) -> None:
+        if self.failure_handlers:
+            await asyncio.to_thread(self._handle_failure, event)
@@ -0,0 +1,265 @@
+"""按 API Key 和模型的客户端限流。
+
+服务商配置段的 RATE_LIMIT_RPM / RATE_LIMIT_TPM 为该服务商每个 API Key/模型组合分别建立
+每分钟请求数和每分钟 token 数的令牌桶。回退链发出请求前先从桶中取出额度：额度不足的组合
+被跳过，请求交给链中的其他 Key 或模型；所有组合都不足时请求不发出，直接以 RateLimitedError
+失败，不再发出注定返回 429 的请求。只有最外层的回退链（多服务商时是服务商回退链）在
+所有目标都因额度不足被跳过后才等待：预计恢复时间不超过 RATE_LIMIT_MAX_WAIT 秒时等待一次
+再重试，内层链不会在轮到其他服务商之前阻塞。
+每个目标的重试层（RetryingApi）为每次重试同样取出额度，发出的每个上游请求都计入限流。
+
+发送前只知道输入的长度，token 数用 api.token_estimation 按字符估算，与历史窗口裁剪
+使用同一估算。请求成功后再按输出的估算 token 数从桶中扣除，额度可以暂时为负，
+后续请求会等到额度恢复。
+"""
+
+import threading
+import time
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Iterator
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, TypeVar
+
+from api.param_schema import ParamType, ProviderParam, parse_params, validate_params
+
+_SECONDS_PER_MINUTE = 60.0
+
+T = TypeVar("T")
+
+
+class RateLimitedError(RuntimeError):
+    """回退链中所有目标的限流额度都不足，且等待时间超过上限，请求未发送"""
+
+    def __init__(self, provider_name: str, targets: list[str], retry_after: float, max_wait: float = 0.0) -> None:
+        super().__init__(
+            f"{provider_name} 的所有目标均已达到速率限制，约 {retry_after:.1f} 秒后恢复: {', '.join(targets)}"
+        )
+        self.provider_name: str = provider_name
+        self.targets: list[str] = targets
+        self.retry_after: float = retry_after
+        # 恢复较快的目标所在服务商配置的 RATE_LIMIT_MAX_WAIT，最外层的链据此决定是否等待
+        self.max_wait: float = max_wait
+
+    @classmethod
+    def from_waits(cls, provider_name: str, targets: list[str], waits: list[tuple[float, float]]) -> "RateLimitedError":
+        """由各目标的（恢复秒数，最多等待秒数）构造，优先取允许等待的目标中恢复最快的一个"""
+        waitable = [wait for wait in waits if wait[0] <= wait[1]]
+        retry_after, max_wait = min(waitable or waits)
+        return cls(provider_name, targets, retry_after, max_wait)
+
+    @property
+    def waitable(self) -> bool:
+        return self.retry_after <= self.max_wait
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """单个服务商每个 API Key/模型组合的限流额度，默认不限流，与旧行为一致"""
+
+    DEFAULT_MAX_WAIT = 5.0
+
+    rpm: int = 0
+    tpm: int = 0
+    max_wait: float = DEFAULT_MAX_WAIT
+
+    @classmethod
+    def get_params(cls) -> List[ProviderParam]:
+        """服务商配置段中可用的限流参数，参数名带 rate_limit_ 前缀以免与服务商自身参数冲突"""
+        return [
+            ProviderParam(
+                name="rate_limit_rpm",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=0,
+                description="每个 API Key/模型组合每分钟最多发出的请求数，0 表示不限制",
+            ),
+            ProviderParam(
+                name="rate_limit_tpm",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=0,
+                description="每个 API Key/模型组合每分钟最多消耗的估算 token 数，0 表示不限制",
+            ),
+            ProviderParam(
+                name="rate_limit_max_wait",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_MAX_WAIT,
+                description="所有 API Key/模型的额度都不足时最多等待的秒数，超过则直接失败",
+            ),
+        ]
+
+    @classmethod
+    def validate_config(cls, config: Dict[str, Any]) -> tuple[bool, List[str]]:
+        is_valid, errors = validate_params(cls.get_params(), config)
+        for name in ("rate_limit_rpm", "rate_limit_tpm"):
+            value = config.get(name)
+            if isinstance(value, int) and value < 0:
+                errors.append(f"{name} must not be negative")
+        max_wait = config.get("rate_limit_max_wait")
+        if isinstance(max_wait, (int, float)) and max_wait < 0:
+            errors.append("rate_limit_max_wait must not be negative")
+        return is_valid and not errors, errors
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "RateLimit":
+        """从服务商配置中取出并移除 rate_limit_* 参数，校验失败时抛出 ValueError"""
+        names = {param.name for param in cls.get_params()}
+        raw_config = {name: config.pop(name) for name in list(config) if name in names}
+        limit_config = parse_params(cls.get_params(), raw_config)
+        is_valid, errors = cls.validate_config(limit_config)
+        if not is_valid:
+            raise ValueError("\n".join(errors))
+        return cls(
+            rpm=limit_config["rate_limit_rpm"],
+            tpm=limit_config["rate_limit_tpm"],
+            max_wait=float(limit_config["rate_limit_max_wait"]),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+
+class TokenBucket:
+    """容量为每分钟额度、按每秒 额度/60 匀速恢复的令牌桶，不加锁，由 RateLimiter 保护"""
+
+    def __init__(self, per_minute: int, now: float) -> None:
+        self.capacity: float = float(per_minute)
+        self.rate: float = per_minute / _SECONDS_PER_MINUTE
+        self.tokens: float = self.capacity
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """取出 amount 还需等待的秒数；超过容量的请求等到桶满为止"""
+        self._refill(now)
+        shortfall = min(amount, self.capacity) - self.tokens
+        return max(shortfall / self.rate, 0.0)
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.tokens -= amount
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class RateLimiter:
+    """一个 API Key/模型组合的请求数和 token 数令牌桶，线程安全"""
+
+    def __init__(self, limit: RateLimit, clock: Callable[[], float] = time.monotonic) -> None:
+        self.limit: RateLimit = limit
+        self._clock = clock
+        self._lock = threading.Lock()
+        now = clock()
+        self._requests = TokenBucket(limit.rpm, now) if limit.rpm > 0 else None
+        self._tokens = TokenBucket(limit.tpm, now) if limit.tpm > 0 else None
+
+    @property
+    def counts_tokens(self) -> bool:
+        return self._tokens is not None
+
+    def wait_time(self, tokens: int) -> float:
+        """额度足够发出一个估算为 tokens 的请求还需等待的秒数"""
+        with self._lock:
+            return self._wait_time(tokens, self._clock())
+
+    def try_acquire(self, tokens: int) -> bool:
+        """额度足够时扣除一个请求和 tokens 个 token 并返回 True，否则不扣除并返回 False"""
+        with self._lock:
+            now = self._clock()
+            if self._wait_time(tokens, now) > 0:
+                return False
+            if self._requests is not None:
+                self._requests.take(1, now)
+            if self._tokens is not None:
+                self._tokens.take(tokens, now)
+            return True
+
+    def charge(self, tokens: int) -> None:
+        """请求完成后扣除输出的估算 token 数，额度可以因此暂时为负"""
+        if self._tokens is None or tokens <= 0:
+            return
+        with self._lock:
+            self._tokens.take(tokens, self._clock())
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        wait = 0.0
+        if self._requests is not None:
+            wait = self._requests.wait_time(1, now)
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.wait_time(tokens, now))
+        return wait
+
+
+def wait_and_retry(
+    call: Callable[[], T],
+    can_wait: Callable[[RateLimitedError], bool],
+    sleeper: Callable[[float], None],
+) -> T:
+    """调用 call；请求因额度不足未发出且 can_wait 允许时，等到额度恢复后再调用一次"""
+    try:
+        return call()
+    except RateLimitedError as error:
+        if not can_wait(error):
+            raise
+        retry_after = error.retry_after
+    sleeper(retry_after)
+    return call()
+
+
+async def wait_and_retry_async(
+    call: Callable[[], Awaitable[T]],
+    can_wait: Callable[[RateLimitedError], bool],
+    sleeper: Callable[[float], Awaitable[None]],
+) -> T:
+    try:
+        return await call()
+    except RateLimitedError as error:
+        if not can_wait(error):
+            raise
+        retry_after = error.retry_after
+    await sleeper(retry_after)
+    return await call()
+
+
+def wait_and_retry_stream(
+    open_stream: Callable[[], Iterator[str]],
+    can_wait: Callable[[RateLimitedError], bool],
+    sleeper: Callable[[float], None],
+) -> Iterator[str]:
+    """流式版本的 wait_and_retry；额度不足时流在输出任何内容之前就会失败"""
+    try:
+        yield from open_stream()
+        return
+    except RateLimitedError as error:
+        if not can_wait(error):
+            raise
+        retry_after = error.retry_after
+    sleeper(retry_after)
+    yield from open_stream()
+
+
+async def wait_and_retry_stream_async(
+    open_stream: Callable[[], AsyncGenerator[str, None]],
+    can_wait: Callable[[RateLimitedError], bool],
+    sleeper: Callable[[float], Awaitable[None]],
+) -> AsyncIterator[str]:
+    stream = open_stream()
+    try:
+        async for chunk in stream:
+            yield chunk
+        return
+    except RateLimitedError as error:
+        if not can_wait(error):
+            raise
+        retry_after = error.retry_after
+    finally:
+        await stream.aclose()
+    await sleeper(retry_after)
+    stream = open_stream()
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await stream.aclose()
@@ -0,0 +1,235 @@
+"""RetryingApi 的退避策略。
+
+每个服务商配置段可以用 RETRY_* 参数单独配置重试次数和退避方式；上游通过 Retry-After
+或限流重置头告知等待时间时优先按上游的要求等待。
+"""
+
+import random
+import re
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Mapping
+
+from api.param_schema import ParamType, ProviderParam, parse_params, unquote, validate_params
+
+# random.uniform 的签名，测试中可替换为确定的取值
+Jitter = Callable[[float, float], float]
+
+_DURATION_PART_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_PATTERN = re.compile(r"(?:\d+(?:\.\d+)?(?:ms|h|m|s))+")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+# 早于该值的数字按剩余秒数处理，否则按 Unix 时间戳处理
+_EPOCH_THRESHOLD = 1_000_000_000
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """单个服务商的重试策略，默认与固定间隔 5 秒、最多重试 5 次的旧行为一致。
+
+    - fixed：每次等待 base_delay 秒
+    - exponential：第 n 次重试等待 base_delay * 2^(n-1) 秒
+    - full_jitter：在 [0, exponential 的等待时间] 内随机取值，避免大量请求同时重试
+    - decorrelated_jitter：在 [base_delay, 上次等待时间 * 3] 内随机取值
+
+    所有策略的等待时间都不超过 max_delay。上游要求的等待时间超过 max_delay 时不再重试，
+    让回退链尽快切换到下一个 API Key 或模型。
+    """
+
+    FIXED = "fixed"
+    EXPONENTIAL = "exponential"
+    FULL_JITTER = "full_jitter"
+    DECORRELATED_JITTER = "decorrelated_jitter"
+    STRATEGIES = (FIXED, EXPONENTIAL, FULL_JITTER, DECORRELATED_JITTER)
+    DEFAULT_MAX_RETRIES = 5
+    DEFAULT_BASE_DELAY = 5.0
+    DEFAULT_MAX_DELAY = 60.0
+
+    strategy: str = FIXED
+    max_retries: int = DEFAULT_MAX_RETRIES
+    base_delay: float = DEFAULT_BASE_DELAY
+    max_delay: float = DEFAULT_MAX_DELAY
+    respect_retry_after: bool = True
+
+    @classmethod
+    def get_params(cls) -> List[ProviderParam]:
+        """服务商配置段中可用的重试参数，参数名带 retry_ 前缀以免与服务商自身参数冲突"""
+        return [
+            ProviderParam(
+                name="retry_strategy",
+                param_type=ParamType.STRING,
+                required=False,
+                default=cls.FIXED,
+                description="重试退避策略：fixed、exponential、full_jitter、decorrelated_jitter",
+            ),
+            ProviderParam(
+                name="retry_max_retries",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_MAX_RETRIES,
+                description="单个 API Key/模型失败后最多重试的次数",
+            ),
+            ProviderParam(
+                name="retry_base_delay",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_BASE_DELAY,
+                description="退避的基础等待秒数",
+            ),
+            ProviderParam(
+                name="retry_max_delay",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_MAX_DELAY,
+                description="单次等待的上限秒数，上游要求等待更久时直接放弃重试",
+            ),
+            ProviderParam(
+                name="retry_respect_retry_after",
+                param_type=ParamType.BOOLEAN,
+                required=False,
+                default=True,
+                description="是否按上游的 Retry-After 和限流重置响应头决定等待时间",
+            ),
+        ]
+
+    @classmethod
+    def validate_config(cls, config: Dict[str, Any]) -> tuple[bool, List[str]]:
+        is_valid, errors = validate_params(cls.get_params(), config)
+        strategy = config.get("retry_strategy")
+        if isinstance(strategy, str) and unquote(strategy).lower() not in cls.STRATEGIES:
+            errors.append(f"retry_strategy must be one of: {', '.join(cls.STRATEGIES)}")
+        max_retries = config.get("retry_max_retries")
+        if isinstance(max_retries, int) and max_retries < 0:
+            errors.append("retry_max_retries must not be negative")
+        base_delay = config.get("retry_base_delay")
+        if isinstance(base_delay, (int, float)) and base_delay < 0:
+            errors.append("retry_base_delay must not be negative")
+        max_delay = config.get("retry_max_delay")
+        if isinstance(max_delay, (int, float)) and isinstance(base_delay, (int, float)) and max_delay < base_delay:
+            errors.append("retry_max_delay must not be less than retry_base_delay")
+        return is_valid and not errors, errors
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "RetryPolicy":
+        """从已解析的服务商配置中取出并移除 retry_* 参数，校验失败时抛出 ValueError"""
+        names = {param.name for param in cls.get_params()}
+        raw_config = {name: config.pop(name) for name in list(config) if name in names}
+        policy_config = parse_params(
+            cls.get_params(),
+            {name: value for name, value in raw_config.items() if isinstance(value, str)},
+        )
+        policy_config.update({name: value for name, value in raw_config.items() if not isinstance(value, str)})
+        is_valid, errors = cls.validate_config(policy_config)
+        if not is_valid:
+            raise ValueError("\n".join(errors))
+        return cls(
+            strategy=unquote(policy_config["retry_strategy"]).lower(),
+            max_retries=policy_config["retry_max_retries"],
+            base_delay=float(policy_config["retry_base_delay"]),
+            max_delay=float(policy_config["retry_max_delay"]),
+            respect_retry_after=policy_config["retry_respect_retry_after"],
+        )
+
+    def next_delay(
+        self,
+        retry_number: int,
+        previous_delay: float,
+        retry_after: float | None = None,
+        jitter: Jitter = random.uniform,
+    ) -> float | None:
+        """第 retry_number 次重试（从 1 开始）前的等待秒数；上游要求的等待超过上限时返回 None"""
+        if retry_after is not None and self.respect_retry_after:
+            if retry_after > self.max_delay:
+                return None
+            return max(retry_after, 0.0)
+
+        exponential = self.base_delay * 2 ** (retry_number - 1)
+        if self.strategy == self.EXPONENTIAL:
+            delay = exponential
+        elif self.strategy == self.FULL_JITTER:
+            delay = jitter(0.0, min(self.max_delay, exponential))
+        elif self.strategy == self.DECORRELATED_JITTER:
+            delay = jitter(self.base_delay, max(self.base_delay, previous_delay * 3))
+        else:
+            delay = self.base_delay
+        return min(delay, self.max_delay)
+
+
+def retry_after_seconds(exception: BaseException, now: Callable[[], float] = time.time) -> float | None:
+    """从异常携带的响应头中读取上游要求的等待秒数，没有相关响应头时返回 None"""
+    # ProviderHTTPError 在构造时已解析好 retry_after（可能为 None），直接使用
+    if hasattr(exception, "retry_after"):
+        retry_after = getattr(exception, "retry_after")
+        return float(retry_after) if isinstance(retry_after, (int, float)) else None
+    response = getattr(exception, "response", None)
+    headers = getattr(exception, "headers", None)
+    if headers is None:
+        headers = getattr(response, "headers", None)
+    if isinstance(headers, dict):
+        headers = {str(name).lower(): value for name, value in headers.items()}
+    elif not hasattr(headers, "get"):
+        return None
+    status_code = getattr(exception, "status_code", None)
+    if status_code is None:
+        status_code = getattr(response, "status_code", None)
+    return parse_retry_after(headers, now, rate_limited=status_code == 429)
+
+
+def parse_retry_after(
+    headers: Mapping[str, str],
+    now: Callable[[], float] = time.time,
+    rate_limited: bool = True,
+) -> float | None:
+    """按 retry-after-ms、Retry-After、x-ratelimit-reset-* 的顺序解析等待秒数。
+    限流重置头在正常响应中也会出现，只有 rate_limited（429）时才参考"""
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return max(float(retry_after_ms) / 1000, 0.0)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after is not None:
+        seconds = _parse_seconds_or_date(retry_after.strip(), now)
+        if seconds is not None:
+            return seconds
+
+    if not rate_limited:
+        return None
+    # OpenAI 风格的 x-ratelimit-reset-requests/-tokens（如 "1s"、"6m0s"）或秒数/时间戳；取最晚恢复的一项
+    resets = [
+        _parse_reset(headers.get(name), now)
+        for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens", "x-ratelimit-reset")
+    ]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+
+def _parse_seconds_or_date(value: str, now: Callable[[], float]) -> float | None:
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - now(), 0.0)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _parse_reset(value: str | None, now: Callable[[], float]) -> float | None:
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if _DURATION_PATTERN.fullmatch(value):
+        return sum(
+            float(amount) * _DURATION_UNITS[unit]
+            for amount, unit in _DURATION_PART_PATTERN.findall(value)
+        )
+    try:
+        seconds = float(value)
+    except ValueError:
+        return None
+    if seconds >= _EPOCH_THRESHOLD:
+        seconds -= now()
+    return max(seconds, 0.0)
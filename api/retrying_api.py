@@ -1,13 +1,20 @@
+import asyncio
+import random
 import re
 import time
-from collections.abc import Iterator
+from collections.abc import AsyncIterator, Awaitable, Iterator
 from dataclasses import dataclass
 from typing import Callable, cast, override
 
+import httpx
 import requests
 
 from api.base_api import BaseApi
+from api.provider_errors import RETRYABLE_STATUS_CODES, ProviderHTTPError
+from api.rate_limiting import RateLimiter
+from api.retry_policy import Jitter, RetryPolicy, retry_after_seconds
 from api.streaming import IncompleteStreamError
+from api.token_estimation import estimate_prompt_tokens
 
 
 @dataclass(frozen=True)
@@ -55,8 +62,20 @@ class ProviderFallbackEvent(FailureEvent):
     secret_values: tuple[str, ...] = ()
 
 
+@dataclass(frozen=True)
+class CircuitBreakerEvent(FailureEvent):
+    """回退链中某个目标的熔断器状态变化（closed/open/half_open）。"""
+
+    target: str
+    from_state: str
+    to_state: str
+    failure_rate: float
+    cool_down_seconds: float
+
+
 FailureHandler = Callable[[FailureEvent], None]
 Sleeper = Callable[[float], None]
+AsyncSleeper = Callable[[float], Awaitable[None]]
 PostRequest = Callable[..., requests.Response]
 
 
@@ -84,6 +103,9 @@ class FeishuNotifier:
     def notify_failure(self, event: FailureEvent) -> None:
         if event.will_retry:
             return
+        # 半开只是冷却结束后的试探，只通知熔断和恢复
+        if isinstance(event, CircuitBreakerEvent) and event.to_state == "half_open":
+            return
 
         try:
             response = self.post_request(
@@ -126,6 +148,8 @@ class FeishuNotifier:
             return self._format_fallback_message(event)
         if isinstance(event, RetryEvent):
             return self._format_retry_message(event)
+        if isinstance(event, CircuitBreakerEvent):
+            return self._format_circuit_breaker_message(event)
         raise TypeError(f"未知失败事件类型: {type(event).__name__}")
 
     def _format_retry_message(self, event: RetryEvent) -> str:
@@ -139,6 +163,22 @@ class FeishuNotifier:
             f"失败原因摘要: {self._format_reason(event.exception)}",
         ])
 
+    def _format_circuit_breaker_message(self, event: CircuitBreakerEvent) -> str:
+        if event.to_state == "open":
+            return "\n".join([
+                "大模型目标已熔断",
+                f"渠道: {event.provider_name}",
+                f"目标: {event.target}",
+                f"最近失败率: {event.failure_rate:.0%}",
+                f"冷却时间: {event.cool_down_seconds:g} 秒，期间请求直接跳过该目标",
+            ])
+        return "\n".join([
+            "大模型目标已恢复",
+            f"渠道: {event.provider_name}",
+            f"目标: {event.target}",
+            f"状态: {event.from_state} -> {event.to_state}",
+        ])
+
     def _format_fallback_message(self, event: FallbackEvent) -> str:
         targets = event.targets
         exceptions = event.exceptions
@@ -201,12 +241,16 @@ class FeishuNotifier:
 
 
 class RetryingApi(BaseApi):
-    """为所有服务商统一提供重试能力的透明代理。"""
+    """为所有服务商统一提供重试能力的透明代理。
 
-    DEFAULT_MAX_RETRIES: int = 5
-    DEFAULT_RETRY_DELAY_SECONDS: float = 5.0
-    RETRYABLE_STATUS_CODES: set[int] = {408, 409, 425, 429, 500, 502, 503, 504}
-    STATUS_CODE_PATTERN: re.Pattern[str] = re.compile(r"(?<!\d)(\d{3})(?!\d)")
+    配置了 limiter 时首次请求的额度由回退链扣除，每次重试同样要从限流桶取出额度：
+    重试间隔至少等到额度恢复，需要等待超过 RATE_LIMIT_MAX_WAIT 秒或等待后仍被其他请求抢先时
+    不再重试，由回退链换下一个目标。
+    """
+
+    DEFAULT_MAX_RETRIES: int = RetryPolicy.DEFAULT_MAX_RETRIES
+    DEFAULT_RETRY_DELAY_SECONDS: float = RetryPolicy.DEFAULT_BASE_DELAY
+    RETRYABLE_STATUS_CODES: frozenset[int] = RETRYABLE_STATUS_CODES
 
     def __init__(
         self,
@@ -216,39 +260,47 @@ class RetryingApi(BaseApi):
         retry_delay_seconds: float = DEFAULT_RETRY_DELAY_SECONDS,
         failure_handlers: list[FailureHandler] | None = None,
         sleeper: Sleeper = time.sleep,
+        async_sleeper: AsyncSleeper = asyncio.sleep,
+        policy: RetryPolicy | None = None,
+        jitter: Jitter = random.uniform,
+        limiter: RateLimiter | None = None,
     ) -> None:
+        # 未指定 policy 时按 max_retries/retry_delay_seconds 固定间隔重试
+        if policy is None:
+            policy = RetryPolicy(max_retries=max_retries, base_delay=retry_delay_seconds)
         self.provider_name: str = provider_name
         self.client: BaseApi = client
-        self.max_retries: int = max_retries
-        self.retry_delay_seconds: float = retry_delay_seconds
+        self.policy: RetryPolicy = policy
+        self.max_retries: int = policy.max_retries
+        self.retry_delay_seconds: float = policy.base_delay
         self.failure_handlers: list[FailureHandler] = failure_handlers or []
         self.sleeper: Sleeper = sleeper
+        self.async_sleeper: AsyncSleeper = async_sleeper
+        self.jitter: Jitter = jitter
+        self.limiter: RateLimiter | None = limiter
 
     @override
     def reason(self, messages: list[dict[str, str]]) -> str:
+        tokens = self._prompt_tokens(messages)
+        delay: float | None = 0.0
         for retry_count in range(self.max_retries + 1):
             try:
                 return self.client.reason(messages)
             except Exception as exception:
-                will_retry = retry_count < self.max_retries and self._should_retry(exception)
-                self._handle_failure(
-                    RetryEvent(
-                        provider_name=self.provider_name,
-                        will_retry=will_retry,
-                        attempt_number=retry_count + 1,
-                        max_retries=self.max_retries,
-                        delay_seconds=self.retry_delay_seconds if will_retry else 0,
-                        exception=exception,
-                    )
-                )
-                if not will_retry:
+                delay = self._next_delay(retry_count, delay, exception, tokens)
+                self._handle_failure(self._retry_event(retry_count, delay, exception))
+                if delay is None:
+                    raise
+                self.sleeper(delay)
+                if not self._acquire_retry(tokens):
                     raise
-                self.sleeper(self.retry_delay_seconds)
 
         raise RuntimeError("重试流程异常结束")
 
     @override
     def reason_stream(self, messages: list[dict[str, str]]) -> Iterator[str]:
+        tokens = self._prompt_tokens(messages)
+        delay: float | None = 0.0
         for retry_count in range(self.max_retries + 1):
             yielded_content = False
             stream = None
@@ -261,24 +313,14 @@ class RetryingApi(BaseApi):
                     yield chunk
                 return
             except Exception as exception:
-                will_retry = (
-                    not yielded_content
-                    and retry_count < self.max_retries
-                    and self._should_retry(exception)
-                )
-                self._handle_failure(
-                    RetryEvent(
-                        provider_name=self.provider_name,
-                        will_retry=will_retry,
-                        attempt_number=retry_count + 1,
-                        max_retries=self.max_retries,
-                        delay_seconds=self.retry_delay_seconds if will_retry else 0,
-                        exception=exception,
-                    )
-                )
-                if not will_retry:
+                # 已经输出内容后不能重试，否则调用方会收到重复的开头
+                delay = None if yielded_content else self._next_delay(retry_count, delay, exception, tokens)
+                self._handle_failure(self._retry_event(retry_count, delay, exception))
+                if delay is None:
+                    raise
+                self.sleeper(delay)
+                if not self._acquire_retry(tokens):
                     raise
-                self.sleeper(self.retry_delay_seconds)
             finally:
                 close = getattr(stream, "close", None)
                 if callable(close):
@@ -286,31 +328,127 @@ class RetryingApi(BaseApi):
 
         raise RuntimeError("流式重试流程异常结束")
 
+    @override
+    async def reason_async(self, messages: list[dict[str, str]]) -> str:
+        tokens = self._prompt_tokens(messages)
+        delay: float | None = 0.0
+        for retry_count in range(self.max_retries + 1):
+            try:
+                return await self.client.reason_async(messages)
+            except Exception as exception:
+                delay = self._next_delay(retry_count, delay, exception, tokens)
+                await self._handle_failure_async(self._retry_event(retry_count, delay, exception))
+                if delay is None:
+                    raise
+                await self.async_sleeper(delay)
+                if not self._acquire_retry(tokens):
+                    raise
+
+        raise RuntimeError("重试流程异常结束")
+
+    @override
+    async def reason_stream_async(self, messages: list[dict[str, str]]) -> AsyncIterator[str]:
+        tokens = self._prompt_tokens(messages)
+        delay: float | None = 0.0
+        for retry_count in range(self.max_retries + 1):
+            yielded_content = False
+            stream = None
+            try:
+                stream = self.client.reason_stream_async(messages)
+                async for chunk in stream:
+                    if not chunk:
+                        continue
+                    yielded_content = True
+                    yield chunk
+                return
+            except Exception as exception:
+                # 已经输出内容后不能重试，否则调用方会收到重复的开头
+                delay = None if yielded_content else self._next_delay(retry_count, delay, exception, tokens)
+                await self._handle_failure_async(self._retry_event(retry_count, delay, exception))
+                if delay is None:
+                    raise
+                await self.async_sleeper(delay)
+                if not self._acquire_retry(tokens):
+                    raise
+            finally:
+                aclose = getattr(stream, "aclose", None)
+                if callable(aclose):
+                    await aclose()
+
+        raise RuntimeError("流式重试流程异常结束")
+
+    def _next_delay(
+        self,
+        retry_count: int,
+        previous_delay: float | None,
+        exception: Exception,
+        tokens: int = 0,
+    ) -> float | None:
+        """第 retry_count + 1 次请求失败后的等待秒数，不再重试时返回 None"""
+        if retry_count >= self.max_retries or not self._should_retry(exception):
+            return None
+        delay = self.policy.next_delay(
+            retry_count + 1,
+            previous_delay or 0.0,
+            retry_after_seconds(exception),
+            self.jitter,
+        )
+        if self.limiter is None:
+            return delay
+        capacity_wait = self.limiter.wait_time(tokens)
+        if capacity_wait > self.limiter.limit.max_wait:
+            return None
+        return max(delay, capacity_wait)
+
+    def _prompt_tokens(self, messages: list[dict[str, str]]) -> int:
+        if self.limiter is not None and self.limiter.counts_tokens:
+            return estimate_prompt_tokens(messages)
+        return 0
+
+    def _acquire_retry(self, tokens: int) -> bool:
+        """重试前从限流桶取出一次请求的额度，未配置限流时总是成功"""
+        return self.limiter is None or self.limiter.try_acquire(tokens)
+
+    def _retry_event(self, retry_count: int, delay: float | None, exception: Exception) -> RetryEvent:
+        return RetryEvent(
+            provider_name=self.provider_name,
+            will_retry=delay is not None,
+            attempt_number=retry_count + 1,
+            max_retries=self.max_retries,
+            delay_seconds=delay or 0,
+            exception=exception,
+        )
+
     def _should_retry(self, exception: Exception) -> bool:
+        if isinstance(exception, ProviderHTTPError):
+            return exception.retryable
         if isinstance(exception, IncompleteStreamError):
             return True
         if isinstance(exception, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
             return True
+        if isinstance(exception, (httpx.TimeoutException, httpx.TransportError)):
+            return True
 
         if isinstance(exception, requests.exceptions.RequestException):
             response = exception.response
             if response is not None:
                 return response.status_code in self.RETRYABLE_STATUS_CODES
             return False
+        if isinstance(exception, httpx.HTTPStatusError):
+            return exception.response.status_code in self.RETRYABLE_STATUS_CODES
 
-        status_code = self._extract_status_code(exception)
+        # SDK 异常（如豆包 SDK 的 ArkAPIStatusError）同样带有 status_code 属性
+        status_code = getattr(exception, "status_code", None)
         return status_code in self.RETRYABLE_STATUS_CODES
 
-    def _extract_status_code(self, exception: Exception) -> int | None:
-        for match in self.STATUS_CODE_PATTERN.finditer(str(exception)):
-            status_code = int(match.group(1))
-            if 400 <= status_code <= 599:
-                return status_code
-        return None
-
     def _handle_failure(self, event: RetryEvent) -> None:
         for handler in self.failure_handlers:
             try:
                 handler(event)
             except Exception as exception:
                 print(f"失败处理器执行失败: {type(exception).__name__}")
+
+    async def _handle_failure_async(self, event: RetryEvent) -> None:
+        # 通知处理器（如飞书）是阻塞调用，放到线程里执行以免卡住事件循环
+        if self.failure_handlers:
+            await asyncio.to_thread(self._handle_failure, event)
@@ -0,0 +1,248 @@
+"""按延迟自适应排序回退链。
+
+[routing] 的 MODE = latency 时，回退链为每个目标记录 EWMA 延迟、首个 token 延迟（TTFT）
+和错误率，每次请求先尝试当前最快的健康目标。样本不足的目标保持配置中的位置并排在前面，
+因此没有统计数据时顺序与配置一致，新目标也会先积累样本；得分相同时按配置顺序。
+同时启用 API Key 均衡时只按模型排序，同一模型的各个 Key 保持均衡器给出的顺序。
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Protocol, Sequence, TypeVar
+
+from api.param_schema import ParamType, ProviderParam, unquote, validate_params
+from api.provider_errors import is_target_failure
+
+# 错误率接近 1 时得分不至于无穷大，仍能与其他不健康目标比较
+_MIN_SUCCESS_RATE = 0.05
+# 计算分位数时参考最近多少次成功请求
+_PERCENTILE_WINDOW = 100
+
+
+@dataclass(frozen=True)
+class RoutingSettings:
+    """[routing] 配置段，默认 ordered，与未配置该段时的行为一致"""
+
+    SECTION_NAME = "routing"
+    ORDERED = "ordered"
+    LATENCY = "latency"
+    MODES = (ORDERED, LATENCY)
+    DEFAULT_EWMA_ALPHA = 0.3
+    DEFAULT_MIN_SAMPLES = 3
+    DEFAULT_MAX_ERROR_RATE = 0.5
+
+    mode: str = ORDERED
+    ewma_alpha: float = DEFAULT_EWMA_ALPHA
+    min_samples: int = DEFAULT_MIN_SAMPLES
+    max_error_rate: float = DEFAULT_MAX_ERROR_RATE
+
+    @classmethod
+    def get_params(cls) -> List[ProviderParam]:
+        return [
+            ProviderParam(
+                name="mode",
+                param_type=ParamType.STRING,
+                required=False,
+                default=cls.ORDERED,
+                description="回退链的尝试顺序：ordered 按配置顺序，latency 优先尝试当前最快的健康目标",
+            ),
+            ProviderParam(
+                name="ewma_alpha",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_EWMA_ALPHA,
+                description="延迟和错误率的指数加权系数，越大越偏向最近的请求，取值 (0, 1]",
+            ),
+            ProviderParam(
+                name="min_samples",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_MIN_SAMPLES,
+                description="目标至少完成这么多次请求后才参与按延迟排序",
+            ),
+            ProviderParam(
+                name="max_error_rate",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_MAX_ERROR_RATE,
+                description="错误率超过该值的目标排在所有健康目标之后，取值 (0, 1]",
+            ),
+        ]
+
+    @classmethod
+    def validate_config(cls, config: Dict[str, Any]) -> tuple[bool, List[str]]:
+        is_valid, errors = validate_params(cls.get_params(), config)
+        mode = config.get("mode")
+        if isinstance(mode, str) and unquote(mode).lower() not in cls.MODES:
+            errors.append(f"mode must be one of: {', '.join(cls.MODES)}")
+        ewma_alpha = config.get("ewma_alpha")
+        if isinstance(ewma_alpha, (int, float)) and not 0 < ewma_alpha <= 1:
+            errors.append("ewma_alpha must be greater than 0 and at most 1")
+        min_samples = config.get("min_samples")
+        if isinstance(min_samples, int) and min_samples <= 0:
+            errors.append("min_samples must be greater than 0")
+        max_error_rate = config.get("max_error_rate")
+        if isinstance(max_error_rate, (int, float)) and not 0 < max_error_rate <= 1:
+            errors.append("max_error_rate must be greater than 0 and at most 1")
+        return is_valid and not errors, errors
+
+    @property
+    def latency_routing(self) -> bool:
+        return unquote(self.mode).lower() == self.LATENCY
+
+
+class TargetStats:
+    """单个目标的 EWMA 延迟、TTFT 和错误率，以及最近请求的延迟分位数，线程安全"""
+
+    def __init__(
+        self,
+        target: str,
+        settings_provider: Callable[[], RoutingSettings],
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.target: str = target
+        self.clock: Callable[[], float] = clock
+        self._settings_provider = settings_provider
+        self._lock = threading.Lock()
+        self._samples = 0
+        self._latency: float | None = None
+        self._ttft: float | None = None
+        self._error_rate = 0.0
+        self._recent_latencies: deque[float] = deque(maxlen=_PERCENTILE_WINDOW)
+        self._recent_ttfts: deque[float] = deque(maxlen=_PERCENTILE_WINDOW)
+
+    def record_success(self, latency: float, ttft: float | None = None) -> None:
+        alpha = self._settings_provider().ewma_alpha
+        with self._lock:
+            self._samples += 1
+            self._latency = _ewma(self._latency, latency, alpha)
+            self._recent_latencies.append(latency)
+            if ttft is not None:
+                self._ttft = _ewma(self._ttft, ttft, alpha)
+                self._recent_ttfts.append(ttft)
+            self._error_rate = _ewma(self._error_rate if self._samples > 1 else None, 0.0, alpha)
+
+    def record_failure(self, exception: Exception) -> None:
+        # 参数错误、超出上下文长度等是请求本身的问题，不影响目标的错误率
+        if not is_target_failure(exception):
+            return
+        alpha = self._settings_provider().ewma_alpha
+        with self._lock:
+            self._samples += 1
+            self._error_rate = _ewma(self._error_rate if self._samples > 1 else None, 1.0, alpha)
+
+    def rank_key(self, settings: RoutingSettings, streaming: bool) -> tuple[int, float]:
+        """(是否不健康, 预计延迟)；样本不足时返回 (0, 0.0)，保持配置中的位置"""
+        with self._lock:
+            if self._samples < settings.min_samples:
+                return 0, 0.0
+            latency = self._ttft if streaming and self._ttft is not None else self._latency
+            error_rate = self._error_rate
+        unhealthy = 1 if error_rate > settings.max_error_rate else 0
+        if latency is None:
+            return unhealthy, float("inf")
+        # 失败后要再尝试其他目标，按成功率折算成预计耗时
+        return unhealthy, latency / max(1.0 - error_rate, _MIN_SUCCESS_RATE)
+
+    def percentile(self, quantile: float, streaming: bool, min_samples: int = 1) -> float | None:
+        """最近成功请求的延迟分位数（流式请求取 TTFT）；样本不足 min_samples 时返回 None"""
+        with self._lock:
+            samples = sorted(self._recent_ttfts if streaming else self._recent_latencies)
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(quantile * len(samples)) - 1)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "samples": self._samples,
+                "latency_ms": None if self._latency is None else round(self._latency * 1000, 3),
+                "ttft_ms": None if self._ttft is None else round(self._ttft * 1000, 3),
+                "error_rate": round(self._error_rate, 4),
+            }
+
+
+class Observation:
+    """一次请求的计时，结束时写入目标的统计"""
+
+    def __init__(self, stats: TargetStats | None) -> None:
+        self._stats = stats
+        self._started = stats.clock() if stats is not None else 0.0
+        self._ttft: float | None = None
+
+    def first_token(self) -> None:
+        if self._stats is not None and self._ttft is None:
+            self._ttft = self._stats.clock() - self._started
+
+    def succeeded(self) -> None:
+        if self._stats is not None:
+            self._stats.record_success(self._stats.clock() - self._started, self._ttft)
+
+    def failed(self, exception: Exception) -> None:
+        if self._stats is not None:
+            self._stats.record_failure(exception)
+
+
+class _RoutedEntry(Protocol):
+    @property
+    def stats(self) -> TargetStats | None: ...
+
+
+EntryT = TypeVar("EntryT", bound=_RoutedEntry)
+
+
+def rank_entries(
+    entries: Sequence[EntryT],
+    settings_provider: Callable[[], RoutingSettings] | None,
+    streaming: bool,
+) -> Sequence[EntryT]:
+    """按配置返回本次请求的尝试顺序；ordered 模式直接返回原顺序"""
+    if settings_provider is None:
+        return entries
+    settings = settings_provider()
+    if not settings.latency_routing:
+        return entries
+
+    def key(indexed: tuple[int, EntryT]) -> tuple[int, float, int]:
+        index, entry = indexed
+        return (*_rank_key(entry, settings, streaming), index)
+
+    return [entry for _, entry in sorted(enumerate(entries), key=key)]
+
+
+def rank_groups(
+    entries: Sequence[EntryT],
+    group_of: Callable[[EntryT], Hashable],
+    settings_provider: Callable[[], RoutingSettings] | None,
+    streaming: bool,
+) -> Sequence[EntryT]:
+    """按组排序：组的先后由组内最快的目标决定，组内保持传入的顺序"""
+    if settings_provider is None:
+        return entries
+    settings = settings_provider()
+    if not settings.latency_routing:
+        return entries
+    groups: dict[Hashable, list[EntryT]] = {}
+    for entry in entries:
+        groups.setdefault(group_of(entry), []).append(entry)
+
+    def key(indexed: tuple[int, list[EntryT]]) -> tuple[int, float, int]:
+        index, group = indexed
+        return (*min(_rank_key(entry, settings, streaming) for entry in group), index)
+
+    return [entry for _, group in sorted(enumerate(groups.values()), key=key) for entry in group]
+
+
+def _rank_key(entry: _RoutedEntry, settings: RoutingSettings, streaming: bool) -> tuple[int, float]:
+    if entry.stats is None:
+        return 0, 0.0
+    return entry.stats.rank_key(settings, streaming)
+
+
+def _ewma(previous: float | None, value: float, alpha: float) -> float:
+    if previous is None:
+        return value
+    return alpha * value + (1 - alpha) * previous
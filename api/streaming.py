@@ -1,121 +1,264 @@
 import json
-from collections.abc import Iterator
+from collections.abc import AsyncIterator, Iterator
 from typing import Any
 
+import httpx
 import requests
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
 
+from api import http_pool
 from api.error_request_logger import log_llm_error_request, log_llm_success_request
+from api.provider_errors import provider_http_error, provider_stream_error
 
 
 class IncompleteStreamError(RuntimeError):
     """上游连接在协议完成标记前结束。"""
 
 
+SSE_READ_SIZE = 65536
+
+
+class SSEDecoder:
+    """增量 SSE 解码器：按字节切分事件，只对完整的 data 字段做 UTF-8 解码。"""
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._data_lines: list[bytes | bytearray] = []
+
+    def feed(self, chunk: bytes) -> list[str]:
+        """喂入任意长度的字节块，返回其中已经以空行结束的事件 data。"""
+        if not chunk:
+            return []
+        buffer = self._buffer
+        buffer += chunk
+        events: list[str] = []
+        start = 0
+        length = len(buffer)
+        has_cr = b"\r" in buffer
+
+        while start < length:
+            end = buffer.find(b"\n", start)
+            if has_cr:
+                carriage = buffer.find(b"\r", start, length if end < 0 else end)
+                if carriage >= 0:
+                    if carriage + 1 == length:
+                        # 可能是被切开的 CRLF，等下一块数据再判断。
+                        break
+                    next_start = carriage + 2 if buffer[carriage + 1] == 0x0A else carriage + 1
+                    self._handle_line(buffer[start:carriage], events)
+                    start = next_start
+                    continue
+            if end < 0:
+                break
+            self._handle_line(buffer[start:end], events)
+            start = end + 1
+
+        if start:
+            del buffer[:start]
+        return events
+
+    def flush(self) -> list[str]:
+        """连接结束时处理残留的半行与未以空行结束的事件。"""
+        events: list[str] = []
+        if self._buffer:
+            line = bytes(self._buffer).rstrip(b"\r")
+            self._buffer.clear()
+            self._handle_line(line, events)
+        self._dispatch(events)
+        return events
+
+    def _handle_line(self, line: bytes | bytearray, events: list[str]) -> None:
+        if not line:
+            self._dispatch(events)
+            return
+        if line[0] == 0x3A:  # ":" 开头是注释
+            return
+
+        field, separator, value = line.partition(b":")
+        if field != b"data":
+            return
+        if separator and value.startswith(b" "):
+            value = value[1:]
+        self._data_lines.append(value)
+
+    def _dispatch(self, events: list[str]) -> None:
+        if not self._data_lines:
+            return
+        data_lines = self._data_lines
+        self._data_lines = []
+        if len(data_lines) == 1:
+            data = data_lines[0]
+        else:
+            data = b"\n".join(data_lines)
+        events.append(data.decode("utf-8", errors="replace"))
+
+
+def iter_response_bytes(response: requests.Response) -> Iterator[bytes]:
+    """按到达顺序读取响应字节；每次只取 socket 当前可用的数据，不等待凑满缓冲区。"""
+    raw = getattr(response, "raw", None)
+    read1 = getattr(raw, "read1", None)
+    if not callable(read1):
+        yield from response.iter_content(chunk_size=None)
+        return
+
+    while True:
+        try:
+            chunk = read1(SSE_READ_SIZE, decode_content=True)
+        except ProtocolError as exception:
+            raise requests.exceptions.ChunkedEncodingError(exception) from exception
+        except ReadTimeoutError as exception:
+            raise requests.exceptions.ConnectionError(exception) from exception
+        if not chunk:
+            return
+        yield chunk
+
+
 def iter_sse_data(response: requests.Response) -> Iterator[str]:
     """解析 SSE 响应，只返回每个事件合并后的 data 字段。"""
-    response.encoding = "utf-8"
-    data_lines: list[str] = []
-
-    for line in response.iter_lines(chunk_size=1, decode_unicode=True):
-        if line is None:
-            continue
-        if line == "":
-            if data_lines:
-                yield "\n".join(data_lines)
-                data_lines = []
-            continue
-        if line.startswith(":"):
-            continue
-
-        field, separator, value = line.partition(":")
-        if field != "data":
-            continue
-        if separator and value.startswith(" "):
-            value = value[1:]
-        data_lines.append(value)
+    decoder = SSEDecoder()
+    for chunk in iter_response_bytes(response):
+        yield from decoder.feed(chunk)
+    yield from decoder.flush()
 
-    if data_lines:
-        yield "\n".join(data_lines)
 
+class OpenAIContentParser:
+    """OpenAI-compatible SSE data -> 可见文本增量；同步与异步读取共用。"""
 
-def iter_openai_content(
-    response: requests.Response,
-    *,
-    cumulative_content: bool = False,
-) -> Iterator[str]:
-    """将 OpenAI-compatible SSE 统一成真正的可见文本增量。"""
-    accumulated_content = ""
-    completed = False
+    def __init__(self, *, cumulative_content: bool = False) -> None:
+        self.cumulative_content = cumulative_content
+        self.done = False
+        self._completed = False
+        self._accumulated_content = ""
 
-    for data in iter_sse_data(response):
+    def parse(self, data: str) -> str | None:
         if data == "[DONE]":
-            return
+            self.done = True
+            return None
 
         payload = json.loads(data)
         if payload.get("error") is not None:
-            raise RuntimeError(f"上游流式响应错误: {payload['error']}")
+            raise provider_stream_error(payload["error"])
         choices = payload.get("choices")
         if not isinstance(choices, list) or not choices:
-            continue
+            return None
 
         choice = choices[0]
         if not isinstance(choice, dict):
-            continue
+            return None
         if choice.get("finish_reason") is not None:
-            completed = True
+            self._completed = True
 
         delta = choice.get("delta")
         if not isinstance(delta, dict):
-            continue
+            return None
         content = delta.get("content")
         if not isinstance(content, str) or not content:
-            continue
+            return None
 
-        if not cumulative_content:
-            yield content
-            continue
+        if not self.cumulative_content:
+            return content
 
-        if content.startswith(accumulated_content):
-            new_content = content[len(accumulated_content):]
-            accumulated_content = content
+        if content.startswith(self._accumulated_content):
+            new_content = content[len(self._accumulated_content):]
+            self._accumulated_content = content
         else:
             new_content = content
-            accumulated_content += content
-        if new_content:
-            yield new_content
+            self._accumulated_content += content
+        return new_content or None
 
-    if not completed:
-        raise IncompleteStreamError("上游流式响应在完成标记前结束")
+    def finish(self) -> None:
+        if not self._completed:
+            raise IncompleteStreamError("上游流式响应在完成标记前结束")
 
 
-def iter_anthropic_content(response: requests.Response) -> Iterator[str]:
-    """将 Anthropic Messages SSE 统一成可见文本增量。"""
-    for data in iter_sse_data(response):
+class AnthropicContentParser:
+    """Anthropic Messages SSE data -> 可见文本增量；同步与异步读取共用。"""
+
+    def __init__(self) -> None:
+        self.done = False
+
+    def parse(self, data: str) -> str | None:
         payload = json.loads(data)
         event_type = payload.get("type")
         if event_type == "message_stop":
-            return
+            self.done = True
+            return None
         if event_type == "error":
-            raise RuntimeError(f"上游流式响应错误: {payload.get('error')}")
+            raise provider_stream_error(payload.get("error"))
 
         if event_type == "content_block_start":
             content_block = payload.get("content_block")
             if isinstance(content_block, dict) and content_block.get("type") == "text":
                 text = content_block.get("text")
                 if isinstance(text, str) and text:
-                    yield text
-            continue
+                    return text
+            return None
 
         if event_type != "content_block_delta":
-            continue
+            return None
         delta = payload.get("delta")
         if not isinstance(delta, dict) or delta.get("type") != "text_delta":
-            continue
+            return None
         text = delta.get("text")
         if isinstance(text, str) and text:
-            yield text
+            return text
+        return None
+
+    def finish(self) -> None:
+        raise IncompleteStreamError("上游流式响应在 message_stop 前结束")
 
-    raise IncompleteStreamError("上游流式响应在 message_stop 前结束")
+
+ContentParser = OpenAIContentParser | AnthropicContentParser
+
+
+def _build_content_parser(protocol: str, cumulative_content: bool) -> ContentParser:
+    if protocol == "anthropic":
+        return AnthropicContentParser()
+    return OpenAIContentParser(cumulative_content=cumulative_content)
+
+
+def _iter_content(response: requests.Response, parser: ContentParser) -> Iterator[str]:
+    for data in iter_sse_data(response):
+        content = parser.parse(data)
+        if parser.done:
+            return
+        if content:
+            yield content
+    parser.finish()
+
+
+def iter_openai_content(
+    response: requests.Response,
+    *,
+    cumulative_content: bool = False,
+) -> Iterator[str]:
+    """将 OpenAI-compatible SSE 统一成真正的可见文本增量。"""
+    yield from _iter_content(response, OpenAIContentParser(cumulative_content=cumulative_content))
+
+
+def iter_anthropic_content(response: requests.Response) -> Iterator[str]:
+    """将 Anthropic Messages SSE 统一成可见文本增量。"""
+    yield from _iter_content(response, AnthropicContentParser())
+
+
+async def aiter_sse_data(response: httpx.Response) -> AsyncIterator[str]:
+    """异步版 iter_sse_data：按到达顺序解码 httpx 响应字节。"""
+    decoder = SSEDecoder()
+    async for chunk in response.aiter_bytes():
+        for data in decoder.feed(chunk):
+            yield data
+    for data in decoder.flush():
+        yield data
+
+
+async def _aiter_content(response: httpx.Response, parser: ContentParser) -> AsyncIterator[str]:
+    async for data in aiter_sse_data(response):
+        content = parser.parse(data)
+        if parser.done:
+            return
+        if content:
+            yield content
+    parser.finish()
 
 
 def stream_chat_completion(
@@ -137,22 +280,19 @@ def stream_chat_completion(
 
     try:
         try:
-            response = requests.post(url, headers=headers, json=body, stream=True)
+            response = http_pool.post(url, headers=headers, json=body, stream=True)
         except requests.exceptions.RequestException as exception:
             log_llm_error_request(provider, url, body, exception=exception)
             raise
 
         if response.status_code != 200:
             log_llm_error_request(provider, url, body, response=response)
-            raise Exception(f"{error_prefix}: {response.status_code}, {response.text}")
+            raise provider_http_error(error_prefix, response)
 
-        if protocol == "anthropic":
-            content_iterator = iter_anthropic_content(response)
-        else:
-            content_iterator = iter_openai_content(
-                response,
-                cumulative_content=cumulative_content,
-            )
+        content_iterator = _iter_content(
+            response,
+            _build_content_parser(protocol, cumulative_content),
+        )
 
         try:
             for chunk in content_iterator:
@@ -182,3 +322,60 @@ def stream_chat_completion(
             response=response,
             response_body="".join(chunks),
         )
+
+
+async def stream_chat_completion_async(
+    *,
+    provider: str,
+    url: str,
+    headers: dict[str, str],
+    request_body: dict[str, Any],
+    error_prefix: str,
+    protocol: str = "openai",
+    cumulative_content: bool = False,
+) -> AsyncIterator[str]:
+    """stream_chat_completion 的异步版本；退出时释放连接回连接池。"""
+    body = dict(request_body)
+    body["stream"] = True
+    chunks: list[str] = []
+
+    try:
+        stream_context = http_pool.async_stream(url, headers=headers, json=body)
+        response = await stream_context.__aenter__()
+    except httpx.HTTPError as exception:
+        log_llm_error_request(provider, url, body, exception=exception)
+        raise
+
+    try:
+        if response.status_code != 200:
+            await response.aread()
+            log_llm_error_request(provider, url, body, response=response)
+            raise provider_http_error(error_prefix, response)
+
+        try:
+            async for chunk in _aiter_content(
+                response,
+                _build_content_parser(protocol, cumulative_content),
+            ):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as exception:
+            log_llm_error_request(
+                provider,
+                url,
+                body,
+                response=response,
+                response_body="".join(chunks),
+                exception=exception,
+            )
+            raise
+    finally:
+        await stream_context.__aexit__(None, None, None)
+
+    log_llm_success_request(
+        provider,
+        url,
+        body,
+        response=response,
+        response_body="".join(chunks),
+    )
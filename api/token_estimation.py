@@ -0,0 +1,28 @@
+"""本地快速估算 token 数，供历史窗口裁剪和客户端限流共用。
+
+估算只看字符：ASCII 约 4 个字符一个 token，其他字符（中文等）每个约一个 token，
+结果与服务商的实际计数有出入，但不需要加载分词器。
+"""
+
+from typing import Any, Dict, Sequence
+
+# 每条消息的角色、分隔符等格式开销（按 OpenAI 消息格式的经验值估算）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: Any) -> int:
+    """本地快速估算 token 数：ASCII 约 4 个字符一个 token，其他字符（中文等）每个约一个 token"""
+    if not isinstance(text, str):
+        text = str(text)
+    length = len(text)
+    # 非 ASCII 字符在 UTF-8 中多为 3 字节，用编码后长度差推算其个数，避免逐字符遍历
+    non_ascii = (len(text.encode("utf-8")) - length) // 2
+    return (length - non_ascii + 3) // 4 + non_ascii
+
+
+def estimate_message_tokens(message: Dict[str, Any]) -> int:
+    return MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content") or "")
+
+
+def estimate_prompt_tokens(messages: Sequence[Dict[str, Any]]) -> int:
+    return sum(estimate_message_tokens(message) for message in messages)
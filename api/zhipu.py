@@ -1,12 +1,15 @@
-from collections.abc import Iterator
-from typing import Dict, List
+from collections.abc import AsyncIterator, Iterator
+from typing import Any, Dict, List, Tuple
 
+import httpx
 import requests
 
+from api import http_pool
 from api.base_api import BaseApi
 from api.error_request_logger import log_llm_error_request, log_llm_success_request
 from api.param_schema import ParamType, ProviderParam
-from api.streaming import stream_chat_completion
+from api.provider_errors import provider_http_error
+from api.streaming import stream_chat_completion, stream_chat_completion_async
 
 
 class Zhipu(BaseApi):
@@ -57,25 +60,41 @@ class Zhipu(BaseApi):
             self.base_url = "https://open.bigmodel.cn/api/paas/v4/"
 
     def reason(self, messages: List[Dict[str, str]]) -> str:
-        url = f"{self.base_url}/chat/completions"
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": self.model,
-            "messages": messages,
-            "temperature": 1.0
-        }
-        
+        url, headers, data = self._build_request(messages)
+
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = http_pool.post(url, headers=headers, json=data)
         except requests.exceptions.RequestException as exception:
             log_llm_error_request("zhipu", url, data, exception=exception)
             raise
-        
+        return self._handle_response(url, data, response)
+
+    def reason_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        url, headers, data = self._build_request(messages)
+        yield from stream_chat_completion(
+            provider="zhipu",
+            url=url,
+            headers=headers,
+            request_body=data,
+            error_prefix="API调用失败",
+        )
+
+    async def reason_async(self, messages: List[Dict[str, str]]) -> str:
+        url, headers, data = self._build_request(messages)
+
+        try:
+            response = await http_pool.async_post(url, headers=headers, json=data)
+        except httpx.HTTPError as exception:
+            log_llm_error_request("zhipu", url, data, exception=exception)
+            raise
+        return self._handle_response(url, data, response)
+
+    def _handle_response(
+        self,
+        url: str,
+        data: Dict[str, Any],
+        response: requests.Response | httpx.Response,
+    ) -> str:
         if response.status_code == 200:
             try:
                 result = response.json()
@@ -85,11 +104,21 @@ class Zhipu(BaseApi):
                 raise
             log_llm_success_request("zhipu", url, data, response=response)
             return response_content
-        else:
-            log_llm_error_request("zhipu", url, data, response=response)
-            raise Exception(f"API调用失败: {response.status_code}, {response.text}")
+        log_llm_error_request("zhipu", url, data, response=response)
+        raise provider_http_error("API调用失败", response)
 
-    def reason_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+    async def reason_stream_async(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        url, headers, data = self._build_request(messages)
+        async for chunk in stream_chat_completion_async(
+            provider="zhipu",
+            url=url,
+            headers=headers,
+            request_body=data,
+            error_prefix="API调用失败",
+        ):
+            yield chunk
+
+    def _build_request(self, messages: List[Dict[str, str]]) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
         url = f"{self.base_url}/chat/completions"
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -100,10 +129,4 @@ class Zhipu(BaseApi):
             "messages": messages,
             "temperature": 1.0,
         }
-        yield from stream_chat_completion(
-            provider="zhipu",
-            url=url,
-            headers=headers,
-            request_body=data,
-            error_prefix="API调用失败",
-        )
+        return url, headers, data
@@ -1,8 +1,11 @@
+import argparse
 import logging
 import sys
 
 from api.credentials_watcher import start_credentials_watcher
-from server.web_server import app, sm
+
+HOST = "0.0.0.0"
+PORT = 11301
 
 
 def _configure_logging() -> None:
@@ -16,7 +19,75 @@ def _configure_logging() -> None:
     )
 
 
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="多 AI 服务商网关服务")
+    parser.add_argument(
+        "--asgi",
+        action="store_true",
+        help="使用 ASGI (uvicorn) 模式启动，流式连接不再占用线程",
+    )
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        help="使用 gunicorn 多进程启动（配置在 fork 前预加载）",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="worker 进程数，默认等于 CPU 核数（仅 --production）",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="每个 worker 的线程数，默认 8（仅 --production 的 Flask 模式）",
+    )
+    parser.add_argument(
+        "--backlog",
+        type=int,
+        default=None,
+        help="监听队列长度，默认 2048（仅 --production）",
+    )
+    return parser.parse_args()
+
+
+def _run_flask() -> None:
+    from server.web_server import app, sm
+
+    start_credentials_watcher(sm.api_factory)
+    app.run(debug=False, port=PORT, host=HOST)
+
+
+def _run_asgi() -> None:
+    import uvicorn
+
+    from server.asgi import app, sm
+
+    start_credentials_watcher(sm.api_factory)
+    uvicorn.run(app, host=HOST, port=PORT, log_config=None)
+
+
+def _run_production(args: argparse.Namespace) -> None:
+    from server.production import ProductionOptions, run
+
+    defaults = ProductionOptions
+    run(ProductionOptions(
+        host=HOST,
+        port=PORT,
+        workers=args.workers or defaults.default_workers(),
+        threads=args.threads or defaults.DEFAULT_THREADS,
+        backlog=args.backlog or defaults.DEFAULT_BACKLOG,
+        asgi=args.asgi,
+    ))
+
+
 if __name__ == "__main__":
+    args = _parse_args()
     _configure_logging()
-    start_credentials_watcher(sm.api_factory)
-    app.run(debug=False, port=11301, host="0.0.0.0")
+    if args.production:
+        _run_production(args)
+    elif args.asgi:
+        _run_asgi()
+    else:
+        _run_flask()
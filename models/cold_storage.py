@@ -0,0 +1,265 @@
+"""把空闲会话的历史压缩保存在内存中，下次访问时透明解压。"""
+
+import json
+import lzma
+import threading
+import time
+import weakref
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List
+
+from api.param_schema import ParamType, ProviderParam, unquote, validate_params
+from models.message import compact_message
+
+if TYPE_CHECKING:
+    from models.session_manager import Session
+
+
+class HistoryCodec(ABC):
+    """历史压缩算法，compress/decompress 必须线程安全"""
+
+    name: str
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def decompress(self, data: bytes) -> bytes:
+        pass
+
+
+class ZlibCodec(HistoryCodec):
+    name = "zlib"
+    LEVEL = 6
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.LEVEL)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class LzmaCodec(HistoryCodec):
+    """压缩率高于 zlib，但压缩更慢"""
+
+    name = "lzma"
+    PRESET = 1
+
+    def compress(self, data: bytes) -> bytes:
+        return lzma.compress(data, preset=self.PRESET)
+
+    def decompress(self, data: bytes) -> bytes:
+        return lzma.decompress(data)
+
+
+class ZstdCodec(HistoryCodec):
+    """需要 Python 3.14 起自带的 compression.zstd"""
+
+    name = "zstd"
+
+    def __init__(self) -> None:
+        from compression import zstd
+
+        self._zstd = zstd
+
+    def compress(self, data: bytes) -> bytes:
+        return self._zstd.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._zstd.decompress(data)
+
+
+_CODECS: Dict[str, Callable[[], HistoryCodec]] = {
+    ZlibCodec.name: ZlibCodec,
+    LzmaCodec.name: LzmaCodec,
+}
+try:
+    from compression import zstd as _zstd  # noqa: F401
+except ImportError:
+    pass
+else:
+    _CODECS[ZstdCodec.name] = ZstdCodec
+_codec_instances: Dict[str, HistoryCodec] = {}
+_codecs_lock = threading.Lock()
+
+
+def register_codec(name: str, factory: Callable[[], HistoryCodec]) -> None:
+    """注册自定义压缩算法，之后可在 [cold_storage] CODEC 中使用"""
+    with _codecs_lock:
+        _CODECS[name.lower()] = factory
+        _codec_instances.pop(name.lower(), None)
+
+
+def available_codecs() -> List[str]:
+    return list(_CODECS)
+
+
+def get_codec(name: str) -> HistoryCodec:
+    name = name.lower()
+    with _codecs_lock:
+        codec = _codec_instances.get(name)
+        if codec is None:
+            if name not in _CODECS:
+                raise ValueError(f"不支持的压缩算法: {name}")
+            codec = _codec_instances[name] = _CODECS[name]()
+        return codec
+
+
+@dataclass(frozen=True)
+class ColdStorageSettings:
+    """[cold_storage] 配置段，IDLE_SECONDS 为 0 时不压缩"""
+
+    SECTION_NAME = "cold_storage"
+    DEFAULT_IDLE_SECONDS = 0.0
+    DEFAULT_CODEC = ZlibCodec.name
+
+    idle_seconds: float = DEFAULT_IDLE_SECONDS
+    codec: str = DEFAULT_CODEC
+
+    @classmethod
+    def get_params(cls) -> List[ProviderParam]:
+        return [
+            ProviderParam(
+                name="idle_seconds",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_IDLE_SECONDS,
+                description="会话空闲多少秒后压缩其历史，0 表示不压缩",
+            ),
+            ProviderParam(
+                name="codec",
+                param_type=ParamType.STRING,
+                required=False,
+                default=cls.DEFAULT_CODEC,
+                description="压缩算法：zlib、lzma，Python 3.14 起还可使用 zstd",
+            ),
+        ]
+
+    @classmethod
+    def validate_config(cls, config: Dict[str, Any]) -> tuple[bool, List[str]]:
+        is_valid, errors = validate_params(cls.get_params(), config)
+        idle_seconds = config.get("idle_seconds")
+        if isinstance(idle_seconds, (int, float)) and idle_seconds < 0:
+            errors.append("idle_seconds must not be negative")
+        codec = config.get("codec")
+        if isinstance(codec, str) and unquote(codec).lower() not in _CODECS:
+            errors.append(f"codec must be one of: {', '.join(_CODECS)}")
+        return is_valid and not errors, errors
+
+
+class FrozenHistory:
+    """压缩后的历史，解压时使用压缩时的算法，不受之后配置修改影响"""
+
+    __slots__ = ("codec", "payload", "raw_size", "storage", "__weakref__")
+
+    def __init__(self, storage: "ColdStorage", codec: HistoryCodec, payload: bytes, raw_size: int) -> None:
+        self.storage = storage
+        self.codec = codec
+        self.payload = payload
+        self.raw_size = raw_size
+
+    def thaw(self) -> List[Dict[str, Any]]:
+        return self.storage.thaw(self)
+
+    def decode(self) -> List[Dict[str, Any]]:
+        """解压出一份临时的历史，不计入解压统计，压缩数据保持不变"""
+        return self.storage.decode(self)
+
+
+class ColdStorage:
+    """按 [cold_storage] 配置压缩空闲会话的历史，并统计压缩率和解压耗时"""
+
+    # 太短的历史压缩收益小于 FrozenHistory 本身的开销
+    MIN_HISTORY_BYTES = 1024
+
+    def __init__(
+        self,
+        settings_provider: Callable[[], ColdStorageSettings],
+        timer: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        self._settings_provider = settings_provider
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._frozen_sessions = 0
+        self._raw_bytes = 0
+        self._compressed_bytes = 0
+        self._freezes = 0
+        self._rehydrations = 0
+        self._rehydration_seconds = 0.0
+        self._max_rehydration_seconds = 0.0
+        self._last_rehydration_seconds = 0.0
+
+    def freeze_idle(self, sessions: List["Session"], now: float) -> List["Session"]:
+        """压缩空闲超过阈值的会话，返回本次压缩的会话"""
+        settings = self._settings_provider()
+        if not settings.idle_seconds:
+            return []
+        codec = get_codec(unquote(settings.codec))
+        return [
+            session
+            for session in sessions
+            if now - session.last_access > settings.idle_seconds and session.freeze_history(self, codec)
+        ]
+
+    def freeze(self, history: List[Dict[str, Any]], codec: HistoryCodec) -> FrozenHistory | None:
+        raw = json.dumps(history, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if len(raw) < self.MIN_HISTORY_BYTES:
+            return None
+        frozen = FrozenHistory(self, codec, codec.compress(raw), len(raw))
+        with self._lock:
+            self._freezes += 1
+            self._frozen_sessions += 1
+            self._raw_bytes += frozen.raw_size
+            self._compressed_bytes += len(frozen.payload)
+        # 解压、历史被替换或会话被淘汰后，压缩数据随对象回收从统计中扣除
+        weakref.finalize(frozen, self._forget, frozen.raw_size, len(frozen.payload))
+        return frozen
+
+    def thaw(self, frozen: FrozenHistory) -> List[Dict[str, Any]]:
+        started = self._timer()
+        history = self.decode(frozen)
+        elapsed = self._timer() - started
+        with self._lock:
+            self._rehydrations += 1
+            self._rehydration_seconds += elapsed
+            self._last_rehydration_seconds = elapsed
+            self._max_rehydration_seconds = max(self._max_rehydration_seconds, elapsed)
+        return history
+
+    @staticmethod
+    def decode(frozen: FrozenHistory) -> List[Dict[str, Any]]:
+        return [
+            compact_message(message)
+            for message in json.loads(frozen.codec.decompress(frozen.payload))
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        settings = self._settings_provider()
+        with self._lock:
+            average = self._rehydration_seconds / self._rehydrations if self._rehydrations else 0.0
+            return {
+                "idle_seconds": settings.idle_seconds,
+                "codec": unquote(settings.codec).lower(),
+                "frozen_sessions": self._frozen_sessions,
+                "raw_bytes": self._raw_bytes,
+                "compressed_bytes": self._compressed_bytes,
+                "compression_ratio": (
+                    round(self._raw_bytes / self._compressed_bytes, 2) if self._compressed_bytes else None
+                ),
+                "freezes": self._freezes,
+                "rehydrations": self._rehydrations,
+                "rehydration_ms": {
+                    "avg": round(average * 1000, 3),
+                    "max": round(self._max_rehydration_seconds * 1000, 3),
+                    "last": round(self._last_rehydration_seconds * 1000, 3),
+                },
+            }
+
+    def _forget(self, raw_size: int, compressed_size: int) -> None:
+        with self._lock:
+            self._frozen_sessions -= 1
+            self._raw_bytes -= raw_size
+            self._compressed_bytes -= compressed_size
@@ -0,0 +1,231 @@
+"""把长会话中较早的历史在后台压缩成摘要。
+
+会话历史的估算 token 数超过阈值后，由指定的（通常较便宜的）服务商在后台线程
+中生成摘要，替换最近几轮之前的全部历史。正在进行的请求不会等待摘要完成。
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List
+
+from api.param_schema import ParamType, ProviderParam, unquote, validate_params
+from api.token_estimation import estimate_message_tokens
+
+if TYPE_CHECKING:
+    from api.api_factory import ApiFactory
+    from models.session_manager import Session
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTION = (
+    "你是对话摘要助手。请用简洁的中文概括下面的对话，保留其中的事实、结论、约定、"
+    "用户偏好和尚未完成的事项，不要添加对话中没有的信息，只输出摘要正文。"
+)
+SUMMARY_PREFIX = "此前对话的摘要：\n"
+
+
+@dataclass(frozen=True)
+class HistorySummarySettings:
+    """[history_summary] 配置段，THRESHOLD_TOKENS 为 0 时不压缩"""
+
+    SECTION_NAME = "history_summary"
+    DEFAULT_THRESHOLD_TOKENS = 0
+    DEFAULT_KEEP_RECENT_TURNS = 4
+
+    threshold_tokens: int = DEFAULT_THRESHOLD_TOKENS
+    keep_recent_turns: int = DEFAULT_KEEP_RECENT_TURNS
+    provider: str = ""
+    model: str = ""
+
+    @classmethod
+    def get_params(cls) -> List[ProviderParam]:
+        return [
+            ProviderParam(
+                name="threshold_tokens",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_THRESHOLD_TOKENS,
+                description="会话历史估算超过多少 token 后在后台压缩为摘要，0 表示不压缩",
+            ),
+            ProviderParam(
+                name="keep_recent_turns",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_KEEP_RECENT_TURNS,
+                description="压缩时原样保留的最近轮数",
+            ),
+            ProviderParam(
+                name="provider",
+                param_type=ParamType.STRING,
+                required=False,
+                default="",
+                description="生成摘要使用的服务商，留空使用默认服务商链",
+            ),
+            ProviderParam(
+                name="model",
+                param_type=ParamType.STRING,
+                required=False,
+                default="",
+                description="生成摘要使用的模型，需同时配置 PROVIDER",
+            ),
+        ]
+
+    @classmethod
+    def validate_config(cls, config: Dict[str, Any]) -> tuple[bool, List[str]]:
+        is_valid, errors = validate_params(cls.get_params(), config)
+        for name in ("threshold_tokens", "keep_recent_turns"):
+            value = config.get(name)
+            if isinstance(value, int) and value < 0:
+                errors.append(f"{name} must not be negative")
+        model = config.get("model")
+        provider = config.get("provider")
+        if isinstance(model, str) and unquote(model) and not (isinstance(provider, str) and unquote(provider)):
+            errors.append("model requires provider")
+        return is_valid and not errors, errors
+
+
+class CompactionState:
+    """单个会话的压缩状态与节省统计，统计只覆盖当前进程。
+
+    tokens/bytes_saved_per_request 为当前摘要相比其替换掉的原始消息每次请求少发送的量，
+    tokens/bytes_avoided 为压缩后所有请求累计少发送的量。
+    """
+
+    def __init__(self) -> None:
+        self.in_progress = False
+        self.compactions = 0
+        self.summarized_messages = 0
+        self.last_error: str | None = None
+        # 被摘要替换掉的原始消息累计大小
+        self._source_tokens = 0
+        self._source_bytes = 0
+        self._summary_tokens = 0
+        self._summary_bytes = 0
+        self.tokens_avoided = 0
+        self.bytes_avoided = 0
+
+    def record_compaction(self, summarized: List[Dict[str, Any]], summary: Dict[str, Any]) -> None:
+        # 新摘要取代旧摘要；旧摘要对应的原始消息已累计在 _source_* 中
+        self.compactions += 1
+        self.summarized_messages += len(summarized)
+        self._source_tokens += sum(estimate_message_tokens(message) for message in summarized)
+        self._source_bytes += sum(_message_bytes(message) for message in summarized)
+        self._summary_tokens = estimate_message_tokens(summary)
+        self._summary_bytes = _message_bytes(summary)
+        self.last_error = None
+
+    def record_request(self) -> None:
+        if self.compactions:
+            self.tokens_avoided += self.tokens_saved_per_request
+            self.bytes_avoided += self.bytes_saved_per_request
+
+    def forget_summary(self) -> None:
+        """清空历史后摘要随之作废，之后的请求不再计入节省；累计值保留"""
+        self._source_tokens = self._source_bytes = 0
+        self._summary_tokens = self._summary_bytes = 0
+
+    @property
+    def tokens_saved_per_request(self) -> int:
+        return max(0, self._source_tokens - self._summary_tokens)
+
+    @property
+    def bytes_saved_per_request(self) -> int:
+        return max(0, self._source_bytes - self._summary_bytes)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_progress": self.in_progress,
+            "compactions": self.compactions,
+            "summarized_messages": self.summarized_messages,
+            "tokens_saved_per_request": self.tokens_saved_per_request,
+            "bytes_saved_per_request": self.bytes_saved_per_request,
+            "tokens_avoided": self.tokens_avoided,
+            "bytes_avoided": self.bytes_avoided,
+            "last_error": self.last_error,
+        }
+
+
+class HistorySummarizer:
+    """在后台线程池中为超出阈值的会话生成摘要"""
+
+    MAX_WORKERS = 2
+
+    def __init__(
+        self,
+        api_factory: "ApiFactory",
+        settings_provider: Callable[[], HistorySummarySettings],
+    ) -> None:
+        self._api_factory = api_factory
+        self._settings_provider = settings_provider
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+
+    def maybe_schedule(self, session: "Session") -> bool:
+        """会话历史超过阈值且没有进行中的压缩时提交后台任务，返回是否提交"""
+        settings = self._settings_provider()
+        if not settings.threshold_tokens:
+            return False
+        candidate = session._begin_compaction(settings.threshold_tokens, settings.keep_recent_turns)
+        if candidate is None:
+            return False
+        self._get_executor().submit(self._summarize, session, settings, *candidate)
+        return True
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _summarize(
+        self,
+        session: "Session",
+        settings: HistorySummarySettings,
+        summarized: List[Dict[str, Any]],
+        previous_summary: List[Dict[str, Any]],
+    ) -> None:
+        try:
+            client = self._get_client(settings)
+            content = client.reason(self._build_prompt(summarized, previous_summary))
+            summary = {"role": "system", "content": SUMMARY_PREFIX + str(content).strip()}
+            session._finish_compaction(summarized, previous_summary, summary)
+        except Exception as exception:
+            logger.exception("history summary failed: session=%s", session.id)
+            session._fail_compaction(f"{type(exception).__name__}: {exception}")
+
+    def _get_client(self, settings: HistorySummarySettings) -> Any:
+        provider = unquote(settings.provider) or None
+        model = unquote(settings.model) or None
+        if model is None:
+            return self._api_factory.get_client(provider)
+        return self._api_factory.get_client(provider, model)
+
+    @staticmethod
+    def _build_prompt(
+        summarized: List[Dict[str, Any]],
+        previous_summary: List[Dict[str, Any]],
+    ) -> List[Dict[str, str]]:
+        role_names = {"user": "用户", "assistant": "助手", "system": "摘要"}
+        lines = [
+            f"{role_names.get(message.get('role'), message.get('role'))}: {message.get('content')}"
+            for message in [*previous_summary, *summarized]
+        ]
+        return [
+            {"role": "system", "content": SUMMARY_INSTRUCTION},
+            {"role": "user", "content": "\n\n".join(lines)},
+        ]
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.MAX_WORKERS,
+                    thread_name_prefix="history-summary",
+                )
+            return self._executor
+
+
+def _message_bytes(message: Dict[str, Any]) -> int:
+    return len(str(message.get("content") or "").encode("utf-8"))
@@ -0,0 +1,153 @@
+"""按 token 预算裁剪发送给模型的历史消息。"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence
+
+from api.param_schema import ParamType, ProviderParam, unquote, validate_params
+from api.token_estimation import estimate_message_tokens
+
+@dataclass(frozen=True)
+class HistoryWindow:
+    """单个服务商/模型的历史窗口。预算不足时仍保留系统消息和本轮用户消息"""
+
+    max_tokens: int
+    strategy: str = "drop_oldest"
+    keep_first_turns: int = 0
+
+    def select(
+        self,
+        system_part: Sequence[Dict[str, Any]],
+        history: Sequence[Dict[str, Any]],
+        current: Dict[str, Any],
+    ) -> List[Dict[str, Any]]:
+        remaining = self.max_tokens - sum(
+            estimate_message_tokens(message) for message in [*system_part, current]
+        )
+        # 历史按 user/assistant 成对保存，以完整的一轮为单位取舍
+        turns = [list(history[index:index + 2]) for index in range(0, len(history), 2)]
+        costs = [sum(estimate_message_tokens(message) for message in turn) for turn in turns]
+
+        first_count = 0
+        if self.strategy == HistoryWindowSettings.KEEP_FIRST_LAST:
+            while first_count < min(self.keep_first_turns, len(turns)) and costs[first_count] <= remaining:
+                remaining -= costs[first_count]
+                first_count += 1
+
+        last_start = len(turns)
+        while last_start > first_count and costs[last_start - 1] <= remaining:
+            remaining -= costs[last_start - 1]
+            last_start -= 1
+
+        selected = [*system_part]
+        for turn in turns[:first_count] + turns[last_start:]:
+            selected.extend(turn)
+        selected.append(current)
+        return selected
+
+
+@dataclass(frozen=True)
+class HistoryWindowSettings:
+    """[history_window] 配置段，MAX_TOKENS 为 0 时不裁剪历史"""
+
+    SECTION_NAME = "history_window"
+    DROP_OLDEST = "drop_oldest"
+    KEEP_FIRST_LAST = "keep_first_last"
+    STRATEGIES = (DROP_OLDEST, KEEP_FIRST_LAST)
+    DEFAULT_MAX_TOKENS = 0
+    DEFAULT_KEEP_FIRST_TURNS = 1
+
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    strategy: str = DROP_OLDEST
+    keep_first_turns: int = DEFAULT_KEEP_FIRST_TURNS
+    budgets: str = ""
+
+    @classmethod
+    def get_params(cls) -> List[ProviderParam]:
+        return [
+            ProviderParam(
+                name="max_tokens",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_MAX_TOKENS,
+                description="默认的上下文 token 预算（系统消息 + 历史 + 本轮问题），0 表示不裁剪",
+            ),
+            ProviderParam(
+                name="strategy",
+                param_type=ParamType.STRING,
+                required=False,
+                default=cls.DROP_OLDEST,
+                description="超出预算时的裁剪策略：drop_oldest 丢弃最早的轮次，keep_first_last 保留最早 N 轮和最新的轮次",
+            ),
+            ProviderParam(
+                name="keep_first_turns",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_KEEP_FIRST_TURNS,
+                description="keep_first_last 策略下始终保留的最早轮数",
+            ),
+            ProviderParam(
+                name="budgets",
+                param_type=ParamType.STRING,
+                required=False,
+                default="",
+                description="按服务商或模型覆盖预算，例如 zhipu=128000,zhipu:glm-4-flash=32000",
+            ),
+        ]
+
+    @classmethod
+    def validate_config(cls, config: Dict[str, Any]) -> tuple[bool, List[str]]:
+        is_valid, errors = validate_params(cls.get_params(), config)
+        for name in ("max_tokens", "keep_first_turns"):
+            value = config.get(name)
+            if isinstance(value, int) and value < 0:
+                errors.append(f"{name} must not be negative")
+        strategy = config.get("strategy")
+        if isinstance(strategy, str) and unquote(strategy).lower() not in cls.STRATEGIES:
+            errors.append(f"strategy must be one of: {', '.join(cls.STRATEGIES)}")
+        budgets = config.get("budgets")
+        if isinstance(budgets, str):
+            try:
+                _parse_budgets(budgets)
+            except ValueError as exception:
+                errors.append(str(exception))
+        return is_valid and not errors, errors
+
+    def window_for(self, provider: str | None, model: str | None) -> HistoryWindow | None:
+        """返回会话所用服务商/模型的窗口；预算为 0 时返回 None，表示发送完整历史"""
+        budgets = _parse_budgets(self.budgets)
+        provider_name = provider.strip().lower() if provider else None
+        max_tokens = self.max_tokens
+        if provider_name is not None:
+            max_tokens = budgets.get(provider_name, max_tokens)
+            if model:
+                max_tokens = budgets.get(f"{provider_name}:{model.strip().lower()}", max_tokens)
+        if not max_tokens:
+            return None
+        return HistoryWindow(
+            max_tokens=max_tokens,
+            strategy=unquote(self.strategy).lower(),
+            keep_first_turns=self.keep_first_turns,
+        )
+
+
+@lru_cache(maxsize=16)
+def _parse_budgets(value: str) -> Dict[str, int]:
+    budgets: Dict[str, int] = {}
+    for item in unquote(value).split(","):
+        item = item.strip()
+        if not item:
+            continue
+        target, separator, raw_tokens = item.rpartition("=")
+        target = target.strip()
+        if not separator or not target:
+            raise ValueError(f"budgets 格式错误: {item}")
+        try:
+            tokens = int(raw_tokens)
+        except ValueError:
+            raise ValueError(f"budgets 中的预算必须是整数: {item}") from None
+        if tokens < 0:
+            raise ValueError(f"budgets 中的预算不能为负数: {item}")
+        # 服务商名本身可能含冒号（chat_completion:xxx），整体按小写匹配即可
+        budgets[target.lower()] = tokens
+    return budgets
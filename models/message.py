@@ -1,8 +1,104 @@
+import sys
+from collections.abc import Sequence
+from itertools import chain, islice
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List
+
+if TYPE_CHECKING:
+    from models.cold_storage import ColdStorage, FrozenHistory, HistoryCodec
+    from models.history_window import HistoryWindow
+
+
+# 单条消息 dict 本身及其键的大致开销
+MESSAGE_OVERHEAD_BYTES = 256
+
+
+def compact_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """从存储读出的消息的键和角色改用驻留字符串，避免每条消息各存一份 "role"、"user" 等"""
+    return {
+        sys.intern(key): sys.intern(value) if key == "role" and isinstance(value, str) else value
+        for key, value in message.items()
+    }
+
+
+class MessageSnapshot(Sequence):
+    """消息列表的只读快照。
+
+    历史只在末尾追加，清空、压缩等改写总是换成新列表，所以快照只需记住列表引用和当时的长度，
+    之后的追加对快照不可见，也不复制任何消息。
+    """
+
+    __slots__ = ("_system_part", "_history", "_history_length")
+
+    def __init__(self, system_part: Sequence, history: List[Dict[str, Any]], history_length: int) -> None:
+        self._system_part = system_part
+        self._history = history
+        self._history_length = history_length
+
+    @property
+    def history(self) -> "MessageSnapshot":
+        return MessageSnapshot((), self._history, self._history_length)
+
+    def __len__(self) -> int:
+        return len(self._system_part) + self._history_length
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return chain(self._system_part, islice(self._history, self._history_length))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("message index out of range")
+        system_length = len(self._system_part)
+        if index < system_length:
+            return self._system_part[index]
+        return self._history[index - system_length]
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (list, tuple, MessageSnapshot)):
+            return NotImplemented
+        return len(self) == len(other) and all(left == right for left, right in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"MessageSnapshot({list(self)!r})"
+
+    def generate_messages_jar(
+        self,
+        current: Dict[str, Any],
+        window: "HistoryWindow | None" = None,
+    ) -> List[Dict[str, Any]]:
+        """生成发送给模型的消息列表，只复制消息引用"""
+        if window is None:
+            return [*self, current]
+        return window.select(self._system_part, self.history, current)
+
+
 class Message:
     def __init__(self, system_message=None) -> None:
         self._messages = []
         self._messages_system_part = []
-        self._messages_user_and_assistant_part = []
+        # 较早历史压缩后的摘要，位于系统消息与历史之间
+        self._messages_summary_part = []
+        # 只在末尾追加；清空或压缩时整体换成新列表，已发出的快照因此保持不变
+        self._history = []
+        # 空闲时压缩保存的历史，访问 _messages_user_and_assistant_part 时自动解压
+        self._frozen_history: "FrozenHistory | None" = None
+        # 与分叉出的会话共用同一历史列表（写时复制），任一方追加前先复制一份自己的
+        self._history_shared = False
+        # 历史列表借自分叉前的会话，内存计入对方，直到本方追加历史
+        self._history_borrowed = False
+        # 系统消息由 SystemPromptTable 跨会话共享时，其内存计入共享表而不是每个会话
+        self.shared_system_part = False
+        self._fixed_size_key = None
+        self._fixed_size = 0
+        self._sized_history = None
+        self._sized_history_length = 0
+        self._history_size = 0
         if system_message:
             self._messages_system_part.append(self.construct_system_message(system_message))
 
@@ -15,13 +111,127 @@ class Message:
     def construct_system_message(self, message):
         return {"role": "system", "content": message}
 
+    @property
+    def _messages_user_and_assistant_part(self):
+        frozen = self._frozen_history
+        if frozen is not None:
+            self._history = frozen.thaw()
+            self._frozen_history = None
+            self._history_shared = self._history_borrowed = False
+        return self._history
+
+    @_messages_user_and_assistant_part.setter
+    def _messages_user_and_assistant_part(self, history):
+        self._history = history
+        self._frozen_history = None
+        self._history_shared = self._history_borrowed = False
+
+    @property
+    def is_frozen(self) -> bool:
+        return self._frozen_history is not None
+
+    def freeze_history(self, cold_storage: "ColdStorage", codec: "HistoryCodec") -> bool:
+        """压缩历史并释放原列表，返回是否压缩"""
+        if self._frozen_history is not None or not self._history:
+            return False
+        frozen = cold_storage.freeze(self._history, codec)
+        if frozen is None:
+            return False
+        self._frozen_history = frozen
+        self._history = []
+        self._history_shared = self._history_borrowed = False
+        # 不再持有原列表，它占用的内存才能被回收
+        self._sized_history = None
+        self._sized_history_length = 0
+        self._history_size = 0
+        return True
+
+    def fork(self) -> "Message":
+        """分叉出共用系统消息、摘要和历史的新消息对象，只复制引用。
+        历史只在追加时修改原列表，所以任一方第一次追加前才复制列表；压缩保存的历史不可变，直接共用"""
+        fork = Message()
+        fork._messages_system_part = self._messages_system_part
+        fork._messages_summary_part = self._messages_summary_part
+        fork.shared_system_part = self.shared_system_part
+        if self._frozen_history is not None:
+            fork._frozen_history = self._frozen_history
+        else:
+            fork._history = self._history
+            fork._history_borrowed = True
+            self._history_shared = fork._history_shared = True
+        return fork
+
     def preserve_history(self, question, answer):
-        self._messages_user_and_assistant_part.append(self.construct_user_message(question))
-        self._messages_user_and_assistant_part.append(self.construct_assistant_message(answer))
+        history = self._messages_user_and_assistant_part
+        if self._history_shared:
+            history = self._messages_user_and_assistant_part = list(history)
+        history.append(self.construct_user_message(question))
+        history.append(self.construct_assistant_message(answer))
+
+    def snapshot(self) -> MessageSnapshot:
+        system_part = self._messages_system_part
+        if self._messages_summary_part:
+            system_part = system_part + self._messages_summary_part
+        history = self._messages_user_and_assistant_part
+        return MessageSnapshot(system_part, history, len(history))
+
+    def peek_snapshot(self) -> MessageSnapshot:
+        """只读快照：历史被压缩时解压出一份临时列表，会话仍保持压缩状态，供 /inspect 等查看接口使用"""
+        frozen = self._frozen_history
+        if frozen is None:
+            return self.snapshot()
+        system_part = self._messages_system_part
+        if self._messages_summary_part:
+            system_part = system_part + self._messages_summary_part
+        history = frozen.decode()
+        return MessageSnapshot(system_part, history, len(history))
 
     @property
     def messages(self):
-        return self._messages_system_part + self._messages_user_and_assistant_part
+        return self.snapshot()
+
+    def generate_messages_jar(self, message, window: "HistoryWindow | None" = None):
+        return self.snapshot().generate_messages_jar(self.construct_user_message(message), window)
+
+    def approximate_size(self) -> int:
+        """历史消息占用内存的粗略估计（字节）。历史追加后只累加新消息，换成新列表时才整体重算。
+        历史被压缩时按压缩后的大小计算，不会触发解压；分叉后尚未追加的历史计入被分叉的会话"""
+        system_part = self._messages_system_part
+        summary_part = self._messages_summary_part
+        fixed_key = (
+            id(system_part),
+            len(system_part),
+            self.shared_system_part,
+            id(summary_part),
+            len(summary_part),
+        )
+        if fixed_key != self._fixed_size_key:
+            self._fixed_size = _messages_size(summary_part)
+            if not self.shared_system_part:
+                self._fixed_size += _messages_size(system_part)
+            self._fixed_size_key = fixed_key
+
+        frozen = self._frozen_history
+        if frozen is not None:
+            return self._fixed_size + MESSAGE_OVERHEAD_BYTES + sys.getsizeof(frozen.payload)
+
+        if self._history_borrowed:
+            return self._fixed_size
+
+        history = self._history
+        if history is not self._sized_history or len(history) < self._sized_history_length:
+            self._sized_history = history
+            self._sized_history_length = 0
+            self._history_size = 0
+        if len(history) > self._sized_history_length:
+            self._history_size += _messages_size(history[self._sized_history_length:])
+            self._sized_history_length = len(history)
+        return self._fixed_size + self._history_size
+
+
+def message_size(message: Dict[str, Any]) -> int:
+    return MESSAGE_OVERHEAD_BYTES + sys.getsizeof(message.get("content") or "")
+
 
-    def generate_messages_jar(self, message):
-        return self.messages + [self.construct_user_message(message)]
+def _messages_size(messages) -> int:
+    return sum(message_size(message) for message in messages)
@@ -0,0 +1,294 @@
+"""同一会话并发请求的准入控制。
+
+同一会话同一时间只处理一个请求。会话正忙时按 [session_admission] 配置的策略处理后来的请求：
+reject 立即拒绝（409），wait 最多等待 WAIT_TIMEOUT_MS 毫秒（超时 429），queue 排队等待，
+排队数超过 MAX_QUEUE_DEPTH 时拒绝（429）。
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List
+
+from api.param_schema import ParamType, ProviderParam, unquote, validate_params
+
+if TYPE_CHECKING:
+    from models.session_manager import Session
+
+
+class SessionAdmissionError(RuntimeError):
+    """会话正忙，请求未被受理"""
+
+    status_code = 429
+
+
+class SessionBusyError(SessionAdmissionError):
+    status_code = 409
+
+
+class SessionWaitTimeoutError(SessionAdmissionError):
+    pass
+
+
+class SessionQueueFullError(SessionAdmissionError):
+    pass
+
+
+@dataclass(frozen=True)
+class SessionAdmissionSettings:
+    """[session_admission] 配置段，默认与不限制排队时的行为一致"""
+
+    SECTION_NAME = "session_admission"
+    REJECT = "reject"
+    WAIT = "wait"
+    QUEUE = "queue"
+    MODES = (REJECT, WAIT, QUEUE)
+    DEFAULT_WAIT_TIMEOUT_MS = 5000
+    DEFAULT_MAX_QUEUE_DEPTH = 0
+
+    mode: str = QUEUE
+    wait_timeout_ms: int = DEFAULT_WAIT_TIMEOUT_MS
+    max_queue_depth: int = DEFAULT_MAX_QUEUE_DEPTH
+
+    @classmethod
+    def get_params(cls) -> List[ProviderParam]:
+        return [
+            ProviderParam(
+                name="mode",
+                param_type=ParamType.STRING,
+                required=False,
+                default=cls.QUEUE,
+                description="会话正忙时的处理方式：reject 立即返回 409，wait 限时等待后返回 429，queue 排队等待",
+            ),
+            ProviderParam(
+                name="wait_timeout_ms",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_WAIT_TIMEOUT_MS,
+                description="wait 模式下最多等待的毫秒数",
+            ),
+            ProviderParam(
+                name="max_queue_depth",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_MAX_QUEUE_DEPTH,
+                description="queue 模式下每个会话最多排队的请求数，0 表示不限制",
+            ),
+        ]
+
+    @classmethod
+    def validate_config(cls, config: Dict[str, Any]) -> tuple[bool, List[str]]:
+        is_valid, errors = validate_params(cls.get_params(), config)
+        mode = config.get("mode")
+        if isinstance(mode, str) and unquote(mode).lower() not in cls.MODES:
+            errors.append(f"mode must be one of: {', '.join(cls.MODES)}")
+        wait_timeout_ms = config.get("wait_timeout_ms")
+        if isinstance(wait_timeout_ms, int) and wait_timeout_ms <= 0:
+            errors.append("wait_timeout_ms must be greater than 0")
+        max_queue_depth = config.get("max_queue_depth")
+        if isinstance(max_queue_depth, int) and max_queue_depth < 0:
+            errors.append("max_queue_depth must not be negative")
+        return is_valid and not errors, errors
+
+
+class ConversationLock:
+    """同步与异步请求共用的会话锁。
+
+    线程直接阻塞在底层的 threading.Lock 上；协程登记后在自己的事件循环上等待，
+    锁每次释放时唤醒最早登记的一个协程去抢锁。等待中的协程不占用线程，取消后
+    也不会留下仍在抢锁的线程。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._waiters: "deque[tuple[asyncio.AbstractEventLoop, asyncio.Future[None]]]" = deque()
+        self._waiters_lock = threading.Lock()
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        return self._lock.acquire(blocking, timeout)
+
+    def release(self) -> None:
+        self._lock.release()
+        self._wake_one()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.release()
+
+    async def acquire_async(self, timeout: float = -1) -> bool:
+        """在事件循环上等待并获取锁，timeout 为秒数，-1 表示不限；超时返回 False"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout < 0 else loop.time() + timeout
+        while not self._lock.acquire(blocking=False):
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return False
+            if not await self._wait_for_release(loop, remaining):
+                return False
+        return True
+
+    async def _wait_for_release(self, loop: asyncio.AbstractEventLoop, timeout: float | None) -> bool:
+        """等待下一次释放，返回是否在超时前被唤醒"""
+        waiter = (loop, loop.create_future())
+        with self._waiters_lock:
+            self._waiters.append(waiter)
+        # 登记之前发生的释放不会唤醒这个等待者
+        if not self._lock.locked():
+            self._forget(waiter)
+            return True
+        woken = False
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+            woken = True
+            return True
+        except TimeoutError:
+            return False
+        finally:
+            # 已被唤醒却因超时或取消不再抢锁时，把唤醒转交给下一个等待者
+            if not woken and not self._forget(waiter):
+                self._wake_one()
+
+    def _forget(self, waiter: "tuple[asyncio.AbstractEventLoop, asyncio.Future[None]]") -> bool:
+        with self._waiters_lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return False
+            return True
+
+    def _wake_one(self) -> None:
+        with self._waiters_lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(_set_woken, future)
+                except RuntimeError:
+                    # 等待者所在的事件循环已关闭
+                    continue
+                return
+
+
+class SessionAdmission:
+    """按配置获取会话锁，并统计等待时间和拒绝次数"""
+
+    def __init__(
+        self,
+        settings_provider: Callable[[], SessionAdmissionSettings],
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._settings_provider = settings_provider
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._admitted = 0
+        self._waited = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._rejected_busy = 0
+        self._rejected_timeout = 0
+        self._rejected_queue_full = 0
+
+    def admit(self, session: "Session") -> None:
+        """获取会话锁，未受理时抛出 SessionAdmissionError"""
+        lock = session._conversation_lock
+        if lock.acquire(blocking=False):
+            self._record_admitted()
+            return
+        timeout = self._enter_wait(session)
+        started = self._timer()
+        try:
+            acquired = lock.acquire(timeout=timeout)
+        finally:
+            self._leave_wait(session, self._timer() - started)
+        self._finish_wait(session, acquired, timeout)
+
+    async def admit_async(self, session: "Session") -> None:
+        """在事件循环上等待会话锁，同步与异步请求共用同一把锁"""
+        lock = session._conversation_lock
+        if lock.acquire(blocking=False):
+            self._record_admitted()
+            return
+        timeout = self._enter_wait(session)
+        started = self._timer()
+        try:
+            acquired = await lock.acquire_async(timeout)
+        finally:
+            self._leave_wait(session, self._timer() - started)
+        self._finish_wait(session, acquired, timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        settings = self._settings_provider()
+        with self._lock:
+            average = self._wait_seconds / self._waited if self._waited else 0.0
+            return {
+                "mode": unquote(settings.mode).lower(),
+                "waiting": self._waiting,
+                "admitted": self._admitted,
+                "waited": self._waited,
+                "wait_ms": {
+                    "total": round(self._wait_seconds * 1000, 3),
+                    "avg": round(average * 1000, 3),
+                    "max": round(self._max_wait_seconds * 1000, 3),
+                },
+                "rejected": {
+                    "busy": self._rejected_busy,
+                    "timeout": self._rejected_timeout,
+                    "queue_full": self._rejected_queue_full,
+                },
+            }
+
+    def _enter_wait(self, session: "Session") -> float:
+        """登记一个等待者并返回等待上限（秒，-1 表示不限）；不允许等待时直接抛出"""
+        settings = self._settings_provider()
+        mode = unquote(settings.mode).lower()
+        with self._lock:
+            if mode == SessionAdmissionSettings.REJECT:
+                self._rejected_busy += 1
+                raise SessionBusyError(f"会话 {session.id} 正在处理其他请求")
+            if (
+                mode == SessionAdmissionSettings.QUEUE
+                and settings.max_queue_depth
+                and session.waiting_requests >= settings.max_queue_depth
+            ):
+                self._rejected_queue_full += 1
+                raise SessionQueueFullError(
+                    f"会话 {session.id} 排队的请求已达上限 {settings.max_queue_depth}"
+                )
+            session.waiting_requests += 1
+            self._waiting += 1
+        if mode == SessionAdmissionSettings.WAIT:
+            return settings.wait_timeout_ms / 1000
+        return -1
+
+    def _leave_wait(self, session: "Session", waited: float) -> None:
+        with self._lock:
+            session.waiting_requests -= 1
+            session.wait_seconds += waited
+            self._waiting -= 1
+            self._waited += 1
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+
+    def _finish_wait(self, session: "Session", acquired: bool, timeout: float) -> None:
+        if acquired:
+            self._record_admitted()
+            return
+        with self._lock:
+            self._rejected_timeout += 1
+        raise SessionWaitTimeoutError(f"等待会话 {session.id} 超时（{round(timeout * 1000)} ms）")
+
+    def _record_admitted(self) -> None:
+        with self._lock:
+            self._admitted += 1
+
+
+def _set_woken(future: "asyncio.Future[None]") -> None:
+    if not future.done():
+        future.set_result(None)
@@ -1,20 +1,98 @@
+import asyncio
+import logging
+import time
 import uuid
-from collections.abc import Iterator
+import weakref
+from collections.abc import AsyncIterator, Callable, Iterator
+from concurrent.futures import Future
 from threading import Lock, RLock
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 
 from api.api_factory import ApiFactory
 from api.base_api import BaseApi
-from models.message import Message
+from api.token_estimation import estimate_message_tokens
+from models.cold_storage import ColdStorage, ColdStorageSettings, HistoryCodec
+from models.history_summary import CompactionState, HistorySummarizer, HistorySummarySettings
+from models.history_window import HistoryWindow, HistoryWindowSettings
+from models.message import Message, MessageSnapshot
+from models.session_admission import ConversationLock, SessionAdmission, SessionAdmissionSettings
+from models.session_pool import SessionPool, SessionPoolSettings
+from models.session_store import (
+    SessionRecord,
+    SessionStore,
+    SessionStoreSettings,
+    SessionVersionConflictError,
+    create_session_store,
+)
+from models.system_prompts import SystemPromptTable
+
+logger = logging.getLogger(__name__)
+
+
+class SessionNotFoundError(LookupError):
+    """要分叉的会话不存在"""
+
+    status_code = 404
+
+
+class SessionExistsError(ValueError):
+    """分叉的目标会话 id 已被占用"""
+
+    status_code = 409
 
 
 class Session:
-    def __init__(self, id, client: BaseApi, messages: Message) -> None:
+    def __init__(
+        self,
+        id,
+        client: BaseApi,
+        messages: Message,
+        store: SessionStore | None = None,
+        history_window_settings: Callable[[], HistoryWindowSettings] | None = None,
+        summarizer: HistorySummarizer | None = None,
+        system_prompts: SystemPromptTable | None = None,
+        admission: SessionAdmission | None = None,
+    ) -> None:
         self.id = id
         self.messages = messages
         self.client = client
-        self._conversation_lock = Lock()
+        self.store = store
+        self.provider: str | None = None
+        self.model: str | None = None
+        self.version = 0
+        self._history_window_settings = history_window_settings
+        self._summarizer = summarizer
+        self.compaction = CompactionState()
+        self._system_prompt_references = None
+        if system_prompts is not None:
+            # 会话被淘汰或替换后随对象回收释放共享系统消息的引用
+            self._system_prompt_references = system_prompts.references()
+            weakref.finalize(self, self._system_prompt_references.release)
+            messages.shared_system_part = True
+            self._set_system_part(messages._messages_system_part)
+        self._admission = admission
+        self._conversation_lock = ConversationLock()
+        # 等待会话锁的请求数和累计等待时间，由 SessionAdmission 在其锁内维护
+        self.waiting_requests = 0
+        self.wait_seconds = 0.0
         self._messages_lock = RLock()
+        self.last_access = time.monotonic()
+
+    def is_busy(self) -> bool:
+        return self._conversation_lock.locked()
+
+    def approximate_size(self) -> int:
+        with self._messages_lock:
+            return self.messages.approximate_size()
+
+    def freeze_history(self, cold_storage: ColdStorage, codec: HistoryCodec) -> bool:
+        """压缩空闲会话的历史，下次访问历史时自动解压。正在使用的会话直接跳过"""
+        if self.is_busy() or not self._messages_lock.acquire(blocking=False):
+            return False
+        try:
+            return self.messages.freeze_history(cold_storage, codec)
+        finally:
+            self._messages_lock.release()
 
     def chat_once(self, question: str):
         return self.chat(question)
@@ -29,18 +107,17 @@ class Session:
         preserve: bool = False,
         system_message: str | None = None,
     ) -> str:
-        with self._conversation_lock:
-            if system_message:
-                self._adjust_system_message(system_message)
-            with self._messages_lock:
-                request_messages = self.messages.generate_messages_jar(question)
+        self._acquire_conversation_lock()
+        try:
+            request_messages = self._begin_turn(question, system_message)
             response_content = self.client.reason(
                 request_messages
             )
             if preserve:
-                with self._messages_lock:
-                    self.messages.preserve_history(question, response_content)
+                self._preserve_history(question, response_content)
             return response_content
+        finally:
+            self._conversation_lock.release()
 
     def chat_stream_once(self, question: str) -> Iterator[str]:
         yield from self.chat_stream(question)
@@ -55,13 +132,10 @@ class Session:
         preserve: bool = False,
         system_message: str | None = None,
     ) -> Iterator[str]:
-        with self._conversation_lock:
-            if system_message:
-                self._adjust_system_message(system_message)
-
+        self._acquire_conversation_lock()
+        try:
+            request_messages = self._begin_turn(question, system_message)
             chunks: list[str] = []
-            with self._messages_lock:
-                request_messages = self.messages.generate_messages_jar(question)
             stream = self.client.reason_stream(request_messages)
             try:
                 for chunk in stream:
@@ -75,33 +149,285 @@ class Session:
                     close()
 
             if preserve:
-                with self._messages_lock:
-                    self.messages.preserve_history(question, "".join(chunks))
+                self._preserve_history(question, "".join(chunks))
+        finally:
+            self._conversation_lock.release()
+
+    async def chat_async(
+        self,
+        question: str,
+        *,
+        preserve: bool = False,
+        system_message: str | None = None,
+    ) -> str:
+        await self._acquire_conversation_lock_async()
+        try:
+            request_messages = await self._call_store_async(self._begin_turn, question, system_message)
+            response_content = await self.client.reason_async(request_messages)
+            if preserve:
+                await self._call_store_async(self._preserve_history, question, response_content)
+            return response_content
+        finally:
+            self._conversation_lock.release()
+
+    async def chat_stream_async(
+        self,
+        question: str,
+        *,
+        preserve: bool = False,
+        system_message: str | None = None,
+    ) -> AsyncIterator[str]:
+        await self._acquire_conversation_lock_async()
+        try:
+            request_messages = await self._call_store_async(self._begin_turn, question, system_message)
+            chunks: list[str] = []
+            stream = self.client.reason_stream_async(request_messages)
+            try:
+                async for chunk in stream:
+                    if not chunk:
+                        continue
+                    chunks.append(chunk)
+                    yield chunk
+            finally:
+                await stream.aclose()
+
+            if preserve:
+                await self._call_store_async(self._preserve_history, question, "".join(chunks))
+        finally:
+            self._conversation_lock.release()
+
+    def _acquire_conversation_lock(self) -> None:
+        """按准入策略获取会话锁，会话正忙且不允许等待时抛出 SessionAdmissionError"""
+        if self._admission is not None:
+            self._admission.admit(self)
+        else:
+            self._conversation_lock.acquire()
+
+    async def _acquire_conversation_lock_async(self) -> None:
+        """在事件循环上等待会话锁，不占用线程，同步与异步调用共用同一把锁。"""
+        if self._admission is not None:
+            await self._admission.admit_async(self)
+        else:
+            await self._conversation_lock.acquire_async()
 
     def clear_history(self):
-        with self._messages_lock:
+        def clear() -> None:
             self.messages._messages_user_and_assistant_part = []
+            self.messages._messages_summary_part = []
+            self.compaction.forget_summary()
+
+        self._write_through(
+            clear,
+            lambda store, version: store.clear_history(self.id, expected_version=version),
+        )
 
     def adjust_system_message(self, system_message: str):
         with self._messages_lock:
             self._adjust_system_message(system_message)
 
     def _adjust_system_message(self, system_message: str):
+        system_part = [self.messages.construct_system_message(system_message)]
+
+        def adjust() -> None:
+            self._set_system_part(system_part)
+
+        self._write_through(
+            adjust,
+            lambda store, version: store.set_system_messages(self.id, system_part, expected_version=version),
+        )
+
+    def _set_system_part(self, system_part: list) -> None:
+        if self._system_prompt_references is not None:
+            system_part = self._system_prompt_references.replace(system_part)
+        self.messages._messages_system_part = system_part
+
+    def _begin_turn(self, question: str, system_message: str | None) -> list:
+        self._sync_from_store()
+        if system_message:
+            self._adjust_system_message(system_message)
+        window = self._history_window()
+        with self._messages_lock:
+            if self.messages._messages_summary_part:
+                self.compaction.record_request()
+            snapshot = self.messages.snapshot()
+        # 锁内只取快照，消息列表在锁外组装
+        return snapshot.generate_messages_jar(self.messages.construct_user_message(question), window)
+
+    def _history_window(self) -> HistoryWindow | None:
+        if self._history_window_settings is None:
+            return None
+        return self._history_window_settings().window_for(self.provider, self.model)
+
+    def _preserve_history(self, question: str, answer: str):
+        turn = [
+            self.messages.construct_user_message(question),
+            self.messages.construct_assistant_message(answer),
+        ]
+
+        def append() -> None:
+            self.messages.preserve_history(question, answer)
+
+        self._write_through(
+            append,
+            lambda store, version: store.append_messages(self.id, turn, expected_version=version),
+        )
+        if self._summarizer is not None:
+            # 只提交后台任务，本轮请求不等待摘要生成
+            self._summarizer.maybe_schedule(self)
+
+    def _begin_compaction(
+        self,
+        threshold_tokens: int,
+        keep_recent_turns: int,
+    ) -> tuple[list, list] | None:
+        """历史超过阈值时标记压缩开始，返回待压缩的历史和当前摘要的快照"""
+        with self._messages_lock:
+            if self.compaction.in_progress:
+                return None
+            summary_part = self.messages._messages_summary_part
+            history = self.messages._messages_user_and_assistant_part
+            keep_count = keep_recent_turns * 2
+            if len(history) <= keep_count:
+                return None
+            tokens = sum(estimate_message_tokens(message) for message in summary_part + history)
+            if tokens <= threshold_tokens:
+                return None
+            self.compaction.in_progress = True
+            return list(history[:len(history) - keep_count]), list(summary_part)
+
+    def _finish_compaction(self, summarized: list, previous_summary: list, summary: Dict[str, Any]) -> bool:
+        """用摘要替换已压缩的历史。摘要生成期间历史被清空或改写时丢弃本次结果"""
+        try:
+            with self._messages_lock:
+                self._sync_from_store()
+                history = self.messages._messages_user_and_assistant_part
+                if (
+                    self.messages._messages_summary_part != previous_summary
+                    or history[:len(summarized)] != summarized
+                ):
+                    return False
+                if self.store is not None:
+                    expected_version = self.version if self.store.shared else None
+                    try:
+                        version = self.store.compact_history(
+                            self.id,
+                            [summary],
+                            len(summarized),
+                            expected_version=expected_version,
+                        )
+                    except SessionVersionConflictError:
+                        # 其他进程刚写入，下一轮追加历史后会重新判断是否需要压缩
+                        return False
+                    if version is not None:
+                        self.version = version
+                self.messages._messages_user_and_assistant_part = history[len(summarized):]
+                self.messages._messages_summary_part = [summary]
+                self.compaction.record_compaction(summarized, summary)
+                return True
+        finally:
+            self.compaction.in_progress = False
+
+    def _fail_compaction(self, error: str) -> None:
         with self._messages_lock:
-            self.messages._messages_system_part = [
-                self.messages.construct_system_message(system_message)
-            ]
+            self.compaction.last_error = error
+            self.compaction.in_progress = False
 
-    def snapshot_messages(self):
+    def _write_through(
+        self,
+        apply: Callable[[], None],
+        write: Callable[[SessionStore, int | None], int | None],
+    ) -> None:
+        """先写存储再改内存。共享存储按版本号写入，冲突时同步最新内容后重试，不会覆盖其他进程的写入"""
+        with self._messages_lock:
+            while self.store is not None:
+                expected_version = self.version if self.store.shared else None
+                try:
+                    version = write(self.store, expected_version)
+                except SessionVersionConflictError:
+                    record = self.store.load(self.id)
+                    if record is None:
+                        break
+                    self._apply_record(record)
+                    continue
+                if version is not None:
+                    self.version = version
+                break
+            apply()
+
+    def _sync_from_store(self) -> None:
+        if self.store is None or not self.store.shared:
+            return
+        with self._messages_lock:
+            record = self.store.refresh(self.id, self.version)
+            if record is not None:
+                self._apply_record(record)
+
+    def _apply_record(self, record: SessionRecord) -> None:
+        self._set_system_part(list(record.system_messages))
+        self.messages._messages_summary_part = list(record.summary_messages)
+        self.messages._messages_user_and_assistant_part = list(record.history)
+        self.version = record.version
+
+    async def _call_store_async(self, function: Callable[..., Any], *args: Any) -> Any:
+        # 共享存储的读写是同步数据库调用，放到线程中执行，避免阻塞事件循环
+        if self.store is not None and self.store.shared:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    def snapshot_messages(self) -> MessageSnapshot:
         with self._messages_lock:
-            return list(self.messages.messages)
+            return self.messages.snapshot()
+
+    def peek_messages(self) -> MessageSnapshot:
+        """查看用的快照，不会解压回空闲会话被压缩的历史"""
+        with self._messages_lock:
+            return self.messages.peek_snapshot()
+
+    def compaction_stats(self) -> Dict[str, Any]:
+        with self._messages_lock:
+            return self.compaction.stats()
+
+    def admission_stats(self) -> Dict[str, Any]:
+        return {
+            "busy": self.is_busy(),
+            "waiting": self.waiting_requests,
+            "wait_ms": round(self.wait_seconds * 1000, 3),
+        }
 
 
 class SessionManager:
-    def __init__(self, api_factory: Optional[ApiFactory] = None) -> None:
-        self.pool: Dict[str, Session] = dict()
-        self.api_factory = api_factory or ApiFactory()
-        self._lock = RLock()
+    # 会话创建按 id 哈希分散到多把锁上，锁内只登记/查询创建中的 Future
+    LOCK_STRIPES = 64
+    # 会话层自己的配置段，由 SessionManager 注册到 ApiFactory，随配置热更新
+    SETTINGS_CLASSES = (
+        SessionPoolSettings,
+        SessionStoreSettings,
+        HistoryWindowSettings,
+        HistorySummarySettings,
+        ColdStorageSettings,
+        SessionAdmissionSettings,
+    )
+
+    def __init__(
+        self,
+        api_factory: Optional[ApiFactory] = None,
+        store: Optional[SessionStore] = None,
+    ) -> None:
+        if api_factory is None:
+            api_factory = ApiFactory(settings_classes=self.SETTINGS_CLASSES)
+        api_factory.register_settings_classes(self.SETTINGS_CLASSES)
+        self.api_factory = api_factory
+        self.store = store or create_session_store(
+            self.api_factory.get_settings(SessionStoreSettings.SECTION_NAME)
+        )
+        self.cold_storage = ColdStorage(self._cold_storage_settings)
+        self.pool = SessionPool(self._pool_settings, cold_storage=self.cold_storage)
+        self.summarizer = HistorySummarizer(self.api_factory, self._history_summary_settings)
+        self.system_prompts = SystemPromptTable()
+        self.admission = SessionAdmission(self._admission_settings)
+        self._stateless_requests = 0
+        self._stateless_lock = Lock()
+        self._stripes = [_CreationStripe() for _ in range(self.LOCK_STRIPES)]
 
     def new_session(self, id=None, system_message=None, provider=None, model=None):
         """
@@ -116,16 +442,13 @@ class SessionManager:
         Returns:
             Session 实例
         """
-        with self._lock:
-            if not id:
-                id = str(uuid.uuid4())
-            if model is None:
-                client = self.api_factory.get_client(provider)
-            else:
-                client = self.api_factory.get_client(provider, model)
-            session = Session(id, client, Message(system_message))
-            self.pool[id] = session
-            return session
+        if not id:
+            id = str(uuid.uuid4())
+        # 客户端构造可能很慢（例如豆包的 Ark SDK），不能放在任何共享锁内
+        client = self._get_client(provider, model)
+        record = self._new_record(id, system_message, provider, model)
+        self.store.create(record)
+        return self.pool.add(self._session_from_record(record, client))
 
     def get_or_create_session(self, id=None, provider=None, model=None):
         """
@@ -139,11 +462,239 @@ class SessionManager:
         Returns:
             Session 实例
         """
-        with self._lock:
-            if id not in self.pool:
-                return self.new_session(id, provider=provider, model=model)
-            return self.pool[id]
+        if not id:
+            return self.new_session(provider=provider, model=model)
+
+        while True:
+            # 已有会话直接查表返回，不经过任何锁
+            session = self.pool.get(id)
+            if session is not None:
+                return session
+
+            stripe = self._stripes[hash(id) % self.LOCK_STRIPES]
+            with stripe.lock:
+                session = self.pool.get(id)
+                if session is not None:
+                    return session
+                creating = stripe.creating.get(id)
+                is_creator = creating is None
+                if is_creator:
+                    creating = stripe.creating[id] = Future()
+
+            if not is_creator:
+                # 同一 id 的并发首请求等待创建者，不各自构造客户端
+                try:
+                    return creating.result()
+                except Exception:
+                    # 创建者失败时由本请求按自己的参数重试
+                    continue
+
+            try:
+                session = self._load_or_create_session(id, provider, model)
+            except BaseException as exception:
+                creating.set_exception(exception)
+                raise
+            else:
+                creating.set_result(session)
+                return session
+            finally:
+                with stripe.lock:
+                    stripe.creating.pop(id, None)
+
+    async def get_or_create_session_async(self, id=None, provider=None, model=None):
+        """get_or_create_session 的异步版本：内存中已有的会话直接返回，需要读取存储或构造客户端时放到线程中执行"""
+        if id:
+            session = self.pool.get(id)
+            if session is not None:
+                return session
+        return await asyncio.to_thread(self.get_or_create_session, id, provider, model)
+
+    def fork_session(self, id, new_id=None, system_message=None):
+        """
+        分叉会话：新会话与原会话共用分叉时的系统消息、摘要和历史，任一方追加历史前都不复制消息
+
+        Args:
+            id: 被分叉的会话 ID
+            new_id: 新会话 ID，如果不提供则自动生成
+            system_message: 新会话的系统消息，不提供则沿用原会话的
+
+        Returns:
+            新会话的 Session 实例
+
+        Raises:
+            SessionNotFoundError: 原会话不存在
+            SessionExistsError: new_id 已被其他会话使用
+        """
+        if not new_id:
+            new_id = str(uuid.uuid4())
+        if new_id == id:
+            raise SessionExistsError(f"会话 {new_id} 已存在")
+        parent = self.pool.get(id)
+        if parent is None:
+            if self.store.load(id) is None:
+                raise SessionNotFoundError(f"会话 {id} 不存在")
+            parent = self.get_or_create_session(id)
+
+        stripe = self._stripes[hash(new_id) % self.LOCK_STRIPES]
+        with stripe.lock:
+            if new_id in self.pool or new_id in stripe.creating:
+                raise SessionExistsError(f"会话 {new_id} 已存在")
+            # 同一 id 的并发首请求等待分叉完成，不会另建一个同名会话
+            creating = stripe.creating[new_id] = Future()
+        try:
+            session = self._fork_session(parent, new_id)
+        except BaseException as exception:
+            creating.set_exception(exception)
+            raise
+        else:
+            creating.set_result(session)
+        finally:
+            with stripe.lock:
+                stripe.creating.pop(new_id, None)
+
+        if system_message:
+            session.adjust_system_message(system_message)
+        return session
+
+    async def fork_session_async(self, id, new_id=None, system_message=None):
+        """fork_session 的异步版本，存储读写在线程中执行"""
+        return await asyncio.to_thread(self.fork_session, id, new_id, system_message)
+
+    def stateless_client(self, provider=None, model=None) -> BaseApi:
+        """
+        获取无状态请求使用的客户端：调用方自带完整消息数组，不创建会话、不获取会话锁，也不保存任何消息
+
+        Args:
+            provider: AI 服务商名称，如果不提供则使用默认服务商
+            model: 模型名称，仅与 provider 同时提供时使用
+        """
+        client = self._get_client(provider, model)
+        with self._stateless_lock:
+            self._stateless_requests += 1
+        return client
+
+    async def stateless_client_async(self, provider=None, model=None) -> BaseApi:
+        """stateless_client 的异步版本：指定模型的客户端可能需要构造，放到线程中执行"""
+        if model is None:
+            return self.stateless_client(provider, model)
+        return await asyncio.to_thread(self.stateless_client, provider, model)
 
     def list_sessions(self):
-        with self._lock:
-            return list(self.pool.values())
+        return self.pool.values()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.pool.stats(),
+            "stateless_requests": self._stateless_requests,
+            "system_prompts": self.system_prompts.stats(),
+            "cold_storage": self.cold_storage.stats(),
+            "admission": self.admission.stats(),
+            "store": self.store.stats(),
+        }
+
+    async def stats_async(self) -> Dict[str, Any]:
+        """stats 的异步版本，各组件加锁统计时不阻塞事件循环"""
+        return await asyncio.to_thread(self.stats)
+
+    def _load_or_create_session(self, id, provider, model) -> Session:
+        """内存中没有该会话时先从持久化后端恢复，后端也没有才新建"""
+        record = self.store.load(id)
+        if record is None:
+            client = self._get_client(provider, model)
+            record = self._new_record(id, None, provider, model)
+            if self.store.create_if_absent(record):
+                return self.pool.add(self._session_from_record(record, client))
+            # 共享存储中其他进程刚创建了同一会话，以对方写入的为准
+            record = self.store.load(id)
+
+        try:
+            client = self._get_client(record.provider, record.model)
+        except ValueError:
+            # 会话绑定的服务商或模型已从配置中移除，改用当前默认客户端继续对话
+            logger.warning(
+                "stored session client unavailable, using default client: id=%s provider=%s model=%s",
+                id,
+                record.provider,
+                record.model,
+            )
+            client = self._get_client(None, None)
+        return self.pool.add(self._session_from_record(record, client))
+
+    def _fork_session(self, parent: Session, new_id: str) -> Session:
+        if not self.store.shared and self.store.load(new_id) is not None:
+            raise SessionExistsError(f"会话 {new_id} 已存在")
+        with parent._messages_lock:
+            while True:
+                # 共享存储先同步其他进程的写入，保证新会话在内存和数据库中的内容一致
+                parent._sync_from_store()
+                expected_version = parent.version if self.store.shared else None
+                try:
+                    forked = self.store.fork(parent.id, new_id, expected_version=expected_version)
+                except SessionVersionConflictError:
+                    if self.store.load(parent.id) is None:
+                        raise SessionNotFoundError(f"会话 {parent.id} 不存在")
+                    continue
+                break
+            if not forked:
+                raise SessionExistsError(f"会话 {new_id} 已存在")
+            messages = parent.messages.fork()
+        session = self._create_session(new_id, parent.client, messages)
+        session.provider = parent.provider
+        session.model = parent.model
+        if self.store.shared:
+            session.version = 1
+        return self.pool.add(session)
+
+    @staticmethod
+    def _new_record(id, system_message, provider, model) -> SessionRecord:
+        return SessionRecord(
+            id=id,
+            provider=provider,
+            model=model,
+            system_messages=Message(system_message)._messages_system_part,
+        )
+
+    def _session_from_record(self, record: SessionRecord, client: BaseApi) -> Session:
+        session = self._create_session(record.id, client, Message())
+        session.provider = record.provider
+        session.model = record.model
+        session._apply_record(record)
+        return session
+
+    def _create_session(self, id: str, client: BaseApi, messages: Message) -> Session:
+        return Session(
+            id,
+            client,
+            messages,
+            store=self.store,
+            history_window_settings=self._history_window_settings,
+            summarizer=self.summarizer,
+            system_prompts=self.system_prompts,
+            admission=self.admission,
+        )
+
+    def _get_client(self, provider, model) -> BaseApi:
+        if model is None:
+            return self.api_factory.get_client(provider)
+        return self.api_factory.get_client(provider, model)
+
+    def _pool_settings(self) -> SessionPoolSettings:
+        return self.api_factory.get_settings(SessionPoolSettings.SECTION_NAME)
+
+    def _history_window_settings(self) -> HistoryWindowSettings:
+        return self.api_factory.get_settings(HistoryWindowSettings.SECTION_NAME)
+
+    def _admission_settings(self) -> SessionAdmissionSettings:
+        return self.api_factory.get_settings(SessionAdmissionSettings.SECTION_NAME)
+
+    def _cold_storage_settings(self) -> ColdStorageSettings:
+        return self.api_factory.get_settings(ColdStorageSettings.SECTION_NAME)
+
+    def _history_summary_settings(self) -> HistorySummarySettings:
+        return self.api_factory.get_settings(HistorySummarySettings.SECTION_NAME)
+
+
+class _CreationStripe:
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.creating: Dict[str, "Future[Session]"] = {}
@@ -0,0 +1,211 @@
+"""有容量上限的会话存储，按近似 LRU、空闲超时和近似内存上限淘汰会话。"""
+
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List
+
+from api.param_schema import ParamType, ProviderParam, validate_params
+
+if TYPE_CHECKING:
+    from models.cold_storage import ColdStorage
+    from models.session_manager import Session
+
+
+@dataclass(frozen=True)
+class SessionPoolSettings:
+    """[session_pool] 配置段，各项填 0 表示不限制"""
+
+    SECTION_NAME = "session_pool"
+    DEFAULT_MAX_SESSIONS = 10000
+    DEFAULT_IDLE_TTL = 86400.0
+    DEFAULT_MAX_MEMORY_MB = 512.0
+
+    max_sessions: int = DEFAULT_MAX_SESSIONS
+    idle_ttl: float = DEFAULT_IDLE_TTL
+    max_memory_mb: float = DEFAULT_MAX_MEMORY_MB
+
+    @classmethod
+    def get_params(cls) -> List[ProviderParam]:
+        return [
+            ProviderParam(
+                name="max_sessions",
+                param_type=ParamType.INTEGER,
+                required=False,
+                default=cls.DEFAULT_MAX_SESSIONS,
+                description="最多保留的会话数，超出后淘汰最久未使用的会话（0 表示不限制）",
+            ),
+            ProviderParam(
+                name="idle_ttl",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_IDLE_TTL,
+                description="会话连续空闲多少秒后被淘汰（0 表示不限制）",
+            ),
+            ProviderParam(
+                name="max_memory_mb",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_MAX_MEMORY_MB,
+                description="全部会话历史的近似内存上限，单位 MB（0 表示不限制）",
+            ),
+        ]
+
+    @classmethod
+    def validate_config(cls, config: Dict[str, Any]) -> tuple[bool, List[str]]:
+        is_valid, errors = validate_params(cls.get_params(), config)
+        for name in ("max_sessions", "idle_ttl", "max_memory_mb"):
+            value = config.get(name)
+            if isinstance(value, (int, float)) and value < 0:
+                errors.append(f"{name} must not be negative")
+        return is_valid and not errors, errors
+
+    @property
+    def max_memory_bytes(self) -> int:
+        return int(self.max_memory_mb * 1024 * 1024)
+
+
+class SessionPool:
+    """会话 id 到 Session 的映射。
+
+    读取路径只做一次字典查找并刷新访问时间，不加锁。淘汰由写入或到期的读取
+    顺带触发，同一时刻只有一个线程执行；拿不到淘汰锁的线程直接跳过。正在
+    对话中的会话不会被淘汰。
+    """
+
+    SWEEP_INTERVAL_SECONDS = 1.0
+    # 超出容量时一次淘汰到上限以下 5%，避免满载后每创建一个会话都要排序一次
+    EVICTION_BATCH_RATIO = 0.05
+
+    def __init__(
+        self,
+        settings_provider: Callable[[], SessionPoolSettings],
+        clock: Callable[[], float] = time.monotonic,
+        cold_storage: "ColdStorage | None" = None,
+    ) -> None:
+        self._settings_provider = settings_provider
+        self._clock = clock
+        self._cold_storage = cold_storage
+        self._sessions: Dict[str, "Session"] = {}
+        self._eviction_lock = threading.Lock()
+        self._last_sweep = clock()
+        self._approximate_bytes = 0
+        self._created = 0
+        self._evicted_lru = 0
+        self._evicted_ttl = 0
+        self._evicted_memory = 0
+
+    def get(self, id: str) -> "Session | None":
+        now = self._clock()
+        if now - self._last_sweep >= self.SWEEP_INTERVAL_SECONDS:
+            self.evict()
+        session = self._sessions.get(id)
+        if session is not None:
+            session.last_access = now
+        return session
+
+    def add(self, session: "Session") -> "Session":
+        session.last_access = self._clock()
+        self._sessions[session.id] = session
+        self._created += 1
+        settings = self._settings_provider()
+        if settings.max_sessions and len(self._sessions) > settings.max_sessions:
+            self.evict()
+        elif self._clock() - self._last_sweep >= self.SWEEP_INTERVAL_SECONDS:
+            self.evict()
+        return session
+
+    def __getitem__(self, id: str) -> "Session":
+        return self._sessions[id]
+
+    def __contains__(self, id: object) -> bool:
+        return id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def values(self) -> List["Session"]:
+        return list(self._sessions.values())
+
+    def evict(self) -> int:
+        """执行一轮淘汰，返回淘汰的会话数；已有线程在淘汰时立即返回 0。"""
+        if not self._eviction_lock.acquire(blocking=False):
+            return 0
+        try:
+            return self._sweep(self._settings_provider())
+        finally:
+            self._eviction_lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        settings = self._settings_provider()
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": settings.max_sessions,
+            "idle_ttl": settings.idle_ttl,
+            "approximate_memory_bytes": self._approximate_bytes,
+            "max_memory_bytes": settings.max_memory_bytes,
+            "created": self._created,
+            "evicted": {
+                "lru": self._evicted_lru,
+                "ttl": self._evicted_ttl,
+                "memory": self._evicted_memory,
+            },
+        }
+
+    def _sweep(self, settings: SessionPoolSettings) -> int:
+        now = self._clock()
+        self._last_sweep = now
+        # list() 在 GIL 下一次取得快照，之后的新增/删除不影响本轮遍历
+        snapshot = list(self._sessions.values())
+        sizes = {id(session): session.approximate_size() for session in snapshot}
+        total_bytes = sum(sizes.values())
+        # 正在对话的会话不参与淘汰，但仍计入内存占用
+        candidates = [session for session in snapshot if not session.is_busy()]
+        candidates.sort(key=lambda session: session.last_access)
+
+        evicted_before = self._evicted_ttl + self._evicted_lru + self._evicted_memory
+        remaining: List["Session"] = []
+        for session in candidates:
+            if settings.idle_ttl and now - session.last_access > settings.idle_ttl:
+                if self._remove(session):
+                    self._evicted_ttl += 1
+                    total_bytes -= sizes[id(session)]
+            else:
+                remaining.append(session)
+
+        if self._cold_storage is not None:
+            # 先压缩空闲会话的历史，压缩后仍超出内存上限才淘汰
+            for session in self._cold_storage.freeze_idle(remaining, now):
+                size = session.approximate_size()
+                total_bytes -= sizes[id(session)] - size
+                sizes[id(session)] = size
+
+        over_count = 0
+        if settings.max_sessions and len(self._sessions) > settings.max_sessions:
+            batch = max(1, int(settings.max_sessions * self.EVICTION_BATCH_RATIO))
+            over_count = len(self._sessions) - settings.max_sessions + batch
+        max_bytes = settings.max_memory_bytes
+
+        for session in remaining:
+            if over_count > 0:
+                over_count -= 1
+                if self._remove(session):
+                    self._evicted_lru += 1
+                    total_bytes -= sizes[id(session)]
+            elif max_bytes and total_bytes > max_bytes:
+                if self._remove(session):
+                    self._evicted_memory += 1
+                    total_bytes -= sizes[id(session)]
+            else:
+                break
+
+        self._approximate_bytes = total_bytes
+        return self._evicted_ttl + self._evicted_lru + self._evicted_memory - evicted_before
+
+    def _remove(self, session: "Session") -> bool:
+        # 只删除仍指向同一对象的条目，避免误删同 id 的新会话
+        if self._sessions.get(session.id) is not session:
+            return False
+        self._sessions.pop(session.id, None)
+        return True
@@ -0,0 +1,844 @@
+"""会话持久化后端。
+
+SessionPool 是常驻内存的热数据层；SessionStore 负责把会话写到进程之外，
+使会话在重启、部署或被淘汰出内存后仍能按 id 恢复。默认的 MemorySessionStore
+不做任何持久化，行为与只有内存字典时一致。
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, List, Optional
+
+from api.param_schema import ParamType, ProviderParam, unquote, validate_params
+from models.message import compact_message
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SessionStoreSettings:
+    """[session_store] 配置段，后端只在进程启动时读取，热更新不会切换后端"""
+
+    SECTION_NAME = "session_store"
+    BACKENDS = ("memory", "sqlite", "shared_sqlite")
+    DEFAULT_BACKEND = "memory"
+    DEFAULT_PATH = "sessions.db"
+    DEFAULT_RETENTION_DAYS = 30.0
+
+    backend: str = DEFAULT_BACKEND
+    path: str = DEFAULT_PATH
+    retention_days: float = DEFAULT_RETENTION_DAYS
+
+    @classmethod
+    def get_params(cls) -> List[ProviderParam]:
+        return [
+            ProviderParam(
+                name="backend",
+                param_type=ParamType.STRING,
+                required=False,
+                default=cls.DEFAULT_BACKEND,
+                description="会话持久化后端：memory 只保存在内存中，sqlite 写入本地数据库文件，shared_sqlite 供多个 worker 进程共用同一数据库文件",
+            ),
+            ProviderParam(
+                name="path",
+                param_type=ParamType.STRING,
+                required=False,
+                default=cls.DEFAULT_PATH,
+                description="sqlite 后端的数据库文件路径",
+            ),
+            ProviderParam(
+                name="retention_days",
+                param_type=ParamType.FLOAT,
+                required=False,
+                default=cls.DEFAULT_RETENTION_DAYS,
+                description="sqlite 后端中会话连续多少天没有写入后被删除（0 表示永久保留）",
+            ),
+        ]
+
+    @classmethod
+    def validate_config(cls, config: Dict[str, Any]) -> tuple[bool, List[str]]:
+        is_valid, errors = validate_params(cls.get_params(), config)
+        backend = config.get("backend")
+        if isinstance(backend, str) and unquote(backend).lower() not in cls.BACKENDS:
+            errors.append(f"backend must be one of: {', '.join(cls.BACKENDS)}")
+        path = config.get("path")
+        if isinstance(path, str) and not unquote(path):
+            errors.append("path must not be empty")
+        retention_days = config.get("retention_days")
+        if isinstance(retention_days, (int, float)) and retention_days < 0:
+            errors.append("retention_days must be non-negative")
+        return is_valid and not errors, errors
+
+
+@dataclass
+class SessionRecord:
+    id: str
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    system_messages: List[Dict[str, Any]] = field(default_factory=list)
+    history: List[Dict[str, Any]] = field(default_factory=list)
+    # 较早历史被压缩后的摘要消息（0 或 1 条），位于系统消息与历史之间
+    summary_messages: List[Dict[str, Any]] = field(default_factory=list)
+    # 每次写入加一；共享后端用它做乐观并发控制，其他后端可能恒为 0
+    version: int = 0
+
+
+class SessionVersionConflictError(RuntimeError):
+    """写入时会话版本已被其他进程推进"""
+
+
+class SessionStore(ABC):
+    """会话持久化接口。写入方法可以异步落盘，但同一进程内随后的 load 必须能读到。
+
+    shared 为 True 的后端由多个进程同时使用：Session 每轮对话前用 refresh
+    同步其他进程写入的内容，写入时传入 expected_version，版本不一致时抛出
+    SessionVersionConflictError。其他后端忽略 expected_version 并返回 None。
+    """
+
+    shared = False
+
+    @abstractmethod
+    def create(self, record: SessionRecord) -> None:
+        """保存新会话，已存在的同 id 会话被整体替换；写入后的版本号回写到 record.version"""
+
+    def create_if_absent(self, record: SessionRecord) -> bool:
+        """仅在会话不存在时保存，返回是否保存成功"""
+        self.create(record)
+        return True
+
+    @abstractmethod
+    def load(self, id: str) -> SessionRecord | None:
+        """读取会话，不存在时返回 None"""
+
+    def refresh(self, id: str, version: int) -> SessionRecord | None:
+        """会话版本与 version 不同时返回最新记录，否则返回 None"""
+        return None
+
+    @abstractmethod
+    def set_system_messages(
+        self,
+        id: str,
+        messages: List[Dict[str, Any]],
+        expected_version: int | None = None,
+    ) -> int | None:
+        pass
+
+    @abstractmethod
+    def append_messages(
+        self,
+        id: str,
+        messages: List[Dict[str, Any]],
+        expected_version: int | None = None,
+    ) -> int | None:
+        pass
+
+    @abstractmethod
+    def clear_history(self, id: str, expected_version: int | None = None) -> int | None:
+        """清空历史和摘要"""
+
+    @abstractmethod
+    def compact_history(
+        self,
+        id: str,
+        summary_messages: List[Dict[str, Any]],
+        removed_count: int,
+        expected_version: int | None = None,
+    ) -> int | None:
+        """用摘要替换最早的 removed_count 条历史"""
+
+    @abstractmethod
+    def fork(self, parent_id: str, child_id: str, expected_version: int | None = None) -> bool:
+        """把 parent_id 的系统消息、摘要和历史复制为新会话 child_id，返回是否保存成功。
+        child_id 已存在时共享后端返回 False，其他后端与 create 一样整体替换"""
+
+    def flush(self) -> None:
+        """等待此前提交的写入全部落盘"""
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory"}
+
+
+class MemorySessionStore(SessionStore):
+    """默认后端：会话只存在于 SessionPool 中，被淘汰或进程退出后丢失"""
+
+    def create(self, record: SessionRecord) -> None:
+        pass
+
+    def load(self, id: str) -> SessionRecord | None:
+        return None
+
+    def set_system_messages(
+        self,
+        id: str,
+        messages: List[Dict[str, Any]],
+        expected_version: int | None = None,
+    ) -> int | None:
+        return None
+
+    def append_messages(
+        self,
+        id: str,
+        messages: List[Dict[str, Any]],
+        expected_version: int | None = None,
+    ) -> int | None:
+        return None
+
+    def clear_history(self, id: str, expected_version: int | None = None) -> int | None:
+        return None
+
+    def compact_history(
+        self,
+        id: str,
+        summary_messages: List[Dict[str, Any]],
+        removed_count: int,
+        expected_version: int | None = None,
+    ) -> int | None:
+        return None
+
+    def fork(self, parent_id: str, child_id: str, expected_version: int | None = None) -> bool:
+        return True
+
+
+class SqliteSessionStore(SessionStore):
+    """基于 sqlite 的本地持久化后端。
+
+    所有数据库操作都在一个后台写线程中按提交顺序执行：写入立即返回并在后台
+    批量提交（write-behind），load 排在此前的写入之后执行，因此总能读到
+    最新状态。写线程在首次提交操作时才启动，fork 出的子进程会启动自己的写线程。
+    """
+
+    MAX_BATCH_SIZE = 256
+    SWEEP_INTERVAL_SECONDS = 3600.0
+
+    def __init__(
+        self,
+        path: str,
+        retention: float = 0.0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.path = path
+        self._retention = _Retention(retention, clock)
+        self._queue: "queue.Queue[Callable[[sqlite3.Connection], None] | Future[None] | None]" = queue.Queue()
+        self._writer: threading.Thread | None = None
+        # 写线程所在进程；fork 出的子进程没有父进程的写线程，首次写入时重新启动
+        self._writer_pid: int | None = None
+        self._writer_lock = threading.Lock()
+        self._write_errors = 0
+        self._closed = False
+        self._close_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def create(self, record: SessionRecord) -> None:
+        record = replace(
+            record,
+            system_messages=list(record.system_messages),
+            history=list(record.history),
+            summary_messages=list(record.summary_messages),
+        )
+        self._submit(lambda connection: _replace_record(connection, record, self._retention.clock()))
+
+    def load(self, id: str) -> SessionRecord | None:
+        loaded: Future[SessionRecord | None] = Future()
+
+        def read(connection: sqlite3.Connection) -> None:
+            if loaded.done():
+                return
+            try:
+                loaded.set_result(_read_record(connection, id))
+            except Exception as exception:
+                loaded.set_exception(exception)
+
+        self._submit(read)
+        return loaded.result()
+
+    def set_system_messages(
+        self,
+        id: str,
+        messages: List[Dict[str, Any]],
+        expected_version: int | None = None,
+    ) -> int | None:
+        payload = _dumps(messages)
+        self._submit(lambda connection: _update_session(
+            connection,
+            id,
+            self._retention.clock(),
+            lambda connection, id: _set_system_messages(connection, id, payload),
+        ))
+        return None
+
+    def append_messages(
+        self,
+        id: str,
+        messages: List[Dict[str, Any]],
+        expected_version: int | None = None,
+    ) -> int | None:
+        messages = list(messages)
+        self._submit(lambda connection: _update_session(
+            connection,
+            id,
+            self._retention.clock(),
+            lambda connection, id: _insert_messages(connection, id, messages),
+        ))
+        return None
+
+    def clear_history(self, id: str, expected_version: int | None = None) -> int | None:
+        self._submit(lambda connection: _update_session(connection, id, self._retention.clock(), _clear_history))
+        return None
+
+    def compact_history(
+        self,
+        id: str,
+        summary_messages: List[Dict[str, Any]],
+        removed_count: int,
+        expected_version: int | None = None,
+    ) -> int | None:
+        summary_messages = list(summary_messages)
+        self._submit(lambda connection: _update_session(
+            connection,
+            id,
+            self._retention.clock(),
+            lambda connection, id: _compact_history(connection, id, summary_messages, removed_count),
+        ))
+        return None
+
+    def fork(self, parent_id: str, child_id: str, expected_version: int | None = None) -> bool:
+        # 排在父会话此前的写入之后执行，复制的是分叉时的内容
+        self._submit(lambda connection: _fork_record(connection, parent_id, child_id, self._retention.clock()))
+        return True
+
+    def flush(self) -> None:
+        # 写线程在此前的写入所在事务提交之后才完成 flushed
+        flushed: Future[None] = Future()
+        self._submit(flushed)
+        flushed.result()
+
+    def close(self) -> None:
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        with self._writer_lock:
+            if self._writer_pid != os.getpid():
+                return
+        self._queue.put(None)
+        self._writer.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "pending_writes": self._queue.qsize(),
+            "write_errors": self._write_errors,
+            "expired_sessions": self._retention.expired,
+        }
+
+    def _submit(self, operation: "Callable[[sqlite3.Connection], Any] | Future[None]") -> None:
+        if self._closed:
+            raise RuntimeError("会话存储已关闭")
+        self._ensure_writer()
+        self._queue.put(operation)
+
+    def _ensure_writer(self) -> None:
+        pid = os.getpid()
+        if self._writer_pid == pid:
+            return
+        with self._writer_lock:
+            if self._writer_pid == pid:
+                return
+            # 从父进程继承的队列里是父进程尚未落盘的写入，由父进程自己完成
+            self._queue = queue.Queue()
+            connection_ready: Future[None] = Future()
+            self._writer = threading.Thread(
+                target=self._run,
+                args=(self._queue, connection_ready),
+                name="session-store-writer",
+                daemon=True,
+            )
+            self._writer.start()
+            connection_ready.result()
+            self._writer_pid = pid
+
+    def _run(
+        self,
+        operations: "queue.Queue[Callable[[sqlite3.Connection], None] | Future[None] | None]",
+        connection_ready: "Future[None]",
+    ) -> None:
+        try:
+            connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            _create_schema(connection)
+        except Exception as exception:
+            connection_ready.set_exception(exception)
+            return
+        connection_ready.set_result(None)
+
+        try:
+            while True:
+                batch = [operations.get()]
+                while len(batch) < self.MAX_BATCH_SIZE:
+                    try:
+                        batch.append(operations.get_nowait())
+                    except queue.Empty:
+                        break
+                stopping = None in batch
+                self._execute_batch(connection, [operation for operation in batch if callable(operation)])
+                if self._retention.due(self.SWEEP_INTERVAL_SECONDS):
+                    self._execute_batch(connection, [self._retention.delete_expired])
+                for operation in batch:
+                    if isinstance(operation, Future):
+                        operation.set_result(None)
+                if stopping:
+                    return
+        finally:
+            connection.close()
+
+    def _execute_batch(
+        self,
+        connection: sqlite3.Connection,
+        batch: List[Callable[[sqlite3.Connection], Any]],
+    ) -> None:
+        # 一批写入合并为一个事务；失败时逐条重试，只丢弃真正出错的那一条
+        try:
+            with connection:
+                for operation in batch:
+                    operation(connection)
+        except Exception:
+            if len(batch) > 1:
+                for operation in batch:
+                    self._execute_batch(connection, [operation])
+                return
+            self._write_errors += 1
+            logger.exception("session store write failed: path=%s", self.path)
+
+
+class SharedSqliteSessionStore(SessionStore):
+    """多进程共享的 sqlite 后端。
+
+    同一台机器上的多个 worker 进程打开同一个数据库文件，每次写入都同步提交，
+    并在同一事务中校验、推进会话版本号；任意 worker 都可以安全地为同一会话
+    追加问答。
+    """
+
+    shared = True
+    BUSY_TIMEOUT_SECONDS = 5.0
+    SWEEP_INTERVAL_SECONDS = 3600.0
+
+    def __init__(
+        self,
+        path: str,
+        retention: float = 0.0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.path = path
+        self._retention = _Retention(retention, clock)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # 打开 _connections 的进程；gunicorn 主进程构造的存储在 worker 中重新建立连接
+        self._connections_pid = os.getpid()
+        self._inherited_connections: List[sqlite3.Connection] = []
+        self._version_conflicts = 0
+        # 建表用的连接随即关闭，构造后不保留任何打开的连接，可以安全地 fork
+        connection = self._open_connection()
+        try:
+            _create_schema(connection)
+        finally:
+            connection.close()
+
+    def create(self, record: SessionRecord) -> None:
+        with self._transaction() as connection:
+            record.version = _replace_record(connection, record, self._retention.clock())
+        self._sweep()
+
+    def create_if_absent(self, record: SessionRecord) -> bool:
+        with self._transaction() as connection:
+            inserted = connection.execute(
+                "INSERT OR IGNORE INTO sessions "
+                "(id, provider, model, system_messages, summary_messages, version, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 1, ?)",
+                (
+                    record.id,
+                    record.provider,
+                    record.model,
+                    _dumps(record.system_messages),
+                    _dumps(record.summary_messages),
+                    self._retention.clock(),
+                ),
+            ).rowcount
+            if not inserted:
+                return False
+            _insert_messages(connection, record.id, record.history)
+        record.version = 1
+        self._sweep()
+        return True
+
+    def load(self, id: str) -> SessionRecord | None:
+        with self._transaction("BEGIN") as connection:
+            return _read_record(connection, id)
+
+    def refresh(self, id: str, version: int) -> SessionRecord | None:
+        row = self._connection().execute("SELECT version FROM sessions WHERE id = ?", (id,)).fetchone()
+        if row is None or row[0] == version:
+            return None
+        return self.load(id)
+
+    def set_system_messages(
+        self,
+        id: str,
+        messages: List[Dict[str, Any]],
+        expected_version: int | None = None,
+    ) -> int | None:
+        payload = _dumps(messages)
+        return self._write(id, expected_version, lambda connection: _set_system_messages(connection, id, payload))
+
+    def append_messages(
+        self,
+        id: str,
+        messages: List[Dict[str, Any]],
+        expected_version: int | None = None,
+    ) -> int | None:
+        return self._write(id, expected_version, lambda connection: _insert_messages(connection, id, messages))
+
+    def clear_history(self, id: str, expected_version: int | None = None) -> int | None:
+        return self._write(id, expected_version, lambda connection: _clear_history(connection, id))
+
+    def compact_history(
+        self,
+        id: str,
+        summary_messages: List[Dict[str, Any]],
+        removed_count: int,
+        expected_version: int | None = None,
+    ) -> int | None:
+        return self._write(
+            id,
+            expected_version,
+            lambda connection: _compact_history(connection, id, summary_messages, removed_count),
+        )
+
+    def fork(self, parent_id: str, child_id: str, expected_version: int | None = None) -> bool:
+        with self._transaction() as connection:
+            if expected_version is not None:
+                row = connection.execute("SELECT version FROM sessions WHERE id = ?", (parent_id,)).fetchone()
+                if row is None or row[0] != expected_version:
+                    self._version_conflicts += 1
+                    raise SessionVersionConflictError(f"会话 {parent_id} 已被其他进程更新")
+            if connection.execute("SELECT 1 FROM sessions WHERE id = ?", (child_id,)).fetchone():
+                return False
+            _fork_record(connection, parent_id, child_id, self._retention.clock())
+        self._sweep()
+        return True
+
+    def close(self) -> None:
+        if self._connections_pid != os.getpid():
+            self._discard_inherited_connections()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "shared_sqlite",
+            "path": self.path,
+            "version_conflicts": self._version_conflicts,
+            "expired_sessions": self._retention.expired,
+        }
+
+    def _write(
+        self,
+        id: str,
+        expected_version: int | None,
+        operation: Callable[[sqlite3.Connection], Any],
+    ) -> int | None:
+        with self._transaction() as connection:
+            if expected_version is None:
+                cursor = connection.execute(
+                    "UPDATE sessions SET version = version + 1, updated_at = ? WHERE id = ?",
+                    (self._retention.clock(), id),
+                )
+            else:
+                cursor = connection.execute(
+                    "UPDATE sessions SET version = version + 1, updated_at = ? WHERE id = ? AND version = ?",
+                    (self._retention.clock(), id, expected_version),
+                )
+            if not cursor.rowcount:
+                if expected_version is None:
+                    return None
+                self._version_conflicts += 1
+                raise SessionVersionConflictError(f"会话 {id} 已被其他进程更新")
+            operation(connection)
+            version = connection.execute("SELECT version FROM sessions WHERE id = ?", (id,)).fetchone()[0]
+        self._sweep()
+        return version
+
+    def _sweep(self) -> None:
+        if not self._retention.due(self.SWEEP_INTERVAL_SECONDS):
+            return
+        # 清理放在写入事务之外，不延长写锁的持有时间，失败也不影响已提交的写入；
+        # 多个 worker 各自定期清理，重复删除是无害的
+        try:
+            with self._transaction() as connection:
+                self._retention.delete_expired(connection)
+        except sqlite3.Error:
+            logger.exception("session store sweep failed: path=%s", self.path)
+
+    @contextmanager
+    def _transaction(self, begin: str = "BEGIN IMMEDIATE") -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE 在事务开始时就拿到写锁，版本校验与写入之间不会插入其他进程的写入
+        connection = self._connection()
+        connection.execute(begin)
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._connections_pid != os.getpid():
+            self._discard_inherited_connections()
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._open_connection()
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _open_connection(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path,
+            timeout=self.BUSY_TIMEOUT_SECONDS,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def _discard_inherited_connections(self) -> None:
+        # sqlite 连接不能跨 fork 使用，在子进程中关闭也不安全；只保留引用防止被回收，
+        # 子进程的每个线程重新打开自己的连接
+        with self._connections_lock:
+            if self._connections_pid == os.getpid():
+                return
+            self._inherited_connections.extend(self._connections)
+            self._connections = []
+            self._local = threading.local()
+            self._connections_pid = os.getpid()
+
+
+class _Retention:
+    """按 updated_at 删除长期没有写入的会话；retention 为 0 时永久保留"""
+
+    def __init__(self, retention: float, clock: Callable[[], float]) -> None:
+        self.retention = retention
+        self.clock = clock
+        self.expired = 0
+        self._last_sweep: float | None = None
+        self._lock = threading.Lock()
+
+    def due(self, interval: float) -> bool:
+        """距上次清理已超过 interval 秒时返回 True 并记为已清理"""
+        if not self.retention:
+            return False
+        now = self.clock()
+        with self._lock:
+            if self._last_sweep is not None and now - self._last_sweep < interval:
+                return False
+            self._last_sweep = now
+        return True
+
+    def delete_expired(self, connection: sqlite3.Connection) -> None:
+        cutoff = self.clock() - self.retention
+        connection.execute(
+            "DELETE FROM messages WHERE session_id IN (SELECT id FROM sessions WHERE updated_at < ?)",
+            (cutoff,),
+        )
+        self.expired += connection.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,)).rowcount
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    provider TEXT,
+    model TEXT,
+    system_messages TEXT NOT NULL,
+    summary_messages TEXT NOT NULL DEFAULT '[]',
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session_id, seq);
+"""
+# 早期版本创建的数据库缺少的列
+_ADDED_COLUMNS = {
+    "summary_messages": "TEXT NOT NULL DEFAULT '[]'",
+    "updated_at": "REAL",
+}
+
+
+def _create_schema(connection: sqlite3.Connection) -> None:
+    connection.executescript(_SCHEMA)
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(sessions)")}
+    for name, definition in _ADDED_COLUMNS.items():
+        if name in columns:
+            continue
+        try:
+            connection.execute(f"ALTER TABLE sessions ADD COLUMN {name} {definition}")
+        except sqlite3.OperationalError:
+            # 共享数据库中其他进程可能刚添加了同一列
+            if name not in {row[1] for row in connection.execute("PRAGMA table_info(sessions)")}:
+                raise
+    # 早期版本写入的会话没有写入时间，从升级时开始计算保留期
+    if "updated_at" not in columns:
+        with connection:
+            connection.execute("UPDATE sessions SET updated_at = ? WHERE updated_at IS NULL", (time.time(),))
+    connection.execute("CREATE INDEX IF NOT EXISTS sessions_by_updated_at ON sessions (updated_at)")
+
+
+def _replace_record(connection: sqlite3.Connection, record: SessionRecord, updated_at: float) -> int:
+    row = connection.execute("SELECT version FROM sessions WHERE id = ?", (record.id,)).fetchone()
+    # 替换同 id 会话时版本号继续递增，其他进程缓存的旧会话会在下一轮同步时失效
+    version = (row[0] if row else 0) + 1
+    connection.execute("DELETE FROM messages WHERE session_id = ?", (record.id,))
+    connection.execute(
+        "INSERT OR REPLACE INTO sessions "
+        "(id, provider, model, system_messages, summary_messages, version, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            record.id,
+            record.provider,
+            record.model,
+            _dumps(record.system_messages),
+            _dumps(record.summary_messages),
+            version,
+            updated_at,
+        ),
+    )
+    _insert_messages(connection, record.id, record.history)
+    return version
+
+
+def _fork_record(connection: sqlite3.Connection, parent_id: str, child_id: str, updated_at: float) -> int:
+    row = connection.execute("SELECT version FROM sessions WHERE id = ?", (child_id,)).fetchone()
+    version = (row[0] if row else 0) + 1
+    connection.execute("DELETE FROM messages WHERE session_id = ?", (child_id,))
+    connection.execute(
+        "INSERT OR REPLACE INTO sessions "
+        "(id, provider, model, system_messages, summary_messages, version, updated_at) "
+        "SELECT ?, provider, model, system_messages, summary_messages, ?, ? FROM sessions WHERE id = ?",
+        (child_id, version, updated_at, parent_id),
+    )
+    # 在数据库内按原顺序复制历史，不经过 Python 反序列化
+    connection.execute(
+        "INSERT INTO messages (session_id, message) "
+        "SELECT ?, message FROM messages WHERE session_id = ? ORDER BY seq",
+        (child_id, parent_id),
+    )
+    return version
+
+
+def _update_session(
+    connection: sqlite3.Connection,
+    id: str,
+    updated_at: float,
+    operation: Callable[[sqlite3.Connection, str], Any],
+) -> None:
+    cursor = connection.execute(
+        "UPDATE sessions SET version = version + 1, updated_at = ? WHERE id = ?",
+        (updated_at, id),
+    )
+    # 会话已过保留期被删除时不再写入，避免留下没有会话的孤立消息
+    if cursor.rowcount:
+        operation(connection, id)
+
+
+def _set_system_messages(connection: sqlite3.Connection, id: str, payload: str) -> None:
+    connection.execute("UPDATE sessions SET system_messages = ? WHERE id = ?", (payload, id))
+
+
+def _clear_history(connection: sqlite3.Connection, id: str) -> None:
+    connection.execute("DELETE FROM messages WHERE session_id = ?", (id,))
+    connection.execute("UPDATE sessions SET summary_messages = '[]' WHERE id = ?", (id,))
+
+
+def _compact_history(
+    connection: sqlite3.Connection,
+    id: str,
+    summary_messages: List[Dict[str, Any]],
+    removed_count: int,
+) -> None:
+    connection.execute(
+        "DELETE FROM messages WHERE seq IN "
+        "(SELECT seq FROM messages WHERE session_id = ? ORDER BY seq LIMIT ?)",
+        (id, removed_count),
+    )
+    connection.execute(
+        "UPDATE sessions SET summary_messages = ? WHERE id = ?",
+        (_dumps(summary_messages), id),
+    )
+
+
+def _insert_messages(connection: sqlite3.Connection, id: str, messages: List[Dict[str, Any]]) -> None:
+    connection.executemany(
+        "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+        [(id, _dumps(message)) for message in messages],
+    )
+
+
+def _read_record(connection: sqlite3.Connection, id: str) -> SessionRecord | None:
+    row = connection.execute(
+        "SELECT provider, model, system_messages, summary_messages, version FROM sessions WHERE id = ?",
+        (id,),
+    ).fetchone()
+    if row is None:
+        return None
+    provider, model, system_messages, summary_messages, version = row
+    history = [
+        compact_message(json.loads(message))
+        for (message,) in connection.execute(
+            "SELECT message FROM messages WHERE session_id = ? ORDER BY seq",
+            (id,),
+        )
+    ]
+    return SessionRecord(
+        id=id,
+        provider=provider,
+        model=model,
+        system_messages=[compact_message(message) for message in json.loads(system_messages)],
+        history=history,
+        summary_messages=[compact_message(message) for message in json.loads(summary_messages)],
+        version=version,
+    )
+
+
+def create_session_store(settings: SessionStoreSettings) -> SessionStore:
+    backend = unquote(settings.backend).lower()
+    if backend == "sqlite":
+        return SqliteSessionStore(unquote(settings.path), retention=settings.retention_days * 86400)
+    if backend == "shared_sqlite":
+        return SharedSqliteSessionStore(unquote(settings.path), retention=settings.retention_days * 86400)
+    return MemorySessionStore()
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False)
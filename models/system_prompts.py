@@ -0,0 +1,99 @@
+"""跨会话共享的系统提示词表。
+
+大量会话通常使用同一个较长的系统提示词。表中按内容保存唯一的一份系统消息，
+会话只持有它的引用；引用计数归零时从表中删除。
+"""
+
+import threading
+from typing import Any, Dict, List
+
+from models.message import message_size
+
+
+class _SharedPrompt:
+    __slots__ = ("message", "references", "size")
+
+    def __init__(self, message: Dict[str, Any]) -> None:
+        self.message = message
+        self.references = 0
+        self.size = message_size(message)
+
+
+class SystemPromptTable:
+    """以内容为键、带引用计数的系统消息表，线程安全"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._prompts: Dict[str, _SharedPrompt] = {}
+        self._stored_bytes = 0
+        self._saved_bytes = 0
+
+    def acquire(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """返回与 message 内容相同的共享消息并增加引用；不可共享的消息原样返回"""
+        key = _prompt_key(message)
+        if key is None:
+            return message
+        with self._lock:
+            prompt = self._prompts.get(key)
+            if prompt is None:
+                prompt = self._prompts[key] = _SharedPrompt(message)
+                self._stored_bytes += prompt.size
+            else:
+                self._saved_bytes += prompt.size
+            prompt.references += 1
+            return prompt.message
+
+    def release(self, message: Dict[str, Any]) -> None:
+        key = _prompt_key(message)
+        if key is None:
+            return
+        with self._lock:
+            prompt = self._prompts.get(key)
+            if prompt is None or prompt.message is not message:
+                return
+            prompt.references -= 1
+            if prompt.references:
+                self._saved_bytes -= prompt.size
+            else:
+                del self._prompts[key]
+                self._stored_bytes -= prompt.size
+
+    def references(self) -> "SystemPromptReferences":
+        return SystemPromptReferences(self)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "prompts": len(self._prompts),
+                "references": sum(prompt.references for prompt in self._prompts.values()),
+                "stored_bytes": self._stored_bytes,
+                "saved_bytes": self._saved_bytes,
+            }
+
+
+class SystemPromptReferences:
+    """单个会话持有的系统消息引用。替换时先取得新引用再释放旧引用"""
+
+    __slots__ = ("_table", "_messages")
+
+    def __init__(self, table: SystemPromptTable) -> None:
+        self._table = table
+        self._messages: List[Dict[str, Any]] = []
+
+    def replace(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        shared = [self._table.acquire(message) for message in messages]
+        previous, self._messages = self._messages, shared
+        for message in previous:
+            self._table.release(message)
+        return shared
+
+    def release(self) -> None:
+        self.replace([])
+
+
+def _prompt_key(message: Dict[str, Any]) -> str | None:
+    # 只共享纯文本的系统消息；带其他字段的消息各自保存
+    content = message.get("content")
+    if message.get("role") != "system" or not isinstance(content, str) or len(message) != 2:
+        return None
+    return content
@@ -0,0 +1,438 @@
+"""ASGI 服务入口，与 server/web_server.py 提供相同的接口约定。
+
+流式请求全程在事件循环上等待上游，不再为每个连接占用一个线程，单进程即可
+维持数千条并发 SSE 连接。使用方式::
+
+    uvicorn server.asgi:app --host 0.0.0.0 --port 11301
+
+或 ``python main.py --asgi``。
+"""
+
+import asyncio
+import json
+import logging
+from collections.abc import AsyncIterator, Awaitable, Callable, MutableMapping
+from typing import Any
+from urllib.parse import parse_qs
+
+from api import http_pool
+from api.api_factory import ManualModelSelectionError
+from api.base_api import BaseApi
+from models.session_admission import SessionAdmissionError
+from models.session_manager import SessionExistsError, SessionManager, SessionNotFoundError
+from server.chat_protocol import (
+    CHAT_PARAMETER_NAMES,
+    FORK_PARAMETER_NAMES,
+    JSON_OBJECT_REQUIRED,
+    SSE_CONTENT_TYPE,
+    SSE_HEADERS,
+    STREAM_FAILED,
+    delta_event,
+    done_event,
+    help_text,
+    interrupted_event,
+    load_messages_parameter,
+    session_event,
+    should_preserve_history,
+    validate_chat_parameters,
+    validate_fork_parameters,
+    validate_stateless_parameters,
+)
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+logger = logging.getLogger(__name__)
+
+# 与 flask-cors 默认值保持一致
+CORS_ALLOW_METHODS = "DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"
+
+sm = SessionManager()
+
+
+class Request:
+    def __init__(self, scope: Scope, receive: Receive) -> None:
+        self.scope = scope
+        self.receive = receive
+        self.method: str = scope["method"]
+        self.path: str = scope["path"]
+        self.headers: dict[str, str] = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope.get("headers", [])
+        }
+        query = parse_qs(scope.get("query_string", b"").decode("utf-8"), keep_blank_values=True)
+        self.args: dict[str, str] = {name: values[0] for name, values in query.items()}
+
+    async def body(self) -> bytes:
+        chunks: list[bytes] = []
+        while True:
+            message = await self.receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    async def json(self) -> Any:
+        body = await self.body()
+        if not body:
+            return None
+        try:
+            return json.loads(body)
+        except ValueError:
+            return None
+
+    async def wait_for_disconnect(self) -> None:
+        while True:
+            message = await self.receive()
+            if message["type"] == "http.disconnect":
+                return
+
+
+class Responder:
+    """发送响应并统一附加跨域头。"""
+
+    def __init__(self, request: Request, send: Send) -> None:
+        self.request = request
+        self.send = send
+        self.started = False
+
+    async def start(self, status: int, headers: dict[str, str]) -> None:
+        self.started = True
+        headers = {**headers, **self._cors_headers()}
+        await self.send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers.items()
+            ],
+        })
+
+    async def text(self, content: str, status: int = 200) -> None:
+        await self._complete(status, "text/html; charset=utf-8", content.encode("utf-8"))
+
+    async def json(self, payload: Any, status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        await self._complete(status, "application/json", body)
+
+    async def chunk(self, content: str) -> None:
+        await self.send({
+            "type": "http.response.body",
+            "body": content.encode("utf-8"),
+            "more_body": True,
+        })
+
+    async def finish(self) -> None:
+        await self.send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _complete(self, status: int, content_type: str, body: bytes) -> None:
+        await self.start(status, {
+            "Content-Type": content_type,
+            "Content-Length": str(len(body)),
+        })
+        await self.send({"type": "http.response.body", "body": body})
+
+    def _cors_headers(self) -> dict[str, str]:
+        origin = self.request.headers.get("origin")
+        if not origin:
+            return {}
+        headers = {"Access-Control-Allow-Origin": origin, "Vary": "Origin"}
+        if self.request.method == "OPTIONS":
+            headers["Access-Control-Allow-Methods"] = CORS_ALLOW_METHODS
+            requested_headers = self.request.headers.get("access-control-request-headers")
+            if requested_headers:
+                headers["Access-Control-Allow-Headers"] = requested_headers
+        return headers
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    request = Request(scope, receive)
+    responder = Responder(request, send)
+    try:
+        await _dispatch(request, responder)
+    except Exception:
+        logger.exception("请求处理失败: %s %s", request.method, request.path)
+        if not responder.started:
+            await responder.text("Internal Server Error", 500)
+
+
+async def _lifespan(receive: Receive, send: Send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await http_pool.aclose_async_clients()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _dispatch(request: Request, responder: Responder) -> None:
+    if request.method == "OPTIONS":
+        await responder.text("")
+        return
+
+    routes = ROUTES.get(request.path)
+    if routes is None:
+        await responder.text("Not Found", 404)
+        return
+    handler = routes.get(request.method)
+    if handler is None:
+        await responder.text("Method Not Allowed", 405)
+        return
+    await handler(request, responder)
+
+
+async def home(request: Request, responder: Responder) -> None:
+    await responder.text(help_text())
+
+
+async def inspect_all_messages(request: Request, responder: Responder) -> None:
+    # 被压缩的历史要解压后才能输出，放到线程中执行，避免阻塞事件循环
+    await responder.json(await asyncio.to_thread(_inspect_sessions))
+
+
+def _inspect_sessions() -> list[dict[str, Any]]:
+    return [
+        {
+            "id": session.id,
+            "messages": list(session.peek_messages()),
+            "compaction": session.compaction_stats(),
+            "admission": session.admission_stats(),
+        }
+        for session in sm.list_sessions()
+    ]
+
+
+async def list_available_models(request: Request, responder: Responder) -> None:
+    await responder.json({
+        "providers": sm.api_factory.list_available_provider_models(),
+    })
+
+
+async def show_runtime_stats(request: Request, responder: Responder) -> None:
+    await responder.json({
+        "http_pool": http_pool.get_stats(),
+        "sessions": await sm.stats_async(),
+        "hedging": sm.api_factory.hedging_stats(),
+    })
+
+
+async def process_fork_request(request: Request, responder: Responder) -> None:
+    parameters = await _read_parameters(request, responder, FORK_PARAMETER_NAMES)
+    if parameters is None:
+        return
+    id, new_id, system_message = parameters
+
+    validation_error = validate_fork_parameters(id, new_id, system_message)
+    if validation_error:
+        await responder.text(validation_error, 400)
+        return
+
+    try:
+        session = await sm.fork_session_async(id, new_id=new_id, system_message=system_message)
+    except (SessionNotFoundError, SessionExistsError) as exception:
+        await responder.text(str(exception), exception.status_code)
+        return
+    await responder.json({"id": session.id, "parent": id})
+
+
+async def process_chat_request(request: Request, responder: Responder) -> None:
+    parameters = await _read_chat_parameters(request, responder)
+    if parameters is None:
+        return
+    id, system_message, user_message, preserve, provider, model, messages = parameters
+    if messages is not None:
+        client = await _stateless_client(parameters, responder)
+        if client is not None:
+            await responder.text(str(await client.reason_async(messages)))
+        return
+
+    validation_error = validate_chat_parameters(user_message, provider, model)
+    if validation_error:
+        await responder.text(validation_error, 400)
+        return
+
+    preserve = should_preserve_history(preserve)
+    try:
+        session = await sm.get_or_create_session_async(id, provider=provider, model=model)
+    except ManualModelSelectionError as exception:
+        await responder.text(str(exception), 400)
+        return
+    try:
+        answer = await session.chat_async(
+            user_message,
+            preserve=preserve,
+            system_message=system_message,
+        )
+    except SessionAdmissionError as exception:
+        await responder.text(str(exception), exception.status_code)
+        return
+    await responder.text(str(answer))
+
+
+async def process_stream_chat_request(request: Request, responder: Responder) -> None:
+    parameters = await _read_chat_parameters(request, responder)
+    if parameters is None:
+        return
+    id, system_message, user_message, preserve, provider, model, messages = parameters
+    if messages is not None:
+        client = await _stateless_client(parameters, responder)
+        if client is None:
+            return
+        # 无状态请求没有会话 id，也不保存历史
+        session_id = None
+        preserve = False
+        stream = _non_empty_chunks(client.reason_stream_async(messages))
+    else:
+        validation_error = validate_chat_parameters(user_message, provider, model)
+        if validation_error:
+            await responder.text(validation_error, 400)
+            return
+
+        preserve = should_preserve_history(preserve)
+        try:
+            session = await sm.get_or_create_session_async(id, provider=provider, model=model)
+        except ManualModelSelectionError as exception:
+            await responder.text(str(exception), 400)
+            return
+        session_id = session.id
+        stream = session.chat_stream_async(
+            user_message,
+            preserve=preserve,
+            system_message=system_message,
+        )
+
+    try:
+        try:
+            first_chunk = await anext(stream)
+        except StopAsyncIteration:
+            first_chunk = None
+        except SessionAdmissionError as exception:
+            await responder.text(str(exception), exception.status_code)
+            return
+        except Exception:
+            await responder.text(STREAM_FAILED, 502)
+            return
+
+        await responder.start(200, {"Content-Type": SSE_CONTENT_TYPE, **SSE_HEADERS})
+        await _send_until_disconnect(
+            request,
+            _generate_events(session_id, first_chunk, stream, preserve),
+            responder,
+        )
+    finally:
+        await stream.aclose()
+
+
+async def _stateless_client(parameters: tuple[Any, ...], responder: Responder) -> BaseApi | None:
+    """校验无状态请求参数并返回客户端，参数无效时已发送 400 并返回 None"""
+    id, system_message, user_message, preserve, provider, model, messages = parameters
+    validation_error = validate_stateless_parameters(messages, provider, model, {
+        "id": id,
+        "system_message": system_message,
+        "user_message": user_message,
+        "preserve": preserve,
+    })
+    if validation_error:
+        await responder.text(validation_error, 400)
+        return None
+    try:
+        return await sm.stateless_client_async(provider, model)
+    except ManualModelSelectionError as exception:
+        await responder.text(str(exception), 400)
+        return None
+
+
+async def _non_empty_chunks(stream: AsyncIterator[str]) -> AsyncIterator[str]:
+    try:
+        async for chunk in stream:
+            if chunk:
+                yield chunk
+    finally:
+        await stream.aclose()
+
+
+async def _generate_events(
+    session_id: str | None,
+    first_chunk: str | None,
+    stream: AsyncIterator[str],
+    preserve: bool,
+) -> AsyncIterator[str]:
+    try:
+        if session_id is not None:
+            yield session_event(session_id)
+        if first_chunk is not None:
+            yield delta_event(first_chunk)
+        async for chunk in stream:
+            yield delta_event(chunk)
+        yield done_event(preserve)
+    except Exception:
+        yield interrupted_event()
+
+
+async def _send_until_disconnect(
+    request: Request,
+    events: AsyncIterator[str],
+    responder: Responder,
+) -> None:
+    """转发事件直到结束；客户端断开时取消上游读取，不再继续消耗模型输出。"""
+
+    async def forward() -> None:
+        async for event in events:
+            await responder.chunk(event)
+        await responder.finish()
+
+    forwarding = asyncio.create_task(forward())
+    disconnect = asyncio.create_task(request.wait_for_disconnect())
+    try:
+        await asyncio.wait({forwarding, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (forwarding, disconnect):
+            task.cancel()
+        await asyncio.gather(forwarding, disconnect, return_exceptions=True)
+    if forwarding.done() and not forwarding.cancelled() and forwarding.exception() is not None:
+        raise forwarding.exception()
+
+
+async def _read_chat_parameters(request: Request, responder: Responder) -> tuple[Any, ...] | None:
+    parameters = await _read_parameters(request, responder, CHAT_PARAMETER_NAMES)
+    if parameters is None or request.method == "POST":
+        return parameters
+    # GET 请求中的 messages 是 JSON 字符串
+    return (*parameters[:-1], load_messages_parameter(parameters[-1]))
+
+
+async def _read_parameters(
+    request: Request,
+    responder: Responder,
+    names: tuple[str, ...],
+) -> tuple[Any, ...] | None:
+    if request.method == "POST":
+        payload = await request.json()
+        if not isinstance(payload, dict):
+            await responder.text(JSON_OBJECT_REQUIRED, 400)
+            return None
+        return tuple(payload.get(name) for name in names)
+    return tuple(request.args.get(name) for name in names)
+
+
+ROUTES: dict[str, dict[str, Callable[[Request, Responder], Awaitable[None]]]] = {
+    "/help": {"GET": home},
+    "/inspect": {"GET": inspect_all_messages},
+    "/models": {"GET": list_available_models},
+    "/stats": {"GET": show_runtime_stats},
+    "/": {"GET": process_chat_request, "POST": process_chat_request},
+    "/stream": {"GET": process_stream_chat_request, "POST": process_stream_chat_request},
+    "/fork": {"GET": process_fork_request, "POST": process_fork_request},
+}
@@ -0,0 +1,132 @@
+"""Flask 与 ASGI 两种服务模式共用的请求参数校验和 SSE 事件格式。"""
+
+import json
+from typing import Any
+
+HELP_LINES = [
+    "可接受请求参数:",
+    "",
+    "id : 会话id, 不提供则自动生成",
+    "system_message : 系统消息, 不提供则不使用系统消息",
+    "preserve : 是否对于相同的会话id保留历史记录",
+    "provider : AI服务商名称(可选)，不提供则使用默认服务商",
+    "model : 模型名称(可选)，提供时必须同时提供 provider",
+    "user_message : 用户消息(必填)",
+    "messages : 完整的消息数组(可选)，提供时不使用服务端会话，也不能再提供 id、system_message、user_message、preserve",
+    "",
+    "/fork 分叉会话，新会话共用原会话的历史:",
+    "id : 被分叉的会话id(必填)",
+    "new_id : 新会话id, 不提供则自动生成",
+    "system_message : 新会话的系统消息, 不提供则沿用原会话的",
+]
+CHAT_PARAMETER_NAMES = ("id", "system_message", "user_message", "preserve", "provider", "model", "messages")
+# 无状态请求由调用方提供完整消息数组，与这些会话参数互斥
+SESSION_PARAMETER_NAMES = ("id", "system_message", "user_message", "preserve")
+FORK_PARAMETER_NAMES = ("id", "new_id", "system_message")
+
+SSE_CONTENT_TYPE = "text/event-stream; charset=utf-8"
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+MISSING_USER_MESSAGE = "缺少必填参数: user_message"
+MISSING_SESSION_ID = "缺少必填参数: id"
+JSON_OBJECT_REQUIRED = "请求体必须是 JSON 对象"
+STREAM_FAILED = "模型流式调用失败"
+
+
+def help_text() -> str:
+    return "<br>".join(HELP_LINES)
+
+
+def should_preserve_history(preserve: Any) -> bool:
+    if isinstance(preserve, bool):
+        return preserve
+    if isinstance(preserve, str):
+        return preserve.strip().lower() in ["true", "1", "yes"]
+    return False
+
+
+def validate_manual_selection_parameters(provider: Any, model: Any) -> str | None:
+    if model is None:
+        return None
+    if provider is None:
+        return "指定 model 时必须同时指定 provider"
+    if not isinstance(provider, str):
+        return "参数 'provider' 必须是字符串"
+    if not isinstance(model, str):
+        return "参数 'model' 必须是字符串"
+    if not provider.strip():
+        return "参数 'provider' 不能为空"
+    if not model.strip():
+        return "参数 'model' 不能为空"
+    if "," in model:
+        return "参数 'model' 只能指定一个模型"
+    return None
+
+
+def validate_chat_parameters(user_message: Any, provider: Any, model: Any) -> str | None:
+    if not user_message:
+        return MISSING_USER_MESSAGE
+    return validate_manual_selection_parameters(provider, model)
+
+
+def validate_fork_parameters(id: Any, new_id: Any, system_message: Any) -> str | None:
+    if not id:
+        return MISSING_SESSION_ID
+    for name, value in (("id", id), ("new_id", new_id), ("system_message", system_message)):
+        if value is not None and not isinstance(value, str):
+            return f"参数 '{name}' 必须是字符串"
+    return None
+
+
+def load_messages_parameter(messages: Any) -> Any:
+    """GET 请求中的 messages 是 JSON 字符串，解析失败时原样返回，由校验给出错误"""
+    if isinstance(messages, str):
+        try:
+            return json.loads(messages)
+        except ValueError:
+            return messages
+    return messages
+
+
+def validate_stateless_parameters(
+    messages: Any,
+    provider: Any,
+    model: Any,
+    session_parameters: dict[str, Any],
+) -> str | None:
+    conflicting = [name for name in SESSION_PARAMETER_NAMES if session_parameters.get(name) is not None]
+    if conflicting:
+        return f"提供 messages 时不能同时提供: {', '.join(conflicting)}"
+    if not isinstance(messages, list) or not messages:
+        return "参数 'messages' 必须是非空的消息数组"
+    for message in messages:
+        if not isinstance(message, dict) or not isinstance(message.get("role"), str) or "content" not in message:
+            return "参数 'messages' 中的每条消息都必须是包含 role 和 content 的对象"
+    return validate_manual_selection_parameters(provider, model)
+
+
+def encode_sse_event(payload: dict[str, Any]) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def session_event(session_id: str) -> str:
+    return encode_sse_event({"type": "session", "id": session_id})
+
+
+def delta_event(content: str) -> str:
+    return encode_sse_event({"type": "delta", "content": content})
+
+
+def done_event(preserved: bool) -> str:
+    return encode_sse_event({"type": "done", "preserved": preserved})
+
+
+def interrupted_event() -> str:
+    return encode_sse_event({
+        "type": "error",
+        "code": "upstream_interrupted",
+        "message": "模型流式响应中断",
+    })
@@ -0,0 +1,129 @@
+"""生产环境多进程启动器（基于 gunicorn，仅支持类 Unix 系统）。
+
+主进程在 fork 之前导入服务模块，完成 ApiFactory 的配置解析与各服务商模块
+导入，worker 直接继承这些状态。会话存储在主进程中构造时不保留数据库连接或
+写线程，worker 在 fork 之后首次读写会话时各自打开。
+
+credentials.config 的监控线程只运行在主进程：主进程先重新加载自身配置（之后
+新 fork 的 worker 直接继承新配置），再向每个 worker 发送 SIGHUP，worker 收到
+后在后台线程中重新加载各自的 ApiFactory。
+
+会话默认保存在各 worker 进程内存中，多 worker 部署时需要配置 shared_sqlite
+会话存储，或由上游负载均衡按 id 固定到同一进程，或者使用单 worker 多线程。
+"""
+
+import logging
+import os
+import signal
+import threading
+from dataclasses import dataclass
+from types import FrameType
+from typing import Any
+
+from gunicorn.app.base import BaseApplication
+
+from api.credentials_watcher import start_credentials_watcher
+
+logger = logging.getLogger(__name__)
+
+RELOAD_SIGNAL = signal.SIGHUP
+
+
+@dataclass(frozen=True)
+class ProductionOptions:
+    DEFAULT_THREADS = 8
+    DEFAULT_BACKLOG = 2048
+
+    host: str
+    port: int
+    workers: int
+    threads: int = DEFAULT_THREADS
+    backlog: int = DEFAULT_BACKLOG
+    asgi: bool = False
+
+    def __post_init__(self) -> None:
+        for name in ("workers", "threads", "backlog"):
+            if getattr(self, name) <= 0:
+                raise ValueError(f"{name} 必须大于 0")
+
+    @staticmethod
+    def default_workers() -> int:
+        return os.cpu_count() or 1
+
+
+class GatewayApplication(BaseApplication):
+    """以 preload 方式加载 Flask 或 ASGI 应用的 gunicorn Application。"""
+
+    def __init__(self, options: ProductionOptions) -> None:
+        self.options = options
+        self.server_module: Any = None
+        super().__init__()
+
+    def load_config(self) -> None:
+        options = self.options
+        settings: dict[str, Any] = {
+            "bind": f"{options.host}:{options.port}",
+            "workers": options.workers,
+            "backlog": options.backlog,
+            "preload_app": True,
+            "when_ready": self._start_master_watcher,
+            "post_worker_init": self._install_worker_reload_handler,
+        }
+        if options.asgi:
+            settings["worker_class"] = "uvicorn.workers.UvicornWorker"
+        else:
+            settings["worker_class"] = "gthread"
+            settings["threads"] = options.threads
+        for key, value in settings.items():
+            self.cfg.set(key, value)
+
+    def load(self) -> Any:
+        if self.server_module is None:
+            if self.options.asgi:
+                from server import asgi as server_module
+            else:
+                from server import web_server as server_module
+            self.server_module = server_module
+        return self.server_module.app
+
+    def _factory(self) -> Any:
+        return self.server_module.sm.api_factory
+
+    def _start_master_watcher(self, arbiter: Any) -> None:
+        def signal_workers() -> None:
+            # 刚 fork、尚未装好处理函数的 worker 会被 SIGHUP 结束，arbiter 随后
+            # 从已重新加载的主进程 fork 新 worker，结果同样是新配置
+            for pid in list(arbiter.WORKERS):
+                try:
+                    os.kill(pid, RELOAD_SIGNAL)
+                except ProcessLookupError:
+                    continue
+            logger.info("credentials reload signalled to workers: count=%s", len(arbiter.WORKERS))
+
+        start_credentials_watcher(self._factory(), on_reloaded=signal_workers)
+
+    def _install_worker_reload_handler(self, worker: Any) -> None:
+        factory = self._factory()
+
+        def handle_reload(signum: int, frame: FrameType | None) -> None:
+            # 信号处理函数里只启动线程，真正的解析和日志都在线程中完成
+            threading.Thread(
+                target=_reload_worker_factory,
+                args=(factory, worker.pid),
+                name="credentials-reload",
+                daemon=True,
+            ).start()
+
+        signal.signal(RELOAD_SIGNAL, handle_reload)
+        signal.siginterrupt(RELOAD_SIGNAL, False)
+
+
+def _reload_worker_factory(factory: Any, pid: int) -> None:
+    try:
+        factory.reload_credentials()
+    except Exception:
+        logger.exception("worker credentials reload failed: pid=%s", pid)
+
+
+def run(options: ProductionOptions) -> None:
+    GatewayApplication(options).run()
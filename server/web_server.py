@@ -1,10 +1,26 @@
-import json
-
 from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 
+from api import http_pool
 from api.api_factory import ManualModelSelectionError
-from models.session_manager import SessionManager
+from models.session_admission import SessionAdmissionError
+from models.session_manager import SessionExistsError, SessionManager, SessionNotFoundError
+from server.chat_protocol import (
+    JSON_OBJECT_REQUIRED,
+    SSE_CONTENT_TYPE,
+    SSE_HEADERS,
+    STREAM_FAILED,
+    delta_event,
+    done_event,
+    help_text,
+    interrupted_event,
+    load_messages_parameter,
+    session_event,
+    should_preserve_history,
+    validate_chat_parameters,
+    validate_fork_parameters,
+    validate_stateless_parameters,
+)
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -13,23 +29,18 @@ sm = SessionManager()
 
 @app.route("/help", methods=["GET"])
 def home():
-    content_lines = [
-        "可接受请求参数:",
-        "",
-        "id : 会话id, 不提供则自动生成",
-        "system_message : 系统消息, 不提供则不使用系统消息",
-        "preserve : 是否对于相同的会话id保留历史记录",
-        "provider : AI服务商名称(可选)，不提供则使用默认服务商",
-        "model : 模型名称(可选)，提供时必须同时提供 provider",
-        "user_message : 用户消息(必填)",
-    ]
-    return "<br>".join(content_lines)
+    return help_text()
 
 
 @app.route("/inspect", methods=["GET"])
 def inspect_all_messages():
     return jsonify([
-        {"id": session.id, "messages": session.snapshot_messages()}
+        {
+            "id": session.id,
+            "messages": list(session.peek_messages()),
+            "compaction": session.compaction_stats(),
+            "admission": session.admission_stats(),
+        }
         for session in sm.list_sessions()
     ])
 
@@ -41,126 +52,161 @@ def list_available_models():
     })
 
 
-def _should_preserve_history(preserve):
-    if isinstance(preserve, bool):
-        return preserve
-    if isinstance(preserve, str):
-        return preserve.strip().lower() in ["true", "1", "yes"]
-    return False
-
-
-def _validate_manual_selection_parameters(provider, model):
-    if model is None:
-        return None
-    if provider is None:
-        return "指定 model 时必须同时指定 provider"
-    if not isinstance(provider, str):
-        return "参数 'provider' 必须是字符串"
-    if not isinstance(model, str):
-        return "参数 'model' 必须是字符串"
-    if not provider.strip():
-        return "参数 'provider' 不能为空"
-    if not model.strip():
-        return "参数 'model' 不能为空"
-    if "," in model:
-        return "参数 'model' 只能指定一个模型"
-    return None
-
-
-def _chat_using_parameters(id, system_message, user_message, preserve, provider, model):
-    if not user_message:
-        return "缺少必填参数: user_message", 400
-
-    validation_error = _validate_manual_selection_parameters(provider, model)
+@app.route("/stats", methods=["GET"])
+def show_runtime_stats():
+    return jsonify({
+        "http_pool": http_pool.get_stats(),
+        "sessions": sm.stats(),
+        "hedging": sm.api_factory.hedging_stats(),
+    })
+
+
+def _fork_using_parameters(id, new_id, system_message):
+    validation_error = validate_fork_parameters(id, new_id, system_message)
     if validation_error:
         return validation_error, 400
 
-    preserve = _should_preserve_history(preserve)
-
     try:
-        session = sm.get_or_create_session(id, provider=provider, model=model)
-    except ManualModelSelectionError as exception:
-        return str(exception), 400
-    answer = session.chat(
-        user_message,
-        preserve=preserve,
-        system_message=system_message,
-    )
-
-    return str(answer)
-
-
-def _encode_sse_event(payload):
-    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        session = sm.fork_session(id, new_id=new_id, system_message=system_message)
+    except (SessionNotFoundError, SessionExistsError) as exception:
+        return str(exception), exception.status_code
+    return jsonify({"id": session.id, "parent": id})
 
 
-def _stream_chat_using_parameters(id, system_message, user_message, preserve, provider, model):
-    if not user_message:
-        return "缺少必填参数: user_message", 400
-
-    validation_error = _validate_manual_selection_parameters(provider, model)
+def _stateless_client(messages, provider, model, session_parameters):
+    """返回 (client, None)；参数无效时返回 (None, 错误响应)"""
+    validation_error = validate_stateless_parameters(messages, provider, model, session_parameters)
+    if validation_error:
+        return None, (validation_error, 400)
+    try:
+        return sm.stateless_client(provider, model), None
+    except ManualModelSelectionError as exception:
+        return None, (str(exception), 400)
+
+
+def _chat_using_parameters(id, system_message, user_message, preserve, provider, model, messages=None):
+    if messages is not None:
+        client, error_response = _stateless_client(messages, provider, model, {
+            "id": id,
+            "system_message": system_message,
+            "user_message": user_message,
+            "preserve": preserve,
+        })
+        if error_response:
+            return error_response
+        return str(client.reason(messages))
+
+    validation_error = validate_chat_parameters(user_message, provider, model)
     if validation_error:
         return validation_error, 400
 
-    preserve = _should_preserve_history(preserve)
+    preserve = should_preserve_history(preserve)
+
     try:
         session = sm.get_or_create_session(id, provider=provider, model=model)
     except ManualModelSelectionError as exception:
         return str(exception), 400
-    stream = session.chat_stream(
-        user_message,
-        preserve=preserve,
-        system_message=system_message,
-    )
+    try:
+        answer = session.chat(
+            user_message,
+            preserve=preserve,
+            system_message=system_message,
+        )
+    except SessionAdmissionError as exception:
+        return str(exception), exception.status_code
+
+    return str(answer)
+
+
+def _stream_chat_using_parameters(id, system_message, user_message, preserve, provider, model, messages=None):
+    if messages is not None:
+        client, error_response = _stateless_client(messages, provider, model, {
+            "id": id,
+            "system_message": system_message,
+            "user_message": user_message,
+            "preserve": preserve,
+        })
+        if error_response:
+            return error_response
+        # 无状态请求没有会话 id，也不保存历史
+        session_id = None
+        preserve = False
+        stream = _non_empty_chunks(client.reason_stream(messages))
+    else:
+        validation_error = validate_chat_parameters(user_message, provider, model)
+        if validation_error:
+            return validation_error, 400
+
+        preserve = should_preserve_history(preserve)
+        try:
+            session = sm.get_or_create_session(id, provider=provider, model=model)
+        except ManualModelSelectionError as exception:
+            return str(exception), 400
+        session_id = session.id
+        stream = session.chat_stream(
+            user_message,
+            preserve=preserve,
+            system_message=system_message,
+        )
 
     try:
         first_chunk = next(stream)
     except StopIteration:
         first_chunk = None
+    except SessionAdmissionError as exception:
+        return str(exception), exception.status_code
     except Exception:
-        return "模型流式调用失败", 502
+        return STREAM_FAILED, 502
 
     @stream_with_context
     def generate():
         try:
-            yield _encode_sse_event({"type": "session", "id": session.id})
+            if session_id is not None:
+                yield session_event(session_id)
             if first_chunk is not None:
-                yield _encode_sse_event({"type": "delta", "content": first_chunk})
+                yield delta_event(first_chunk)
             for chunk in stream:
-                yield _encode_sse_event({"type": "delta", "content": chunk})
-            yield _encode_sse_event({"type": "done", "preserved": preserve})
+                yield delta_event(chunk)
+            yield done_event(preserve)
         except GeneratorExit:
             raise
         except Exception:
-            yield _encode_sse_event({
-                "type": "error",
-                "code": "upstream_interrupted",
-                "message": "模型流式响应中断",
-            })
+            yield interrupted_event()
         finally:
             close = getattr(stream, "close", None)
             if callable(close):
                 close()
 
-    response = Response(generate(), content_type="text/event-stream; charset=utf-8")
-    response.headers["Cache-Control"] = "no-cache"
-    response.headers["X-Accel-Buffering"] = "no"
+    response = Response(generate(), content_type=SSE_CONTENT_TYPE)
+    response.headers.update(SSE_HEADERS)
     return response
 
 
+def _non_empty_chunks(stream):
+    try:
+        for chunk in stream:
+            if chunk:
+                yield chunk
+    finally:
+        close = getattr(stream, "close", None)
+        if callable(close):
+            close()
+
+
 @app.route("/", methods=["POST"])
 def process_chat_request_port():
     payload = request.get_json()
     if not isinstance(payload, dict):
-        return "请求体必须是 JSON 对象", 400
+        return JSON_OBJECT_REQUIRED, 400
     id = payload.get("id")
     system_message = payload.get("system_message")
     user_message = payload.get("user_message")
     preserve = payload.get("preserve")
     provider = payload.get("provider")
     model = payload.get("model")
+    messages = payload.get("messages")
 
-    return _chat_using_parameters(id, system_message, user_message, preserve, provider, model)
+    return _chat_using_parameters(id, system_message, user_message, preserve, provider, model, messages)
 
 
 @app.route("/", methods=["GET"])
@@ -171,21 +217,23 @@ def process_chat_request_get():
     preserve = request.args.get("preserve")
     provider = request.args.get("provider")
     model = request.args.get("model")
+    messages = load_messages_parameter(request.args.get("messages"))
 
-    return _chat_using_parameters(id, system_message, user_message, preserve, provider, model)
+    return _chat_using_parameters(id, system_message, user_message, preserve, provider, model, messages)
 
 
 @app.route("/stream", methods=["POST"])
 def process_stream_chat_request_post():
     payload = request.get_json()
     if not isinstance(payload, dict):
-        return "请求体必须是 JSON 对象", 400
+        return JSON_OBJECT_REQUIRED, 400
     id = payload.get("id")
     system_message = payload.get("system_message")
     user_message = payload.get("user_message")
     preserve = payload.get("preserve")
     provider = payload.get("provider")
     model = payload.get("model")
+    messages = payload.get("messages")
 
     return _stream_chat_using_parameters(
         id,
@@ -194,6 +242,7 @@ def process_stream_chat_request_post():
         preserve,
         provider,
         model,
+        messages,
     )
 
 
@@ -205,6 +254,7 @@ def process_stream_chat_request_get():
     preserve = request.args.get("preserve")
     provider = request.args.get("provider")
     model = request.args.get("model")
+    messages = load_messages_parameter(request.args.get("messages"))
 
     return _stream_chat_using_parameters(
         id,
@@ -213,4 +263,23 @@ def process_stream_chat_request_get():
         preserve,
         provider,
         model,
+        messages,
+    )
+
+
+@app.route("/fork", methods=["POST"])
+def process_fork_request_post():
+    payload = request.get_json()
+    if not isinstance(payload, dict):
+        return JSON_OBJECT_REQUIRED, 400
+
+    return _fork_using_parameters(payload.get("id"), payload.get("new_id"), payload.get("system_message"))
+
+
+@app.route("/fork", methods=["GET"])
+def process_fork_request_get():
+    return _fork_using_parameters(
+        request.args.get("id"),
+        request.args.get("new_id"),
+        request.args.get("system_message"),
     )
@@ -13,13 +13,20 @@ if not hasattr(typing, "override"):
 from api.api_factory import ApiFactory, ManualModelSelectionError
 from api.base_api import BaseApi
 from api.chat_completion import ChatCompletion
+from api.circuit_breaker import CircuitBreakerSettings
 from api.doubao import Doubao
 from api.fallback_api import FallbackApi
+from api.http_pool import HttpPoolSettings
+from api.key_balancing import KeyBalancing
 from api.kimi import Kimi
 from api.param_schema import ParamType, ProviderParam
 from api.provider_fallback_api import ProviderFallbackApi
+from api.rate_limiting import RateLimit
+from api.retry_policy import RetryPolicy
 from api.retrying_api import ProviderSwitchEvent, RetryingApi
+from api.routing import RoutingSettings
 from models.session_manager import SessionManager
+from models.session_pool import SessionPoolSettings
 
 
 class FakeProvider(BaseApi):
@@ -78,9 +85,25 @@ class ApiFactoryProviderChainTest(unittest.TestCase):
             "p2": FakeProvider,
             "p3": FakeProvider,
         }
+        factory._settings_classes = {}
+        factory._register_settings_classes()
+        factory._settings = {}
         factory._credentials_path = "credentials.config"
         factory._reload_lock = threading.RLock()
         factory._last_config_hash = None
+        factory._manual_clients = {}
+        factory._manual_clients_lock = threading.Lock()
+        factory._circuit_breakers = {}
+        factory._circuit_breakers_lock = threading.Lock()
+        factory._target_stats = {}
+        factory._target_stats_lock = threading.Lock()
+        factory._hedgers = {}
+        factory._hedgers_lock = threading.Lock()
+        factory._key_balancers = {}
+        factory._key_balancers_lock = threading.Lock()
+        factory._rate_limiters = {}
+        factory._rate_limiters_lock = threading.Lock()
+        factory._reload_used_keys = None
         return factory
 
     def test_parse_designated_providers_normalizes_and_validates_list(self) -> None:
@@ -138,6 +161,206 @@ class ApiFactoryProviderChainTest(unittest.TestCase):
         self.assertEqual(factory._credentials["p1"], {"api_key": "key-1", "model": "model-1"})
         self.assertEqual(factory._credentials["p2"], {"api_key": "key-2", "model": "model-2"})
 
+    def test_load_config_reads_per_provider_retry_policy(self) -> None:
+        factory = self.make_factory()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            previous_cwd = os.getcwd()
+            os.chdir(temp_dir)
+            try:
+                with open("credentials.config", "w", encoding="utf-8") as config_file:
+                    config_file.write(
+                        "\n".join([
+                            "[designated_provider]",
+                            "PROVIDER = p1,p2",
+                            "",
+                            "[P1]",
+                            "API_KEY = key-a,key-b",
+                            "MODEL = model-1",
+                            "RETRY_STRATEGY = full_jitter",
+                            "RETRY_MAX_RETRIES = 2",
+                            "RETRY_MAX_DELAY = 30",
+                            "",
+                            "[P2]",
+                            "API_KEY = key-2",
+                            "MODEL = model-2",
+                        ])
+                    )
+
+                factory._load_config()
+                factory._register_designated_provider()
+
+                with open("credentials.config", "a", encoding="utf-8") as config_file:
+                    config_file.write("\nRETRY_STRATEGY = linear\n")
+                with self.assertRaisesRegex(ValueError, r"服务商 \[P2\] 配置错误:\n  - retry_strategy must be one of"):
+                    factory._load_config()
+            finally:
+                os.chdir(previous_cwd)
+
+        self.assertEqual(factory._credentials["p1"], {"api_key": "key-a,key-b", "model": "model-1"})
+        expected = RetryPolicy(strategy=RetryPolicy.FULL_JITTER, max_retries=2, max_delay=30.0)
+        self.assertEqual([entry.client.policy for entry in factory.get_client("p1").entries], [expected, expected])
+        self.assertEqual(factory.get_client("p2").policy, RetryPolicy())
+
+    def test_load_config_reads_key_balancing_and_shares_balancer(self) -> None:
+        factory = self.make_factory()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            previous_cwd = os.getcwd()
+            os.chdir(temp_dir)
+            try:
+                with open("credentials.config", "w", encoding="utf-8") as config_file:
+                    config_file.write(
+                        "\n".join([
+                            "[designated_provider]",
+                            "PROVIDER = p1,p2",
+                            "",
+                            "[P1]",
+                            "API_KEY = key-a,key-b",
+                            "MODEL = model-1,model-2",
+                            "KEY_BALANCING = weighted",
+                            "API_KEY_WEIGHTS = 3,1",
+                            "",
+                            "[P2]",
+                            "API_KEY = key-2",
+                            "MODEL = model-2",
+                            "KEY_BALANCING = round_robin",
+                        ])
+                    )
+
+                factory._load_config()
+                factory._register_designated_provider()
+                manual_client = factory.get_client("p1", "model-2")
+
+                with open("credentials.config", "a", encoding="utf-8") as config_file:
+                    config_file.write("\nAPI_KEY_WEIGHTS = 1,2\n")
+                with self.assertRaisesRegex(ValueError, r"服务商 \[P2\] 配置错误:\n  - api_key_weights must list one weight per api_key"):
+                    factory._load_config()
+            finally:
+                os.chdir(previous_cwd)
+
+        self.assertEqual(factory._credentials["p1"], {"api_key": "key-a,key-b", "model": "model-1,model-2"})
+        provider_client = factory.get_client("p1")
+        self.assertEqual(provider_client.balancer.balancing, KeyBalancing(KeyBalancing.WEIGHTED, (3, 1)))
+        self.assertIs(factory.get_client().entries[0].client.balancer, provider_client.balancer)
+        self.assertIs(manual_client.balancer, provider_client.balancer)
+        # 只有一个 API Key 时均衡策略不起作用
+        self.assertIsInstance(factory.get_client("p2"), RetryingApi)
+
+    def test_load_config_reads_rate_limits_and_shares_limiters(self) -> None:
+        factory = self.make_factory()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            previous_cwd = os.getcwd()
+            os.chdir(temp_dir)
+            try:
+                with open("credentials.config", "w", encoding="utf-8") as config_file:
+                    config_file.write(
+                        "\n".join([
+                            "[designated_provider]",
+                            "PROVIDER = p1,p2",
+                            "",
+                            "[P1]",
+                            "API_KEY = key-a,key-b",
+                            "MODEL = model-1,model-2",
+                            "RATE_LIMIT_RPM = 60",
+                            "RATE_LIMIT_TPM = 100000",
+                            "",
+                            "[P2]",
+                            "API_KEY = key-2",
+                            "MODEL = model-2",
+                            "RATE_LIMIT_RPM = 10",
+                            "RATE_LIMIT_MAX_WAIT = 0",
+                        ])
+                    )
+
+                factory._load_config()
+                factory._register_designated_provider()
+                manual_client = factory.get_client("p1", "model-2")
+
+                with open("credentials.config", "a", encoding="utf-8") as config_file:
+                    config_file.write("\nRATE_LIMIT_TPM = -1\n")
+                with self.assertRaisesRegex(ValueError, r"服务商 \[P2\] 配置错误:\n  - rate_limit_tpm must not be negative"):
+                    factory._load_config()
+            finally:
+                os.chdir(previous_cwd)
+
+        self.assertEqual(factory._credentials["p1"], {"api_key": "key-a,key-b", "model": "model-1,model-2"})
+        provider_client = factory.get_client("p1")
+        limiters = [entry.limiter for entry in provider_client.entries]
+        self.assertEqual({limiter.limit for limiter in limiters}, {RateLimit(rpm=60, tpm=100000)})
+        self.assertEqual(len({id(limiter) for limiter in limiters}), 4)
+        self.assertIs(factory.get_client().entries[0].client.entries[0].limiter, limiters[0])
+        # 额度不足时的等待交给最外层的服务商回退链
+        self.assertTrue(provider_client.waits_for_capacity)
+        self.assertFalse(factory.get_client().entries[0].client.waits_for_capacity)
+        # 手动选择 model-2 时与回退链共用 key-a:model-2 和 key-b:model-2 的额度
+        self.assertEqual([entry.limiter for entry in manual_client.entries], [limiters[1], limiters[3]])
+        # 启用限流后单个 API Key/模型也经过回退链
+        single_client = factory.get_client("p2")
+        self.assertIsInstance(single_client, FallbackApi)
+        self.assertEqual(single_client.entries[0].limiter.limit, RateLimit(rpm=10, max_wait=0.0))
+
+    def test_load_config_parses_and_applies_http_pool_section(self) -> None:
+        factory = self.make_factory()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            previous_cwd = os.getcwd()
+            os.chdir(temp_dir)
+            try:
+                base_lines = [
+                    "[designated_provider]",
+                    "PROVIDER = p1",
+                    "",
+                    "[P1]",
+                    "API_KEY = key-1",
+                    "MODEL = model-1",
+                    "",
+                    "[http_pool]",
+                ]
+                with open("credentials.config", "w", encoding="utf-8") as config_file:
+                    config_file.write("\n".join(base_lines + ["POOL_SIZE = 8"]))
+
+                with patch("api.api_factory.http_pool.configure") as configure:
+                    factory._load_config()
+
+                with open("credentials.config", "w", encoding="utf-8") as config_file:
+                    config_file.write("\n".join(base_lines + ["POOL_SIZE = 0"]))
+
+                with self.assertRaisesRegex(ValueError, "http_pool"):
+                    factory._load_config()
+            finally:
+                os.chdir(previous_cwd)
+
+        applied = configure.call_args.args[0]
+        self.assertEqual(applied, HttpPoolSettings(pool_size=8))
+        self.assertIs(factory.get_settings("http_pool"), applied)
+
+    def test_registered_settings_sections_load_from_current_config_and_reload(self) -> None:
+        factory = self.make_factory()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            previous_cwd = os.getcwd()
+            os.chdir(temp_dir)
+            try:
+                base_lines = ["[designated_provider]", "PROVIDER = p1", "", "[P1]", "API_KEY = key-1", "MODEL = model-1", ""]
+                with open("credentials.config", "w", encoding="utf-8") as config_file:
+                    config_file.write("\n".join(base_lines + ["[session_pool]", "MAX_SESSIONS = 5"]))
+                factory._load_config()
+
+                with self.assertRaisesRegex(ValueError, "未知配置段"):
+                    factory.get_settings(SessionPoolSettings.SECTION_NAME)
+                factory.register_settings_classes(SessionManager.SETTINGS_CLASSES)
+                self.assertEqual(factory.get_settings(SessionPoolSettings.SECTION_NAME).max_sessions, 5)
+
+                with open("credentials.config", "w", encoding="utf-8") as config_file:
+                    config_file.write("\n".join(base_lines + ["[session_pool]", "MAX_SESSIONS = 7"]))
+                factory._load_config()
+            finally:
+                os.chdir(previous_cwd)
+
+        self.assertEqual(factory.get_settings(SessionPoolSettings.SECTION_NAME).max_sessions, 7)
+
     def test_load_config_supports_named_chat_completion_provider(self) -> None:
         factory = self.make_factory()
 
@@ -268,6 +491,67 @@ class ApiFactoryProviderChainTest(unittest.TestCase):
         self.assertIsInstance(factory.get_client("p2"), RetryingApi)
         self.assertEqual(factory.list_providers(), ["p1", "p2"])
 
+    def test_circuit_breakers_are_shared_per_target_across_clients(self) -> None:
+        factory = self.make_factory()
+        factory._credentials.update({
+            "p1": {"api_key": "key-1,key-2", "model": "model-1"},
+            "p2": {"api_key": "key-3", "model": "model-3"},
+        })
+        factory._set_designated_providers(["p1", "p2"])
+        factory._settings = {"circuit_breaker": CircuitBreakerSettings(enabled=True)}
+
+        factory._register_designated_provider()
+
+        chain = factory.get_client()
+        provider_client = factory.get_client("p1")
+        self.assertEqual([entry.breaker.target for entry in chain.entries], ["p1", "p2"])
+        self.assertEqual(
+            [entry.breaker for entry in chain.entries[0].client.entries],
+            [entry.breaker for entry in provider_client.entries],
+        )
+        self.assertIsNot(provider_client.entries[0].breaker, provider_client.entries[1].breaker)
+        first_target = provider_client.entries[0].target
+        self.assertIs(factory._circuit_breaker("p1", first_target, "key-1"), provider_client.entries[0].breaker)
+        self.assertIsNot(factory._circuit_breaker("p1", first_target, "rotated"), provider_client.entries[0].breaker)
+
+    def test_latency_routing_reads_live_settings_and_shares_target_stats(self) -> None:
+        factory = self.make_factory()
+        factory._credentials.update({
+            "p1": {"api_key": "key-1", "model": "model-1,model-2"},
+            "p2": {"api_key": "key-3", "model": "model-3"},
+        })
+        factory._set_designated_providers(["p1", "p2"])
+
+        factory._register_designated_provider()
+
+        chain = factory.get_client()
+        provider_client = factory.get_client("p1")
+        self.assertEqual([entry.stats.target for entry in chain.entries], ["p1", "p2"])
+        self.assertEqual(
+            [entry.stats for entry in chain.entries[0].client.entries],
+            [entry.stats for entry in provider_client.entries],
+        )
+        self.assertFalse(provider_client.routing_settings().latency_routing)
+        factory._settings = {"routing": RoutingSettings(mode="latency")}
+        self.assertTrue(provider_client.routing_settings().latency_routing)
+        self.assertTrue(chain.routing_settings().latency_routing)
+
+    def test_hedgers_are_shared_per_chain_and_reported_in_stats(self) -> None:
+        factory = self.make_factory()
+        factory._credentials.update({
+            "p1": {"api_key": "key-1,key-2", "model": "model-1"},
+            "p2": {"api_key": "key-3", "model": "model-3"},
+        })
+        factory._set_designated_providers(["p1", "p2"])
+
+        factory._register_designated_provider()
+
+        chain = factory.get_client()
+        self.assertIs(chain.hedger, factory._hedger("provider-chain"))
+        self.assertIs(chain.entries[0].client.hedger, factory.get_client("p1").hedger)
+        self.assertEqual(set(factory.hedging_stats()), {"provider-chain", "p1"})
+        self.assertEqual(factory.hedging_stats()["p1"]["hedged"], 0)
+
     def test_manual_model_selection_uses_only_requested_model_and_keeps_api_key_fallback(self) -> None:
         factory = self.make_factory()
         factory._config.read_string(
@@ -292,6 +576,22 @@ class ApiFactoryProviderChainTest(unittest.TestCase):
         )
         self.assertNotIn("p3", factory._clients)
 
+    def test_manual_model_selection_reuses_one_client_per_provider_and_model(self) -> None:
+        factory = self.make_factory()
+        factory._config.read_string(
+            "\n".join([
+                "[P1]",
+                "API_KEY = key-1",
+                "MODEL = model-1,model-2",
+            ])
+        )
+
+        first = factory.get_client("p1", "model-2")
+
+        self.assertIs(factory.get_client(" P1 ", "model-2 "), first)
+        self.assertIsNot(factory.get_client("p1", "model-1"), first)
+        self.assertEqual(first.client.model, "model-2")
+
     def test_manual_model_selection_does_not_replace_automatic_clients(self) -> None:
         factory = self.make_factory()
         factory._credentials["p1"] = {
@@ -510,6 +810,7 @@ class ApiFactoryProviderChainTest(unittest.TestCase):
                     factory.list_available_provider_models(),
                     [{"id": "p1", "models": ["model-1"]}],
                 )
+                manual_before_reload = factory.get_client("p1", "model-1")
 
                 self._write_credentials(
                     "\n".join([
@@ -543,6 +844,72 @@ class ApiFactoryProviderChainTest(unittest.TestCase):
         manual_client = factory.get_client("p1", "model-extra")
         self.assertIsInstance(manual_client, RetryingApi)
         self.assertEqual(manual_client.client.model, "model-extra")
+        self.assertIsNot(factory.get_client("p1", "model-1"), manual_before_reload)
+
+    def test_reload_credentials_drops_state_of_removed_targets(self) -> None:
+        factory = self.make_factory()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            previous_cwd = os.getcwd()
+            os.chdir(temp_dir)
+            try:
+                self._write_credentials(
+                    "\n".join([
+                        "[designated_provider]",
+                        "PROVIDER = p1,p2",
+                        "",
+                        "[P1]",
+                        "API_KEY = key-1,key-2",
+                        "MODEL = model-1,model-2",
+                        "KEY_BALANCING = round_robin",
+                        "RATE_LIMIT_RPM = 60",
+                        "",
+                        "[P2]",
+                        "API_KEY = key-3",
+                        "MODEL = model-3",
+                    ])
+                )
+                factory._load_config()
+                factory._register_designated_provider()
+                factory._last_config_hash = factory._hash_file("credentials.config")
+                kept_breaker = factory._circuit_breaker("p1", "api_key#1:model-1", "key-1")
+                kept_stats = factory._routing_stats("p1", "api_key#1:model-1", "key-1")
+
+                self._write_credentials(
+                    "\n".join([
+                        "[designated_provider]",
+                        "PROVIDER = p1",
+                        "",
+                        "[P1]",
+                        "API_KEY = key-1,key-2",
+                        "MODEL = model-1",
+                        "KEY_BALANCING = round_robin",
+                        "RATE_LIMIT_RPM = 60",
+                    ])
+                )
+                reloaded = factory.reload_credentials()
+            finally:
+                os.chdir(previous_cwd)
+
+        self.assertTrue(reloaded)
+        self.assertEqual(set(factory._circuit_breakers), {
+            ("p1", "api_key#1:model-1", "key-1"),
+            ("p1", "api_key#2:model-1", "key-2"),
+        })
+        self.assertEqual(set(factory._target_stats), set(factory._circuit_breakers))
+        self.assertEqual(set(factory._hedgers), {"p1"})
+        self.assertEqual(set(factory.hedging_stats()), {"p1"})
+        self.assertEqual(
+            {(provider, api_keys) for provider, api_keys, _ in factory._key_balancers},
+            {("p1", ("key-1", "key-2"))},
+        )
+        self.assertEqual(
+            {(provider, api_key, model) for provider, api_key, model, _ in factory._rate_limiters},
+            {("p1", "key-1", "model-1"), ("p1", "key-2", "model-1")},
+        )
+        # 仍在配置中的目标保留原有状态
+        self.assertIs(factory._circuit_breakers[("p1", "api_key#1:model-1", "key-1")], kept_breaker)
+        self.assertIs(factory._target_stats[("p1", "api_key#1:model-1", "key-1")], kept_stats)
 
     def test_reload_credentials_keeps_previous_config_when_invalid(self) -> None:
         factory = self.make_factory()
@@ -868,6 +1235,49 @@ class CredentialsWatcherTest(unittest.TestCase):
 
         self.assertFalse(thread.is_alive())
 
+    def test_on_reloaded_runs_only_when_config_was_replaced(self) -> None:
+        from api.credentials_watcher import start_credentials_watcher
+        from watchfiles import Change
+
+        results = [False, True]
+        notified: list[int] = []
+        done = threading.Event()
+
+        class FakeFactory:
+            def reload_credentials(self) -> bool:
+                result = results.pop(0)
+                if not results:
+                    done.set()
+                return result
+
+        stop_event = threading.Event()
+
+        def fake_watch(*_args, **_kwargs):
+            target = str(Path.cwd() / "credentials.config")
+            yield {(Change.modified, target)}
+            yield {(Change.modified, target)}
+            stop_event.set()
+            return
+            yield
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            previous_cwd = os.getcwd()
+            os.chdir(temp_dir)
+            try:
+                with patch("api.credentials_watcher.watch", side_effect=fake_watch):
+                    thread = start_credentials_watcher(
+                        FakeFactory(),
+                        credentials_path="credentials.config",
+                        stop_event=stop_event,
+                        on_reloaded=lambda: notified.append(1),
+                    )
+                    self.assertTrue(done.wait(timeout=2))
+                    thread.join(timeout=2)
+            finally:
+                os.chdir(previous_cwd)
+
+        self.assertEqual(notified, [1])
+
     def test_watcher_continues_after_reload_raises(self) -> None:
         from api.credentials_watcher import start_credentials_watcher
         from watchfiles import Change
@@ -0,0 +1,290 @@
+import asyncio
+import importlib
+import json
+import sys
+import typing
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from test_web_server import FakeSession, FakeSessionManager
+
+
+class AsyncFakeSession(FakeSession):
+    async def chat_async(self, question: str, **kwargs) -> str:
+        return self.chat(question, **kwargs)
+
+    async def chat_stream_async(self, question: str, **kwargs):
+        for chunk in self.chat_stream(question, **kwargs):
+            yield chunk
+
+
+class AsyncFakeSessionManager(FakeSessionManager):
+    def get_or_create_session(self, id=None, provider=None, model=None):
+        self.requests.append((id, provider, model))
+        session_id = id or "generated"
+        if session_id not in self.pool:
+            self.pool[session_id] = AsyncFakeSession(session_id, provider, model)
+        return self.pool[session_id]
+
+    async def get_or_create_session_async(self, id=None, provider=None, model=None):
+        return self.get_or_create_session(id, provider, model)
+
+    async def fork_session_async(self, id, new_id=None, system_message=None):
+        return self.fork_session(id, new_id, system_message)
+
+    async def stats_async(self):
+        return self.stats()
+
+    async def stateless_client_async(self, provider=None, model=None):
+        return self.stateless_client(provider, model)
+
+
+class AsgiServerTest(unittest.IsolatedAsyncioTestCase):
+    def load_server_module(self):
+        sys.modules.pop("server.asgi", None)
+        with patch("models.session_manager.SessionManager", AsyncFakeSessionManager):
+            module = importlib.import_module("server.asgi")
+        self.addCleanup(lambda: sys.modules.pop("server.asgi", None))
+        return module
+
+    async def make_client(self):
+        asgi = self.load_server_module()
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=asgi.app),
+            base_url="http://testserver",
+        )
+        self.addAsyncCleanup(client.aclose)
+        return asgi, client
+
+    def parse_sse_events(self, response) -> list[dict]:
+        return [
+            json.loads(line.removeprefix("data: "))
+            for line in response.text.splitlines()
+            if line.startswith("data: ")
+        ]
+
+    async def test_post_chat_preserves_history_and_passes_provider(self) -> None:
+        asgi, client = await self.make_client()
+
+        response = await client.post("/", json={
+            "id": "s1",
+            "system_message": "system",
+            "user_message": "hello",
+            "preserve": True,
+            "provider": "p1",
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, "preserve:hello:p1")
+        session = asgi.sm.pool["s1"]
+        self.assertEqual(session.adjusted_system_messages, ["system"])
+        self.assertEqual(session.chat_preserving_history_calls, ["hello"])
+
+    async def test_get_chat_without_preserve_uses_chat_once(self) -> None:
+        asgi, client = await self.make_client()
+
+        response = await client.get("/?id=s2&user_message=hello&provider=p2")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, "once:hello:p2")
+        self.assertEqual(asgi.sm.pool["s2"].chat_once_calls, ["hello"])
+
+    async def test_parameter_errors_return_400_before_session_lookup(self) -> None:
+        asgi, client = await self.make_client()
+
+        for path in ["/", "/stream"]:
+            with self.subTest(path=path):
+                self.assertEqual((await client.post(path, json={})).status_code, 400)
+                self.assertEqual((await client.post(path, json=[])).status_code, 400)
+                response = await client.post(path, json={"user_message": "hello", "model": "m"})
+                self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(asgi.sm.requests, [])
+
+    async def test_manual_selection_error_returns_400(self) -> None:
+        asgi, client = await self.make_client()
+
+        def fail_selection(id=None, provider=None, model=None):
+            raise asgi.ManualModelSelectionError("model unavailable")
+
+        asgi.sm.get_or_create_session = fail_selection
+
+        for path in ["/", "/stream"]:
+            with self.subTest(path=path):
+                response = await client.post(path, json={
+                    "user_message": "hello",
+                    "provider": "p1",
+                    "model": "model-1",
+                })
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.text, "model unavailable")
+
+    async def test_inspect_models_stats_and_help(self) -> None:
+        asgi, client = await self.make_client()
+        asgi.sm.get_or_create_session("s1", provider="p1")
+
+        inspect = await client.get("/inspect")
+        models = await client.get("/models")
+        with patch.object(asgi.http_pool, "get_stats", return_value={"hits": 1}):
+            stats = await client.get("/stats")
+        help_response = await client.get("/help")
+
+        self.assertEqual(inspect.json(), [{
+            "id": "s1",
+            "messages": [{"role": "user", "content": "stored"}],
+            "compaction": {"compactions": 0},
+            "admission": {"waiting": 0},
+        }])
+        self.assertEqual(models.json()["providers"][0], {"id": "p1", "models": ["model-1", "model-2"]})
+        self.assertEqual(stats.json(), {
+            "http_pool": {"hits": 1},
+            "sessions": {"sessions": 1},
+            "hedging": {"p1": {"hedged": 0}},
+        })
+        self.assertIn("provider", help_response.text)
+        self.assertEqual((await client.post("/models")).status_code, 405)
+        self.assertEqual((await client.get("/missing")).status_code, 404)
+
+    async def test_cross_origin_and_preflight_headers(self) -> None:
+        _, client = await self.make_client()
+
+        response = await client.get("/help", headers={"Origin": "http://intranet.example"})
+        preflight = await client.options("/", headers={
+            "Origin": "http://intranet.example",
+            "Access-Control-Request-Method": "POST",
+            "Access-Control-Request-Headers": "Content-Type",
+        })
+
+        self.assertEqual(response.headers["Access-Control-Allow-Origin"], "http://intranet.example")
+        self.assertEqual(preflight.status_code, 200)
+        self.assertIn("POST", preflight.headers["Access-Control-Allow-Methods"])
+        self.assertIn("Content-Type", preflight.headers["Access-Control-Allow-Headers"])
+
+    async def test_post_stream_returns_sse_events(self) -> None:
+        asgi, client = await self.make_client()
+
+        response = await client.post("/stream", json={
+            "id": "s-stream",
+            "system_message": "system",
+            "user_message": "hello",
+            "preserve": True,
+            "provider": "p1",
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Type"], "text/event-stream; charset=utf-8")
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        self.assertEqual(response.headers["X-Accel-Buffering"], "no")
+        self.assertEqual(self.parse_sse_events(response), [
+            {"type": "session", "id": "s-stream"},
+            {"type": "delta", "content": "stream:"},
+            {"type": "delta", "content": "hello"},
+            {"type": "done", "preserved": True},
+        ])
+        self.assertEqual(asgi.sm.pool["s-stream"].chat_stream_calls, [("hello", True, "system")])
+
+    async def test_busy_session_is_rejected_with_admission_status(self) -> None:
+        _, client = await self.make_client()
+
+        busy = await client.post("/", json={"id": "s1", "user_message": "hello", "provider": "busy"})
+        queue_full = await client.get("/stream?id=s2&user_message=hello&provider=queue-full")
+
+        self.assertEqual((busy.status_code, busy.text), (409, "会话正忙"))
+        self.assertEqual((queue_full.status_code, queue_full.text), (429, "排队已满"))
+
+    async def test_fork_creates_session_and_maps_errors_to_status_codes(self) -> None:
+        asgi, client = await self.make_client()
+        await client.get("/?id=s1&user_message=hello&provider=p1")
+
+        forked = await client.post("/fork", json={"id": "s1", "new_id": "s1-b"})
+        missing = await client.get("/fork?id=missing")
+        taken = await client.get("/fork?id=s1&new_id=s1-b")
+        invalid = await client.post("/fork", json={"id": "s1", "new_id": 1})
+
+        self.assertEqual(forked.json(), {"id": "s1-b", "parent": "s1"})
+        self.assertIsInstance(asgi.sm.pool["s1-b"], AsyncFakeSession)
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual((taken.status_code, taken.text), (409, "会话 s1-b 已存在"))
+        self.assertEqual((invalid.status_code, invalid.text), (400, "参数 'new_id' 必须是字符串"))
+
+    async def test_messages_array_bypasses_sessions(self) -> None:
+        asgi, client = await self.make_client()
+        messages = [{"role": "user", "content": "hello"}]
+
+        answer = await client.get("/", params={"messages": json.dumps(messages), "provider": "p2"})
+        stream = await client.post("/stream", json={"messages": messages})
+        empty = await client.post("/", json={"messages": []})
+
+        self.assertEqual(answer.text, "stateless:hello:p2")
+        self.assertEqual(self.parse_sse_events(stream), [
+            {"type": "delta", "content": "stateless:"},
+            {"type": "delta", "content": "hello"},
+            {"type": "done", "preserved": False},
+        ])
+        self.assertEqual((empty.status_code, empty.text), (400, "参数 'messages' 必须是非空的消息数组"))
+        self.assertEqual((asgi.sm.pool, asgi.sm.requests), ({}, []))
+
+    async def test_stream_failures_before_and_after_first_chunk(self) -> None:
+        _, client = await self.make_client()
+
+        before = await client.get("/stream?user_message=hello&provider=fail-before-chunk")
+        after = await client.get("/stream?id=s-after&user_message=hello&provider=fail-after-chunk")
+
+        self.assertEqual(before.status_code, 502)
+        self.assertEqual(before.text, "模型流式调用失败")
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(self.parse_sse_events(after)[-1], {
+            "type": "error",
+            "code": "upstream_interrupted",
+            "message": "模型流式响应中断",
+        })
+
+    async def test_client_disconnect_stops_reading_upstream(self) -> None:
+        asgi = self.load_server_module()
+        upstream_closed = asyncio.Event()
+        release = asyncio.Event()
+
+        class SlowSession(AsyncFakeSession):
+            async def chat_stream_async(self, question: str, **kwargs):
+                try:
+                    yield "first"
+                    await release.wait()
+                    yield "never-sent"
+                finally:
+                    upstream_closed.set()
+
+        asgi.sm.pool["slow"] = SlowSession("slow", None, None)
+        sent: list[dict] = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            if not sent:
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if message["type"] == "http.response.body" and b"first" in message.get("body", b""):
+                disconnect.set()
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/stream",
+            "query_string": b"id=slow&user_message=hi",
+            "headers": [],
+        }
+        await asyncio.wait_for(asgi.app(scope, receive, send), timeout=2)
+
+        self.assertTrue(upstream_closed.is_set())
+        self.assertFalse(any(b"never-sent" in message.get("body", b"") for message in sent))
+
+
+if __name__ == "__main__":
+    unittest.main()
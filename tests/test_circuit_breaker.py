@@ -0,0 +1,309 @@
+import typing
+import unittest
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from api.base_api import BaseApi
+from api.circuit_breaker import CircuitBreaker, CircuitBreakerSettings, CircuitOpenError
+from api.fallback_api import FallbackApi, FallbackEntry
+from api.provider_errors import ContextLengthError, ProviderHTTPError
+from api.provider_fallback_api import ProviderFallbackApi, ProviderFallbackEntry
+from api.retrying_api import (
+    CircuitBreakerEvent,
+    FeishuNotifier,
+    ProviderFallbackEvent,
+    ProviderSwitchEvent,
+)
+from test_retrying_api import FakeResponse
+
+SETTINGS = CircuitBreakerSettings(
+    enabled=True,
+    failure_rate_threshold=0.5,
+    minimum_requests=2,
+    window_size=4,
+    cool_down_seconds=10.0,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class ToggleClient(BaseApi):
+    def __init__(self, name: str, healthy: bool = True) -> None:
+        self.name = name
+        self.healthy = healthy
+        self.calls = 0
+
+    def reason(self, messages: list[dict[str, str]]) -> str:
+        self.calls += 1
+        if not self.healthy:
+            raise RuntimeError(f"{self.name} down")
+        return self.name
+
+    def reason_stream(self, messages: list[dict[str, str]]):
+        yield self.reason(messages)
+        yield "tail"
+
+
+def make_breaker(clock: FakeClock, events: list, settings: CircuitBreakerSettings = SETTINGS) -> CircuitBreaker:
+    return CircuitBreaker("p1", "api_key#1", lambda: settings, failure_handlers=[events.append], clock=clock)
+
+
+def transitions(events: list) -> list[tuple[str, str, str]]:
+    return [
+        (event.target, event.from_state, event.to_state)
+        for event in events
+        if isinstance(event, CircuitBreakerEvent)
+    ]
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_on_failure_rate_and_probes_after_cool_down(self) -> None:
+        clock = FakeClock()
+        events = []
+        breaker = make_breaker(clock, events)
+
+        breaker.record_success()
+        breaker.record_failure(RuntimeError("down"))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        clock.now = 10.0
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_failure(RuntimeError("still down"))
+        self.assertFalse(breaker.allow_request())
+
+        clock.now = 20.0
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.notify()
+
+        self.assertEqual(
+            [(event.from_state, event.to_state) for event in events],
+            [("closed", "open"), ("open", "half_open"), ("half_open", "open"), ("open", "half_open"), ("half_open", "closed")],
+        )
+        self.assertEqual(events[0].failure_rate, 0.5)
+
+    def test_context_length_errors_and_disabled_settings_do_not_count(self) -> None:
+        clock = FakeClock()
+        events = []
+        breaker = make_breaker(clock, events)
+        for _ in range(3):
+            breaker.record_failure(ContextLengthError("too long", status_code=400))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+        disabled = make_breaker(clock, events, CircuitBreakerSettings())
+        for _ in range(10):
+            disabled.record_failure(RuntimeError("down"))
+        self.assertTrue(disabled.allow_request())
+        self.assertEqual(events, [])
+
+    def test_invalid_request_errors_return_half_open_probe_without_counting(self) -> None:
+        clock = FakeClock()
+        events = []
+        breaker = make_breaker(clock, events)
+        invalid_request = ProviderHTTPError(
+            "bad request",
+            status_code=400,
+            body='{"error": {"type": "invalid_request_error", "message": "messages must not be empty"}}',
+        )
+        for _ in range(3):
+            breaker.record_failure(invalid_request)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+        breaker.record_failure(RuntimeError("down"))
+        breaker.record_failure(ProviderHTTPError("unavailable", status_code=503))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        clock.now = 10.0
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure(invalid_request)
+        # 试探请求本身有误，归还名额，熔断器保持半开等待下一个试探
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+
+    def test_settings_validation(self) -> None:
+        is_valid, errors = CircuitBreakerSettings.validate_config({
+            "failure_rate_threshold": 1.5,
+            "minimum_requests": 10,
+            "window_size": 5,
+            "cool_down_seconds": 0.0,
+        })
+
+        self.assertFalse(is_valid)
+        self.assertEqual(errors, [
+            "failure_rate_threshold must be greater than 0 and at most 1",
+            "window_size must not be less than minimum_requests",
+            "cool_down_seconds must be greater than 0",
+        ])
+
+
+class FallbackCircuitBreakerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.events = []
+
+    def entry(self, client: ToggleClient) -> FallbackEntry:
+        breaker = CircuitBreaker(
+            "p1", client.name, lambda: SETTINGS, failure_handlers=[self.events.append], clock=self.clock
+        )
+        return FallbackEntry(client.name, client, breaker=breaker)
+
+    def test_open_entry_is_skipped_until_cool_down_ends(self) -> None:
+        primary = ToggleClient("primary", healthy=False)
+        backup = ToggleClient("backup")
+        chain = FallbackApi("p1", [self.entry(primary), self.entry(backup)])
+
+        for _ in range(4):
+            self.assertEqual(chain.reason([]), "backup")
+
+        self.assertEqual(primary.calls, 2)
+        self.assertEqual(transitions(self.events), [("primary", "closed", "open")])
+
+        primary.healthy = True
+        self.clock.now = 10.0
+        self.assertEqual(chain.reason([]), "primary")
+        self.assertEqual(transitions(self.events)[-2:], [
+            ("primary", "open", "half_open"),
+            ("primary", "half_open", "closed"),
+        ])
+
+    def test_all_entries_open_fails_fast_without_fallback_event(self) -> None:
+        clients = [ToggleClient("a", healthy=False), ToggleClient("b", healthy=False)]
+        chain = FallbackApi("p1", [self.entry(client) for client in clients], failure_handlers=[self.events.append])
+
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                chain.reason([])
+        fallback_events = len(self.events)
+
+        with self.assertRaises(CircuitOpenError):
+            chain.reason([])
+
+        self.assertEqual([client.calls for client in clients], [2, 2])
+        self.assertEqual(len(self.events), fallback_events)
+
+    def test_abandoned_stream_returns_half_open_probe(self) -> None:
+        primary = ToggleClient("primary", healthy=False)
+        chain = FallbackApi("p1", [self.entry(primary), self.entry(ToggleClient("backup"))])
+        for _ in range(2):
+            chain.reason([])
+        primary.healthy = True
+        self.clock.now = 10.0
+
+        stream = chain.reason_stream([])
+        self.assertEqual(next(stream), "primary")
+        stream.close()
+
+        self.assertEqual(chain.reason([]), "primary")
+        self.assertEqual(chain.entries[0].breaker.state, CircuitBreaker.CLOSED)
+
+
+class ProviderChainCircuitBreakerTest(unittest.TestCase):
+    def test_skips_open_provider_without_switch_notifications(self) -> None:
+        clock = FakeClock()
+        events = []
+        inner_breaker = CircuitBreaker("p1", "api_key#1", lambda: SETTINGS, clock=clock)
+        p1 = FallbackApi("p1", [FallbackEntry("api_key#1", ToggleClient("p1", healthy=False), breaker=inner_breaker)])
+        p2 = ToggleClient("p2")
+        chain = ProviderFallbackApi(
+            [
+                ProviderFallbackEntry("p1", p1, CircuitBreaker("provider-chain", "p1", lambda: SETTINGS, clock=clock)),
+                ProviderFallbackEntry("p2", p2),
+            ],
+            failure_handlers=[events.append],
+        )
+
+        for _ in range(2):
+            self.assertEqual(chain.reason([]), "p2")
+        switches = [event for event in events if isinstance(event, ProviderSwitchEvent)]
+        self.assertEqual(len(switches), 2)
+
+        self.assertEqual(chain.reason([]), "p2")
+        self.assertEqual(chain.entries[0].breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(len([event for event in events if isinstance(event, ProviderSwitchEvent)]), 2)
+
+        p2.healthy = False
+        with self.assertRaises(RuntimeError):
+            chain.reason([])
+        final = [event for event in events if isinstance(event, ProviderFallbackEvent)]
+        self.assertEqual(final[-1].providers, ["p2"])
+
+    def test_interrupted_provider_returns_half_open_probe(self) -> None:
+        clock = FakeClock()
+        p1 = ToggleClient("p1", healthy=False)
+        breaker = CircuitBreaker("provider-chain", "p1", lambda: SETTINGS, clock=clock)
+        chain = ProviderFallbackApi([ProviderFallbackEntry("p1", p1, breaker), ProviderFallbackEntry("p2", ToggleClient("p2"))])
+        for _ in range(2):
+            chain.reason([])
+        clock.now = 10.0
+
+        def interrupt(messages: list[dict[str, str]]) -> str:
+            raise KeyboardInterrupt
+
+        p1.reason = interrupt
+        with self.assertRaises(KeyboardInterrupt):
+            chain.reason([])
+        del p1.reason
+        p1.healthy = True
+
+        self.assertEqual(chain.reason([]), "p1")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+class AsyncFallbackCircuitBreakerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_async_chain_skips_open_entry_and_notifies(self) -> None:
+        clock = FakeClock()
+        events = []
+        primary = ToggleClient("primary", healthy=False)
+        entries = [
+            FallbackEntry(client.name, client, breaker=CircuitBreaker(
+                "p1", client.name, lambda: SETTINGS, failure_handlers=[events.append], clock=clock
+            ))
+            for client in (primary, ToggleClient("backup"))
+        ]
+        chain = FallbackApi("p1", entries)
+
+        for _ in range(3):
+            self.assertEqual(await chain.reason_async([]), "backup")
+
+        self.assertEqual(primary.calls, 2)
+        self.assertEqual(transitions(events), [("primary", "closed", "open")])
+
+
+class CircuitBreakerNotificationTest(unittest.TestCase):
+    def test_feishu_reports_open_and_recovery_but_not_half_open(self) -> None:
+        calls = []
+
+        def post_request(*args, **kwargs):
+            calls.append(kwargs["json"]["content"]["text"])
+            return FakeResponse()
+
+        notifier = FeishuNotifier("https://open.feishu.cn/open-apis/bot/v2/hook/test", post_request=post_request)
+        for from_state, to_state in (("closed", "open"), ("open", "half_open"), ("half_open", "closed")):
+            notifier.notify_failure(CircuitBreakerEvent(
+                provider_name="p1",
+                will_retry=False,
+                target="api_key#1:model-a",
+                from_state=from_state,
+                to_state=to_state,
+                failure_rate=0.6,
+                cool_down_seconds=30.0,
+            ))
+
+        self.assertEqual(len(calls), 2)
+        self.assertIn("大模型目标已熔断", calls[0])
+        self.assertIn("最近失败率: 60%", calls[0])
+        self.assertIn("大模型目标已恢复", calls[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import gc
+import typing
+import unittest
+import zlib
+from unittest.mock import patch
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from models import cold_storage as cold_storage_module
+from models.cold_storage import (
+    ColdStorage,
+    ColdStorageSettings,
+    HistoryCodec,
+    get_codec,
+    register_codec,
+)
+from models.message import Message
+from models.session_manager import Session
+from models.session_pool import SessionPool, SessionPoolSettings
+from test_message_session import RecordingClient
+from test_session_pool import FakeClock
+
+
+class CountingCodec(HistoryCodec):
+    name = "counting"
+
+    def __init__(self) -> None:
+        self.decompressed = 0
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        self.decompressed += 1
+        return zlib.decompress(data)
+
+
+def make_session(id: str, turns: int = 20) -> Session:
+    session = Session(id, RecordingClient(), Message("system"))
+    for index in range(turns):
+        session.messages.preserve_history(f"问题 {index}", "同样的回答内容。" * 20)
+    return session
+
+
+class ColdStorageTest(unittest.TestCase):
+    def make_pool(
+        self,
+        idle_seconds: float = 60.0,
+        codec: str = "zlib",
+        **pool_settings,
+    ) -> tuple[SessionPool, ColdStorage, FakeClock]:
+        clock = FakeClock()
+        settings = SessionPoolSettings(**{"max_memory_mb": 0, **pool_settings})
+        cold_storage = ColdStorage(lambda: ColdStorageSettings(idle_seconds=idle_seconds, codec=codec))
+        pool = SessionPool(lambda: settings, clock=clock, cold_storage=cold_storage)
+        return pool, cold_storage, clock
+
+    def test_idle_history_is_compressed_and_restored_on_next_access(self) -> None:
+        pool, cold_storage, clock = self.make_pool()
+        session = pool.add(make_session("s1"))
+        before = session.snapshot_messages()
+        plain_size = session.approximate_size()
+
+        clock.now += 61
+        pool.evict()
+
+        self.assertTrue(session.messages.is_frozen)
+        self.assertLess(session.approximate_size(), plain_size / 4)
+        stats = cold_storage.stats()
+        self.assertEqual(stats["frozen_sessions"], 1)
+        self.assertGreater(stats["compression_ratio"], 4)
+        self.assertEqual(list(before)[-1]["content"], "同样的回答内容。" * 20)
+
+        self.assertEqual(session.chat("next", preserve=True), "answer")
+
+        self.assertFalse(session.messages.is_frozen)
+        self.assertEqual(session.snapshot_messages()[:-2], before)
+        self.assertEqual(session.client.calls[-1][:-1], before)
+        gc.collect()
+        stats = cold_storage.stats()
+        self.assertEqual(stats["frozen_sessions"], 0)
+        self.assertEqual(stats["compressed_bytes"], 0)
+        self.assertEqual((stats["freezes"], stats["rehydrations"]), (1, 1))
+
+    def test_peeking_at_frozen_history_keeps_it_compressed(self) -> None:
+        pool, cold_storage, clock = self.make_pool()
+        session = pool.add(make_session("s1"))
+        before = session.snapshot_messages()
+        clock.now += 61
+        pool.evict()
+        frozen_size = session.approximate_size()
+
+        self.assertEqual(session.peek_messages(), before)
+
+        self.assertTrue(session.messages.is_frozen)
+        self.assertEqual(session.approximate_size(), frozen_size)
+        self.assertEqual(cold_storage.stats()["rehydrations"], 0)
+
+    def test_recent_busy_and_short_sessions_stay_uncompressed(self) -> None:
+        pool, cold_storage, clock = self.make_pool()
+        short = pool.add(make_session("short", turns=1))
+        busy = pool.add(make_session("busy"))
+        recent = pool.add(make_session("recent"))
+        clock.now += 61
+        recent.last_access = clock.now
+
+        with busy._conversation_lock:
+            pool.evict()
+
+        self.assertEqual(
+            [session.messages.is_frozen for session in [short, busy, recent]],
+            [False, False, False],
+        )
+        self.assertEqual(cold_storage.stats()["freezes"], 0)
+
+    def test_compression_runs_before_memory_eviction(self) -> None:
+        sizes = {}
+        for id in ["s1", "s2"]:
+            sizes[id] = make_session(id).approximate_size()
+        pool, _, clock = self.make_pool(max_memory_mb=(sizes["s1"] * 1.5) / (1024 * 1024))
+        pool.add(make_session("s1"))
+        pool.add(make_session("s2"))
+
+        clock.now += 61
+        evicted = pool.evict()
+
+        self.assertEqual(evicted, 0)
+        self.assertEqual(len(pool), 2)
+        self.assertLess(pool.stats()["approximate_memory_bytes"], sizes["s1"])
+
+    @patch.dict(cold_storage_module._CODECS)
+    @patch.dict(cold_storage_module._codec_instances)
+    def test_registered_codec_compresses_and_restores_history(self) -> None:
+        codec = CountingCodec()
+        register_codec("counting", lambda: codec)
+        pool, _, clock = self.make_pool(codec="counting")
+        session = pool.add(make_session("s1"))
+        clock.now += 61
+        pool.evict()
+
+        self.assertIs(get_codec("COUNTING"), codec)
+        self.assertEqual(len(session.snapshot_messages()), 41)
+        self.assertEqual(codec.decompressed, 1)
+
+    def test_settings_reject_unknown_codec(self) -> None:
+        is_valid, errors = ColdStorageSettings.validate_config({"idle_seconds": -1.0, "codec": "rar"})
+
+        self.assertFalse(is_valid)
+        self.assertEqual(errors[0], "idle_seconds must not be negative")
+        self.assertTrue(errors[1].startswith("codec must be one of: zlib, lzma"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,234 @@
+import asyncio
+import typing
+import unittest
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from api.base_api import BaseApi
+from api.fallback_api import FallbackApi, FallbackEntry
+from api.hedging import Hedger, HedgingSettings
+from api.provider_fallback_api import ProviderFallbackApi, ProviderFallbackEntry
+from api.rate_limiting import RateLimit, RateLimiter
+from api.retrying_api import FallbackEvent, ProviderSwitchEvent
+from api.routing import RoutingSettings, TargetStats
+
+HEDGING = HedgingSettings(enabled=True, delay_ms=20.0, max_hedge_rate=1.0)
+
+
+class SlowClient(BaseApi):
+    """Answers after a delay and records whether the request was cancelled or its stream closed."""
+
+    def __init__(self, name: str, delay: float, error: Exception | None = None) -> None:
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+        self.closed = False
+
+    def reason(self, messages: list[dict[str, str]]) -> str:
+        raise AssertionError("hedging only runs on the async interface")
+
+    async def reason_async(self, messages: list[dict[str, str]]) -> str:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.name
+
+    async def reason_stream_async(self, messages: list[dict[str, str]]):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            yield self.name
+            yield "tail"
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        finally:
+            self.closed = True
+
+
+def fallback_chain(*clients: SlowClient, settings: HedgingSettings = HEDGING, **kwargs) -> FallbackApi:
+    entries = [FallbackEntry(client.name, client) for client in clients]
+    return FallbackApi("p1", entries, hedger=Hedger("p1", lambda: settings), **kwargs)
+
+
+class HedgerTest(unittest.TestCase):
+    def test_settings_validation(self) -> None:
+        is_valid, errors = HedgingSettings.validate_config({
+            "delay_ms": 0.0,
+            "min_p95_samples": 0,
+            "max_hedge_rate": 2.0,
+        })
+
+        self.assertFalse(is_valid)
+        self.assertEqual(errors, [
+            "delay_ms must be greater than 0",
+            "min_p95_samples must be greater than 0",
+            "max_hedge_rate must be greater than 0 and at most 1",
+        ])
+
+    def test_budget_caps_hedge_rate(self) -> None:
+        hedger = Hedger("p1", lambda: HedgingSettings(enabled=True, max_hedge_rate=0.5))
+
+        hedger.begin_request()
+        self.assertFalse(hedger.try_hedge())
+        hedger.begin_request()
+        self.assertTrue(hedger.try_hedge())
+        self.assertFalse(hedger.try_hedge())
+
+        self.assertEqual(hedger.stats(), {
+            "requests": 2,
+            "hedged": 1,
+            "won": 0,
+            "lost": 0,
+            "budget_exhausted": 2,
+        })
+        self.assertIsNone(Hedger("p1", lambda: HedgingSettings()).begin_request())
+
+    def test_delay_uses_p95_once_enough_samples(self) -> None:
+        settings = HedgingSettings(enabled=True, delay_ms=500.0, use_p95=True, min_p95_samples=20)
+        hedger = Hedger("p1", lambda: settings)
+        stats = TargetStats("a", lambda: RoutingSettings())
+
+        self.assertEqual(hedger.delay(settings, stats, streaming=False), 0.5)
+        for latency in range(1, 21):
+            stats.record_success(latency / 100, ttft=latency / 1000)
+
+        self.assertEqual(hedger.delay(settings, stats, streaming=False), 0.19)
+        self.assertEqual(hedger.delay(settings, stats, streaming=True), 0.019)
+
+
+class FallbackHedgingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_hedge_wins_and_slow_primary_is_cancelled(self) -> None:
+        primary = SlowClient("primary", delay=5.0)
+        backup = SlowClient("backup", delay=0.0)
+        chain = fallback_chain(primary, backup)
+
+        result = await asyncio.wait_for(chain.reason_async([]), timeout=1.0)
+
+        self.assertEqual(result, "backup")
+        self.assertTrue(primary.cancelled)
+        self.assertEqual(chain.hedger.stats()["won"], 1)
+
+    async def test_fast_primary_does_not_hedge(self) -> None:
+        primary = SlowClient("primary", delay=0.0)
+        backup = SlowClient("backup", delay=0.0)
+        chain = fallback_chain(primary, backup)
+
+        self.assertEqual(await chain.reason_async([]), "primary")
+
+        self.assertEqual(backup.calls, 0)
+        self.assertEqual(chain.hedger.stats()["hedged"], 0)
+
+    async def test_primary_answering_first_counts_as_lost_hedge(self) -> None:
+        primary = SlowClient("primary", delay=0.05)
+        backup = SlowClient("backup", delay=5.0)
+        chain = fallback_chain(primary, backup)
+
+        self.assertEqual(await asyncio.wait_for(chain.reason_async([]), timeout=1.0), "primary")
+
+        self.assertTrue(backup.cancelled)
+        self.assertEqual(chain.hedger.stats(), {
+            "requests": 1,
+            "hedged": 1,
+            "won": 0,
+            "lost": 1,
+            "budget_exhausted": 0,
+        })
+
+    async def test_stream_hedge_closes_losing_stream(self) -> None:
+        primary = SlowClient("primary", delay=5.0)
+        backup = SlowClient("backup", delay=0.0)
+        chain = fallback_chain(primary, backup)
+
+        chunks = [chunk async for chunk in chain.reason_stream_async([])]
+
+        self.assertEqual(chunks, ["backup", "tail"])
+        self.assertTrue(primary.cancelled)
+        self.assertTrue(primary.closed)
+
+    async def test_exhausted_budget_waits_for_primary(self) -> None:
+        primary = SlowClient("primary", delay=0.05)
+        backup = SlowClient("backup", delay=0.0)
+        chain = fallback_chain(primary, backup, settings=HedgingSettings(enabled=True, delay_ms=1.0, max_hedge_rate=0.1))
+
+        self.assertEqual(await chain.reason_async([]), "primary")
+
+        self.assertEqual(backup.calls, 0)
+        self.assertEqual(chain.hedger.stats()["budget_exhausted"], 1)
+
+    async def test_failures_still_fall_back_and_report_attempted_targets(self) -> None:
+        events = []
+        clients = [
+            SlowClient("a", delay=0.0, error=RuntimeError("a down")),
+            SlowClient("b", delay=0.0, error=RuntimeError("b down")),
+        ]
+        chain = fallback_chain(*clients, failure_handlers=[events.append])
+
+        with self.assertRaisesRegex(RuntimeError, "b down"):
+            await chain.reason_async([])
+
+        fallback_events = [event for event in events if isinstance(event, FallbackEvent)]
+        self.assertEqual(fallback_events[0].targets, ["a", "b"])
+
+    async def test_hedged_winner_charges_its_completion_tokens(self) -> None:
+        primary = SlowClient("primary", delay=5.0)
+        backup = SlowClient("backup", delay=0.0)
+        chain = fallback_chain(primary, backup)
+        limiters = [RateLimiter(RateLimit(tpm=60)) for _ in chain.entries]
+        chain.entries = [
+            FallbackEntry(entry.target, entry.client, limiter=limiter)
+            for entry, limiter in zip(chain.entries, limiters)
+        ]
+
+        self.assertEqual([chunk async for chunk in chain.reason_stream_async([])], ["backup", "tail"])
+
+        # 被取消的首发请求不扣除输出，胜出的对冲请求扣除 "backup" 和 "tail" 共 3 个 token
+        self.assertAlmostEqual(limiters[0].wait_time(60), 0.0, delta=0.1)
+        self.assertAlmostEqual(limiters[1].wait_time(60), 3.0, delta=0.1)
+
+
+
+class ProviderChainHedgingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_provider_failing_before_output_sends_switch_notification(self) -> None:
+        events = []
+        chain = ProviderFallbackApi(
+            [
+                ProviderFallbackEntry("p1", SlowClient("p1", delay=0.0, error=RuntimeError("p1 down"))),
+                ProviderFallbackEntry("p2", SlowClient("p2", delay=0.0)),
+            ],
+            failure_handlers=[events.append],
+            hedger=Hedger("provider-chain", lambda: HEDGING),
+        )
+
+        self.assertEqual(await chain.reason_async([]), "p2")
+
+        switches = [event for event in events if isinstance(event, ProviderSwitchEvent)]
+        self.assertEqual([(event.from_provider, event.to_provider) for event in switches], [("p1", "p2")])
+
+    async def test_provider_chain_hedges_to_next_provider(self) -> None:
+        p1 = SlowClient("p1", delay=5.0)
+        p2 = SlowClient("p2", delay=0.0)
+        chain = ProviderFallbackApi(
+            [ProviderFallbackEntry("p1", p1), ProviderFallbackEntry("p2", p2)],
+            hedger=Hedger("provider-chain", lambda: HEDGING),
+        )
+
+        chunks = [chunk async for chunk in chain.reason_stream_async([])]
+
+        self.assertEqual(chunks, ["p2", "tail"])
+        self.assertTrue(p1.closed)
+        self.assertEqual(chain.hedger.stats()["won"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
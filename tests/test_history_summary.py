@@ -0,0 +1,157 @@
+import os
+import tempfile
+import typing
+import unittest
+from threading import Event
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from models.history_summary import SUMMARY_PREFIX, HistorySummarySettings
+from models.history_window import estimate_message_tokens
+from models.session_manager import SessionManager
+from models.session_store import SqliteSessionStore
+from test_message_session import FakeApiFactory, RecordingClient
+
+LONG_QUESTION = "x" * 100
+
+
+class BlockingSummaryClient(RecordingClient):
+    def __init__(self) -> None:
+        super().__init__("summary")
+        self.started = Event()
+        self.release = Event()
+
+    def reason(self, messages: list[dict[str, str]]) -> str:
+        self.started.set()
+        self.release.wait(timeout=2)
+        return super().reason(messages)
+
+
+class FailingSummaryClient(RecordingClient):
+    def reason(self, messages: list[dict[str, str]]) -> str:
+        raise RuntimeError("quota exceeded")
+
+
+def contents(messages: list[dict[str, str]]) -> list[str]:
+    return [message["content"] for message in messages]
+
+
+class HistorySummaryTest(unittest.TestCase):
+    def make_manager(self, summary_client: RecordingClient, store=None) -> tuple[SessionManager, FakeApiFactory]:
+        api_factory = FakeApiFactory()
+        api_factory.clients["cheap"] = summary_client
+        api_factory.settings[HistorySummarySettings.SECTION_NAME] = HistorySummarySettings(
+            threshold_tokens=40,
+            keep_recent_turns=1,
+            provider="cheap",
+        )
+        manager = SessionManager(api_factory=api_factory, store=store)
+        self.addCleanup(manager.summarizer.shutdown)
+        return manager, api_factory
+
+    def test_old_turns_are_replaced_by_summary_in_the_background(self) -> None:
+        summary_client = RecordingClient("user asked for x")
+        manager, api_factory = self.make_manager(summary_client)
+        session = manager.new_session("s1", system_message="system", provider="p1")
+
+        session.chat(LONG_QUESTION, preserve=True)
+        session.chat("q2", preserve=True)
+        manager.summarizer.shutdown()
+        session.chat("q3", preserve=True)
+
+        summary = SUMMARY_PREFIX + "user asked for x"
+        self.assertIn(LONG_QUESTION, summary_client.calls[0][-1]["content"])
+        self.assertEqual(contents(api_factory.clients["p1"].calls[-1]), [
+            "system", summary, "q2", "from-p1", "q3",
+        ])
+        stats = session.compaction_stats()
+        saved = (
+            estimate_message_tokens({"content": LONG_QUESTION})
+            + estimate_message_tokens({"content": "from-p1"})
+            - estimate_message_tokens({"content": summary})
+        )
+        self.assertEqual(stats["compactions"], 1)
+        self.assertEqual(stats["summarized_messages"], 2)
+        self.assertEqual(stats["tokens_saved_per_request"], saved)
+        self.assertEqual(stats["tokens_avoided"], saved)
+        self.assertFalse(stats["in_progress"])
+
+    def test_live_requests_do_not_wait_for_the_summary(self) -> None:
+        summary_client = BlockingSummaryClient()
+        manager, _ = self.make_manager(summary_client)
+        session = manager.new_session("s1", provider="p1")
+        session.chat(LONG_QUESTION, preserve=True)
+        session.chat("q2", preserve=True)
+        self.assertTrue(summary_client.started.wait(timeout=2))
+
+        self.assertEqual(session.chat("q3", preserve=True), "from-p1")
+        self.assertTrue(session.compaction_stats()["in_progress"])
+        summary_client.release.set()
+        manager.summarizer.shutdown()
+
+        self.assertEqual(contents(session.snapshot_messages()), [
+            SUMMARY_PREFIX + "summary", "q2", "from-p1", "q3", "from-p1",
+        ])
+
+    def test_summary_is_dropped_when_history_is_cleared_meanwhile(self) -> None:
+        summary_client = BlockingSummaryClient()
+        manager, _ = self.make_manager(summary_client)
+        session = manager.new_session("s1", system_message="system", provider="p1")
+        session.chat(LONG_QUESTION, preserve=True)
+        session.chat("q2", preserve=True)
+        self.assertTrue(summary_client.started.wait(timeout=2))
+
+        session.clear_history()
+        summary_client.release.set()
+        manager.summarizer.shutdown()
+
+        self.assertEqual(contents(session.snapshot_messages()), ["system"])
+        self.assertEqual(session.compaction_stats()["compactions"], 0)
+        self.assertFalse(session.compaction_stats()["in_progress"])
+
+    def test_failed_summary_keeps_history_and_reports_error(self) -> None:
+        manager, _ = self.make_manager(FailingSummaryClient())
+        session = manager.new_session("s1", provider="p1")
+
+        with self.assertLogs("models.history_summary", level="ERROR"):
+            session.chat(LONG_QUESTION, preserve=True)
+            session.chat("q2", preserve=True)
+            manager.summarizer.shutdown()
+
+        self.assertEqual(len(session.snapshot_messages()), 4)
+        self.assertEqual(session.compaction_stats()["last_error"], "RuntimeError: quota exceeded")
+
+    def test_compacted_history_survives_restart(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        path = os.path.join(temp_dir.name, "sessions.db")
+        store = SqliteSessionStore(path)
+        manager, _ = self.make_manager(RecordingClient("summary"), store=store)
+        session = manager.new_session("s1", system_message="system", provider="p1")
+        session.chat(LONG_QUESTION, preserve=True)
+        session.chat("q2", preserve=True)
+        manager.summarizer.shutdown()
+        store.close()
+
+        restarted = SqliteSessionStore(path)
+        self.addCleanup(restarted.close)
+        record = restarted.load("s1")
+
+        self.assertEqual(contents(record.summary_messages), [SUMMARY_PREFIX + "summary"])
+        self.assertEqual(contents(record.history), ["q2", "from-p1"])
+
+    def test_settings_reject_model_without_provider(self) -> None:
+        is_valid, errors = HistorySummarySettings.validate_config({
+            "threshold_tokens": -1,
+            "keep_recent_turns": 4,
+            "provider": "",
+            "model": "glm-4-flash",
+        })
+
+        self.assertFalse(is_valid)
+        self.assertEqual(errors, ["threshold_tokens must not be negative", "model requires provider"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import typing
+import unittest
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from api.token_estimation import estimate_message_tokens
+from models.history_window import HistoryWindow, HistoryWindowSettings
+from models.message import Message
+from models.session_manager import SessionManager
+from test_message_session import FakeApiFactory
+
+
+def make_history(turns: int) -> list[dict[str, str]]:
+    history = []
+    for index in range(turns):
+        history.append({"role": "user", "content": f"q{index}" * 10})
+        history.append({"role": "assistant", "content": f"a{index}" * 10})
+    return history
+
+
+def contents(messages: list[dict[str, str]]) -> list[str]:
+    return [message["content"][:2] for message in messages]
+
+
+class HistoryWindowTest(unittest.TestCase):
+    system = [{"role": "system", "content": "system"}]
+    current = {"role": "user", "content": "now"}
+
+    def turn_cost(self) -> int:
+        return sum(estimate_message_tokens(message) for message in make_history(1))
+
+    def fixed_cost(self) -> int:
+        return estimate_message_tokens(self.system[0]) + estimate_message_tokens(self.current)
+
+    def test_drop_oldest_keeps_newest_turns_that_fit(self) -> None:
+        window = HistoryWindow(max_tokens=self.fixed_cost() + 2 * self.turn_cost())
+
+        selected = window.select(self.system, make_history(5), self.current)
+
+        self.assertEqual(contents(selected), ["sy", "q3", "a3", "q4", "a4", "no"])
+
+    def test_keep_first_last_keeps_opening_turns_and_newest_turns(self) -> None:
+        window = HistoryWindow(
+            max_tokens=self.fixed_cost() + 3 * self.turn_cost(),
+            strategy=HistoryWindowSettings.KEEP_FIRST_LAST,
+            keep_first_turns=1,
+        )
+
+        selected = window.select(self.system, make_history(5), self.current)
+
+        self.assertEqual(contents(selected), ["sy", "q0", "a0", "q3", "a3", "q4", "a4", "no"])
+
+    def test_system_and_current_message_survive_an_exhausted_budget(self) -> None:
+        window = HistoryWindow(max_tokens=1)
+
+        selected = window.select(self.system, make_history(3), self.current)
+
+        self.assertEqual(selected, [*self.system, self.current])
+
+    def test_message_without_window_sends_full_history(self) -> None:
+        message = Message("system")
+        message.preserve_history("q1", "a1")
+
+        self.assertEqual(len(message.generate_messages_jar("q2")), 4)
+        self.assertEqual(len(message.generate_messages_jar("q2", HistoryWindow(max_tokens=1))), 2)
+
+
+class HistoryWindowSettingsTest(unittest.TestCase):
+    def test_budgets_override_by_provider_then_model(self) -> None:
+        settings = HistoryWindowSettings(
+            max_tokens=1000,
+            budgets="zhipu=8000, zhipu:GLM-4-Flash=2000, chat_completion:local=0",
+        )
+
+        self.assertEqual(settings.window_for(None, None).max_tokens, 1000)
+        self.assertEqual(settings.window_for("deepseek", None).max_tokens, 1000)
+        self.assertEqual(settings.window_for("Zhipu", "glm-4.7").max_tokens, 8000)
+        self.assertEqual(settings.window_for("zhipu", "glm-4-flash").max_tokens, 2000)
+        self.assertIsNone(settings.window_for("chat_completion:local", "m"))
+        self.assertIsNone(HistoryWindowSettings().window_for("zhipu", None))
+
+    def test_rejects_invalid_strategy_and_budgets(self) -> None:
+        is_valid, errors = HistoryWindowSettings.validate_config({
+            "max_tokens": 0,
+            "strategy": "random",
+            "keep_first_turns": 1,
+            "budgets": "zhipu=many",
+        })
+
+        self.assertFalse(is_valid)
+        self.assertEqual(errors, [
+            "strategy must be one of: drop_oldest, keep_first_last",
+            "budgets 中的预算必须是整数: zhipu=many",
+        ])
+
+    def test_session_sends_windowed_history_but_keeps_full_history(self) -> None:
+        api_factory = FakeApiFactory()
+        api_factory.settings[HistoryWindowSettings.SECTION_NAME] = HistoryWindowSettings(budgets="p1=40")
+        manager = SessionManager(api_factory=api_factory)
+        session = manager.new_session("s1", provider="p1")
+
+        for question in ["q1" * 20, "q2" * 20, "q3"]:
+            session.chat(question, preserve=True)
+
+        client = api_factory.clients["p1"]
+        self.assertEqual(contents(client.calls[-1]), ["q2", "fr", "q3"])
+        self.assertEqual(len(session.snapshot_messages()), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+from api.http_pool import AsyncHttpClientPool, HttpPoolSettings, HttpSessionPool
+
+
+class HttpSessionPoolTest(unittest.TestCase):
+    def test_reuses_one_session_per_base_url_and_counts_hits(self) -> None:
+        pool = HttpSessionPool()
+        self.addCleanup(pool.close)
+
+        first = pool.session_for("https://api.example.test/v1/chat/completions")
+        second = pool.session_for("https://API.example.test/v1/messages")
+        other = pool.session_for("https://other.example.test/v1/chat/completions")
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        stats = pool.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(
+            sorted(stats["hosts"]),
+            ["https://api.example.test", "https://other.example.test"],
+        )
+
+    def test_idle_sessions_expire_and_are_closed(self) -> None:
+        pool = HttpSessionPool(HttpPoolSettings(idle_timeout=10))
+        self.addCleanup(pool.close)
+
+        with patch("api.http_pool.time.monotonic", return_value=100.0):
+            first = pool.session_for("https://api.example.test/a")
+        with (
+            patch("api.http_pool.time.monotonic", return_value=111.0),
+            patch.object(first, "close") as close,
+        ):
+            second = pool.session_for("https://api.example.test/b")
+
+        self.assertIsNot(first, second)
+        close.assert_called_once()
+        self.assertEqual(pool.stats()["expired"], 1)
+
+    def test_configure_rebuilds_sessions_with_new_pool_size(self) -> None:
+        pool = HttpSessionPool()
+        self.addCleanup(pool.close)
+        first = pool.session_for("https://api.example.test/a")
+
+        pool.configure(HttpPoolSettings(pool_size=4))
+        second = pool.session_for("https://api.example.test/a")
+
+        self.assertIsNot(first, second)
+        self.assertEqual(second.get_adapter("https://api.example.test")._pool_maxsize, 4)
+
+    def test_post_goes_through_pooled_session(self) -> None:
+        pool = HttpSessionPool()
+        self.addCleanup(pool.close)
+        session = pool.session_for("https://api.example.test/a")
+
+        with patch.object(session, "post", return_value="response") as post:
+            result = pool.post("https://api.example.test/b", json={"a": 1}, stream=True)
+
+        self.assertEqual(result, "response")
+        post.assert_called_once_with("https://api.example.test/b", json={"a": 1}, stream=True)
+
+    def test_settings_validation_rejects_non_positive_values(self) -> None:
+        is_valid, errors = HttpPoolSettings.validate_config({"pool_size": 0, "idle_timeout": -1.0})
+
+        self.assertFalse(is_valid)
+        self.assertEqual(len(errors), 2)
+
+
+
+class MockAsyncPool(AsyncHttpClientPool):
+    def __init__(self) -> None:
+        super().__init__()
+        self.built: list[httpx.AsyncClient] = []
+
+    def _build_client(self) -> httpx.AsyncClient:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, text="ok")))
+        self.built.append(client)
+        return client
+
+
+class AsyncHttpClientPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def test_configure_closes_idle_clients_on_their_loop(self) -> None:
+        pool = MockAsyncPool()
+        await pool.post("https://api.example.test/a")
+
+        await asyncio.to_thread(pool.configure, HttpPoolSettings(pool_size=4))
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+        self.assertTrue(pool.built[0].is_closed)
+        await pool.post("https://api.example.test/a")
+        self.assertEqual(len(pool.built), 2)
+        self.assertFalse(pool.built[1].is_closed)
+        await pool.aclose()
+        self.assertTrue(pool.built[1].is_closed)
+
+    async def test_configure_waits_for_in_flight_stream(self) -> None:
+        pool = MockAsyncPool()
+
+        async with pool.stream("https://api.example.test/a") as response:
+            pool.configure(HttpPoolSettings(pool_size=4))
+            for _ in range(3):
+                await asyncio.sleep(0)
+            self.assertFalse(pool.built[0].is_closed)
+            self.assertEqual(await response.aread(), b"ok")
+
+        self.assertTrue(pool.built[0].is_closed)
+        self.assertEqual(pool.stats()["clients"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
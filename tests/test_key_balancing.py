@@ -0,0 +1,148 @@
+import asyncio
+import typing
+import unittest
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from api.base_api import BaseApi
+from api.fallback_api import FallbackApi, FallbackEntry
+from api.key_balancing import KeyBalancer, KeyBalancing
+from api.routing import RoutingSettings, TargetStats
+
+
+class KeyClient(BaseApi):
+    def __init__(self, name: str, calls: list[str], healthy: bool = True) -> None:
+        self.name = name
+        self.calls = calls
+        self.healthy = healthy
+
+    def reason(self, messages: list[dict[str, str]]) -> str:
+        self.calls.append(self.name)
+        if not self.healthy:
+            raise RuntimeError(f"{self.name} down")
+        return self.name
+
+
+def balanced_chain(balancing: KeyBalancing, calls: list[str], keys: int = 2, models: tuple[str, ...] = ("m",)):
+    entries = [
+        FallbackEntry(f"api_key#{index}:{model}", KeyClient(f"k{index}:{model}", calls), secrets=(f"key-{index}",), model=model)
+        for index in range(1, keys + 1)
+        for model in models
+    ]
+    return FallbackApi("p1", entries, balancer=KeyBalancer(balancing, keys))
+
+
+class KeyBalancingConfigTest(unittest.TestCase):
+    def test_from_config_pops_keys_and_validates(self) -> None:
+        config = {"api_key": "a,b", "key_balancing": "Weighted", "api_key_weights": "3, 1"}
+
+        balancing = KeyBalancing.from_config(config)
+
+        self.assertEqual(config, {"api_key": "a,b"})
+        self.assertEqual(balancing, KeyBalancing(strategy=KeyBalancing.WEIGHTED, weights=(3, 1)))
+        self.assertEqual(KeyBalancing.from_config({"api_key": "a"}), KeyBalancing())
+        with self.assertRaisesRegex(ValueError, "key_balancing must be one of"):
+            KeyBalancing.from_config({"key_balancing": "random"})
+        with self.assertRaisesRegex(ValueError, "positive integers"):
+            KeyBalancing.from_config({"api_key_weights": "2,0"})
+        with self.assertRaisesRegex(ValueError, "one weight per api_key"):
+            KeyBalancing.from_config({"api_key": "a,b,c", "api_key_weights": "1,2"})
+
+
+class KeyBalancerTest(unittest.TestCase):
+    def test_strategies_pick_first_key(self) -> None:
+        def firsts(balancing: KeyBalancing, key_count: int = 3) -> list[int]:
+            balancer = KeyBalancer(balancing, key_count)
+            return [balancer.order()[0] for _ in range(6)]
+
+        self.assertEqual(firsts(KeyBalancing()), [0, 0, 0, 0, 0, 0])
+        self.assertEqual(firsts(KeyBalancing(KeyBalancing.ROUND_ROBIN)), [0, 1, 2, 0, 1, 2])
+        self.assertEqual(firsts(KeyBalancing(KeyBalancing.WEIGHTED, (3, 1)), 2), [0, 0, 1, 0, 0, 0])
+        self.assertEqual(KeyBalancer(KeyBalancing(KeyBalancing.ROUND_ROBIN), 3).order(), [0, 1, 2])
+
+    def test_least_in_flight_prefers_idle_key(self) -> None:
+        balancer = KeyBalancer(KeyBalancing(KeyBalancing.LEAST_IN_FLIGHT), 3)
+        balancer.acquire(0)
+        balancer.acquire(0)
+        balancer.acquire(1)
+
+        self.assertEqual(balancer.order(), [2, 0, 1])
+        balancer.release(0)
+        balancer.release(0)
+        balancer.release(1)
+        # 进行中的请求数相同时轮流作为首选
+        self.assertEqual([balancer.order()[0] for _ in range(3)], [1, 2, 0])
+
+
+class BalancedFallbackTest(unittest.TestCase):
+    def test_round_robin_spreads_requests_and_keeps_model_order(self) -> None:
+        calls: list[str] = []
+        chain = balanced_chain(KeyBalancing(KeyBalancing.ROUND_ROBIN), calls, models=("m1", "m2"))
+
+        self.assertEqual([chain.reason([]) for _ in range(4)], ["k1:m1", "k2:m1", "k1:m1", "k2:m1"])
+        self.assertEqual(
+            [entry.target for entry in chain._route(streaming=False)],
+            ["api_key#1:m1", "api_key#1:m2", "api_key#2:m1", "api_key#2:m2"],
+        )
+
+    def test_latency_routing_orders_models_and_keeps_balanced_key_order(self) -> None:
+        settings = RoutingSettings(mode=RoutingSettings.LATENCY, min_samples=1)
+        chain = balanced_chain(KeyBalancing(KeyBalancing.ROUND_ROBIN), [], models=("m1", "m2"))
+        chain.routing_settings = lambda: settings
+        # key-1 的 m2 最快，但每个 Key 仍轮流作为首选；m2 整体比 m1 快，排在前面
+        latencies = {"api_key#1:m1": 5.0, "api_key#1:m2": 1.0, "api_key#2:m1": 6.0, "api_key#2:m2": 2.0}
+        chain.entries = [
+            FallbackEntry(entry.target, entry.client, entry.secrets, entry.model, stats=TargetStats(entry.target, lambda: settings))
+            for entry in chain.entries
+        ]
+        for entry in chain.entries:
+            entry.stats.record_success(latencies[entry.target])
+
+        routes = [[entry.target for entry in chain._route(streaming=False)] for _ in range(2)]
+
+        self.assertEqual(routes, [
+            ["api_key#1:m2", "api_key#2:m2", "api_key#1:m1", "api_key#2:m1"],
+            ["api_key#2:m2", "api_key#1:m2", "api_key#2:m1", "api_key#1:m1"],
+        ])
+
+    def test_failed_key_still_fails_over_to_other_keys(self) -> None:
+        calls: list[str] = []
+        chain = balanced_chain(KeyBalancing(KeyBalancing.ROUND_ROBIN), calls, keys=3)
+        chain.entries[1].client.healthy = False
+
+        self.assertEqual([chain.reason([]) for _ in range(3)], ["k1:m", "k3:m", "k3:m"])
+        self.assertEqual(calls, ["k1:m", "k2:m", "k3:m", "k3:m"])
+        self.assertEqual(chain.balancer.in_flight(), [0, 0, 0])
+
+    def test_in_flight_counts_follow_async_requests(self) -> None:
+        calls: list[str] = []
+        chain = balanced_chain(KeyBalancing(KeyBalancing.LEAST_IN_FLIGHT), calls)
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        class HangingClient(BaseApi):
+            def reason(self, messages: list[dict[str, str]]) -> str:
+                raise AssertionError("async only")
+
+            async def reason_async(self, messages: list[dict[str, str]]) -> str:
+                started.set()
+                await release.wait()
+                return "slow"
+
+        chain.entries[0] = FallbackEntry("api_key#1:m", HangingClient(), secrets=("key-1",), model="m")
+
+        async def scenario() -> list[str]:
+            slow = asyncio.create_task(chain.reason_async([]))
+            await started.wait()
+            self.assertEqual(chain.balancer.in_flight(), [1, 0])
+            fast = [await chain.reason_async([]) for _ in range(2)]
+            release.set()
+            return [await slow, *fast]
+
+        self.assertEqual(asyncio.run(scenario()), ["slow", "k2:m", "k2:m"])
+        self.assertEqual(chain.balancer.in_flight(), [0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
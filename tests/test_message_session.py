@@ -1,3 +1,4 @@
+import asyncio
 import typing
 import unittest
 from threading import Event, Lock, Thread
@@ -63,6 +64,14 @@ class FakeApiFactory:
             ("p1", "model-1"): RecordingClient("from-p1-model-1"),
         }
         self.requested_clients: list[tuple[str | None, str | None]] = []
+        self.settings = {}
+
+    def register_settings_classes(self, settings_classes):
+        for settings_class in settings_classes:
+            self.settings.setdefault(settings_class.SECTION_NAME, settings_class())
+
+    def get_settings(self, section_name):
+        return self.settings[section_name]
 
     def get_client(self, provider=None, model=None):
         self.requested_clients.append((provider, model))
@@ -71,6 +80,20 @@ class FakeApiFactory:
         return self.clients[provider]
 
 
+class BlockingApiFactory(FakeApiFactory):
+    def __init__(self, block_provider: str) -> None:
+        super().__init__()
+        self.block_provider = block_provider
+        self.construction_started = Event()
+        self.release = Event()
+
+    def get_client(self, provider=None, model=None):
+        if provider == self.block_provider:
+            self.construction_started.set()
+            self.release.wait(timeout=1)
+        return super().get_client(provider, model)
+
+
 class MessageTest(unittest.TestCase):
     def test_message_jar_combines_system_history_and_current_user_message(self) -> None:
         message = Message("system")
@@ -88,6 +111,40 @@ class MessageTest(unittest.TestCase):
             {"role": "user", "content": "q2"},
         ])
 
+    def test_snapshot_shares_messages_and_ignores_later_changes(self) -> None:
+        message = Message("system")
+        message.preserve_history("q1", "a1")
+        history = message._messages_user_and_assistant_part
+
+        snapshot = message.snapshot()
+        jar = snapshot.generate_messages_jar(message.construct_user_message("q2"))
+        message.preserve_history("q2", "a2")
+        message._messages_user_and_assistant_part = []
+
+        self.assertEqual([item["content"] for item in snapshot], ["system", "q1", "a1"])
+        self.assertEqual(snapshot[-1], {"role": "assistant", "content": "a1"})
+        self.assertEqual(snapshot[1:], [history[0], history[1]])
+        self.assertIs(jar[1], history[0])
+        self.assertIs(snapshot[2], history[1])
+        with self.assertRaises(IndexError):
+            snapshot[3]
+
+    def test_approximate_size_counts_appended_messages_incrementally(self) -> None:
+        message = Message("system")
+        message.preserve_history("q1", "a1")
+        first = message.approximate_size()
+
+        message.preserve_history("q2", "a2" * 100)
+        grown = message.approximate_size()
+        message._messages_user_and_assistant_part = []
+
+        fresh = Message("system")
+        fresh.preserve_history("q1", "a1")
+        fresh.preserve_history("q2", "a2" * 100)
+        self.assertEqual(grown, fresh.approximate_size())
+        self.assertGreater(grown, first)
+        self.assertEqual(message.approximate_size(), Message("system").approximate_size())
+
 
 class SessionTest(unittest.TestCase):
     def test_chat_once_does_not_preserve_history(self) -> None:
@@ -178,6 +235,81 @@ class SessionTest(unittest.TestCase):
         self.assertEqual(results, [["answer-1"], ["answer-2"]])
 
 
+class AsyncSessionTest(unittest.IsolatedAsyncioTestCase):
+    async def test_async_stream_preserves_only_after_complete_response(self) -> None:
+        client = StreamingClient(["hel", "lo"])
+        session = Session("s1", client, Message("system"))
+
+        chunks = [chunk async for chunk in session.chat_stream_async("question", preserve=True)]
+
+        self.assertEqual(chunks, ["hel", "lo"])
+        self.assertEqual(session.messages.messages, [
+            {"role": "system", "content": "system"},
+            {"role": "user", "content": "question"},
+            {"role": "assistant", "content": "hello"},
+        ])
+        self.assertFalse(session._conversation_lock.locked())
+
+    async def test_async_chat_waits_for_blocking_holder_without_blocking_loop(self) -> None:
+        session = Session("s1", RecordingClient("answer"), Message())
+        session._conversation_lock.acquire()
+
+        chat = asyncio.create_task(session.chat_async("question", preserve=True))
+        await asyncio.sleep(0.05)
+        self.assertFalse(chat.done())
+        session._conversation_lock.release()
+
+        self.assertEqual(await asyncio.wait_for(chat, timeout=2), "answer")
+        self.assertEqual(len(session.messages.messages), 2)
+        self.assertFalse(session._conversation_lock.locked())
+
+    async def test_cancelled_waiter_does_not_leak_conversation_lock(self) -> None:
+        session = Session("s1", RecordingClient("answer"), Message())
+        session._conversation_lock.acquire()
+
+        chat = asyncio.create_task(session.chat_async("question"))
+        await asyncio.sleep(0.05)
+        chat.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await chat
+        session._conversation_lock.release()
+
+        self.assertEqual(await asyncio.wait_for(session.chat_async("next"), timeout=2), "answer")
+
+
+class AsyncSessionManagerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_session_creation_does_not_block_the_event_loop(self) -> None:
+        api_factory = BlockingApiFactory("p1")
+        manager = SessionManager(api_factory=api_factory)
+
+        creating = asyncio.create_task(manager.get_or_create_session_async("s1", provider="p1"))
+        while not api_factory.construction_started.is_set():
+            await asyncio.sleep(0.001)
+        self.assertFalse(creating.done())
+        api_factory.release.set()
+        session = await asyncio.wait_for(creating, timeout=2)
+
+        self.assertIs(await manager.get_or_create_session_async("s1"), session)
+        forked = await manager.fork_session_async("s1", "s2", system_message="system")
+        self.assertIs(manager.pool["s2"], forked)
+        self.assertEqual((await manager.stats_async())["admission"]["admitted"], 0)
+        self.assertEqual(api_factory.requested_clients, [("p1", None)])
+
+    async def test_stateless_client_construction_does_not_block_the_event_loop(self) -> None:
+        api_factory = BlockingApiFactory("p1")
+        manager = SessionManager(api_factory=api_factory)
+
+        building = asyncio.create_task(manager.stateless_client_async("p1", "model-1"))
+        while not api_factory.construction_started.is_set():
+            await asyncio.sleep(0.001)
+        self.assertFalse(building.done())
+        api_factory.release.set()
+
+        self.assertIs(await asyncio.wait_for(building, timeout=2), api_factory.clients[("p1", "model-1")])
+        self.assertIs(await manager.stateless_client_async("p2"), api_factory.clients["p2"])
+        self.assertEqual(manager.stats()["stateless_requests"], 2)
+
+
 class SessionManagerTest(unittest.TestCase):
     def test_new_session_uses_requested_provider_and_stores_session(self) -> None:
         api_factory = FakeApiFactory()
@@ -199,6 +331,16 @@ class SessionManagerTest(unittest.TestCase):
         self.assertEqual(api_factory.requested_clients, [("p1", "model-1")])
         self.assertEqual(session.client, api_factory.clients[("p1", "model-1")])
 
+    def test_stateless_client_creates_no_session(self) -> None:
+        api_factory = FakeApiFactory()
+        manager = SessionManager(api_factory=api_factory)
+
+        client = manager.stateless_client("p1", "model-1")
+
+        self.assertIs(client, api_factory.clients[("p1", "model-1")])
+        self.assertEqual(len(manager.pool), 0)
+        self.assertEqual(manager.stats()["stateless_requests"], 1)
+
     def test_get_or_create_session_reuses_existing_session_and_ignores_later_provider(self) -> None:
         api_factory = FakeApiFactory()
         manager = SessionManager(api_factory=api_factory)
@@ -220,5 +362,67 @@ class SessionManagerTest(unittest.TestCase):
         self.assertEqual(api_factory.requested_clients, [("p1", "model-1")])
 
 
+    def test_slow_client_construction_does_not_block_other_sessions(self) -> None:
+        api_factory = BlockingApiFactory(block_provider="p1")
+        manager = SessionManager(api_factory=api_factory)
+        slow_thread = Thread(target=manager.get_or_create_session, args=("slow",), kwargs={"provider": "p1"})
+        slow_thread.start()
+        self.assertTrue(api_factory.construction_started.wait(timeout=1))
+
+        fast = manager.get_or_create_session("fast", provider="p2")
+
+        self.assertEqual(fast.client, api_factory.clients["p2"])
+        self.assertNotIn("slow", manager.pool)
+        api_factory.release.set()
+        slow_thread.join(timeout=1)
+        self.assertIn("slow", manager.pool)
+
+    def test_concurrent_first_requests_for_one_id_build_one_client(self) -> None:
+        api_factory = BlockingApiFactory(block_provider="p1")
+        manager = SessionManager(api_factory=api_factory)
+        sessions: list[Session] = []
+        threads = [
+            Thread(target=lambda: sessions.append(manager.get_or_create_session("s1", provider="p1")))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        self.assertTrue(api_factory.construction_started.wait(timeout=1))
+
+        api_factory.release.set()
+        for thread in threads:
+            thread.join(timeout=1)
+
+        self.assertEqual(len(sessions), 3)
+        self.assertTrue(all(session is sessions[0] for session in sessions))
+        self.assertEqual(api_factory.requested_clients, [("p1", None)])
+
+    def test_waiter_retries_with_own_parameters_when_creator_fails(self) -> None:
+        api_factory = BlockingApiFactory(block_provider="missing")
+        manager = SessionManager(api_factory=api_factory)
+        errors: list[Exception] = []
+
+        def create_with_missing_provider() -> None:
+            try:
+                manager.get_or_create_session("s1", provider="missing")
+            except KeyError as exception:
+                errors.append(exception)
+
+        creator = Thread(target=create_with_missing_provider)
+        creator.start()
+        self.assertTrue(api_factory.construction_started.wait(timeout=1))
+        waiter_sessions: list[Session] = []
+        waiter = Thread(target=lambda: waiter_sessions.append(manager.get_or_create_session("s1", provider="p2")))
+        waiter.start()
+
+        api_factory.release.set()
+        creator.join(timeout=1)
+        waiter.join(timeout=1)
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(waiter_sessions[0].client, api_factory.clients["p2"])
+        self.assertIs(manager.pool["s1"], waiter_sessions[0])
+
+
 if __name__ == "__main__":
     unittest.main()
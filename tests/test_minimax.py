@@ -17,6 +17,7 @@ class FakeResponse:
         self.status_code = status_code
         self.payload = payload or {"ok": True}
         self.text = text
+        self.headers = {}
 
     def json(self):
         return self.payload
@@ -81,7 +82,7 @@ class MiniMaxTest(unittest.TestCase):
 
         client = MiniMax("key", "MiniMax-M2.5")
 
-        with patch("api.minimax.requests.post", side_effect=post):
+        with patch("api.minimax.http_pool.post", side_effect=post):
             result = client._call_api([{"role": "user", "content": "hello"}], reasoning_split=False)
 
         self.assertEqual(result, {"choices": []})
@@ -105,7 +106,7 @@ class MiniMaxTest(unittest.TestCase):
     def test_call_api_raises_on_non_200_response(self) -> None:
         client = MiniMax("key", "model")
 
-        with patch("api.minimax.requests.post", return_value=FakeResponse(500, text="server error")):
+        with patch("api.minimax.http_pool.post", return_value=FakeResponse(500, text="server error")):
             with self.assertRaisesRegex(Exception, "500"):
                 client._call_api([])
 
@@ -126,7 +127,7 @@ class MiniMaxTest(unittest.TestCase):
     def test_success_log_keeps_latest_300_records(self) -> None:
         client = MiniMax("key", "model")
 
-        with patch("api.minimax.requests.post", return_value=FakeResponse(200, {"choices": []}, text="ok")):
+        with patch("api.minimax.http_pool.post", return_value=FakeResponse(200, {"choices": []}, text="ok")):
             for index in range(301):
                 client._call_api([{"role": "user", "content": str(index)}])
 
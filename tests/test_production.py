@@ -0,0 +1,89 @@
+import os
+import signal
+import threading
+import typing
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from server.production import RELOAD_SIGNAL, GatewayApplication, ProductionOptions
+
+
+class FakeFactory:
+    def __init__(self) -> None:
+        self.reloaded = threading.Event()
+
+    def reload_credentials(self) -> bool:
+        self.reloaded.set()
+        return True
+
+
+def make_application(**overrides) -> GatewayApplication:
+    options = {"host": "127.0.0.1", "port": 18000, "workers": 3, **overrides}
+    application = GatewayApplication(ProductionOptions(**options))
+    factory = FakeFactory()
+    application.server_module = SimpleNamespace(
+        app=object(),
+        sm=SimpleNamespace(api_factory=factory),
+    )
+    return application
+
+
+class ProductionOptionsTest(unittest.TestCase):
+    def test_rejects_non_positive_counts(self) -> None:
+        for name in ["workers", "threads", "backlog"]:
+            with self.subTest(name=name):
+                with self.assertRaisesRegex(ValueError, name):
+                    ProductionOptions(host="h", port=1, **{"workers": 1, name: 0})
+
+
+class GatewayApplicationTest(unittest.TestCase):
+    def test_flask_mode_preloads_and_uses_threaded_workers(self) -> None:
+        application = make_application(threads=4, backlog=512)
+
+        self.assertTrue(application.cfg.preload_app)
+        self.assertEqual(application.cfg.bind, ["127.0.0.1:18000"])
+        self.assertEqual(application.cfg.workers, 3)
+        self.assertEqual(application.cfg.threads, 4)
+        self.assertEqual(application.cfg.backlog, 512)
+        self.assertEqual(application.cfg.worker_class_str, "gthread")
+
+    def test_asgi_mode_uses_uvicorn_workers(self) -> None:
+        application = make_application(asgi=True)
+
+        self.assertEqual(application.cfg.worker_class_str, "uvicorn.workers.UvicornWorker")
+
+    def test_master_watcher_signals_every_worker_after_reload(self) -> None:
+        application = make_application()
+        arbiter = SimpleNamespace(WORKERS={101: object(), 102: object()})
+
+        with (
+            patch("server.production.start_credentials_watcher") as start_watcher,
+            patch("server.production.os.kill") as kill,
+        ):
+            application.cfg.when_ready(arbiter)
+            on_reloaded = start_watcher.call_args.kwargs["on_reloaded"]
+            on_reloaded()
+
+        self.assertIs(start_watcher.call_args.args[0], application.server_module.sm.api_factory)
+        self.assertEqual(
+            sorted(call.args for call in kill.call_args_list),
+            [(101, RELOAD_SIGNAL), (102, RELOAD_SIGNAL)],
+        )
+
+    def test_worker_reloads_factory_on_reload_signal(self) -> None:
+        application = make_application()
+        previous_handler = signal.getsignal(RELOAD_SIGNAL)
+        self.addCleanup(signal.signal, RELOAD_SIGNAL, previous_handler)
+
+        application.cfg.post_worker_init(SimpleNamespace(pid=os.getpid()))
+        os.kill(os.getpid(), RELOAD_SIGNAL)
+
+        self.assertTrue(application.server_module.sm.api_factory.reloaded.wait(timeout=2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,7 @@ import json
 import tempfile
 import unittest
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 import requests
 
@@ -17,11 +17,18 @@ import api.error_request_logger as error_request_logger
 from api.kimi import Kimi
 from api.minimax import MiniMax
 from api.modelscope import ModelScope
+from api.provider_errors import (
+    AuthenticationError,
+    ContextLengthError,
+    OverloadedError,
+    ProviderHTTPError,
+    RateLimitError,
+)
 from api.zhipu import Zhipu
 
 
 class FakeResponse:
-    def __init__(self, status_code: int, payload=None, text: str = "error") -> None:
+    def __init__(self, status_code: int, payload=None, text: str = "error", headers=None) -> None:
         self.status_code = status_code
         self.payload = payload or {
             "choices": [
@@ -29,6 +36,7 @@ class FakeResponse:
             ]
         }
         self.text = text
+        self.headers = headers or {}
 
     def json(self):
         return self.payload
@@ -72,7 +80,7 @@ class OpenAICompatibleProviderTest(unittest.TestCase):
             calls.append((url, headers, json))
             return FakeResponse(200)
 
-        with patch("api.deepseek.requests.post", side_effect=post):
+        with patch("api.deepseek.http_pool.post", side_effect=post):
             result = DeepSeek("key", "deepseek-chat").reason([{"role": "user", "content": "hi"}])
 
         self.assertEqual(result, "provider-answer")
@@ -99,7 +107,7 @@ class OpenAICompatibleProviderTest(unittest.TestCase):
             calls.append((url, headers, json))
             return FakeResponse(200)
 
-        with patch("api.modelscope.requests.post", side_effect=post):
+        with patch("api.modelscope.http_pool.post", side_effect=post):
             result = ModelScope("token", "namespace/model").reason([{"role": "user", "content": "hi"}])
 
         self.assertEqual(result, "provider-answer")
@@ -114,7 +122,7 @@ class OpenAICompatibleProviderTest(unittest.TestCase):
             calls.append((url, headers, json))
             return FakeResponse(200)
 
-        with patch("api.chat_completion.requests.post", side_effect=post):
+        with patch("api.chat_completion.http_pool.post", side_effect=post):
             result = ChatCompletion(
                 "https://example.test/v1/",
                 "secret-key",
@@ -147,7 +155,7 @@ class OpenAICompatibleProviderTest(unittest.TestCase):
             calls.append((url, headers, json))
             return FakeResponse(200)
 
-        with patch("api.zhipu.requests.post", side_effect=post):
+        with patch("api.zhipu.http_pool.post", side_effect=post):
             result = Zhipu("key", "glm-4.7", use_coding_endpoint=True).reason([
                 {"role": "user", "content": "hi"}
             ])
@@ -159,7 +167,7 @@ class OpenAICompatibleProviderTest(unittest.TestCase):
         self.assertEqual(calls[0][2]["temperature"], 1.0)
 
     def test_openai_compatible_providers_raise_on_non_200_response(self) -> None:
-        with patch("api.deepseek.requests.post", return_value=FakeResponse(500, text="server error")):
+        with patch("api.deepseek.http_pool.post", return_value=FakeResponse(500, text="server error")):
             with self.assertRaisesRegex(Exception, "500"):
                 DeepSeek("key", "model").reason([])
 
@@ -173,8 +181,27 @@ class OpenAICompatibleProviderTest(unittest.TestCase):
         self.assertNotIn("key", json.dumps(records[0], ensure_ascii=False))
         self.assertFalse(self.success_log_path.exists())
 
+    def test_non_200_responses_raise_typed_provider_errors(self) -> None:
+        cases = [
+            (FakeResponse(429, text="slow down", headers={"Retry-After": "7"}), RateLimitError, True, 7.0),
+            (FakeResponse(503, text="busy"), OverloadedError, True, None),
+            (FakeResponse(400, text='{"code": "context_length_exceeded"}'), ContextLengthError, False, None),
+            (FakeResponse(401, text="invalid api key"), AuthenticationError, False, None),
+            (FakeResponse(404, text="model has 503 replicas"), ProviderHTTPError, False, None),
+        ]
+
+        for response, error_class, retryable, retry_after in cases:
+            with patch("api.deepseek.http_pool.post", return_value=response):
+                with self.assertRaises(ProviderHTTPError) as raised:
+                    DeepSeek("key", "model").reason([])
+            self.assertIs(type(raised.exception), error_class)
+            self.assertEqual(raised.exception.status_code, response.status_code)
+            self.assertEqual(raised.exception.retryable, retryable)
+            self.assertEqual(raised.exception.retry_after, retry_after)
+            self.assertEqual(str(raised.exception), f"DeepSeek API 调用失败: {response.status_code}, {response.text}")
+
     def test_deepseek_logs_request_exception(self) -> None:
-        with patch("api.deepseek.requests.post", side_effect=requests.exceptions.ConnectionError("boom")):
+        with patch("api.deepseek.http_pool.post", side_effect=requests.exceptions.ConnectionError("boom")):
             with self.assertRaisesRegex(requests.exceptions.ConnectionError, "boom"):
                 DeepSeek("key", "model").reason([{"role": "user", "content": "hi"}])
 
@@ -185,7 +212,7 @@ class OpenAICompatibleProviderTest(unittest.TestCase):
         self.assertEqual(records[0]["exception_message"], "boom")
 
     def test_generic_chat_completion_logs_non_200_response(self) -> None:
-        with patch("api.chat_completion.requests.post", return_value=FakeResponse(500, text="server error")):
+        with patch("api.chat_completion.http_pool.post", return_value=FakeResponse(500, text="server error")):
             with self.assertRaisesRegex(Exception, "500"):
                 ChatCompletion(
                     "https://example.test/v1",
@@ -286,7 +313,7 @@ class KimiProviderTest(unittest.TestCase):
                 ]
             })
 
-        with patch("api.kimi.requests.post", side_effect=post):
+        with patch("api.kimi.http_pool.post", side_effect=post):
             result = Kimi("key").reason([
                 {"role": "system", "content": "system prompt"},
                 {"role": "user", "content": "hi"},
@@ -316,7 +343,7 @@ class KimiProviderTest(unittest.TestCase):
             {"role": "user", "content": "hi"},
         ]
 
-        with patch("api.kimi.requests.post", side_effect=post):
+        with patch("api.kimi.http_pool.post", side_effect=post):
             result = Kimi("key", "kimi-k2.6", protocol="openai").reason(messages)
 
         self.assertEqual(result, "provider-answer")
@@ -340,7 +367,7 @@ class KimiProviderTest(unittest.TestCase):
             ]
         })
 
-        with patch("api.kimi.requests.post", return_value=response):
+        with patch("api.kimi.http_pool.post", return_value=response):
             with self.assertRaisesRegex(Exception, "max_tokens"):
                 Kimi("key", protocol="openai", max_tokens=16).reason([
                     {"role": "user", "content": "hi"}
@@ -547,5 +574,116 @@ class DoubaoTest(unittest.TestCase):
         self.assertTrue(records[0]["request_body"]["stream"])
 
 
+class FakeAsyncArkStream(FakeArkStream):
+    async def __aiter__(self):
+        for chunk in FakeArkStream.__iter__(self):
+            yield chunk
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class FakeAsyncArkCompletions(FakeArkCompletions):
+    async def create(self, model, messages, stream=False):
+        if stream:
+            self.calls.append((model, messages, stream))
+            return FakeAsyncArkStream()
+        self.calls.append((model, messages))
+        return FakeArkCompletion()
+
+
+class FakeAsyncArk:
+    calls = []
+
+    def __init__(self, api_key: str) -> None:
+        self.chat = FakeArkChat(self.calls)
+        self.chat.completions = FakeAsyncArkCompletions(self.calls)
+
+
+class AsyncProviderClientTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.success_log_path = Path(self.temp_dir.name) / "llm_success_requests.jsonl"
+        self.log_path_patcher = patch.object(
+            error_request_logger,
+            "LOG_PATH",
+            Path(self.temp_dir.name) / "llm_error_requests.jsonl",
+        )
+        self.success_log_path_patcher = patch.object(
+            error_request_logger,
+            "SUCCESS_LOG_PATH",
+            self.success_log_path,
+        )
+        self.log_path_patcher.start()
+        self.success_log_path_patcher.start()
+
+    def tearDown(self) -> None:
+        self.success_log_path_patcher.stop()
+        self.log_path_patcher.stop()
+        self.temp_dir.cleanup()
+
+    async def test_deepseek_reason_async_posts_same_request_as_blocking_path(self) -> None:
+        messages = [{"role": "user", "content": "hi"}]
+        async_post = AsyncMock(return_value=FakeResponse(200))
+
+        with (
+            patch("api.deepseek.http_pool.async_post", async_post),
+            patch("api.deepseek.http_pool.post") as blocking_post,
+        ):
+            result = await DeepSeek("key", "deepseek-chat").reason_async(messages)
+
+        self.assertEqual(result, "provider-answer")
+        blocking_post.assert_not_called()
+        self.assertEqual(async_post.call_args.args[0], "https://api.deepseek.com/chat/completions")
+        self.assertEqual(async_post.call_args.kwargs["json"], {
+            "model": "deepseek-chat",
+            "messages": messages,
+        })
+
+    async def test_openai_compatible_providers_raise_on_non_200_async_response(self) -> None:
+        with patch(
+            "api.chat_completion.http_pool.async_post",
+            AsyncMock(return_value=FakeResponse(500, text="upstream")),
+        ):
+            with self.assertRaisesRegex(Exception, "500, upstream"):
+                await ChatCompletion("key", "model", "https://example.test/v1").reason_async([])
+
+    async def test_kimi_async_stream_delegates_protocol(self) -> None:
+        async def fake_stream(**kwargs):
+            yield kwargs["protocol"]
+
+        with patch("api.kimi.stream_chat_completion_async", side_effect=fake_stream) as stream:
+            chunks = [chunk async for chunk in Kimi("key").reason_stream_async([])]
+
+        self.assertEqual(chunks, ["anthropic"])
+        self.assertEqual(stream.call_args.kwargs["url"], "https://api.kimi.com/coding/v1/messages")
+
+    async def test_minimax_reason_async_strips_think_tags_and_keeps_raw(self) -> None:
+        payload = {"choices": [{"message": {"content": "<think>plan</think>answer"}}]}
+        client = MiniMax("key", "MiniMax-M2.5")
+
+        with patch(
+            "api.minimax.http_pool.async_post",
+            AsyncMock(return_value=FakeResponse(200, payload=payload)),
+        ):
+            result = await client.reason_async([])
+
+        self.assertEqual(result, "answer")
+        self.assertEqual(client._last_raw_content, "<think>plan</think>answer")
+
+    async def test_doubao_uses_async_ark_client(self) -> None:
+        FakeAsyncArk.calls = []
+        messages = [{"role": "user", "content": "hi"}]
+
+        with patch("api.doubao.Ark", FakeArk), patch("api.doubao.AsyncArk", FakeAsyncArk):
+            client = Doubao("key", "ep-1")
+            result = await client.reason_async(messages)
+            chunks = [chunk async for chunk in client.reason_stream_async(messages)]
+
+        self.assertEqual(result, "doubao-answer")
+        self.assertEqual(chunks, ["doubao-", "stream"])
+        self.assertEqual(FakeAsyncArk.calls, [("ep-1", messages), ("ep-1", messages, True)])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -6,6 +6,7 @@ if not hasattr(typing, "override"):
 
 from api.base_api import BaseApi
 from api.fallback_api import FallbackApi, FallbackEntry
+from api.provider_errors import AuthenticationError, ContextLengthError
 from api.provider_fallback_api import ProviderFallbackApi, ProviderFallbackEntry
 from api.retrying_api import ProviderFallbackEvent, ProviderSwitchEvent
 
@@ -37,6 +38,51 @@ class PartialStreamingClient(SuccessfulClient):
         raise RuntimeError("stream interrupted")
 
 
+class RaisingClient(SuccessfulClient):
+    def __init__(self, exception: Exception) -> None:
+        super().__init__()
+        self.exception = exception
+
+    def reason(self, messages: list[dict[str, str]]) -> str:
+        self.calls += 1
+        raise self.exception
+
+
+class FallbackApiTest(unittest.TestCase):
+    def test_skips_entries_sharing_rejected_key_or_oversized_model(self) -> None:
+        auth_error = AuthenticationError("401, invalid key", status_code=401)
+        context_error = ContextLengthError("400, context_length_exceeded", status_code=400)
+        skipped = [SuccessfulClient("same-key"), SuccessfulClient("same-model")]
+        entries = [
+            FallbackEntry("key#1:model-a", RaisingClient(auth_error), ("key-1",), "model-a"),
+            FallbackEntry("key#1:model-b", skipped[0], ("key-1",), "model-b"),
+            FallbackEntry("key#2:model-a", RaisingClient(context_error), ("key-2",), "model-a"),
+            FallbackEntry("key#3:model-a", skipped[1], ("key-3",), "model-a"),
+            FallbackEntry("key#3:model-b", SuccessfulClient("answer"), ("key-3",), "model-b"),
+        ]
+
+        self.assertEqual(FallbackApi("p1", entries).reason([]), "answer")
+        self.assertEqual([client.calls for client in skipped], [0, 0])
+
+    def test_failure_event_lists_only_attempted_entries(self) -> None:
+        events = []
+        auth_error = AuthenticationError("401, invalid key", status_code=401)
+        chain = FallbackApi(
+            "p1",
+            [
+                FallbackEntry("key#1:model-a", RaisingClient(auth_error), ("key-1",), "model-a"),
+                FallbackEntry("key#1:model-b", SuccessfulClient(), ("key-1",), "model-b"),
+            ],
+            failure_handlers=[events.append],
+        )
+
+        with self.assertRaises(AuthenticationError):
+            list(chain.reason_stream([]))
+
+        self.assertEqual(events[0].targets, ["key#1:model-a"])
+        self.assertEqual(events[0].exceptions, [auth_error])
+
+
 class ProviderFallbackApiTest(unittest.TestCase):
     def test_switches_provider_and_reports_failed_inner_targets(self) -> None:
         events = []
@@ -165,5 +211,50 @@ class ProviderFallbackApiTest(unittest.TestCase):
         self.assertEqual(events[0].providers, ["p1"])
 
 
+class AsyncProviderFallbackApiTest(unittest.IsolatedAsyncioTestCase):
+    async def test_async_chain_switches_provider_and_reports_events(self) -> None:
+        events = []
+        first_provider = FallbackApi(
+            "p1",
+            [
+                FallbackEntry("model-a", FailingClient("p1-a")),
+                FallbackEntry("model-b", FailingClient("p1-b")),
+            ],
+        )
+        chain = ProviderFallbackApi(
+            [
+                ProviderFallbackEntry("p1", first_provider),
+                ProviderFallbackEntry("p2", SuccessfulClient("from-p2")),
+            ],
+            failure_handlers=[events.append],
+        )
+
+        result = await chain.reason_async([])
+
+        self.assertEqual(result, "from-p2")
+        self.assertEqual([type(event) for event in events], [ProviderSwitchEvent])
+        self.assertEqual(events[0].targets, ["model-a", "model-b"])
+
+    async def test_async_stream_does_not_switch_after_visible_content(self) -> None:
+        events = []
+        second_provider = SuccessfulClient("from-p2")
+        chain = ProviderFallbackApi(
+            [
+                ProviderFallbackEntry("p1", PartialStreamingClient()),
+                ProviderFallbackEntry("p2", second_provider),
+            ],
+            failure_handlers=[events.append],
+        )
+
+        received = []
+        with self.assertRaisesRegex(RuntimeError, "stream interrupted"):
+            async for chunk in chain.reason_stream_async([]):
+                received.append(chunk)
+
+        self.assertEqual(received, ["partial"])
+        self.assertEqual(second_provider.calls, 0)
+        self.assertEqual([type(event) for event in events], [ProviderFallbackEvent])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,263 @@
+import asyncio
+import typing
+import unittest
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from api.base_api import BaseApi
+from api.fallback_api import FallbackApi, FallbackEntry
+from api.provider_errors import RateLimitError
+from api.provider_fallback_api import ProviderFallbackApi, ProviderFallbackEntry
+from api.rate_limiting import RateLimit, RateLimitedError, RateLimiter
+from api.retry_policy import RetryPolicy
+from api.retrying_api import ProviderSwitchEvent, RetryingApi
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    async def sleep_async(self, seconds: float) -> None:
+        self.sleep(seconds)
+
+
+class NamedClient(BaseApi):
+    def __init__(self, name: str, calls: list[str], answer: str | None = None) -> None:
+        self.name = name
+        self.calls = calls
+        self.answer = answer or name
+
+    def reason(self, messages: list[dict[str, str]]) -> str:
+        self.calls.append(self.name)
+        return self.answer
+
+    async def reason_stream_async(self, messages: list[dict[str, str]]):
+        self.calls.append(self.name)
+        for chunk in self.answer.split(" "):
+            yield chunk
+
+
+def limited_chain(clock: FakeClock, calls: list[str], *limits: RateLimit, **kwargs) -> FallbackApi:
+    entries = [
+        FallbackEntry(f"m{index}", NamedClient(f"m{index}", calls), model=f"m{index}", limiter=RateLimiter(limit, clock))
+        for index, limit in enumerate(limits, start=1)
+    ]
+    return FallbackApi("p1", entries, sleeper=clock.sleep, async_sleeper=clock.sleep_async, **kwargs)
+
+
+class RateLimitTest(unittest.TestCase):
+    def test_from_config_pops_keys_and_validates(self) -> None:
+        config = {"api_key": "a", "rate_limit_rpm": "60", "rate_limit_tpm": "1000", "rate_limit_max_wait": "2.5"}
+
+        limit = RateLimit.from_config(config)
+
+        self.assertEqual(config, {"api_key": "a"})
+        self.assertEqual(limit, RateLimit(rpm=60, tpm=1000, max_wait=2.5))
+        self.assertFalse(RateLimit.from_config({}).enabled)
+        with self.assertRaisesRegex(ValueError, "rate_limit_rpm must not be negative"):
+            RateLimit.from_config({"rate_limit_rpm": "-1"})
+
+    def test_buckets_refill_over_the_minute(self) -> None:
+        clock = FakeClock()
+        limiter = RateLimiter(RateLimit(rpm=2, tpm=100), clock)
+
+        self.assertTrue(limiter.try_acquire(40))
+        self.assertFalse(limiter.try_acquire(80))
+        self.assertAlmostEqual(limiter.wait_time(80), 12.0)
+        self.assertTrue(limiter.try_acquire(10))
+        # 请求数额度用完，token 额度还剩 50
+        self.assertAlmostEqual(limiter.wait_time(10), 30.0)
+        clock.now = 30.0
+        self.assertTrue(limiter.try_acquire(10))
+        # 输出的 token 可以让额度暂时为负，超过容量的请求等到桶满为止
+        limiter.charge(90)
+        self.assertAlmostEqual(limiter.wait_time(1000), 60.0)
+
+
+class RateLimitedFallbackTest(unittest.TestCase):
+    def test_exhausted_entry_routes_to_next_without_request(self) -> None:
+        clock = FakeClock()
+        calls: list[str] = []
+        chain = limited_chain(clock, calls, RateLimit(rpm=1), RateLimit(rpm=1))
+
+        self.assertEqual([chain.reason([]), chain.reason([])], ["m1", "m2"])
+        self.assertEqual(calls, ["m1", "m2"])
+        self.assertEqual(clock.sleeps, [])
+
+    def test_waits_when_every_entry_is_exhausted(self) -> None:
+        clock = FakeClock()
+        calls: list[str] = []
+        chain = limited_chain(clock, calls, RateLimit(rpm=60, max_wait=2.0), RateLimit(rpm=30, max_wait=2.0))
+        for entry in chain.entries:
+            while entry.limiter.try_acquire(0):
+                pass
+
+        self.assertEqual(chain.reason([]), "m1")
+        self.assertEqual(clock.sleeps, [1.0])
+
+    def test_fails_fast_when_wait_exceeds_max_wait(self) -> None:
+        clock = FakeClock()
+        calls: list[str] = []
+        events = []
+        chain = limited_chain(clock, calls, RateLimit(rpm=1, max_wait=5.0), failure_handlers=[events.append])
+        chain.reason([])
+
+        with self.assertRaises(RateLimitedError) as raised:
+            chain.reason([])
+
+        self.assertAlmostEqual(raised.exception.retry_after, 60.0)
+        self.assertEqual(calls, ["m1"])
+        self.assertEqual(events, [])
+
+    def test_stream_charges_completion_tokens(self) -> None:
+        clock = FakeClock()
+        calls: list[str] = []
+        chain = limited_chain(clock, calls, RateLimit(tpm=60))
+        chain.entries[0].client.answer = "你好 世界"
+
+        async def scenario() -> list[str]:
+            return [chunk async for chunk in chain.reason_stream_async([{"role": "user", "content": "hi"}])]
+
+        self.assertEqual(asyncio.run(scenario()), ["你好", "世界"])
+        # 输入 1 + 4 个 token，输出 4 个 token
+        self.assertAlmostEqual(chain.entries[0].limiter.wait_time(60), 9.0)
+
+
+class ThrottledClient(BaseApi):
+    """Returns 429 for the first few calls, then answers."""
+
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.calls = 0
+
+    def reason(self, messages: list[dict[str, str]]) -> str:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RateLimitError("rate limited", status_code=429)
+        return "ok"
+
+
+class CountingLimiter(RateLimiter):
+    def __init__(self, limit: RateLimit, clock: FakeClock) -> None:
+        super().__init__(limit, clock)
+        self.acquired = 0
+
+    def try_acquire(self, tokens: int) -> bool:
+        acquired = super().try_acquire(tokens)
+        self.acquired += acquired
+        return acquired
+
+
+class RateLimitedRetryTest(unittest.TestCase):
+    def limited_retrying_chain(self, clock: FakeClock, client: ThrottledClient, limit: RateLimit) -> FallbackApi:
+        limiter = CountingLimiter(limit, clock)
+        retrying = RetryingApi(
+            "m1",
+            client,
+            policy=RetryPolicy(max_retries=3, base_delay=0.5),
+            sleeper=clock.sleep,
+            jitter=lambda low, high: high,
+            limiter=limiter,
+        )
+        return FallbackApi("p1", [FallbackEntry("m1", retrying, limiter=limiter)], sleeper=clock.sleep)
+
+    def test_every_retry_takes_quota(self) -> None:
+        clock = FakeClock()
+        client = ThrottledClient(failures=2)
+        chain = self.limited_retrying_chain(clock, client, RateLimit(rpm=60))
+
+        self.assertEqual(chain.reason([]), "ok")
+
+        self.assertEqual(client.calls, 3)
+        self.assertEqual(chain.entries[0].limiter.acquired, client.calls)
+
+    def test_retry_waits_for_quota_and_stops_beyond_max_wait(self) -> None:
+        clock = FakeClock()
+        client = ThrottledClient(failures=2)
+        chain = self.limited_retrying_chain(clock, client, RateLimit(rpm=2, max_wait=40.0))
+
+        # 第二次重试时额度已用完，等到恢复一个请求的额度后再发出
+        self.assertEqual(chain.reason([]), "ok")
+        self.assertEqual(chain.entries[0].limiter.acquired, client.calls)
+        self.assertAlmostEqual(clock.sleeps[-1], 29.5)
+
+        clock = FakeClock()
+        client = ThrottledClient(failures=1)
+        chain = self.limited_retrying_chain(clock, client, RateLimit(rpm=1, max_wait=40.0))
+
+        # 恢复额度需要 60 秒，超过上限，不再重试
+        with self.assertRaises(RateLimitError):
+            chain.reason([])
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(clock.sleeps, [])
+
+
+class RateLimitedProviderChainTest(unittest.TestCase):
+    def test_rate_limited_provider_switches_without_notification(self) -> None:
+        clock = FakeClock()
+        calls: list[str] = []
+        events = []
+        limited = limited_chain(clock, calls, RateLimit(rpm=1, max_wait=0.0))
+        limited.reason([])
+        chain = ProviderFallbackApi(
+            [ProviderFallbackEntry("p1", limited), ProviderFallbackEntry("p2", NamedClient("p2", calls))],
+            failure_handlers=[events.append],
+        )
+
+        self.assertEqual(chain.reason([]), "p2")
+        self.assertEqual(calls, ["m1", "p2"])
+        self.assertFalse(any(isinstance(event, ProviderSwitchEvent) for event in events))
+
+        only_limited = ProviderFallbackApi([ProviderFallbackEntry("p1", limited)], failure_handlers=[events.append])
+        with self.assertRaises(RateLimitedError):
+            only_limited.reason([])
+        self.assertEqual(events, [])
+
+    def exhausted_providers(self, clock: FakeClock, calls: list[str]) -> ProviderFallbackApi:
+        providers = []
+        for name, limit in (("p1", RateLimit(rpm=60, max_wait=2.0)), ("p2", RateLimit(rpm=30, max_wait=2.0))):
+            provider = limited_chain(clock, calls, limit, waits_for_capacity=False)
+            provider.entries[0].client.name = provider.entries[0].client.answer = name
+            while provider.entries[0].limiter.try_acquire(0):
+                pass
+            providers.append(ProviderFallbackEntry(name, provider))
+        return ProviderFallbackApi(providers, sleeper=clock.sleep, async_sleeper=clock.sleep_async)
+
+    def test_provider_chain_waits_once_every_provider_is_exhausted(self) -> None:
+        clock = FakeClock()
+        calls: list[str] = []
+        chain = self.exhausted_providers(clock, calls)
+
+        # 内层链不等待，立即让出给下一个服务商
+        with self.assertRaises(RateLimitedError) as raised:
+            chain.entries[0].client.reason([])
+        self.assertEqual((raised.exception.retry_after, raised.exception.max_wait), (1.0, 2.0))
+        self.assertEqual(clock.sleeps, [])
+
+        self.assertEqual(chain.reason([]), "p1")
+        self.assertEqual(clock.sleeps, [1.0])
+        self.assertEqual(calls, ["p1"])
+
+    def test_async_provider_chain_stream_waits_for_capacity(self) -> None:
+        clock = FakeClock()
+        calls: list[str] = []
+        chain = self.exhausted_providers(clock, calls)
+
+        async def scenario() -> list[str]:
+            return [chunk async for chunk in chain.reason_stream_async([])]
+
+        self.assertEqual(asyncio.run(scenario()), ["p1"])
+        self.assertEqual(clock.sleeps, [1.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
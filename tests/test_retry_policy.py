@@ -0,0 +1,123 @@
+import typing
+import unittest
+
+import requests
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from api.provider_errors import ProviderHTTPError
+from api.retry_policy import RetryPolicy, parse_retry_after, retry_after_seconds
+from api.retrying_api import RetryingApi
+from test_retrying_api import SequenceClient
+
+
+def upper_bound(low: float, high: float) -> float:
+    return high
+
+
+def http_error(status_code: int, headers: dict[str, str]) -> requests.exceptions.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+    return requests.exceptions.HTTPError(f"HTTP {status_code}", response=response)
+
+
+def provider_error(status_code: int, headers: dict[str, str] | None = None) -> ProviderHTTPError:
+    return ProviderHTTPError(f"HTTP {status_code}", status_code=status_code, headers=headers)
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_strategies_grow_and_cap_delays(self) -> None:
+        def delays(strategy: str) -> list[float | None]:
+            policy = RetryPolicy(strategy=strategy, base_delay=1.0, max_delay=5.0)
+            result, previous = [], 0.0
+            for retry_number in range(1, 5):
+                previous = policy.next_delay(retry_number, previous, jitter=upper_bound)
+                result.append(previous)
+            return result
+
+        self.assertEqual(delays(RetryPolicy.FIXED), [1.0, 1.0, 1.0, 1.0])
+        self.assertEqual(delays(RetryPolicy.EXPONENTIAL), [1.0, 2.0, 4.0, 5.0])
+        self.assertEqual(delays(RetryPolicy.FULL_JITTER), [1.0, 2.0, 4.0, 5.0])
+        self.assertEqual(delays(RetryPolicy.DECORRELATED_JITTER), [1.0, 3.0, 5.0, 5.0])
+
+    def test_retry_after_overrides_strategy_and_gives_up_beyond_max_delay(self) -> None:
+        policy = RetryPolicy(strategy=RetryPolicy.EXPONENTIAL, base_delay=1.0, max_delay=30.0)
+
+        self.assertEqual(policy.next_delay(3, 2.0, retry_after=7.0), 7.0)
+        self.assertIsNone(policy.next_delay(1, 0.0, retry_after=120.0))
+        ignoring = RetryPolicy(base_delay=1.0, respect_retry_after=False)
+        self.assertEqual(ignoring.next_delay(1, 0.0, retry_after=120.0), 1.0)
+
+    def test_parse_retry_after_formats(self) -> None:
+        now = lambda: 1_700_000_000.0
+
+        self.assertEqual(parse_retry_after({"retry-after-ms": "1500", "retry-after": "9"}, now), 1.5)
+        self.assertEqual(parse_retry_after({"retry-after": "12"}, now), 12.0)
+        self.assertEqual(parse_retry_after({"retry-after": "Tue, 14 Nov 2023 22:13:40 GMT"}, now), 20.0)
+        self.assertEqual(
+            parse_retry_after({"x-ratelimit-reset-requests": "1s", "x-ratelimit-reset-tokens": "6m0s"}, now),
+            360.0,
+        )
+        self.assertEqual(parse_retry_after({"x-ratelimit-reset": "1700000030"}, now), 30.0)
+        self.assertIsNone(parse_retry_after({"x-ratelimit-reset-requests": "1s"}, now, rate_limited=False))
+        self.assertIsNone(parse_retry_after({}, now))
+
+    def test_retry_after_seconds_reads_exception_response(self) -> None:
+        self.assertEqual(retry_after_seconds(http_error(429, {"Retry-After": "3"})), 3.0)
+        self.assertEqual(retry_after_seconds(http_error(429, {"x-ratelimit-reset-tokens": "2s"})), 2.0)
+        self.assertIsNone(retry_after_seconds(http_error(500, {"x-ratelimit-reset-tokens": "2s"})))
+        self.assertEqual(retry_after_seconds(provider_error(503, {"Retry-After": "5"})), 5.0)
+        self.assertIsNone(retry_after_seconds(provider_error(503)))
+        self.assertIsNone(retry_after_seconds(Exception("HTTP 503")))
+
+    def test_from_config_pops_retry_keys_and_validates(self) -> None:
+        config = {"api_key": "key", "retry_strategy": "Full_Jitter", "retry_max_retries": "2", "retry_max_delay": "9"}
+
+        policy = RetryPolicy.from_config(config)
+
+        self.assertEqual(config, {"api_key": "key"})
+        self.assertEqual(policy, RetryPolicy(strategy=RetryPolicy.FULL_JITTER, max_retries=2, max_delay=9.0))
+        with self.assertRaisesRegex(ValueError, "retry_strategy must be one of"):
+            RetryPolicy.from_config({"retry_strategy": "linear"})
+        with self.assertRaisesRegex(ValueError, "retry_max_delay must not be less than retry_base_delay"):
+            RetryPolicy.from_config({"retry_base_delay": "10", "retry_max_delay": "1"})
+
+
+class RetryingApiPolicyTest(unittest.TestCase):
+    def test_uses_policy_delays_and_retry_after(self) -> None:
+        sleeps = []
+        client = SequenceClient([provider_error(500), http_error(429, {"retry-after": "4"}), provider_error(502), "ok"])
+        retrying = RetryingApi(
+            "provider",
+            client,
+            sleeper=sleeps.append,
+            policy=RetryPolicy(strategy=RetryPolicy.EXPONENTIAL, max_retries=3, base_delay=0.5),
+        )
+
+        self.assertEqual(retrying.reason([]), "ok")
+        self.assertEqual(sleeps, [0.5, 4.0, 2.0])
+
+    def test_gives_up_when_retry_after_exceeds_max_delay(self) -> None:
+        events = []
+        sleeps = []
+        client = SequenceClient([provider_error(429, {"retry-after": "600"}), "ok"])
+        retrying = RetryingApi(
+            "provider",
+            client,
+            failure_handlers=[events.append],
+            sleeper=sleeps.append,
+            policy=RetryPolicy(max_retries=3, max_delay=60.0),
+        )
+
+        with self.assertRaisesRegex(Exception, "HTTP 429"):
+            retrying.reason([])
+
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(sleeps, [])
+        self.assertEqual([event.will_retry for event in events], [False])
+
+
+if __name__ == "__main__":
+    unittest.main()
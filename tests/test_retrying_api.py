@@ -4,9 +4,11 @@ import unittest
 if not hasattr(typing, "override"):
     typing.override = lambda func: func
 
+import httpx
 import requests
 
 from api.base_api import BaseApi
+from api.provider_errors import ContextLengthError, ProviderHTTPError
 from api.retrying_api import (
     FailureEvent,
     FeishuNotifier,
@@ -61,7 +63,11 @@ class RetryingApiTest(unittest.TestCase):
     def test_retries_retryable_exception_until_success(self) -> None:
         events = []
         sleeps = []
-        client = SequenceClient([Exception("HTTP 500"), Exception("HTTP 502"), "ok"])
+        client = SequenceClient([
+            ProviderHTTPError("HTTP 500", status_code=500),
+            ProviderHTTPError("HTTP 502", status_code=502),
+            "ok",
+        ])
         retrying = RetryingApi(
             "provider",
             client,
@@ -82,7 +88,7 @@ class RetryingApiTest(unittest.TestCase):
     def test_non_retryable_exception_fails_without_sleep(self) -> None:
         events = []
         sleeps = []
-        client = SequenceClient([Exception("HTTP 401")])
+        client = SequenceClient([ProviderHTTPError("HTTP 401", status_code=401)])
         retrying = RetryingApi(
             "provider",
             client,
@@ -100,6 +106,21 @@ class RetryingApiTest(unittest.TestCase):
         self.assertIsInstance(events[0], RetryEvent)
         self.assertFalse(events[0].will_retry)
 
+    def test_retry_decision_uses_typed_errors_not_message_text(self) -> None:
+        sleeps = []
+        client = SequenceClient([
+            Exception("prompt has 503 tokens"),
+            ContextLengthError("HTTP 400, maximum context length is 4096", status_code=400),
+        ])
+        retrying = RetryingApi("provider", client, max_retries=3, sleeper=sleeps.append)
+
+        for expected in (Exception, ContextLengthError):
+            with self.assertRaises(expected):
+                retrying.reason([])
+
+        self.assertEqual(client.calls, 2)
+        self.assertEqual(sleeps, [])
+
     def test_retryable_exception_reports_final_failure_after_retries(self) -> None:
         events = []
         client = SequenceClient([requests.exceptions.Timeout(), requests.exceptions.Timeout()])
@@ -173,6 +194,80 @@ class RetryingApiTest(unittest.TestCase):
         self.assertEqual([event.will_retry for event in events], [False])
 
 
+class AsyncSequenceClient(SequenceClient):
+    async def reason_async(self, messages: list[dict[str, str]]) -> str:
+        return self.reason(messages)
+
+    async def reason_stream_async(self, messages: list[dict[str, str]]):
+        self.calls += 1
+        outcomes = self.outcomes.pop(0)
+        if isinstance(outcomes, Exception):
+            raise outcomes
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                raise outcome
+            yield str(outcome)
+
+
+class AsyncRetryingApiTest(unittest.IsolatedAsyncioTestCase):
+    async def test_async_retries_httpx_transport_errors_with_async_sleeper(self) -> None:
+        events = []
+        sleeps = []
+
+        async def record_sleep(delay: float) -> None:
+            sleeps.append(delay)
+
+        client = AsyncSequenceClient([httpx.ConnectError("refused"), httpx.ReadTimeout("slow"), "ok"])
+        retrying = RetryingApi(
+            "provider",
+            client,
+            max_retries=2,
+            retry_delay_seconds=0.25,
+            failure_handlers=[events.append],
+            sleeper=lambda delay: self.fail("blocking sleeper used on async path"),
+            async_sleeper=record_sleep,
+        )
+
+        result = await retrying.reason_async([])
+
+        self.assertEqual(result, "ok")
+        self.assertEqual(client.calls, 3)
+        self.assertEqual(sleeps, [0.25, 0.25])
+        self.assertEqual([event.will_retry for event in events], [True, True])
+
+    async def test_async_stream_does_not_retry_after_visible_chunk(self) -> None:
+        events = []
+        client = AsyncSequenceClient([
+            httpx.ConnectError("refused"),
+            ["partial", httpx.ReadTimeout("slow")],
+            ["third-attempt"],
+        ])
+        retrying = RetryingApi(
+            "provider",
+            client,
+            max_retries=2,
+            retry_delay_seconds=0,
+            failure_handlers=[events.append],
+        )
+
+        received = []
+        with self.assertRaises(httpx.ReadTimeout):
+            async for chunk in retrying.reason_stream_async([]):
+                received.append(chunk)
+
+        self.assertEqual(received, ["partial"])
+        self.assertEqual(client.calls, 2)
+        self.assertEqual([event.will_retry for event in events], [True, False])
+
+    async def test_async_default_bridges_to_blocking_client(self) -> None:
+        client = StreamingSequenceClient([["a", "b"]])
+        retrying = RetryingApi("provider", client, max_retries=0)
+
+        chunks = [chunk async for chunk in retrying.reason_stream_async([])]
+
+        self.assertEqual(chunks, ["a", "b"])
+
+
 class FeishuNotifierTest(unittest.TestCase):
     def test_notify_failure_ignores_retry_events_that_will_retry(self) -> None:
         calls = []
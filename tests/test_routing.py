@@ -0,0 +1,189 @@
+import typing
+import unittest
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from api.base_api import BaseApi
+from api.fallback_api import FallbackApi, FallbackEntry
+from api.provider_errors import ContextLengthError, ProviderHTTPError
+from api.provider_fallback_api import ProviderFallbackApi, ProviderFallbackEntry
+from api.retrying_api import ProviderSwitchEvent
+from api.routing import RoutingSettings, TargetStats, rank_entries
+
+LATENCY = RoutingSettings(mode="latency", ewma_alpha=0.5, min_samples=2, max_error_rate=0.5)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TimedClient(BaseApi):
+    """Advances the shared clock by a fixed latency on every call."""
+
+    def __init__(self, name: str, clock: FakeClock, latency: float, first_token: float | None = None) -> None:
+        self.name = name
+        self.clock = clock
+        self.latency = latency
+        self.first_token = latency if first_token is None else first_token
+        self.healthy = True
+        self.calls = 0
+
+    def reason(self, messages: list[dict[str, str]]) -> str:
+        self.calls += 1
+        self.clock.now += self.latency
+        if not self.healthy:
+            raise RuntimeError(f"{self.name} down")
+        return self.name
+
+    def reason_stream(self, messages: list[dict[str, str]]):
+        self.calls += 1
+        self.clock.now += self.first_token
+        yield self.name
+        self.clock.now += self.latency - self.first_token
+        yield "tail"
+
+
+def stats_for(name: str, clock: FakeClock, settings: RoutingSettings = LATENCY) -> TargetStats:
+    return TargetStats(name, lambda: settings, clock=clock)
+
+
+class RoutingSettingsTest(unittest.TestCase):
+    def test_validation(self) -> None:
+        is_valid, errors = RoutingSettings.validate_config({
+            "mode": "fastest",
+            "ewma_alpha": 0.0,
+            "min_samples": 0,
+            "max_error_rate": 1.5,
+        })
+
+        self.assertFalse(is_valid)
+        self.assertEqual(errors, [
+            "mode must be one of: ordered, latency",
+            "ewma_alpha must be greater than 0 and at most 1",
+            "min_samples must be greater than 0",
+            "max_error_rate must be greater than 0 and at most 1",
+        ])
+        self.assertTrue(RoutingSettings(mode='"Latency"').latency_routing)
+        self.assertFalse(RoutingSettings().latency_routing)
+
+
+class TargetStatsTest(unittest.TestCase):
+    def test_rank_key_uses_ewma_and_waits_for_min_samples(self) -> None:
+        stats = stats_for("a", FakeClock())
+
+        stats.record_success(1.0, ttft=0.2)
+        self.assertEqual(stats.rank_key(LATENCY, streaming=False), (0, 0.0))
+        stats.record_success(3.0, ttft=0.4)
+
+        self.assertEqual(stats.rank_key(LATENCY, streaming=False), (0, 2.0))
+        self.assertAlmostEqual(stats.rank_key(LATENCY, streaming=True)[1], 0.3)
+        self.assertEqual(stats.snapshot()["samples"], 2)
+
+    def test_errors_inflate_score_and_mark_unhealthy(self) -> None:
+        stats = stats_for("a", FakeClock())
+        stats.record_success(1.0)
+        stats.record_failure(RuntimeError("down"))
+        self.assertEqual(stats.rank_key(LATENCY, streaming=False), (0, 2.0))
+
+        stats.record_failure(RuntimeError("down"))
+        self.assertEqual(stats.rank_key(LATENCY, streaming=False)[0], 1)
+
+    def test_client_request_errors_are_ignored(self) -> None:
+        stats = stats_for("a", FakeClock())
+        stats.record_success(1.0)
+        stats.record_success(1.0)
+        stats.record_failure(ContextLengthError("too long", status_code=400))
+        stats.record_failure(ProviderHTTPError("invalid_request_error", status_code=422))
+
+        self.assertEqual(stats.snapshot()["samples"], 2)
+        self.assertEqual(stats.rank_key(LATENCY, streaming=False), (0, 1.0))
+
+
+class RankEntriesTest(unittest.TestCase):
+    def test_ordered_mode_and_missing_settings_keep_config_order(self) -> None:
+        clock = FakeClock()
+        slow, fast = stats_for("slow", clock), stats_for("fast", clock)
+        for _ in range(2):
+            slow.record_success(5.0)
+            fast.record_success(1.0)
+        entries = [
+            FallbackEntry("slow", TimedClient("slow", clock, 5.0), stats=slow),
+            FallbackEntry("fast", TimedClient("fast", clock, 1.0), stats=fast),
+        ]
+
+        self.assertIs(rank_entries(entries, None, streaming=False), entries)
+        self.assertIs(rank_entries(entries, lambda: RoutingSettings(), streaming=False), entries)
+        ranked = rank_entries(entries, lambda: LATENCY, streaming=False)
+        self.assertEqual([entry.target for entry in ranked], ["fast", "slow"])
+
+
+class LatencyRoutingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+
+    def chain(self, *clients: TimedClient) -> FallbackApi:
+        entries = [FallbackEntry(client.name, client, stats=stats_for(client.name, self.clock)) for client in clients]
+        return FallbackApi("p1", entries, routing_settings=lambda: LATENCY)
+
+    def test_prefers_faster_target_once_measured(self) -> None:
+        slow = TimedClient("slow", self.clock, latency=4.0)
+        fast = TimedClient("fast", self.clock, latency=1.0)
+        chain = self.chain(slow, fast)
+
+        # 样本不足的目标排在前面：先按配置顺序测量 slow，再测量 fast
+        self.assertEqual([chain.reason([]) for _ in range(5)], ["slow", "slow", "fast", "fast", "fast"])
+        self.assertEqual(slow.calls, 2)
+
+        fast.healthy = False
+        self.assertEqual(chain.reason([]), "slow")
+        self.assertEqual(fast.calls, 4)
+
+    def test_streaming_ranks_by_time_to_first_token(self) -> None:
+        steady = TimedClient("steady", self.clock, latency=2.0, first_token=1.0)
+        quick_start = TimedClient("quick_start", self.clock, latency=3.0, first_token=0.1)
+        chain = self.chain(steady, quick_start)
+        for stats in (entry.stats for entry in chain.entries):
+            for _ in range(2):
+                stats.record_success(
+                    2.0 if stats.target == "steady" else 3.0,
+                    ttft=1.0 if stats.target == "steady" else 0.1,
+                )
+
+        self.assertEqual(chain.reason([]), "steady")
+        self.assertEqual(list(chain.reason_stream([])), ["quick_start", "tail"])
+        self.assertAlmostEqual(chain.entries[1].stats.snapshot()["ttft_ms"], 100.0)
+
+    def test_provider_chain_switch_event_names_next_ranked_provider(self) -> None:
+        events = []
+        clients = [TimedClient(name, self.clock, latency) for name, latency in (("p1", 3.0), ("p2", 2.0), ("p3", 1.0))]
+        entries = [ProviderFallbackEntry(client.name, client, stats=stats_for(client.name, self.clock)) for client in clients]
+        chain = ProviderFallbackApi(entries, failure_handlers=[events.append], routing_settings=lambda: LATENCY)
+        for _ in range(2):
+            for client in clients:
+                client.reason([])
+                chain.entries[clients.index(client)].stats.record_success(client.latency)
+
+        clients[2].healthy = False
+        self.assertEqual(chain.reason([]), "p2")
+
+        switches = [event for event in events if isinstance(event, ProviderSwitchEvent)]
+        self.assertEqual([(event.from_provider, event.to_provider) for event in switches], [("p3", "p2")])
+
+
+class AsyncLatencyRoutingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_async_reason_records_latency(self) -> None:
+        clock = FakeClock()
+        client = TimedClient("a", clock, latency=1.5)
+        chain = FallbackApi("p1", [FallbackEntry("a", client, stats=stats_for("a", clock))], routing_settings=lambda: LATENCY)
+
+        self.assertEqual(await chain.reason_async([]), "a")
+        self.assertEqual(chain.entries[0].stats.snapshot()["latency_ms"], 1500.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
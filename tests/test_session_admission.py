@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+import typing
+import unittest
+from threading import Thread
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from models.session_admission import (
+    SessionAdmissionSettings,
+    SessionBusyError,
+    SessionQueueFullError,
+    SessionWaitTimeoutError,
+)
+from models.session_manager import SessionManager
+from test_message_session import FakeApiFactory
+
+
+class SessionAdmissionTest(unittest.TestCase):
+    def make_session(self, **settings):
+        api_factory = FakeApiFactory()
+        api_factory.settings[SessionAdmissionSettings.SECTION_NAME] = SessionAdmissionSettings(**settings)
+        manager = SessionManager(api_factory=api_factory)
+        return manager, manager.new_session("s1", provider="p1")
+
+    def wait_until(self, condition) -> None:
+        deadline = time.monotonic() + 2
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+    def test_reject_mode_returns_busy_immediately(self) -> None:
+        manager, session = self.make_session(mode="reject")
+
+        with session._conversation_lock:
+            with self.assertRaises(SessionBusyError) as raised:
+                session.chat("q")
+            with self.assertRaises(SessionBusyError):
+                next(session.chat_stream("q"))
+
+        self.assertEqual(raised.exception.status_code, 409)
+        self.assertEqual(session.chat("q"), "from-p1")
+        stats = manager.stats()["admission"]
+        self.assertEqual(stats["rejected"]["busy"], 2)
+        self.assertEqual((stats["admitted"], stats["waited"]), (1, 0))
+
+    def test_wait_mode_times_out_and_records_wait_time(self) -> None:
+        manager, session = self.make_session(mode="wait", wait_timeout_ms=30)
+
+        with session._conversation_lock:
+            with self.assertRaises(SessionWaitTimeoutError) as raised:
+                session.chat("q")
+
+        self.assertEqual(raised.exception.status_code, 429)
+        stats = manager.stats()["admission"]
+        self.assertEqual(stats["rejected"]["timeout"], 1)
+        self.assertGreaterEqual(stats["wait_ms"]["max"], 25)
+        self.assertEqual(session.admission_stats()["waiting"], 0)
+        self.assertGreaterEqual(session.admission_stats()["wait_ms"], 25)
+
+    def test_queue_mode_limits_waiters_per_session(self) -> None:
+        manager, session = self.make_session(mode="queue", max_queue_depth=1)
+        results = []
+
+        with session._conversation_lock:
+            waiter = Thread(target=lambda: results.append(session.chat("queued")))
+            waiter.start()
+            self.wait_until(lambda: session.waiting_requests == 1)
+            with self.assertRaises(SessionQueueFullError):
+                session.chat("rejected")
+            # 其他会话不受影响
+            self.assertEqual(manager.new_session("s2", provider="p2").chat("q"), "from-p2")
+        waiter.join(timeout=2)
+
+        self.assertEqual(results, ["from-p1"])
+        stats = manager.stats()["admission"]
+        self.assertEqual(stats["rejected"]["queue_full"], 1)
+        self.assertEqual((stats["admitted"], stats["waited"], stats["waiting"]), (2, 1, 0))
+
+    def test_async_requests_wait_without_blocking_the_event_loop(self) -> None:
+        manager, session = self.make_session(mode="wait", wait_timeout_ms=2000)
+
+        async def scenario() -> str:
+            session._conversation_lock.acquire()
+            pending = asyncio.ensure_future(session.chat_async("q"))
+            while session.waiting_requests == 0:
+                await asyncio.sleep(0.001)
+            session._conversation_lock.release()
+            return await pending
+
+        self.assertEqual(asyncio.run(scenario()), "from-p1")
+        self.assertEqual(manager.stats()["admission"]["waited"], 1)
+
+    def test_async_waiters_hold_no_threads_and_can_be_cancelled(self) -> None:
+        manager, session = self.make_session(mode="queue")
+
+        async def scenario() -> list[str]:
+            threads = threading.active_count()
+            session._conversation_lock.acquire()
+            waiters = [asyncio.ensure_future(session.chat_async(f"q{index}")) for index in range(3)]
+            while session.waiting_requests < 3:
+                await asyncio.sleep(0.001)
+            self.assertEqual(threading.active_count(), threads)
+            # 最早排队的请求被取消，释放时的唤醒转交给下一个等待者
+            waiters[0].cancel()
+            session._conversation_lock.release()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiters[0]
+            return await asyncio.wait_for(asyncio.gather(*waiters[1:]), 2)
+
+        self.assertEqual(asyncio.run(scenario()), ["from-p1", "from-p1"])
+        self.assertFalse(session.is_busy())
+        stats = manager.stats()["admission"]
+        self.assertEqual((stats["admitted"], stats["waited"], stats["waiting"]), (2, 3, 0))
+
+    def test_settings_reject_unknown_mode_and_invalid_limits(self) -> None:
+        is_valid, errors = SessionAdmissionSettings.validate_config({
+            "mode": "drop",
+            "wait_timeout_ms": 0,
+            "max_queue_depth": -1,
+        })
+
+        self.assertFalse(is_valid)
+        self.assertEqual(errors, [
+            "mode must be one of: reject, wait, queue",
+            "wait_timeout_ms must be greater than 0",
+            "max_queue_depth must not be negative",
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import tempfile
+import typing
+import unittest
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from models.cold_storage import ColdStorage, ColdStorageSettings, get_codec
+from models.message import Message
+from models.session_manager import SessionExistsError, SessionManager, SessionNotFoundError
+from models.session_store import SharedSqliteSessionStore, SqliteSessionStore
+from test_message_session import FakeApiFactory
+
+
+def contents(session) -> list:
+    return [message["content"] for message in session.snapshot_messages()]
+
+
+class MessageForkTest(unittest.TestCase):
+    def test_fork_shares_history_until_either_side_appends(self) -> None:
+        parent = Message("system")
+        parent.preserve_history("q1", "a1")
+        parent_size = parent.approximate_size()
+
+        fork = parent.fork()
+
+        self.assertIs(fork._history, parent._history)
+        self.assertIs(fork._messages_system_part, parent._messages_system_part)
+        self.assertLess(fork.approximate_size(), parent_size)
+        self.assertEqual(parent.approximate_size(), parent_size)
+
+        fork.preserve_history("fork-q", "fork-a")
+        parent.preserve_history("parent-q", "parent-a")
+
+        self.assertIsNot(fork._history, parent._history)
+        self.assertIs(fork._history[0], parent._history[0])
+        self.assertEqual([m["content"] for m in fork.messages], ["system", "q1", "a1", "fork-q", "fork-a"])
+        self.assertEqual([m["content"] for m in parent.messages], ["system", "q1", "a1", "parent-q", "parent-a"])
+        self.assertGreater(fork.approximate_size(), parent_size)
+
+    def test_fork_of_frozen_history_shares_compressed_payload(self) -> None:
+        parent = Message("system")
+        for index in range(20):
+            parent.preserve_history(f"问题 {index}", "同样的回答内容。" * 20)
+        before = list(parent.messages)
+        cold_storage = ColdStorage(lambda: ColdStorageSettings(idle_seconds=1.0))
+        self.assertTrue(parent.freeze_history(cold_storage, get_codec("zlib")))
+
+        fork = parent.fork()
+
+        self.assertIs(fork._frozen_history, parent._frozen_history)
+        fork.preserve_history("fork-q", "fork-a")
+        self.assertTrue(parent.is_frozen)
+        self.assertEqual(list(parent.messages), before)
+        self.assertEqual(list(fork.messages)[:-2], before)
+
+
+class SessionManagerForkTest(unittest.TestCase):
+    def test_fork_continues_independently_from_parent(self) -> None:
+        api_factory = FakeApiFactory()
+        manager = SessionManager(api_factory=api_factory)
+        parent = manager.new_session("s1", system_message="system", provider="p1")
+        parent.chat("q1", preserve=True)
+
+        fork = manager.fork_session("s1", new_id="s1-b", system_message="variant")
+        fork.chat("q2", preserve=True)
+        parent.chat("q3", preserve=True)
+
+        self.assertIs(manager.get_or_create_session("s1-b"), fork)
+        self.assertIs(fork.client, parent.client)
+        self.assertEqual(fork.provider, "p1")
+        self.assertEqual(contents(fork), ["variant", "q1", "from-p1", "q2", "from-p1"])
+        self.assertEqual(contents(parent), ["system", "q1", "from-p1", "q3", "from-p1"])
+        self.assertEqual(manager.stats()["system_prompts"]["prompts"], 2)
+
+    def test_fork_generates_id_and_rejects_missing_parent_or_taken_id(self) -> None:
+        manager = SessionManager(api_factory=FakeApiFactory())
+        manager.new_session("s1", provider="p1")
+        manager.new_session("s2", provider="p2")
+
+        generated = manager.fork_session("s1")
+
+        self.assertNotIn(generated.id, ["s1", "s2"])
+        self.assertIn(generated.id, manager.pool)
+        with self.assertRaises(SessionNotFoundError) as missing:
+            manager.fork_session("missing")
+        with self.assertRaises(SessionExistsError) as taken:
+            manager.fork_session("s1", new_id="s2")
+        self.assertEqual((missing.exception.status_code, taken.exception.status_code), (404, 409))
+        self.assertEqual(contents(manager.get_or_create_session("s2")), [])
+
+
+class PersistentForkTest(unittest.TestCase):
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, "sessions.db")
+
+    def test_sqlite_fork_is_restored_after_restart(self) -> None:
+        api_factory = FakeApiFactory()
+        store = SqliteSessionStore(self.path)
+        manager = SessionManager(api_factory=api_factory, store=store)
+        manager.new_session("s1", system_message="system", provider="p1").chat("q1", preserve=True)
+        manager.fork_session("s1", new_id="s1-b").chat("q2", preserve=True)
+        store.close()
+
+        restored_store = SqliteSessionStore(self.path)
+        self.addCleanup(restored_store.close)
+        restarted = SessionManager(api_factory=api_factory, store=restored_store)
+
+        fork = restarted.get_or_create_session("s1-b")
+        self.assertEqual(contents(fork), ["system", "q1", "from-p1", "q2", "from-p1"])
+        self.assertEqual(fork.provider, "p1")
+        self.assertEqual(contents(restarted.get_or_create_session("s1")), ["system", "q1", "from-p1"])
+
+    def test_shared_fork_includes_other_workers_turns_and_claims_id_once(self) -> None:
+        workers = []
+        for _ in range(2):
+            store = SharedSqliteSessionStore(self.path)
+            self.addCleanup(store.close)
+            workers.append(SessionManager(api_factory=FakeApiFactory(), store=store))
+        worker_a, worker_b = workers
+        worker_a.new_session("s1", provider="p1").chat("q1", preserve=True)
+        worker_b.get_or_create_session("s1").chat("q2", preserve=True)
+
+        fork = worker_a.fork_session("s1", new_id="s1-b")
+
+        self.assertEqual(contents(fork), ["q1", "from-p1", "q2", "from-p1"])
+        with self.assertRaises(SessionExistsError):
+            worker_b.fork_session("s1", new_id="s1-b")
+        self.assertEqual(contents(worker_b.get_or_create_session("s1-b")), contents(fork))
+        fork.chat("q3", preserve=True)
+        self.assertEqual(len(worker_b.store.load("s1-b").history), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import typing
+import unittest
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from api.base_api import BaseApi
+from models.message import MESSAGE_OVERHEAD_BYTES, Message
+from models.session_manager import Session
+from models.session_pool import SessionPool, SessionPoolSettings
+
+
+class IdleClient(BaseApi):
+    def reason(self, messages: list[dict[str, str]]) -> str:
+        return "answer"
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_session(id: str) -> Session:
+    return Session(id, IdleClient(), Message())
+
+
+class SessionPoolTest(unittest.TestCase):
+    def make_pool(self, **settings) -> tuple[SessionPool, FakeClock]:
+        clock = FakeClock()
+        pool_settings = SessionPoolSettings(**{"max_memory_mb": 0, **settings})
+        return SessionPool(lambda: pool_settings, clock=clock), clock
+
+    def test_evicts_least_recently_used_sessions_below_capacity(self) -> None:
+        pool, clock = self.make_pool(max_sessions=3)
+        for id in ["s1", "s2", "s3"]:
+            pool.add(make_session(id))
+            clock.now += 0.1
+        pool.get("s1")
+
+        pool.add(make_session("s4"))
+
+        self.assertEqual(sorted(session.id for session in pool.values()), ["s1", "s4"])
+        self.assertEqual(pool.stats()["evicted"]["lru"], 2)
+        self.assertEqual(pool.stats()["created"], 4)
+
+    def test_evicts_sessions_idle_longer_than_ttl(self) -> None:
+        pool, clock = self.make_pool(idle_ttl=60)
+        pool.add(make_session("old"))
+        clock.now += 50
+        pool.add(make_session("recent"))
+        clock.now += 20
+
+        self.assertIsNone(pool.get("old"))
+
+        self.assertIn("recent", pool)
+        self.assertNotIn("old", pool)
+        self.assertEqual(pool.stats()["evicted"]["ttl"], 1)
+
+    def test_evicts_oldest_sessions_until_under_memory_ceiling(self) -> None:
+        pool, clock = self.make_pool(max_memory_mb=0.001)
+        for id in ["s1", "s2", "s3"]:
+            session = make_session(id)
+            session.messages.preserve_history("q", "a" * 300)
+            pool.add(session)
+            clock.now += 0.1
+
+        self.assertEqual(pool.evict(), 2)
+
+        self.assertEqual([session.id for session in pool.values()], ["s3"])
+        stats = pool.stats()
+        self.assertEqual(stats["evicted"]["memory"], 2)
+        self.assertLessEqual(stats["approximate_memory_bytes"], stats["max_memory_bytes"])
+
+    def test_busy_sessions_are_never_evicted(self) -> None:
+        pool, clock = self.make_pool(max_sessions=1, idle_ttl=1)
+        busy = pool.add(make_session("busy"))
+        busy._conversation_lock.acquire()
+        self.addCleanup(busy._conversation_lock.release)
+        clock.now += 10
+
+        pool.add(make_session("idle"))
+
+        self.assertIn("busy", pool)
+        self.assertEqual(len(pool), 1)
+
+    def test_zero_limits_disable_eviction(self) -> None:
+        pool, clock = self.make_pool(max_sessions=0, idle_ttl=0)
+        for index in range(5):
+            pool.add(make_session(f"s{index}"))
+        clock.now += 10 ** 6
+
+        self.assertEqual(pool.evict(), 0)
+        self.assertEqual(len(pool), 5)
+
+    def test_message_size_tracks_history_changes(self) -> None:
+        message = Message("system")
+        base_size = message.approximate_size()
+
+        message.preserve_history("q", "a" * 1000)
+        grown_size = message.approximate_size()
+        message._messages_user_and_assistant_part = []
+
+        self.assertGreater(grown_size, base_size + 1000 + 2 * MESSAGE_OVERHEAD_BYTES)
+        self.assertEqual(message.approximate_size(), base_size)
+
+    def test_settings_reject_negative_limits(self) -> None:
+        is_valid, errors = SessionPoolSettings.validate_config({
+            "max_sessions": -1,
+            "idle_ttl": 0.0,
+            "max_memory_mb": 1.0,
+        })
+
+        self.assertFalse(is_valid)
+        self.assertEqual(errors, ["max_sessions must not be negative"])
+
+
+if __name__ == "__main__":
+    unittest.main()
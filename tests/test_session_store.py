@@ -0,0 +1,283 @@
+import os
+import signal
+import sqlite3
+import sys
+import tempfile
+import typing
+import unittest
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from models.session_manager import SessionManager
+from models.session_store import (
+    SessionRecord,
+    SessionStoreSettings,
+    SessionVersionConflictError,
+    SharedSqliteSessionStore,
+    SqliteSessionStore,
+    create_session_store,
+)
+from test_message_session import FakeApiFactory
+
+CHILD_TIMEOUT_SECONDS = 10
+
+
+def run_in_child(test: unittest.TestCase, function: typing.Callable[[], None]) -> None:
+    """在 fork 出的子进程中执行 function，子进程卡住或抛出异常时测试失败"""
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            signal.alarm(CHILD_TIMEOUT_SECONDS)
+            function()
+            status = 0
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    test.assertEqual(os.waitstatus_to_exitcode(status), 0)
+
+
+class SqliteSessionStoreTest(unittest.TestCase):
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, "sessions.db")
+
+    def open_store(self) -> SqliteSessionStore:
+        store = SqliteSessionStore(self.path)
+        self.addCleanup(store.close)
+        return store
+
+    def test_writes_survive_reopening_the_database(self) -> None:
+        store = self.open_store()
+        store.create(SessionRecord(id="s1", provider="p1", model="model-1"))
+        store.set_system_messages("s1", [{"role": "system", "content": "system"}])
+        store.append_messages("s1", [
+            {"role": "user", "content": "q1"},
+            {"role": "assistant", "content": "a1"},
+        ])
+        store.clear_history("s1")
+        store.append_messages("s1", [
+            {"role": "user", "content": "问题"},
+            {"role": "assistant", "content": "回答"},
+        ])
+        store.close()
+
+        record = self.open_store().load("s1")
+
+        self.assertEqual(record, SessionRecord(
+            id="s1",
+            provider="p1",
+            model="model-1",
+            system_messages=[{"role": "system", "content": "system"}],
+            history=[
+                {"role": "user", "content": "问题"},
+                {"role": "assistant", "content": "回答"},
+            ],
+            version=5,
+        ))
+        # 读出的消息共用驻留的角色字符串
+        self.assertIs(record.history[0]["role"], sys.intern("user"))
+        self.assertIsNone(self.open_store().load("missing"))
+
+    def test_create_replaces_existing_session(self) -> None:
+        store = self.open_store()
+        store.create(SessionRecord(id="s1", history=[{"role": "user", "content": "old"}]))
+
+        store.create(SessionRecord(id="s1", provider="p2"))
+
+        self.assertEqual(store.load("s1"), SessionRecord(id="s1", provider="p2", version=2))
+
+    def test_session_manager_rehydrates_evicted_and_restarted_sessions(self) -> None:
+        api_factory = FakeApiFactory()
+        store = self.open_store()
+        manager = SessionManager(api_factory=api_factory, store=store)
+        session = manager.new_session("s1", system_message="system", provider="p1")
+        session.chat("q1", preserve=True)
+        manager.pool._sessions.clear()
+
+        rehydrated = manager.get_or_create_session("s1", provider="p2")
+        store.close()
+        restarted = SessionManager(api_factory=api_factory, store=self.open_store())
+        after_restart = restarted.get_or_create_session("s1")
+
+        for restored in [rehydrated, after_restart]:
+            self.assertIsNot(restored, session)
+            self.assertIs(restored.client, api_factory.clients["p1"])
+            self.assertEqual(restored.snapshot_messages(), session.snapshot_messages())
+        self.assertEqual(api_factory.requested_clients, [("p1", None)] * 3)
+
+    def test_new_ids_are_created_when_store_has_no_record(self) -> None:
+        api_factory = FakeApiFactory()
+        manager = SessionManager(api_factory=api_factory, store=self.open_store())
+
+        session = manager.get_or_create_session("fresh", provider="p2")
+
+        self.assertIs(session.client, api_factory.clients["p2"])
+        self.assertEqual(manager.store.load("fresh"), SessionRecord(id="fresh", provider="p2", version=1))
+
+    def test_sessions_without_writes_expire_after_retention(self) -> None:
+        now = [1000.0]
+        store = SqliteSessionStore(self.path, retention=60.0, clock=lambda: now[0])
+        self.addCleanup(store.close)
+        store.create(SessionRecord(id="idle", history=[{"role": "user", "content": "old"}]))
+        store.create(SessionRecord(id="active"))
+        store.flush()
+
+        # 写入时间在写线程执行时读取，每步之后都等待落盘
+        now[0] += 50.0
+        store.append_messages("active", [{"role": "user", "content": "q"}])
+        store.flush()
+        now[0] += SqliteSessionStore.SWEEP_INTERVAL_SECONDS - 40.0
+        store.set_system_messages("active", [{"role": "system", "content": "system"}])
+        store.flush()
+        # 被清理的会话之后的写入被忽略，不留下孤立消息
+        store.append_messages("idle", [{"role": "user", "content": "late"}])
+        store.flush()
+
+        self.assertIsNone(store.load("idle"))
+        self.assertEqual(store.load("active").history, [{"role": "user", "content": "q"}])
+        self.assertEqual(store.stats()["expired_sessions"], 1)
+        with sqlite3.connect(self.path) as connection:
+            self.assertEqual(connection.execute("SELECT DISTINCT session_id FROM messages").fetchall(), [("active",)])
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires os.fork")
+    def test_forked_process_starts_its_own_writer(self) -> None:
+        store = self.open_store()
+        store.create(SessionRecord(id="parent", provider="p1"))
+        store.flush()
+
+        def child() -> None:
+            assert store.load("parent").provider == "p1"
+            store.create(SessionRecord(id="child", provider="p2"))
+            store.append_messages("parent", [{"role": "user", "content": "from-child"}])
+            store.flush()
+
+        run_in_child(self, child)
+
+        self.assertEqual(store.load("child").provider, "p2")
+        self.assertEqual(store.load("parent").history, [{"role": "user", "content": "from-child"}])
+
+
+class SharedSqliteSessionStoreTest(unittest.TestCase):
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, "shared.db")
+
+    def make_worker(self) -> tuple[SessionManager, FakeApiFactory]:
+        # 每个 worker 进程各自打开同一个数据库文件
+        store = SharedSqliteSessionStore(self.path)
+        self.addCleanup(store.close)
+        api_factory = FakeApiFactory()
+        return SessionManager(api_factory=api_factory, store=store), api_factory
+
+    def test_workers_continue_each_others_conversation(self) -> None:
+        worker_a, factory_a = self.make_worker()
+        worker_b, _ = self.make_worker()
+
+        worker_a.new_session("s1", system_message="system", provider="p1").chat("q1", preserve=True)
+        worker_b.get_or_create_session("s1").chat("q2", preserve=True)
+        worker_a.get_or_create_session("s1").chat("q3", preserve=True)
+
+        self.assertEqual(factory_a.clients["p1"].calls[-1], [
+            {"role": "system", "content": "system"},
+            {"role": "user", "content": "q1"},
+            {"role": "assistant", "content": "from-p1"},
+            {"role": "user", "content": "q2"},
+            {"role": "assistant", "content": "from-p1"},
+            {"role": "user", "content": "q3"},
+        ])
+        self.assertEqual(
+            [message["content"] for message in worker_b.store.load("s1").history],
+            ["q1", "from-p1", "q2", "from-p1", "q3", "from-p1"],
+        )
+
+    def test_stale_append_is_retried_after_concurrent_turn(self) -> None:
+        worker_a, _ = self.make_worker()
+        worker_b, _ = self.make_worker()
+        session_a = worker_a.new_session("s1", provider="p1")
+        session_b = worker_b.get_or_create_session("s1")
+
+        session_b._preserve_history("from-b", "answer-b")
+        session_a._preserve_history("from-a", "answer-a")
+
+        expected = ["from-b", "answer-b", "from-a", "answer-a"]
+        self.assertEqual([message["content"] for message in session_a.snapshot_messages()], expected)
+        self.assertEqual([message["content"] for message in worker_b.store.load("s1").history], expected)
+        self.assertEqual(worker_a.store.stats()["version_conflicts"], 1)
+
+    def test_writes_with_outdated_version_are_rejected(self) -> None:
+        store = SharedSqliteSessionStore(self.path)
+        self.addCleanup(store.close)
+        record = SessionRecord(id="s1")
+        self.assertTrue(store.create_if_absent(record))
+        self.assertFalse(store.create_if_absent(SessionRecord(id="s1", provider="p2")))
+
+        version = store.append_messages("s1", [{"role": "user", "content": "q"}], expected_version=record.version)
+
+        with self.assertRaises(SessionVersionConflictError):
+            store.clear_history("s1", expected_version=record.version)
+        self.assertIsNone(store.refresh("s1", version))
+        self.assertEqual(store.refresh("s1", record.version).history, [{"role": "user", "content": "q"}])
+
+    def test_sessions_without_writes_expire_after_retention(self) -> None:
+        now = [1000.0]
+        store = SharedSqliteSessionStore(self.path, retention=60.0, clock=lambda: now[0])
+        self.addCleanup(store.close)
+        self.assertTrue(store.create_if_absent(SessionRecord(id="idle", history=[{"role": "user", "content": "old"}])))
+        self.assertTrue(store.create_if_absent(SessionRecord(id="active")))
+
+        now[0] += 50.0
+        version = store.append_messages("active", [{"role": "user", "content": "q"}], expected_version=1)
+        now[0] += SharedSqliteSessionStore.SWEEP_INTERVAL_SECONDS
+        store.set_system_messages("active", [], expected_version=version)
+
+        self.assertIsNone(store.load("idle"))
+        self.assertEqual(store.load("active").history, [{"role": "user", "content": "q"}])
+        self.assertEqual(store.stats()["expired_sessions"], 1)
+        with self.assertRaises(SessionVersionConflictError):
+            store.append_messages("idle", [{"role": "user", "content": "late"}], expected_version=1)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires os.fork")
+    def test_forked_worker_opens_its_own_connection(self) -> None:
+        # 与 gunicorn preload 相同：主进程构造存储，worker 在 fork 之后使用
+        store = SharedSqliteSessionStore(self.path)
+        self.addCleanup(store.close)
+        self.assertTrue(store.create_if_absent(SessionRecord(id="s1")))
+        parent_connection = store._connection()
+
+        def child() -> None:
+            assert store._connection() is not parent_connection
+            store.append_messages("s1", [{"role": "user", "content": "from-child"}], expected_version=1)
+            store.close()
+
+        run_in_child(self, child)
+
+        self.assertEqual(store.load("s1").history, [{"role": "user", "content": "from-child"}])
+        self.assertIs(store._connection(), parent_connection)
+
+
+class SessionStoreSettingsTest(unittest.TestCase):
+    def test_rejects_unknown_backend(self) -> None:
+        is_valid, errors = SessionStoreSettings.validate_config({"backend": "redis", "path": "x.db"})
+
+        self.assertFalse(is_valid)
+        self.assertEqual(errors, ["backend must be one of: memory, sqlite, shared_sqlite"])
+
+    def test_rejects_negative_retention(self) -> None:
+        is_valid, errors = SessionStoreSettings.validate_config({"retention_days": -1.0})
+
+        self.assertFalse(is_valid)
+        self.assertEqual(errors, ["retention_days must be non-negative"])
+
+    def test_memory_backend_is_the_default(self) -> None:
+        store = create_session_store(SessionStoreSettings())
+
+        self.assertEqual(store.stats(), {"backend": "memory"})
+        self.assertIsNone(store.load("s1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,28 +1,57 @@
 import json
+import typing
 import unittest
 from unittest.mock import patch
 
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+import httpx
+
+from api.base_api import BaseApi
+from api.provider_errors import ErrorCategory, OverloadedError, ProviderHTTPError, RateLimitError
+from api.retrying_api import RetryingApi
 from api.streaming import (
+    SSE_READ_SIZE,
+    SSEDecoder,
     iter_anthropic_content,
     iter_openai_content,
     iter_sse_data,
     stream_chat_completion,
+    stream_chat_completion_async,
 )
 
 
+class FakeRawStream:
+    def __init__(self, chunks: list[bytes]) -> None:
+        self.chunks = list(chunks)
+        self.read_sizes: list[int] = []
+
+    def read1(self, amt=None, decode_content=None):
+        self.read_sizes.append(amt)
+        self.decode_content = decode_content
+        if not self.chunks:
+            return b""
+        return self.chunks.pop(0)
+
+
 class FakeStreamingResponse:
-    def __init__(self, lines: list[str], status_code: int = 200) -> None:
-        self.lines = lines
+    def __init__(
+        self,
+        lines: list[str],
+        status_code: int = 200,
+        chunk_size: int | None = None,
+    ) -> None:
+        body = "".join(f"{line}\n" for line in lines).encode("utf-8")
+        if chunk_size is None:
+            chunks = [body] if body else []
+        else:
+            chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        self.raw = FakeRawStream(chunks)
         self.status_code = status_code
         self.text = "error body"
-        self.encoding = None
         self.closed = False
 
-    def iter_lines(self, chunk_size=1, decode_unicode=False):
-        self.chunk_size = chunk_size
-        self.decode_unicode = decode_unicode
-        yield from self.lines
-
     def close(self) -> None:
         self.closed = True
 
@@ -31,6 +60,40 @@ def sse_payload(payload: object) -> str:
     return f"data: {json.dumps(payload, ensure_ascii=False)}"
 
 
+RATE_LIMITED_LINES = [
+    sse_payload({"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded", "code": "429"}}),
+    "",
+]
+COMPLETED_LINES = [
+    sse_payload({"choices": [{"delta": {"content": "ok"}, "finish_reason": "stop"}]}),
+    "",
+]
+
+
+class StreamingClient(BaseApi):
+    """Streams through stream_chat_completion like the provider clients do."""
+
+    def reason(self, messages: list[dict[str, str]]) -> str:
+        return "".join(self.reason_stream(messages))
+
+    def reason_stream(self, messages: list[dict[str, str]]):
+        return stream_chat_completion(**self._request())
+
+    async def reason_stream_async(self, messages: list[dict[str, str]]):
+        async for chunk in stream_chat_completion_async(**self._request()):
+            yield chunk
+
+    @staticmethod
+    def _request() -> dict:
+        return {
+            "provider": "provider",
+            "url": "https://example.test/chat/completions",
+            "headers": {},
+            "request_body": {"model": "model", "messages": []},
+            "error_prefix": "failed",
+        }
+
+
 class StreamingParserTest(unittest.TestCase):
     def test_iter_sse_data_handles_comments_and_multiline_events(self) -> None:
         response = FakeStreamingResponse([
@@ -43,9 +106,33 @@ class StreamingParserTest(unittest.TestCase):
         ])
 
         self.assertEqual(list(iter_sse_data(response)), ["first\nsecond", "last"])
-        self.assertEqual(response.encoding, "utf-8")
-        self.assertEqual(response.chunk_size, 1)
-        self.assertTrue(response.decode_unicode)
+        self.assertTrue(response.raw.decode_content)
+        self.assertEqual(response.raw.read_sizes, [SSE_READ_SIZE, SSE_READ_SIZE])
+
+    def test_iter_sse_data_reassembles_events_split_across_reads(self) -> None:
+        lines = [
+            sse_payload({"choices": [{"delta": {"content": "你好，世界"}}]}),
+            "",
+            "data: second",
+            "",
+        ]
+        for chunk_size in [1, 2, 3, 7]:
+            with self.subTest(chunk_size=chunk_size):
+                response = FakeStreamingResponse(lines, chunk_size=chunk_size)
+
+                events = list(iter_sse_data(response))
+
+                self.assertEqual(json.loads(events[0])["choices"][0]["delta"]["content"], "你好，世界")
+                self.assertEqual(events[1], "second")
+
+    def test_sse_decoder_flushes_event_as_soon_as_blank_line_arrives(self) -> None:
+        decoder = SSEDecoder()
+
+        self.assertEqual(decoder.feed(b"data: a\r\n"), [])
+        self.assertEqual(decoder.feed(b"\r"), [])
+        self.assertEqual(decoder.feed(b"\ndata: b"), ["a"])
+        self.assertEqual(decoder.feed(b"\n\n: keep-alive\n\n"), ["b"])
+        self.assertEqual(decoder.flush(), [])
 
     def test_openai_parser_ignores_reasoning_and_usage_chunks(self) -> None:
         response = FakeStreamingResponse([
@@ -103,7 +190,7 @@ class StreamingParserTest(unittest.TestCase):
             sse_payload({"error": {"message": "failed"}}),
             "",
         ])
-        with self.assertRaisesRegex(RuntimeError, "上游流式响应错误"):
+        with self.assertRaisesRegex(ProviderHTTPError, "上游流式响应错误: 200, "):
             list(iter_openai_content(error_response))
 
         incomplete_response = FakeStreamingResponse([
@@ -120,7 +207,7 @@ class StreamingParserTest(unittest.TestCase):
             sse_payload({"type": "error", "error": {"message": "failed"}}),
             "",
         ])
-        with self.assertRaisesRegex(RuntimeError, "上游流式响应错误"):
+        with self.assertRaisesRegex(ProviderHTTPError, "上游流式响应错误"):
             list(iter_anthropic_content(error_response))
 
         incomplete_response = FakeStreamingResponse([
@@ -135,6 +222,43 @@ class StreamingParserTest(unittest.TestCase):
         with self.assertRaisesRegex(RuntimeError, "message_stop 前结束"):
             next(stream)
 
+    def test_error_events_are_classified_by_status_or_type(self) -> None:
+        def raised(lines: list[str], parse=iter_openai_content) -> ProviderHTTPError:
+            with self.assertRaises(ProviderHTTPError) as context:
+                list(parse(FakeStreamingResponse(lines)))
+            return context.exception
+
+        rate_limited = raised(RATE_LIMITED_LINES)
+        self.assertIsInstance(rate_limited, RateLimitError)
+        self.assertEqual(rate_limited.status_code, 429)
+        self.assertTrue(rate_limited.retryable)
+
+        overloaded = raised(
+            [sse_payload({"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}}), ""],
+            iter_anthropic_content,
+        )
+        self.assertIsInstance(overloaded, OverloadedError)
+        self.assertEqual(overloaded.status_code, 529)
+
+        too_long = raised([sse_payload({"error": {"message": "maximum context length is 8192", "code": 400}}), ""])
+        self.assertIs(too_long.category, ErrorCategory.CONTEXT_LENGTH)
+        self.assertFalse(too_long.retryable)
+
+    def test_in_stream_rate_limit_is_retried(self) -> None:
+        sleeps: list[float] = []
+        responses = [FakeStreamingResponse(RATE_LIMITED_LINES), FakeStreamingResponse(COMPLETED_LINES)]
+        retrying = RetryingApi("provider", StreamingClient(), max_retries=1, sleeper=sleeps.append)
+
+        with (
+            patch("api.streaming.http_pool.post", side_effect=responses),
+            patch("api.streaming.log_llm_error_request"),
+            patch("api.streaming.log_llm_success_request"),
+        ):
+            self.assertEqual(list(retrying.reason_stream([])), ["ok"])
+
+        self.assertEqual(len(sleeps), 1)
+        self.assertTrue(all(response.closed for response in responses))
+
     def test_stream_request_sets_stream_closes_and_logs_visible_answer(self) -> None:
         response = FakeStreamingResponse([
             sse_payload({"choices": [{"delta": {"content": "a"}}]}),
@@ -146,7 +270,7 @@ class StreamingParserTest(unittest.TestCase):
         ])
 
         with (
-            patch("api.streaming.requests.post", return_value=response) as post,
+            patch("api.streaming.http_pool.post", return_value=response) as post,
             patch("api.streaming.log_llm_success_request") as log_success,
         ):
             result = list(stream_chat_completion(
@@ -164,5 +288,102 @@ class StreamingParserTest(unittest.TestCase):
         self.assertEqual(log_success.call_args.kwargs["response_body"], "ab")
 
 
+class AsyncStreamingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_async_stream_request_parses_split_chunks_and_logs_visible_answer(self) -> None:
+        body = "".join(f"{line}\n" for line in [
+            sse_payload({"choices": [{"delta": {"content": "你好"}}]}),
+            "",
+            sse_payload({"choices": [{"delta": {"content": "世界"}, "finish_reason": "stop"}]}),
+            "",
+        ]).encode("utf-8")
+        requests_seen: list[httpx.Request] = []
+
+        async def split_body():
+            for index in range(0, len(body), 5):
+                yield body[index:index + 5]
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests_seen.append(request)
+            return httpx.Response(200, content=split_body())
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        self.addAsyncCleanup(client.aclose)
+
+        def fake_stream(url, **kwargs):
+            return client.stream("POST", url, **kwargs)
+
+        with (
+            patch("api.streaming.http_pool.async_stream", side_effect=fake_stream),
+            patch("api.streaming.log_llm_success_request") as log_success,
+        ):
+            result = [
+                chunk
+                async for chunk in stream_chat_completion_async(
+                    provider="provider",
+                    url="https://example.test/chat/completions",
+                    headers={"Authorization": "Bearer key"},
+                    request_body={"model": "model", "messages": []},
+                    error_prefix="failed",
+                )
+            ]
+
+        self.assertEqual(result, ["你好", "世界"])
+        self.assertTrue(json.loads(requests_seen[0].content)["stream"])
+        self.assertEqual(log_success.call_args.kwargs["response_body"], "你好世界")
+
+    async def test_async_in_stream_rate_limit_is_retried(self) -> None:
+        bodies = [
+            "".join(f"{line}\n" for line in lines).encode("utf-8")
+            for lines in (RATE_LIMITED_LINES, COMPLETED_LINES)
+        ]
+        client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, content=bodies.pop(0)))
+        )
+        self.addAsyncCleanup(client.aclose)
+        sleeps: list[float] = []
+
+        async def record_sleep(delay: float) -> None:
+            sleeps.append(delay)
+
+        retrying = RetryingApi("provider", StreamingClient(), max_retries=1, async_sleeper=record_sleep)
+        with (
+            patch(
+                "api.streaming.http_pool.async_stream",
+                side_effect=lambda url, **kwargs: client.stream("POST", url, **kwargs),
+            ),
+            patch("api.streaming.log_llm_error_request"),
+            patch("api.streaming.log_llm_success_request"),
+        ):
+            chunks = [chunk async for chunk in retrying.reason_stream_async([])]
+
+        self.assertEqual(chunks, ["ok"])
+        self.assertEqual(len(sleeps), 1)
+
+    async def test_async_stream_request_raises_with_status_on_error_response(self) -> None:
+        client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(503, text="busy"))
+        )
+        self.addAsyncCleanup(client.aclose)
+
+        with (
+            patch(
+                "api.streaming.http_pool.async_stream",
+                side_effect=lambda url, **kwargs: client.stream("POST", url, **kwargs),
+            ),
+            patch("api.streaming.log_llm_error_request") as log_error,
+        ):
+            with self.assertRaisesRegex(Exception, "failed: 503, busy"):
+                async for _ in stream_chat_completion_async(
+                    provider="provider",
+                    url="https://example.test/chat/completions",
+                    headers={},
+                    request_body={"model": "model", "messages": []},
+                    error_prefix="failed",
+                ):
+                    pass
+
+        log_error.assert_called_once()
+
+
 if __name__ == "__main__":
     unittest.main()
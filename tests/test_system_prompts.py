@@ -0,0 +1,92 @@
+import gc
+import typing
+import unittest
+from threading import Thread
+
+if not hasattr(typing, "override"):
+    typing.override = lambda func: func
+
+from models.message import Message, message_size
+from models.session_manager import SessionManager
+from models.system_prompts import SystemPromptTable
+from test_message_session import FakeApiFactory
+
+PROMPT = "你是一个乐于助人的助手。" * 200
+
+
+class SystemPromptTableTest(unittest.TestCase):
+    def test_sessions_share_one_copy_of_the_same_prompt(self) -> None:
+        manager = SessionManager(api_factory=FakeApiFactory())
+        sessions = [
+            manager.new_session(f"s{index}", system_message=PROMPT, provider="p1")
+            for index in range(3)
+        ]
+        size = message_size({"role": "system", "content": PROMPT})
+
+        self.assertIs(sessions[0].snapshot_messages()[0], sessions[2].snapshot_messages()[0])
+        self.assertEqual(manager.stats()["system_prompts"], {
+            "prompts": 1,
+            "references": 3,
+            "stored_bytes": size,
+            "saved_bytes": 2 * size,
+        })
+        # 共享的系统消息不再计入每个会话的内存估算
+        self.assertEqual(sessions[0].approximate_size(), Message().approximate_size())
+
+    def test_adjusting_and_dropping_sessions_releases_references(self) -> None:
+        manager = SessionManager(api_factory=FakeApiFactory())
+        first = manager.new_session("s1", system_message=PROMPT, provider="p1")
+        second = manager.new_session("s2", system_message=PROMPT, provider="p1")
+        before = first.snapshot_messages()
+
+        first.adjust_system_message("other")
+
+        self.assertEqual(before[0]["content"], PROMPT)
+        self.assertEqual(manager.system_prompts.stats()["prompts"], 2)
+        self.assertEqual(manager.system_prompts.stats()["saved_bytes"], 0)
+
+        manager.pool._sessions.clear()
+        del first, second, before
+        gc.collect()
+        self.assertEqual(manager.system_prompts.stats(), {
+            "prompts": 0,
+            "references": 0,
+            "stored_bytes": 0,
+            "saved_bytes": 0,
+        })
+
+    def test_concurrent_replacement_keeps_reference_counts_consistent(self) -> None:
+        manager = SessionManager(api_factory=FakeApiFactory())
+        sessions = [
+            manager.new_session(f"s{index}", system_message=PROMPT, provider="p1")
+            for index in range(4)
+        ]
+
+        def adjust(session) -> None:
+            for round in range(200):
+                session.adjust_system_message(PROMPT if round % 2 else "other")
+
+        threads = [Thread(target=adjust, args=(session,)) for session in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = manager.system_prompts.stats()
+        self.assertEqual(stats["references"], 4)
+        self.assertEqual(stats["prompts"], 1)
+        self.assertEqual(
+            [session.snapshot_messages()[0]["content"] for session in sessions],
+            [PROMPT] * 4,
+        )
+
+    def test_messages_with_extra_fields_are_not_shared(self) -> None:
+        table = SystemPromptTable()
+        message = {"role": "system", "content": PROMPT, "name": "policy"}
+
+        self.assertIs(table.acquire(message), message)
+        self.assertEqual(table.stats()["prompts"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+
+from api.token_estimation import estimate_message_tokens, estimate_prompt_tokens, estimate_tokens
+
+
+class EstimateTokensTest(unittest.TestCase):
+    def test_counts_ascii_by_four_characters_and_cjk_per_character(self) -> None:
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("abcd" * 10), 10)
+        self.assertEqual(estimate_tokens("你好世界"), 4)
+        self.assertEqual(estimate_tokens("你好 abcd"), 4)
+        self.assertEqual(estimate_tokens("hello 世界"), 4)
+
+    def test_messages_add_format_overhead(self) -> None:
+        self.assertEqual(estimate_message_tokens({"role": "user", "content": "你好"}), 6)
+        self.assertEqual(estimate_message_tokens({"role": "assistant", "content": None}), 4)
+        self.assertEqual(estimate_prompt_tokens([
+            {"role": "system", "content": "abcd"},
+            {"role": "user", "content": "你好"},
+        ]), 11)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,6 +8,9 @@ from unittest.mock import patch
 if not hasattr(typing, "override"):
     typing.override = lambda func: func
 
+from models.session_admission import SessionBusyError, SessionQueueFullError
+from models.session_manager import SessionExistsError, SessionNotFoundError
+
 
 class FakeMessageStore:
     def __init__(self) -> None:
@@ -48,6 +51,8 @@ class FakeSession:
         preserve: bool = False,
         system_message: str | None = None,
     ) -> str:
+        if self.provider == "busy":
+            raise SessionBusyError("会话正忙")
         if system_message:
             self.adjust_system_message(system_message)
         if preserve:
@@ -64,27 +69,67 @@ class FakeSession:
         self.chat_stream_calls.append((question, preserve, system_message))
         if self.provider == "fail-before-chunk":
             raise RuntimeError("failed before chunk")
+        if self.provider == "queue-full":
+            raise SessionQueueFullError("排队已满")
         yield "stream:"
         if self.provider == "fail-after-chunk":
             raise RuntimeError("failed after chunk")
         yield question
 
-    def snapshot_messages(self):
+    def peek_messages(self):
         return list(self.messages.messages)
 
+    def compaction_stats(self):
+        return {"compactions": 0}
+
+    def admission_stats(self):
+        return {"waiting": 0}
+
+
+class FakeStatelessClient:
+    def __init__(self, provider: str | None, model: str | None) -> None:
+        self.provider = provider
+        self.model = model
+        self.calls: list[list[dict]] = []
+
+    def reason(self, messages):
+        self.calls.append(messages)
+        return f"stateless:{messages[-1]['content']}:{self.provider}"
+
+    def reason_stream(self, messages):
+        self.calls.append(messages)
+        yield "stateless:"
+        yield ""
+        yield messages[-1]["content"]
+
+    async def reason_async(self, messages):
+        return self.reason(messages)
+
+    async def reason_stream_async(self, messages):
+        for chunk in self.reason_stream(messages):
+            yield chunk
+
 
 class FakeSessionManager:
     def __init__(self) -> None:
         self.pool: dict[str, FakeSession] = {}
         self.requests: list[tuple[str | None, str | None, str | None]] = []
+        self.stateless_clients: list[FakeStatelessClient] = []
         self.api_factory = self
 
+    def stateless_client(self, provider=None, model=None):
+        self.stateless_clients.append(FakeStatelessClient(provider, model))
+        return self.stateless_clients[-1]
+
     def list_available_provider_models(self):
         return [
             {"id": "p1", "models": ["model-1", "model-2"]},
             {"id": "p2", "models": ["Model-A"]},
         ]
 
+    def hedging_stats(self):
+        return {"p1": {"hedged": 0}}
+
     def get_or_create_session(self, id=None, provider=None, model=None):
         self.requests.append((id, provider, model))
         session_id = id or "generated"
@@ -92,9 +137,24 @@ class FakeSessionManager:
             self.pool[session_id] = FakeSession(session_id, provider, model)
         return self.pool[session_id]
 
+    def fork_session(self, id, new_id=None, system_message=None):
+        if id not in self.pool:
+            raise SessionNotFoundError(f"会话 {id} 不存在")
+        new_id = new_id or "forked"
+        if new_id in self.pool:
+            raise SessionExistsError(f"会话 {new_id} 已存在")
+        parent = self.pool[id]
+        self.pool[new_id] = type(parent)(new_id, parent.provider, parent.model)
+        if system_message:
+            self.pool[new_id].adjust_system_message(system_message)
+        return self.pool[new_id]
+
     def list_sessions(self):
         return list(self.pool.values())
 
+    def stats(self):
+        return {"sessions": len(self.pool)}
+
 
 class WebServerTest(unittest.TestCase):
     def load_server_module(self):
@@ -298,8 +358,25 @@ class WebServerTest(unittest.TestCase):
         self.assertEqual(response.get_json(), [{
             "id": "s1",
             "messages": [{"role": "user", "content": "stored"}],
+            "compaction": {"compactions": 0},
+            "admission": {"waiting": 0},
         }])
 
+    def test_stats_returns_http_pool_session_and_hedging_counters(self) -> None:
+        web_server = self.load_server_module()
+        client = web_server.app.test_client()
+        web_server.sm.get_or_create_session("s1")
+
+        with patch.object(web_server.http_pool, "get_stats", return_value={"hits": 3, "misses": 1}):
+            response = client.get("/stats")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {
+            "http_pool": {"hits": 3, "misses": 1},
+            "sessions": {"sessions": 1},
+            "hedging": {"p1": {"hedged": 0}},
+        })
+
     def test_models_returns_available_provider_models(self) -> None:
         web_server = self.load_server_module()
         client = web_server.app.test_client()
@@ -388,6 +465,33 @@ class WebServerTest(unittest.TestCase):
         self.assertEqual(web_server.sm.requests, [("s-stream", "p1", "model-1")])
         self.assertEqual(session.chat_stream_calls, [("hello", True, "system")])
 
+    def test_messages_array_bypasses_sessions(self) -> None:
+        web_server = self.load_server_module()
+        client = web_server.app.test_client()
+        messages = [
+            {"role": "system", "content": "system"},
+            {"role": "user", "content": "hello"},
+        ]
+
+        answer = client.post("/", json={"messages": messages, "provider": "p1"})
+        stream = client.get("/stream", query_string={"messages": json.dumps(messages)})
+        conflicting = client.post("/", json={"messages": messages, "id": "s1", "preserve": False})
+        invalid = client.get("/?messages=not-json")
+
+        self.assertEqual(answer.get_data(as_text=True), "stateless:hello:p1")
+        self.assertEqual(self.parse_sse_events(stream), [
+            {"type": "delta", "content": "stateless:"},
+            {"type": "delta", "content": "hello"},
+            {"type": "done", "preserved": False},
+        ])
+        self.assertEqual([client.calls for client in web_server.sm.stateless_clients], [[messages], [messages]])
+        self.assertEqual(
+            (conflicting.status_code, conflicting.get_data(as_text=True)),
+            (400, "提供 messages 时不能同时提供: id, preserve"),
+        )
+        self.assertEqual(invalid.status_code, 400)
+        self.assertEqual((web_server.sm.pool, web_server.sm.requests), ({}, []))
+
     def test_get_stream_returns_generated_session_id(self) -> None:
         web_server = self.load_server_module()
         client = web_server.app.test_client()
@@ -411,6 +515,34 @@ class WebServerTest(unittest.TestCase):
         self.assertEqual(response.status_code, 502)
         self.assertEqual(response.get_data(as_text=True), "模型流式调用失败")
 
+    def test_busy_session_is_rejected_with_admission_status(self) -> None:
+        web_server = self.load_server_module()
+        client = web_server.app.test_client()
+
+        busy = client.get("/?id=s1&user_message=hello&provider=busy")
+        queue_full = client.get("/stream?id=s2&user_message=hello&provider=queue-full")
+
+        self.assertEqual((busy.status_code, busy.get_data(as_text=True)), (409, "会话正忙"))
+        self.assertEqual((queue_full.status_code, queue_full.get_data(as_text=True)), (429, "排队已满"))
+
+    def test_fork_creates_session_and_maps_errors_to_status_codes(self) -> None:
+        web_server = self.load_server_module()
+        client = web_server.app.test_client()
+        client.get("/?id=s1&user_message=hello&provider=p1")
+
+        forked = client.post("/fork", json={"id": "s1", "new_id": "s1-b", "system_message": "variant"})
+        generated = client.get("/fork?id=s1")
+        missing = client.get("/fork?id=missing")
+        taken = client.post("/fork", json={"id": "s1", "new_id": "s1-b"})
+        no_id = client.post("/fork", json={"new_id": "x"})
+
+        self.assertEqual(forked.get_json(), {"id": "s1-b", "parent": "s1"})
+        self.assertEqual(web_server.sm.pool["s1-b"].adjusted_system_messages, ["variant"])
+        self.assertEqual(generated.get_json(), {"id": "forked", "parent": "s1"})
+        self.assertEqual((missing.status_code, missing.get_data(as_text=True)), (404, "会话 missing 不存在"))
+        self.assertEqual(taken.status_code, 409)
+        self.assertEqual((no_id.status_code, no_id.get_data(as_text=True)), (400, "缺少必填参数: id"))
+
     def test_stream_failure_after_first_chunk_returns_error_event(self) -> None:
         web_server = self.load_server_module()
         client = web_server.app.test_client()